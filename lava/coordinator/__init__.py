@@ -16,20 +16,49 @@
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #  MA 02110-1301, USA.
 
-import time
-import socket
+import asyncio
 import logging
 import json
+import struct
 
 LOG = logging.getLogger("lava-coordinator")
 
 
+class Response:
+    """
+    Collect the response to a request: the request handlers write the
+    header and the message to self.conn.
+    """
+
+    def __init__(self):
+        self.data = b""
+
+    def send(self, data):
+        self.data += data
+
+    def close(self):
+        pass
+
+    @property
+    def waiting(self):
+        if not self.data:
+            return False
+        return json.loads(self.data[8:].decode("utf-8"))["response"] == "wait"
+
+
 class LavaCoordinator:
 
     running = False
     delay = 1
     rpc_delay = 2
     blocksize = 4 * 1024
+    # Maximum duration (in seconds) of a blocking wait
+    max_wait = 60
+    # Requests that are kept pending until they can be completed instead of
+    # answering "wait" straight away
+    blocking_requests = ["group_data", "lava_sync", "lava_wait", "lava_wait_all"]
+    # Maximum size of a frame on persistent connections
+    max_frame = 16 * 1024 * 1024
     all_groups = {}
     # All data handling for each connection happens on this local reference into the
     # all_groups dict with a new group looked up each time.
@@ -50,53 +79,181 @@ class LavaCoordinator:
         self.host = host
         self.group_port = port
         self.blocksize = blocksize
+        # Pending requests, by group name
+        self.waiters = {}
 
     def run(self):
-        s = None
-        while 1:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        asyncio.run(self.serve())
+
+    async def start(self):
+        while True:
             try:
                 # TODO: use self.host
                 LOG.info("[BTSP] binding to %s:%s", "0.0.0.0", self.group_port)
-                s.bind(("0.0.0.0", self.group_port))
-                break
-            except socket.error as e:
+                return await asyncio.start_server(
+                    self.handle, "0.0.0.0", self.group_port, reuse_address=True
+                )
+            except OSError as e:
                 LOG.warning(
                     "[BTSP] Unable to bind, trying again with delay=%d msg=%s",
                     self.delay,
                     str(e),
                 )
-                time.sleep(self.delay)
+                await asyncio.sleep(self.delay)
                 self.delay *= 2
-        s.listen(1)
+
+    async def serve(self):
+        server = await self.start()
         self.running = True
-        while self.running:
-            LOG.info("Ready to accept new connections")
-            self.conn, addr = s.accept()
+        LOG.info("Ready to accept new connections")
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        """
+        Read one request, send the response and close the connection.
+        Many connections are served at the same time.
+        """
+        try:
             # read the header to get the size of the message to follow
-            data = self.conn.recv(8).decode("utf-8")  # 32bit limit
+            data = await reader.readexactly(8)  # 32bit limit
             try:
-                count = int(data, 16)
+                count = int(data.decode("utf-8"), 16)
             except ValueError:
                 LOG.warning(
-                    "Invalid message: %s from %s", data, self.conn.getpeername()[0]
+                    "Invalid message: %s from %s",
+                    data,
+                    writer.get_extra_info("peername")[0],
                 )
-                self.conn.close()
-                continue
-            c = 0
-            data = ""
+                return
             # get the message itself
-            while c < count:
-                data += self.conn.recv(self.blocksize).decode("utf-8")
-                c += self.blocksize
+            data = await reader.readexactly(count)
             try:
-                json_data = json.loads(data)
+                json_data = json.loads(data.decode("utf-8"))
             except ValueError:
                 LOG.warning("JSON error for '%s'", data[:100])
-                self.conn.close()
-                continue
+                return
+            if not isinstance(json_data, dict):
+                LOG.warning("Invalid request '%s'", data[:100])
+                return
+            if json_data.get("request") == "persistent":
+                msgdata = self._formatMessage(
+                    {"response": "ack", "max_frame": self.max_frame}
+                )
+                writer.write(msgdata[0] + msgdata[1])
+                await self.persistent(reader, writer)
+                return
+            writer.write(await self.process(json_data))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError) as exc:
+            LOG.warning("Connection error: %s", exc)
+        except Exception:
+            LOG.exception("Unable to handle the request")
+        finally:
+            writer.close()
+
+    async def persistent(self, reader, writer):
+        """
+        Serve a persistent connection, negotiated by a "persistent" request.
+        Each request is a frame: the size of the JSON request and the request
+        id (as big-endian 32bits integers) followed by the request. The
+        requests are handled concurrently and each response is sent with the
+        same request id as soon as it's available.
+        """
+        tasks = set()
+
+        async def reply(request_id, data):
+            response = self._formatMessage({"response": "nack"})[1]
+            try:
+                json_data = json.loads(data.decode("utf-8"))
+            except ValueError:
+                json_data = None
+            if not isinstance(json_data, dict):
+                LOG.warning("Invalid request '%s'", data[:100])
+            else:
+                try:
+                    response = (await self.process(json_data))[8:]
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    LOG.exception("Unable to handle the request")
+            writer.write(struct.pack("!II", len(response), request_id) + response)
+            await writer.drain()
+
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(8)
+                except asyncio.IncompleteReadError as exc:
+                    if exc.partial:
+                        raise
+                    # The client closed the connection
+                    break
+                (size, request_id) = struct.unpack("!II", header)
+                if size > self.max_frame:
+                    LOG.warning("Frame too large: %d > %d", size, self.max_frame)
+                    break
+                data = await reader.readexactly(size)
+                task = asyncio.ensure_future(reply(request_id, data))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def process(self, json_data):
+        """
+        Handle the request and return the response.
+        When the request cannot be completed yet, it is kept pending and
+        handled again each time the group is updated, for up to
+        "wait_timeout" seconds (or "poll_delay" for older clients). The
+        response is "wait" if the request is still not completed: the
+        client will send it again.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            timeout = float(json_data.get("wait_timeout", json_data.get("poll_delay")))
+        except (TypeError, ValueError):
+            timeout = 0
+        deadline = loop.time() + min(timeout, self.max_wait)
+        group_name = json_data.get("group_name")
+
+        blocking = json_data.get("request") in self.blocking_requests
+        while True:
+            before = self._snapshot(group_name)
+            self.conn = Response()
             self.dataReceived(json_data)
+            response = self.conn
+            if self._snapshot(group_name) != before:
+                # The group was updated: handle the pending requests again,
+                # including this one (like the last client of a lava_sync).
+                self._wakeup(group_name)
+                if blocking and response.waiting:
+                    continue
+            if not response.waiting:
+                return response.data
+            remaining = deadline - loop.time()
+            if not blocking or remaining <= 0:
+                return response.data
+            waiter = loop.create_future()
+            self.waiters.setdefault(group_name, []).append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                waiters = self.waiters.get(group_name, [])
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    self.waiters.pop(group_name, None)
+                return response.data
+
+    def _snapshot(self, group_name):
+        return json.dumps(self.all_groups.get(group_name))
+
+    def _wakeup(self, group_name):
+        for waiter in self.waiters.pop(group_name, []):
+            if not waiter.done():
+                waiter.set_result(None)
 
     def _updateData(self, json_data):
         """
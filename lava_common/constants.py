@@ -43,11 +43,37 @@ HTTP_DOWNLOAD_TIMEOUT = 60
 # Size of the chunks when downloading over scp
 SCP_DOWNLOAD_CHUNK_SIZE = 32768
 
+# Size of the writes when saving the downloaded files and maximum size of
+# each chunk returned by the in-process decompressors
+DOWNLOAD_WRITE_SIZE = 1024 * 1024
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+# Number of buffers waiting to be decompressed or written
+DOWNLOAD_QUEUE_SIZE = 256
+
+# Maximum number of concurrent downloads when "parallel_downloads" is set
+PARALLEL_DOWNLOADS = 4
+
 # dispatcher temporary directory
 # This is distinct from the TFTP daemon directory
 # Files here are for download using the Apache /tmp alias.
 DISPATCHER_DOWNLOAD_DIR = "/var/lib/lava/dispatcher/tmp"
 
+# Cache of the downloaded files, shared by the jobs running on the worker.
+# The cache is disabled when the size limit (in bytes) is 0.
+DOWNLOAD_CACHE_DIR = "/var/lib/lava/dispatcher/cache"
+DOWNLOAD_CACHE_SIZE = 0
+
+# Bare mirrors of the git repositories, shared by the jobs running on the
+# worker. The cache is disabled when the size limit (in bytes) is 0. Mirrors
+# unused for GIT_CACHE_MAX_AGE seconds are removed.
+GIT_CACHE_DIR = "/var/lib/lava/dispatcher/git-cache"
+GIT_CACHE_SIZE = 0
+GIT_CACHE_MAX_AGE = 30 * 24 * 3600
+
+# Number of git repositories cloned at the same time
+GIT_PARALLEL_CLONES = 4
+
 # Distinctive prompt characters which can
 # help distinguish status messages from shell prompts.
 DISTINCTIVE_PROMPT_CHARACTERS = "\\:"
@@ -55,6 +81,9 @@ DISTINCTIVE_PROMPT_CHARACTERS = "\\:"
 # LAVA Coordinator setup and finalize timeout
 LAVA_MULTINODE_SYSTEM_TIMEOUT = 90
 
+# Maximum duration of a blocking request to the LAVA Coordinator
+LAVA_MULTINODE_WAIT_TIMEOUT = 60
+
 # Default Action timeout
 ACTION_TIMEOUT = 30
 
@@ -134,6 +163,10 @@ LINE_SEPARATOR = "\n"
 # other newline separators
 UEFI_LINE_SEPARATOR = "\r\n"
 
+# Number of characters, before the new data, searched again by pexpect.
+# Matches longer than that can be missed.
+SPAWN_SEARCH_OVERLAP = 16384
+
 # valid characters in components of a test definition name
 # excludes whitespace and punctuation (except hyphen and underscore)
 DEFAULT_TESTDEF_NAME_CLASS = r"^[\w\d\_\-]+$"
@@ -19,21 +19,102 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import contextlib
 import datetime
 import logging
 import multiprocessing
+import re
 import requests
 import signal
+import threading
 import time
 
 from lava_common.compat import yaml_dump
 from lava_common.version import __version__
 
 
+# Characters that can be written as-is in a double quoted YAML scalar
+NO_ESCAPE_PATTERN = re.compile(r"[\x20\x21\x23-\x5b\x5d-\x7e]*")
+
+
+class YAMLEscapes(dict):
+    """
+    Translation table escaping a string like the YAML emitter (without
+    allow_unicode) does for double quoted scalars. Each character is computed
+    once and cached.
+    """
+
+    NAMED = {
+        "\0": "0",
+        "\x07": "a",
+        "\x08": "b",
+        "\x09": "t",
+        "\x0a": "n",
+        "\x0b": "v",
+        "\x0c": "f",
+        "\x0d": "r",
+        "\x1b": "e",
+        '"': '"',
+        "\\": "\\",
+        "\x85": "N",
+        "\xa0": "_",
+        "\u2028": "L",
+        "\u2029": "P",
+    }
+
+    def __missing__(self, key: int) -> str:
+        char = chr(key)
+        if char in self.NAMED:
+            value = "\\" + self.NAMED[char]
+        elif "\x20" <= char <= "\x7e":
+            value = char
+        elif "\ud800" <= char <= "\udfff":
+            # Surrogates cannot be encoded: let the YAML emitter raise
+            raise ValueError("Surrogate character")
+        elif key <= 0xFF:
+            value = "\\x%02X" % key
+        elif key <= 0xFFFF:
+            value = "\\u%04X" % key
+        else:
+            value = "\\U%08X" % key
+        self[key] = value
+        return value
+
+
+YAML_ESCAPES = YAMLEscapes()
+
+
+def dump_fast(data: Dict) -> Optional[str]:
+    """
+    Serialize a dictionary of strings, like the log records
+    ({"dt": ..., "lvl": ..., "msg": ...[, "ns": ...]}), without the YAML
+    emitter. The result is identical to the output of dump().
+    Return None when the data cannot be serialized this way.
+    """
+    if not data:
+        return None
+    items = []
+    for key in sorted(data):
+        value = data[key]
+        if type(key) is not str or type(value) is not str:
+            return None
+        if NO_ESCAPE_PATTERN.fullmatch(key) is None:
+            key = key.translate(YAML_ESCAPES)
+        if NO_ESCAPE_PATTERN.fullmatch(value) is None:
+            value = value.translate(YAML_ESCAPES)
+        items.append(f'"{key}": "{value}"')
+    return "{" + ", ".join(items) + "}"
+
+
 def dump(data: Dict) -> str:
+    # Log records are serialized without the (slow) YAML emitter
+    with contextlib.suppress(ValueError):
+        data_str = dump_fast(data)
+        if data_str is not None and len(data_str) < 10 ** 6:
+            return data_str
+
     # Set width to a really large value in order to always get one line.
     # But keep this reasonable because the logs will be loaded by CLoader
     # that is limited to around 10**7 chars
@@ -91,7 +172,8 @@ def sender(conn, url: str, token: str, max_time: int) -> None:
                 if data == b"":
                     leaving = True
                 else:
-                    records.append(data.decode("utf-8", errors="replace"))
+                    # The records are sent in batches, one record per line
+                    records.extend(data.decode("utf-8", errors="replace").split("\n"))
 
             records_limit = len(records) >= MAX_RECORDS
             time_limit = (time.time() - last_call) >= max_time
@@ -106,9 +188,16 @@ def sender(conn, url: str, token: str, max_time: int) -> None:
 
 
 class HTTPHandler(logging.Handler):
+    # Records are sent to the sender process in batches: when BATCH_SIZE
+    # records are pending or after BATCH_DELAY seconds.
+    BATCH_SIZE = 100
+    BATCH_DELAY = 0.1
+
     def __init__(self, url, token, interval):
         super().__init__()
         self.formatter = logging.Formatter("%(message)s")
+        self.records: List[bytes] = []
+        self.timer: Optional[threading.Timer] = None
         # Create the multiprocess sender
         (reader, writter) = multiprocessing.Pipe(duplex=False)
         self.writter = writter
@@ -127,9 +216,26 @@ class HTTPHandler(logging.Handler):
         # This can't happen as data is a dictionary dumped in yaml format
         if data == "":
             return
-        self.writter.send_bytes(data.encode("utf-8", errors="replace"))
+        self.records.append(data.encode("utf-8", errors="replace"))
+        if len(self.records) >= self.BATCH_SIZE:
+            self.flush()
+        elif self.timer is None:
+            self.timer = threading.Timer(self.BATCH_DELAY, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.records:
+                # The dumped records are always on one line
+                self.writter.send_bytes(b"\n".join(self.records))
+                self.records = []
 
     def close(self):
+        self.flush()
         super().close()
 
         # wait for the multiprocess
@@ -20,6 +20,7 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
+import functools
 import importlib
 
 from voluptuous import (
@@ -91,11 +92,21 @@ CONTEXT_VARIABLES = [
 ]
 
 
+@functools.lru_cache(maxsize=None)
+def action_schema(name, strict=True):
+    # Import the module and compile the schema only once
+    module = importlib.import_module("lava_common.schemas." + name)
+    return Schema(module.schema(), extra=not strict)
+
+
+@functools.lru_cache(maxsize=None)
+def job_schema(extra_context_variables=(), strict=True):
+    return Schema(job(list(extra_context_variables)), extra=not strict)
+
+
 def validate_action(name, index, data, strict=True):
-    # Import the module
     try:
-        module = importlib.import_module("lava_common.schemas." + name)
-        Schema(module.schema(), extra=not strict)(data)
+        action_schema(name, strict)(data)
     except ImportError:
         raise Invalid("unknown action type", path=["actions"] + name.split("."))
     except MultipleInvalid as exc:
@@ -104,8 +115,7 @@ def validate_action(name, index, data, strict=True):
 
 
 def validate(data, strict=True, extra_context_variables=[]):
-    schema = Schema(job(extra_context_variables), extra=not strict)
-    schema(data)
+    job_schema(tuple(extra_context_variables), strict)(data)
     for index, action in enumerate(data["actions"]):
         # The job schema does already check the we have only one key
         action_type = next(iter(action.keys()))
@@ -46,6 +46,7 @@ def url(extra=None):
             Required("format"): Any("cpio.newc", "ext4", "tar"),
             Optional("partition"): int,
             Optional("sparse"): bool,
+            Optional("append_overlay"): bool,
             Required("overlays"): {
                 Optional("lava"): bool,
                 str: {
@@ -59,4 +60,9 @@ def url(extra=None):
 
 
 def schema():
-    return {**action(), Optional("os"): str, Optional("authorize"): "ssh"}
+    return {
+        **action(),
+        Optional("os"): str,
+        Optional("authorize"): "ssh",
+        Optional("parallel_downloads"): bool,
+    }
@@ -41,6 +41,7 @@ def schema():
                 Optional("install_modules"): bool,
                 Optional("install_overlay"): bool,
                 Optional("header"): "u-boot",
+                Optional("append_overlay"): bool,
             }
         ),
         Exclusive("nfsrootfs", "nfs"): deploy.url(
@@ -36,8 +36,10 @@ from lava_dispatcher.utils.filesystem import (
 )
 from lava_dispatcher.utils.shell import which
 from lava_dispatcher.utils.compression import (
+    CpioNewc,
     compress_file,
     cpio,
+    cpio_append,
     create_tarfile,
     decompress_file,
     untar_file,
@@ -291,6 +293,8 @@ class ApplyOverlayTftp(Action):
         directory = None
         nfs_address = None
         overlay_file = None
+        # The overlay is appended to the ramdisk by CompressRamdisk
+        appended = False
         namespace = self.parameters.get("namespace")
         if self.parameters.get("nfsrootfs") is not None:
             if not self.parameters["nfsrootfs"].get("install_overlay", True):
@@ -349,7 +353,20 @@ class ApplyOverlayTftp(Action):
                 label="extracted_ramdisk",
                 key="directory",
             )
-            if overlay_file:
+            if overlay_file and self.parameters["ramdisk"].get("append_overlay"):
+                self.logger.info(
+                    "[%s] Overlay %s will be appended to the ramdisk",
+                    namespace,
+                    overlay_file,
+                )
+                self.set_namespace_data(
+                    action="compress-ramdisk",
+                    label="append",
+                    key="overlay",
+                    value=overlay_file,
+                )
+                appended = True
+            elif overlay_file:
                 self.logger.info(
                     "[%s] Applying overlay %s to ramdisk", namespace, overlay_file
                 )
@@ -383,7 +400,12 @@ class ApplyOverlayTftp(Action):
                 key="overlay",
                 value=os.path.join(suffix, "ramdisk", os.path.basename(overlay_file)),
             )
-        if overlay_file:
+        if overlay_file and not appended:
+            if not directory:
+                raise JobError(
+                    "Unable to find the directory to apply the overlay %s to"
+                    % overlay_file
+                )
             self.logger.debug(
                 "[%s] Applying overlay %s to directory %s",
                 namespace,
@@ -530,6 +552,16 @@ class ExtractModules(Action):
         if self.parameters.get("ramdisk"):
             if not self.parameters["ramdisk"].get("install_modules", True):
                 self.logger.info("Not adding modules to the ramdisk.")
+            elif self.parameters["ramdisk"].get("append_overlay"):
+                self.logger.info(
+                    "modules file %s will be appended to the ramdisk", modules
+                )
+                self.set_namespace_data(
+                    action="compress-ramdisk",
+                    label="append",
+                    key="modules",
+                    value=modules,
+                )
             else:
                 root = self.get_namespace_data(
                     action="extract-overlay-ramdisk",
@@ -548,6 +580,8 @@ class ExtractRamdisk(Action):
     applies the overlay and then leaves the ramdisk open
     for other actions to modify. Needs CompressRamdisk to
     recreate the ramdisk with modifications.
+    With append_overlay, the ramdisk is kept packed and
+    CompressRamdisk appends the modifications.
     """
 
     name = "extract-overlay-ramdisk"
@@ -606,6 +640,15 @@ class ExtractRamdisk(Action):
         else:
             # give the file a predictable name
             shutil.move(ramdisk, ramdisk_compressed_data)
+        if self.parameters["ramdisk"].get("append_overlay"):
+            self.logger.info("Not extracting ramdisk, the overlay will be appended.")
+            self.set_namespace_data(
+                action=self.name,
+                label="ramdisk_file",
+                key="file",
+                value=ramdisk_compressed_data,
+            )
+            return connection
         ramdisk_data = decompress_file(ramdisk_compressed_data, compression)
         uncpio(ramdisk_data, extracted_ramdisk)
 
@@ -672,40 +715,10 @@ class CompressRamdisk(Action):
         if self.skip:
             return connection
         connection = super().run(connection, max_end_time)
-        ramdisk_dir = self.get_namespace_data(
-            action="extract-overlay-ramdisk", label="extracted_ramdisk", key="directory"
-        )
-        ramdisk_data = self.get_namespace_data(
-            action="extract-overlay-ramdisk", label="ramdisk_file", key="file"
-        )
-        if not ramdisk_dir:
-            raise LAVABug("Unable to find unpacked ramdisk")
-        if not ramdisk_data:
-            raise LAVABug("Unable to find ramdisk directory")
-        if self.parameters.get("preseed"):
-            if self.parameters["deployment_data"].get("preseed_to_ramdisk"):
-                # download action must have completed to get this far
-                # some installers (centos) cannot fetch the preseed file via tftp.
-                # Instead, put the preseed file into the ramdisk using a given name
-                # from deployment_data which we can use in the boot commands.
-                filename = self.parameters["deployment_data"]["preseed_to_ramdisk"]
-                self.logger.info("Copying preseed file into ramdisk: %s", filename)
-                shutil.copy(
-                    self.get_namespace_data(
-                        action="download-action", label="preseed", key="file"
-                    ),
-                    os.path.join(ramdisk_dir, filename),
-                )
-                self.set_namespace_data(
-                    action=self.name, label="file", key="preseed_local", value=filename
-                )
-
-        self.logger.info("Building ramdisk %s containing %s", ramdisk_data, ramdisk_dir)
-        self.logger.debug(">> %s", cpio(ramdisk_dir, ramdisk_data))
-
-        # we need to compress the ramdisk with the same method is was submitted with
-        compression = self.parameters["ramdisk"].get("compression")
-        final_file = compress_file(ramdisk_data, compression)
+        if self.parameters["ramdisk"].get("append_overlay"):
+            final_file = self.append_overlay()
+        else:
+            final_file = self.repack()
 
         tftp_dir = os.path.dirname(
             self.get_namespace_data(
@@ -749,6 +762,82 @@ class CompressRamdisk(Action):
             )
         return connection
 
+    def preseed(self):
+        """
+        Return the preseed file to add to the ramdisk and its name
+        """
+        if not self.parameters.get("preseed"):
+            return (None, None)
+        if not self.parameters["deployment_data"].get("preseed_to_ramdisk"):
+            return (None, None)
+        # download action must have completed to get this far
+        # some installers (centos) cannot fetch the preseed file via tftp.
+        # Instead, put the preseed file into the ramdisk using a given name
+        # from deployment_data which we can use in the boot commands.
+        filename = self.parameters["deployment_data"]["preseed_to_ramdisk"]
+        self.logger.info("Copying preseed file into ramdisk: %s", filename)
+        self.set_namespace_data(
+            action=self.name, label="file", key="preseed_local", value=filename
+        )
+        preseed = self.get_namespace_data(
+            action="download-action", label="preseed", key="file"
+        )
+        return (preseed, filename)
+
+    def repack(self):
+        ramdisk_dir = self.get_namespace_data(
+            action="extract-overlay-ramdisk", label="extracted_ramdisk", key="directory"
+        )
+        ramdisk_data = self.get_namespace_data(
+            action="extract-overlay-ramdisk", label="ramdisk_file", key="file"
+        )
+        if not ramdisk_dir:
+            raise LAVABug("Unable to find unpacked ramdisk")
+        if not ramdisk_data:
+            raise LAVABug("Unable to find ramdisk directory")
+        (preseed, filename) = self.preseed()
+        if preseed:
+            shutil.copy(preseed, os.path.join(ramdisk_dir, filename))
+
+        self.logger.info("Building ramdisk %s containing %s", ramdisk_data, ramdisk_dir)
+        self.logger.debug(">> %s", cpio(ramdisk_dir, ramdisk_data))
+
+        # we need to compress the ramdisk with the same method is was submitted with
+        compression = self.parameters["ramdisk"].get("compression")
+        return compress_file(ramdisk_data, compression)
+
+    def append_overlay(self):
+        """
+        Build a cpio archive with the overlay, the modules and the preseed
+        file and append it to the original ramdisk.
+        """
+        ramdisk = self.get_namespace_data(
+            action="extract-overlay-ramdisk", label="ramdisk_file", key="file"
+        )
+        if not ramdisk:
+            raise LAVABug("Unable to find the ramdisk")
+        segment = os.path.join(self.mkdtemp(), "overlay.cpio")
+        with open(segment, "wb") as f_segment:
+            archive = CpioNewc(f_segment)
+            for key in ["modules", "overlay"]:
+                tarball = self.get_namespace_data(
+                    action=self.name, label="append", key=key
+                )
+                if tarball:
+                    self.logger.debug("* adding %s %r", key, tarball)
+                    archive.add_tar(tarball)
+            (preseed, filename) = self.preseed()
+            if preseed:
+                archive.add_file(preseed, archive.normalize("/", filename))
+            archive.close()
+
+        # The kernel accepts compressed segments
+        compression = self.parameters["ramdisk"].get("compression")
+        segment = compress_file(segment, compression)
+        self.logger.info("Appending %s to ramdisk %s", segment, ramdisk)
+        cpio_append(ramdisk, segment)
+        return ramdisk
+
 
 class ApplyLxcOverlay(Action):
 
@@ -896,6 +985,9 @@ class AppendOverlays(Action):
         if self.params.get("sparse") and self.params.get("format") != "ext4":
             raise JobError("sparse=True is only available for ext4 images")
 
+        if self.params.get("append_overlay") and self.params["format"] != "cpio.newc":
+            raise JobError("append_overlay=True is only available for cpio.newc images")
+
     def run(self, connection, max_end_time):
         connection = super().run(connection, max_end_time)
         if self.params["format"] == "cpio.newc":
@@ -972,7 +1064,58 @@ class AppendOverlays(Action):
             image = compress_file(image, compression)
 
     def update_cpio(self):
-        self._update(uncpio, cpio)
+        if self.params.get("append_overlay"):
+            self.append_cpio()
+        else:
+            self._update(uncpio, cpio)
+
+    def append_cpio(self):
+        image = self.get_namespace_data(
+            action="download-action", label=self.key, key="file"
+        )
+        compression = self.get_namespace_data(
+            action="download-action", label=self.key, key="compression"
+        )
+        decompressed = self.get_namespace_data(
+            action="download-action", label=self.key, key="decompressed"
+        )
+        self.logger.info("Modifying %r", image)
+        segment = os.path.join(self.mkdtemp(), "overlays.cpio")
+
+        self.logger.debug("Overlays:")
+        with open(segment, "wb") as f_segment:
+            archive = CpioNewc(f_segment)
+            for overlay in self.params["overlays"]:
+                label = "%s.%s" % (self.key, overlay)
+                if overlay == "lava":
+                    overlay_image = self.get_namespace_data(
+                        action="compress-overlay", label="output", key="file"
+                    )
+                    path = "/"
+                else:
+                    overlay_image = self.get_namespace_data(
+                        action="download-action", label=label, key="file"
+                    )
+                    path = self.params["overlays"][overlay]["path"]
+                if not overlay_image:
+                    self.logger.warning("- %s: <MISSING> to %r", label, path)
+                elif (
+                    overlay == "lava"
+                    or self.params["overlays"][overlay]["format"] == "tar"
+                ):
+                    self.logger.debug("- %s: %r to %r", label, overlay_image, path)
+                    archive.add_tar(overlay_image, path)
+                else:
+                    self.logger.debug("- %s: %r to %r", label, overlay_image, path)
+                    archive.add_file(overlay_image, archive.normalize("/", path))
+            archive.close()
+
+        # The kernel accepts compressed segments
+        if compression and not decompressed:
+            self.logger.debug("* compressing (%s)", compression)
+            segment = compress_file(segment, compression)
+        self.logger.debug("* appending %r", segment)
+        cpio_append(image, segment)
 
     def update_tar(self):
         self._update(untar_file, create_tarfile)
@@ -23,12 +23,15 @@
 # This class is used for all downloads, including images and individual files for tftp.
 # python2 only
 
+import concurrent.futures
 import contextlib
 import errno
 import math
 import os
 import pathlib
+import queue
 import shutil
+import threading
 import time
 import hashlib
 import requests
@@ -42,7 +45,8 @@ from lava_dispatcher.connections.serial import ConnectDevice
 from lava_common.exceptions import InfrastructureError, JobError, LAVABug
 from lava_dispatcher.action import Action, Pipeline
 from lava_dispatcher.logical import Deployment, RetryAction
-from lava_dispatcher.utils.compression import untar_file
+from lava_dispatcher.utils.cache import DownloadCache
+from lava_dispatcher.utils.compression import StreamDecompressor, untar_file
 from lava_dispatcher.utils.filesystem import (
     copy_to_lxc,
     lava_lxc_home,
@@ -50,9 +54,14 @@ from lava_dispatcher.utils.filesystem import (
 )
 from lava_dispatcher.utils.network import requests_retry
 from lava_common.constants import (
+    DOWNLOAD_CACHE_DIR,
+    DOWNLOAD_CACHE_SIZE,
+    DOWNLOAD_QUEUE_SIZE,
+    DOWNLOAD_WRITE_SIZE,
     FILE_DOWNLOAD_CHUNK_SIZE,
     HTTP_DOWNLOAD_CHUNK_SIZE,
     HTTP_DOWNLOAD_TIMEOUT,
+    PARALLEL_DOWNLOADS,
     SCP_DOWNLOAD_CHUNK_SIZE,
 )
 from lava_dispatcher.actions.boot.fastboot import EnterFastbootAction
@@ -78,6 +87,7 @@ class DownloaderAction(RetryAction):
         self.path = path  # where to download
         self.uniquify = uniquify
         self.params = params
+        self.prefetched = False
 
     def populate(self, parameters):
         self.pipeline = Pipeline(parent=self, job=self.job, parameters=parameters)
@@ -122,6 +132,74 @@ class DownloaderAction(RetryAction):
         if overlays:
             self.pipeline.add_action(AppendOverlays(self.key, params=self.params))
 
+    def cleanup(self, connection):
+        self.prefetched = False
+        super().cleanup(connection)
+
+    def run(self, connection, max_end_time):
+        if self.parameters.get("parallel_downloads") and not self.prefetched:
+            self.prefetch()
+        return super().run(connection, max_end_time)
+
+    def prefetch(self):
+        """
+        Download the images of this action and of the following download
+        actions of the same pipeline in parallel.
+        Only the downloads are done here: every action will then use the
+        downloaded file and do the rest of the work (namespace data,
+        archives, ...) in the pipeline order.
+        """
+        handlers = []
+
+        def collect(action):
+            if isinstance(action, DownloaderAction):
+                action.prefetched = True
+                for sub_action in action.pipeline.actions:
+                    collect(sub_action)
+            elif isinstance(action, DownloadHandler):
+                handlers.append(action)
+
+        # Find the pipeline of this action
+        pipeline = self.job.pipeline
+        for index in self.level.split(".")[:-1]:
+            pipeline = pipeline.actions[int(index) - 1].pipeline
+        for action in pipeline.actions[pipeline.actions.index(self) :]:
+            collect(action)
+        if len(handlers) < 2:
+            return
+
+        self.logger.info("Downloading %d images in parallel", len(handlers))
+        abort = threading.Event()
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(len(handlers), PARALLEL_DOWNLOADS)
+        ) as executor:
+            futures = [executor.submit(h.prefetch, abort) for h in handlers]
+            try:
+                concurrent.futures.wait(futures)
+            except BaseException:
+                # Stop the downloads when the action times out
+                abort.set()
+                raise
+
+
+class PrefixLogger:
+    """
+    Prefix the messages of the logger, to identify the messages of each
+    download when downloading in parallel.
+    """
+
+    def __init__(self, logger, prefix):
+        self.logger = logger
+        self.prefix = prefix
+
+    def __getattr__(self, name):
+        method = getattr(self.logger, name)
+
+        def log(message, *args, **kwargs):
+            return method(self.prefix + str(message), *args, **kwargs)
+
+        return log
+
 
 class DownloadHandler(Action):
     """
@@ -159,6 +237,9 @@ class DownloadHandler(Action):
             self.path = os.path.join(path, key)
         self.fname = None
         self.params = params
+        # Set by the parallel download stage
+        self.prefetched = None
+        self.abort = None
 
     def reader(self):
         raise LAVABug("'reader' function unimplemented")
@@ -170,6 +251,7 @@ class DownloadHandler(Action):
         self.set_namespace_data(
             action="download-action", label=self.key, key="file", value=""
         )
+        self.prefetched = None
         super().cleanup(connection)
 
     def _compression(self):
@@ -257,7 +339,49 @@ class DownloadHandler(Action):
         self.results = {"fail": {algorithm: expected, "download": actual}}
         raise JobError("%s for '%s' does not match." % (algorithm, self.url.geturl()))
 
-    def run(self, connection, max_end_time):
+    def cache_key(self, decompress_command):
+        """
+        Key of the resource in the download cache, or None when the resource
+        cannot be cached: the content should be identified by the declared
+        checksums or by the validators returned by the server.
+        """
+        checksums = {
+            key: self.params[key]
+            for key in ["md5sum", "sha256sum", "sha512sum"]
+            if self.params.get(key)
+        }
+        validators = self.cache_validators()
+        if not checksums and not validators:
+            return None
+        return DownloadCache.key(
+            url=self.params["url"],
+            headers=self.params.get("headers"),
+            decompress=decompress_command,
+            validators=validators,
+            **checksums,
+        )
+
+    def cache_validators(self):
+        return {}
+
+    def _cache(self):
+        dispatcher = self.job.parameters.get("dispatcher", {})
+        size = dispatcher.get("download_cache_size", DOWNLOAD_CACHE_SIZE)
+        if not size:
+            return None
+        return DownloadCache(
+            dispatcher.get("download_cache_dir", DOWNLOAD_CACHE_DIR), size
+        )
+
+    def _download(self, decompress_command):
+        """
+        Download the resource into self.fname and return the downloaded size
+        and the requested checksums of the downloaded data.
+
+        The resource is read and hashed in a separate thread while the
+        current thread decompresses and writes the data.
+        """
+
         def progress_unknown_total(downloaded_sz, last_val):
             """ Compute progress when the size is unknown """
             condition = downloaded_sz >= last_val + 25 * 1024 * 1024
@@ -281,11 +405,252 @@ class DownloadHandler(Action):
                 else "",
             )
 
-        connection = super().run(connection, max_end_time)
         # self.cookies = self.job.context.config.lava_cookies  # FIXME: work out how to restore
-        md5 = hashlib.md5()  # nosec - not being used for cryptography.
-        sha256 = hashlib.sha256()
-        sha512 = hashlib.sha512()
+        # Only compute the checksums requested by the job.
+        # md5 is not used for cryptography.
+        hashes = {
+            algorithm: hashlib.new(algorithm)  # nosec
+            for algorithm in ["md5", "sha256", "sha512"]
+            if self.params.get(algorithm + "sum")
+        }
+
+        downloaded_size = 0
+        beginning = time.time()
+        # Choose the progress bar (is the size known?)
+        if self.size <= 0:
+            self.logger.debug("total size: unknown")
+            last_value = -25 * 1024 * 1024
+            progress = progress_unknown_total
+        else:
+            self.logger.debug(
+                "total size: %d (%dMB)", self.size, int(self.size / (1024 * 1024))
+            )
+            last_value = -5
+            progress = progress_known_total
+
+        buffers = queue.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+        stop = threading.Event()
+
+        def read():
+            nonlocal downloaded_size, last_value
+            reader = self.reader()
+            try:
+                for buff in reader:
+                    if self.abort is not None and self.abort.is_set():
+                        raise InfrastructureError("Download of '%s' aborted" % self.key)
+                    downloaded_size += len(buff)
+                    (printing, new_value, msg) = progress(downloaded_size, last_value)
+                    if printing:
+                        last_value = new_value
+                        self.logger.debug(msg)
+                    for h in hashes.values():
+                        h.update(buff)
+                    if not put(buff):
+                        return
+                put(None)
+            except Exception as exc:
+                put(exc)
+            finally:
+                # Readers are usually generators: close them right away
+                close = getattr(reader, "close", None)
+                if close is not None:
+                    close()
+
+        def put(item):
+            # Stop when the writer has failed
+            while not stop.is_set():
+                with contextlib.suppress(queue.Full):
+                    buffers.put(item, timeout=1)
+                    return True
+            return False
+
+        def get():
+            while True:
+                item = buffers.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+
+        thread = threading.Thread(target=read, name="download-%s" % self.key)
+        thread.daemon = True
+        thread.start()
+        try:
+            if self._compression() in StreamDecompressor.factories:
+                self._write_decompressed(get(), self._compression())
+            elif decompress_command:
+                self._write_piped(get(), decompress_command)
+            else:
+                self._write(get())
+        finally:
+            stop.set()
+        thread.join()
+
+        # Log the download speed
+        ending = time.time()
+        self.logger.info(
+            "%dMB downloaded in %0.2fs (%0.2fMB/s)",
+            downloaded_size / (1024 * 1024),
+            round(ending - beginning, 2),
+            round(downloaded_size / (1024 * 1024 * (ending - beginning)), 2),
+        )
+
+        # If the remote server uses "Content-Encoding: gzip", this calculation will be wrong
+        # because requests will decompress the file on the fly, creating a larger file than
+        # LAVA expects.
+        if self.size > 0 and self.size != downloaded_size:
+            raise InfrastructureError(
+                "Download finished (%i bytes) but was not expected size (%i bytes), check your networking."
+                % (downloaded_size, self.size)
+            )
+
+        checksums = {algo: h.hexdigest() for (algo, h) in hashes.items()}
+        for (algorithm, checksum) in checksums.items():
+            self._check_checksum(
+                algorithm, checksum, self.params.get(algorithm + "sum")
+            )
+        return (downloaded_size, checksums)
+
+    def _write(self, buffers):
+        """
+        Write the buffers in self.fname, using large and aligned writes
+        """
+        try:
+            with open(self.fname, "wb", buffering=0) as dwnld_file:
+                pending = bytearray()
+                for buff in buffers:
+                    pending += buff
+                    if len(pending) >= DOWNLOAD_WRITE_SIZE:
+                        size = len(pending) - len(pending) % DOWNLOAD_WRITE_SIZE
+                        dwnld_file.write(pending[:size])
+                        del pending[:size]
+                dwnld_file.write(pending)
+        except OSError as exc:
+            msg = "Unable to write %s: %s" % (self.fname, exc.strerror)
+            self.logger.error(msg)
+            raise InfrastructureError(msg)
+
+    def _write_decompressed(self, buffers, compression):
+        def decompress():
+            decompressor = StreamDecompressor(compression)
+            for buff in buffers:
+                yield from decompressor.decompress(buff)
+            yield decompressor.finish()
+
+        try:
+            self._write(decompress())
+        except JobError as exc:
+            self.logger.error(str(exc))
+            self.logger.error(
+                "Make sure the 'compression' is corresponding to the image file type."
+            )
+            raise
+
+    def _write_piped(self, buffers, decompress_command):
+        try:
+            with open(self.fname, "wb") as dwnld_file:
+                proc = subprocess.Popen(  # nosec - internal.
+                    [decompress_command],
+                    stdin=subprocess.PIPE,
+                    stdout=dwnld_file,
+                    stderr=subprocess.PIPE,
+                )
+        except OSError as exc:
+            msg = "Unable to open %s: %s" % (self.fname, exc.strerror)
+            self.logger.error(msg)
+            raise InfrastructureError(msg)
+
+        with proc.stdin as pipe:
+            for buff in buffers:
+                try:
+                    pipe.write(buff)
+                except BrokenPipeError as exc:
+                    error_message = (
+                        str(exc) + ": " + proc.stderr.read().decode("utf-8").strip()
+                    )
+                    self.logger.exception(error_message)
+                    msg = (
+                        "Make sure the 'compression' is corresponding "
+                        "to the image file type."
+                    )
+                    self.logger.error(msg)
+                    raise JobError(error_message)
+        if proc.wait() != 0:
+            error_message = "%s failed: %s" % (
+                decompress_command,
+                proc.stderr.read().decode("utf-8", errors="replace").strip(),
+            )
+            self.logger.error(error_message)
+            raise JobError(error_message)
+
+    def _cached_download(self, cache, key, decompress_command):
+        """
+        Use the download cache entry or download the resource and add it to
+        the cache.
+        """
+        with cache.lock(key):
+            entry = cache.get(key, self.fname)
+            if entry is not None:
+                self.logger.info("download cache hit (%s)", entry["method"])
+                self.results = {"cache": "hit"}
+                return (entry["size"], entry["checksums"])
+
+            self.logger.info("download cache miss")
+            self.results = {"cache": "miss"}
+            ret = self._download(decompress_command)
+            try:
+                cache.put(
+                    key,
+                    self.fname,
+                    {"url": self.params["url"], "size": ret[0], "checksums": ret[1]},
+                )
+            except OSError as exc:
+                self.logger.warning("Unable to add to the download cache: %s", exc)
+                return ret
+
+        try:
+            (count, size) = cache.evict()
+            self.logger.debug(
+                "download cache: %d entries (%dMB)", count, size / (1024 * 1024)
+            )
+        except OSError as exc:
+            self.logger.warning("Unable to clean the download cache: %s", exc)
+        return ret
+
+    def _decompress_command(self):
+        return self.decompress_command_map.get(self._compression())
+
+    def _fetch(self, decompress_command):
+        cache = self._cache()
+        key = None if cache is None else self.cache_key(decompress_command)
+        if key is None:
+            return self._download(decompress_command)
+        return self._cached_download(cache, key, decompress_command)
+
+    def prefetch(self, abort):
+        """
+        Download the resource ahead of run(), in a thread of the parallel
+        download stage. The errors are only logged: run() will then download
+        the resource again, with the usual retries and error reporting.
+        """
+        logger = self.logger
+        self.logger = PrefixLogger(logger, "%s: " % self.key)
+        self.abort = abort
+        try:
+            os.makedirs(self.path, 0o755, exist_ok=True)
+            if os.path.exists(self.fname):
+                os.remove(self.fname)
+            self.logger.info("downloading %s", self.params["url"])
+            self.prefetched = self._fetch(self._decompress_command())
+        except Exception as exc:
+            self.logger.warning("parallel download failed: %s", exc)
+        finally:
+            self.abort = None
+            self.logger = logger
+
+    def run(self, connection, max_end_time):
+        connection = super().run(connection, max_end_time)
 
         # Create a fresh directory if the old one has been removed by a previous cleanup
         # (when retrying inside a RetryAction)
@@ -308,112 +673,37 @@ class DownloadHandler(Action):
             value=bool(compression),
         )
 
-        md5sum = self.params.get("md5sum")
-        sha256sum = self.params.get("sha256sum")
-        sha512sum = self.params.get("sha512sum")
-
         if os.path.isdir(self.fname):
             raise JobError("Download '%s' is a directory, not a file" % self.fname)
-        if os.path.exists(self.fname):
-            os.remove(self.fname)
-
-        self.logger.info("downloading %s", self.params["url"])
-        self.logger.debug("saving as %s", self.fname)
 
-        downloaded_size = 0
-        beginning = time.time()
-        # Choose the progress bar (is the size known?)
-        if self.size <= 0:
-            self.logger.debug("total size: unknown")
-            last_value = -25 * 1024 * 1024
-            progress = progress_unknown_total
+        if self.prefetched is not None:
+            # Already downloaded by the parallel download stage
+            self.logger.info("%s already downloaded", self.params["url"])
+            (downloaded_size, checksums) = self.prefetched
+            self.prefetched = None
         else:
-            self.logger.debug(
-                "total size: %d (%dMB)", self.size, int(self.size / (1024 * 1024))
-            )
-            last_value = -5
-            progress = progress_known_total
+            if os.path.exists(self.fname):
+                os.remove(self.fname)
 
-        decompress_command = None
-        if compression:
-            if compression in self.decompress_command_map:
-                decompress_command = self.decompress_command_map[compression]
+            self.logger.info("downloading %s", self.params["url"])
+            self.logger.debug("saving as %s", self.fname)
+
+            decompress_command = self._decompress_command()
+            if compression in StreamDecompressor.factories:
+                self.logger.info("Decompressing %s while downloading", compression)
+            elif decompress_command:
                 self.logger.info(
                     "Using %s to decompress %s", decompress_command, compression
                 )
-            else:
+            elif compression:
                 self.logger.info(
                     "Compression %s specified but not decompressing during download",
                     compression,
                 )
-        elif not self.params.get("compression", False):
-            self.logger.debug("No compression specified")
-
-        def update_progress():
-            nonlocal downloaded_size, last_value, md5, sha256, sha512
-            downloaded_size += len(buff)
-            (printing, new_value, msg) = progress(downloaded_size, last_value)
-            if printing:
-                last_value = new_value
-                self.logger.debug(msg)
-            md5.update(buff)
-            sha256.update(buff)
-            sha512.update(buff)
-
-        if compression and decompress_command:
-            try:
-                with open(self.fname, "wb") as dwnld_file:
-                    proc = subprocess.Popen(  # nosec - internal.
-                        [decompress_command],
-                        stdin=subprocess.PIPE,
-                        stdout=dwnld_file,
-                        stderr=subprocess.PIPE,
-                    )
-            except OSError as exc:
-                msg = "Unable to open %s: %s" % (self.fname, exc.strerror)
-                self.logger.error(msg)
-                raise InfrastructureError(msg)
-
-            with proc.stdin as pipe:
-                for buff in self.reader():
-                    update_progress()
-                    try:
-                        pipe.write(buff)
-                    except BrokenPipeError as exc:
-                        error_message = (
-                            str(exc) + ": " + proc.stderr.read().decode("utf-8").strip()
-                        )
-                        self.logger.exception(error_message)
-                        msg = (
-                            "Make sure the 'compression' is corresponding "
-                            "to the image file type."
-                        )
-                        self.logger.error(msg)
-                        raise JobError(error_message)
-            proc.wait()
-        else:
-            with open(self.fname, "wb") as dwnld_file:
-                for buff in self.reader():
-                    update_progress()
-                    dwnld_file.write(buff)
-
-        # Log the download speed
-        ending = time.time()
-        self.logger.info(
-            "%dMB downloaded in %0.2fs (%0.2fMB/s)",
-            downloaded_size / (1024 * 1024),
-            round(ending - beginning, 2),
-            round(downloaded_size / (1024 * 1024 * (ending - beginning)), 2),
-        )
+            elif not self.params.get("compression", False):
+                self.logger.debug("No compression specified")
 
-        # If the remote server uses "Content-Encoding: gzip", this calculation will be wrong
-        # because requests will decompress the file on the fly, creating a larger file than
-        # LAVA expects.
-        if self.size > 0 and self.size != downloaded_size:
-            raise InfrastructureError(
-                "Download finished (%i bytes) but was not expected size (%i bytes), check your networking."
-                % (downloaded_size, self.size)
-            )
+            (downloaded_size, checksums) = self._fetch(decompress_command)
 
         # set the dynamic data into the context
         self.set_namespace_data(
@@ -422,21 +712,10 @@ class DownloadHandler(Action):
         self.set_namespace_data(
             action="download-action", label="file", key=self.key, value=self.fname
         )
-        self.set_namespace_data(
-            action="download-action", label=self.key, key="md5", value=md5.hexdigest()
-        )
-        self.set_namespace_data(
-            action="download-action",
-            label=self.key,
-            key="sha256",
-            value=sha256.hexdigest(),
-        )
-        self.set_namespace_data(
-            action="download-action",
-            label=self.key,
-            key="sha512",
-            value=sha512.hexdigest(),
-        )
+        for (algorithm, checksum) in checksums.items():
+            self.set_namespace_data(
+                action="download-action", label=self.key, key=algorithm, value=checksum
+            )
 
         # handle archive files
         archive = self.params.get("archive")
@@ -460,10 +739,6 @@ class DownloadHandler(Action):
                 value=target_fname_path,
             )
 
-        self._check_checksum("md5", md5.hexdigest(), md5sum)
-        self._check_checksum("sha256", sha256.hexdigest(), sha256sum)
-        self._check_checksum("sha512", sha512.hexdigest(), sha512sum)
-
         # certain deployments need prefixes set
         if self.parameters["to"] == "tftp" or self.parameters["to"] == "nbd":
             suffix = self.get_namespace_data(
@@ -493,24 +768,9 @@ class DownloadHandler(Action):
         if "lava-xnbd" in self.parameters and nbdroot:
             self.parameters["lava-xnbd"]["nbdroot"] = nbdroot
 
+        self.results = {"label": self.key, "size": downloaded_size}
         self.results = {
-            "label": self.key,
-            "size": downloaded_size,
-            "md5sum": str(
-                self.get_namespace_data(
-                    action="download-action", label=self.key, key="md5"
-                )
-            ),
-            "sha256sum": str(
-                self.get_namespace_data(
-                    action="download-action", label=self.key, key="sha256"
-                )
-            ),
-            "sha512sum": str(
-                self.get_namespace_data(
-                    action="download-action", label=self.key, key="sha512"
-                )
-            ),
+            algorithm + "sum": checksum for (algorithm, checksum) in checksums.items()
         }
         return connection
 
@@ -524,6 +784,10 @@ class FileDownloadAction(DownloadHandler):
     description = "copy a local file"
     summary = "local file copy"
 
+    def cache_key(self, decompress_command):
+        # Local files are not worth caching
+        return None
+
     def validate(self):
         super().validate()
         try:
@@ -556,6 +820,13 @@ class HttpDownloadAction(DownloadHandler):
     description = "use http to download the file"
     summary = "http download"
 
+    def __init__(self, key, path, url, uniquify=True, params=None):
+        super().__init__(key, path, url, uniquify=uniquify, params=params)
+        self.validators = {}
+
+    def cache_validators(self):
+        return self.validators
+
     def validate(self):
         super().validate()
         res = None
@@ -603,6 +874,12 @@ class HttpDownloadAction(DownloadHandler):
                     return
 
             self.size = int(res.headers.get("content-length", -1))
+            # Identify the version of the resource for the download cache
+            self.validators = {
+                key: res.headers[key]
+                for key in ["etag", "last-modified"]
+                if res.headers.get(key)
+            }
         except requests.Timeout:
             self.logger.error("Request timed out")
             self.errors = "'%s' timed out" % (self.url.geturl())
@@ -25,13 +25,24 @@ import base64
 import hashlib
 import tarfile
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from lava_common.compat import yaml_safe_dump, yaml_safe_load
 from lava_common.decorators import nottest
 from lava_common.exceptions import InfrastructureError, JobError, LAVABug, TestError
 from lava_dispatcher.action import Action, Pipeline
+from lava_dispatcher.utils.cache import GitCache
 from lava_dispatcher.utils.vcs import GitHelper
-from lava_common.constants import DEFAULT_TESTDEF_NAME_CLASS, DISPATCHER_DOWNLOAD_DIR
+from lava_common.constants import (
+    DEFAULT_TESTDEF_NAME_CLASS,
+    DISPATCHER_DOWNLOAD_DIR,
+    GIT_CACHE_DIR,
+    GIT_CACHE_MAX_AGE,
+    GIT_CACHE_SIZE,
+    GIT_PARALLEL_CLONES,
+)
 from lava_dispatcher.utils.compression import untar_file
 
 
@@ -72,6 +83,21 @@ def get_test_action_namespaces(parameters=None):
     return test_namespaces
 
 
+def git_cache(parameters):
+    """
+    Return the git cache configured for this dispatcher, if any.
+    """
+    dispatcher = parameters.get("dispatcher", {})
+    size = dispatcher.get("git_cache_size", GIT_CACHE_SIZE)
+    if not size:
+        return None
+    return GitCache(
+        dispatcher.get("git_cache_dir", GIT_CACHE_DIR),
+        size,
+        dispatcher.get("git_cache_max_age", GIT_CACHE_MAX_AGE),
+    )
+
+
 # pylint:disable=too-many-public-methods,too-many-instance-attributes,too-many-locals,too-many-branches
 
 
@@ -169,17 +195,11 @@ class RepoAction(Action):
         # the location written into the lava-test-runner.conf (needs a line ending)
         self.runner = "%s\n" % runner_path
 
-        overlay_base = self.get_namespace_data(
-            action="test", label="test-definition", key="overlay_dir"
-        )
-        overlay_path = os.path.join(
-            overlay_base, str(self.stage), "tests", args["test_name"]
-        )
         self.set_namespace_data(
             action="uuid",
             label="overlay_path",
             key=args["test_name"],
-            value=overlay_path,
+            value=self.overlay_path(),
         )
         self.set_namespace_data(
             action="test",
@@ -198,6 +218,17 @@ class RepoAction(Action):
 
         return connection
 
+    def overlay_path(self):
+        """
+        Location of the test definition in the overlay, before boot
+        """
+        overlay_base = self.get_namespace_data(
+            action="test", label="test-definition", key="overlay_dir"
+        )
+        return os.path.join(
+            overlay_base, str(self.stage), "tests", self.parameters["test_name"]
+        )
+
     def store_testdef(self, testdef, vcs_name, commit_id=None):
         """
         Allows subclasses to pass in the parsed testdef after the repository has been obtained
@@ -248,6 +279,10 @@ class GitRepoAction(RepoAction):
     description = "apply git repository of tests to the test image"
     summary = "clone git test repo"
 
+    def __init__(self):
+        super().__init__()
+        self.prefetched = None
+
     def validate(self):
         if "repository" not in self.parameters:
             self.errors = "Git repository not specified in job definition"
@@ -255,7 +290,9 @@ class GitRepoAction(RepoAction):
             self.errors = "Path to YAML file not specified in the job definition"
         if not self.valid:
             return
-        self.vcs = GitHelper(self.parameters["repository"])
+        self.vcs = GitHelper(
+            self.parameters["repository"], cache=git_cache(self.job.parameters)
+        )
         super().validate()
 
     @classmethod
@@ -277,6 +314,39 @@ class GitRepoAction(RepoAction):
             action="uuid", label="overlay_path", key=self.parameters["test_name"]
         )
 
+        if self.prefetched is not None:
+            commit_id = self.prefetched
+            self.prefetched = None
+        else:
+            self.logger.info("Fetching tests from %s", self.parameters["repository"])
+            commit_id = self.fetch(runner_path)
+        self.results = {
+            "commit": commit_id,
+            "repository": self.parameters["repository"],
+            "path": self.parameters["path"],
+        }
+
+        # now read the YAML to create a testdef dict to retrieve metadata
+        yaml_file = os.path.join(runner_path, self.parameters["path"])
+        self.logger.debug("Tests stored (tmp) in %s", yaml_file)
+        try:
+            with open(yaml_file, "r") as test_file:
+                testdef = yaml_safe_load(test_file)
+        except OSError as exc:
+            raise JobError(
+                "Unable to open test definition '%s': %s"
+                % (self.parameters["path"], str(exc))
+            )
+
+        # set testdef metadata in base class
+        self.store_testdef(testdef, "git", commit_id)
+
+        return connection
+
+    def fetch(self, runner_path):
+        """
+        Clone the repository into runner_path and return the commit id
+        """
         if os.path.exists(runner_path) and os.listdir(runner_path) == []:
             raise LAVABug(
                 "Directory already exists and is not empty - duplicate Action?"
@@ -286,8 +356,6 @@ class GitRepoAction(RepoAction):
         if os.path.exists(runner_path):
             shutil.rmtree(runner_path)
 
-        self.logger.info("Fetching tests from %s", self.parameters["repository"])
-
         # Get the branch if specified.
         branch = self.parameters.get("branch")
 
@@ -310,28 +378,28 @@ class GitRepoAction(RepoAction):
                 "Unable to get test definition from %s (%s)"
                 % (self.vcs.binary, self.parameters)
             )
-        self.results = {
-            "commit": commit_id,
-            "repository": self.parameters["repository"],
-            "path": self.parameters["path"],
-        }
+        return commit_id
 
-        # now read the YAML to create a testdef dict to retrieve metadata
-        yaml_file = os.path.join(runner_path, self.parameters["path"])
-        self.logger.debug("Tests stored (tmp) in %s", yaml_file)
+    def prefetch(self, max_end_time, abort):
+        """
+        Clone the repository before running the action, in a thread of the
+        parallel clone stage. The git commands are killed when the action
+        timeout (bounded by max_end_time) expires or when abort is set.
+        On failure, the repository will be cloned again by run().
+        """
+        self.prefetched = None
+        self.logger.info("Fetching tests from %s", self.parameters["repository"])
+        self.vcs.max_end_time = min(max_end_time, time.time() + self.timeout.duration)
+        self.vcs.abort = abort
         try:
-            with open(yaml_file, "r") as test_file:
-                testdef = yaml_safe_load(test_file)
-        except OSError as exc:
-            raise JobError(
-                "Unable to open test definition '%s': %s"
-                % (self.parameters["path"], str(exc))
+            self.prefetched = self.fetch(self.overlay_path())
+        except InfrastructureError as exc:
+            self.logger.warning(
+                "Unable to fetch %s: %s", self.parameters["repository"], str(exc)
             )
-
-        # set testdef metadata in base class
-        self.store_testdef(testdef, "git", commit_id)
-
-        return connection
+        finally:
+            self.vcs.max_end_time = None
+            self.vcs.abort = None
 
 
 class InlineRepoAction(RepoAction):
@@ -683,6 +751,7 @@ class TestDefinitionAction(Action):
             key="overlay_dir",
             value=overlay_base,
         )
+        self.prefetch(max_end_time)
 
         connection = super().run(connection, max_end_time)
 
@@ -702,6 +771,41 @@ class TestDefinitionAction(Action):
 
         return connection
 
+    def prefetch(self, max_end_time):
+        """
+        Clone the git repositories in parallel, before running the pipeline.
+        The test definitions from the same repository are cloned one after
+        the other to benefit from the git cache.
+        When the action times out, the clones are killed and not waited for.
+        """
+        repositories = {}
+        for handler in self.pipeline.actions:
+            if isinstance(handler, GitRepoAction):
+                handler.prefetched = None
+                repositories.setdefault(handler.parameters["repository"], [])
+                repositories[handler.parameters["repository"]].append(handler)
+        if len(repositories) < 2:
+            return
+
+        abort = threading.Event()
+
+        def prefetch(handlers):
+            for handler in handlers:
+                if abort.is_set():
+                    return
+                handler.prefetch(max_end_time, abort)
+
+        self.logger.info("Cloning %d repositories in parallel", len(repositories))
+        executor = ThreadPoolExecutor(max_workers=GIT_PARALLEL_CLONES)
+        try:
+            list(executor.map(prefetch, repositories.values()))
+        except BaseException:
+            # Kill the git commands when the action times out
+            abort.set()
+            raise
+        finally:
+            executor.shutdown(wait=False)
+
 
 @nottest
 class TestOverlayAction(Action):
@@ -900,7 +1004,9 @@ class TestInstallAction(TestOverlayAction):
                     ".git", "", len(repo) - 1
                 )  # drop .git from the end, if present
                 dest_path = os.path.join(runner_path, os.path.basename(subdir))
-                commit_id = GitHelper(repo).clone(dest_path)
+                commit_id = GitHelper(repo, cache=git_cache(self.job.parameters)).clone(
+                    dest_path
+                )
             elif isinstance(repo, dict):
                 # TODO: We use 'skip_by_default' to check if this
                 # specific repository should be skipped. The value
@@ -928,7 +1034,9 @@ class TestInstallAction(TestOverlayAction):
                         raise TestError(
                             "Cannot mix string and url forms for the same repository."
                         )
-                    commit_id = GitHelper(url).clone(dest_path, branch=branch)
+                    commit_id = GitHelper(
+                        url, cache=git_cache(self.job.parameters)
+                    ).clone(dest_path, branch=branch)
             else:
                 raise TestError("Unrecognised git-repos block.")
             if commit_id is None:
@@ -20,6 +20,7 @@
 
 from lava_dispatcher.utils.shell import which
 from lava_dispatcher.action import Action, JobError
+from lava_common.constants import SPAWN_SEARCH_OVERLAP
 from lava_dispatcher.shell import ShellCommand, ShellSession
 
 
@@ -70,6 +71,11 @@ class ConnectAdb(Action):
             self.timeout,
             logger=self.logger,
             window=self.job.device.get_constant("spawn_maxread"),
+            overlap=self.job.device.get_constant(
+                "spawn_search_overlap",
+                missing_ok=True,
+                missing_default=SPAWN_SEARCH_OVERLAP,
+            ),
         )
         if shell.exitstatus:
             raise JobError(
@@ -23,6 +23,7 @@ from lava_dispatcher.utils.shell import which
 from lava_dispatcher.logical import RetryAction
 from lava_dispatcher.action import Action, Pipeline
 from lava_common.exceptions import JobError, InfrastructureError
+from lava_common.constants import SPAWN_SEARCH_OVERLAP
 from lava_dispatcher.shell import ShellCommand, ShellSession
 
 
@@ -171,6 +172,11 @@ class ConnectDevice(Action):
             self.timeout,
             logger=self.logger,
             window=self.job.device.get_constant("spawn_maxread"),
+            overlap=self.job.device.get_constant(
+                "spawn_search_overlap",
+                missing_ok=True,
+                missing_default=SPAWN_SEARCH_OVERLAP,
+            ),
         )
         if shell.exitstatus:
             raise InfrastructureError(
@@ -26,6 +26,7 @@ import logging
 import traceback
 import os
 import socket
+import struct
 import time
 from lava_dispatcher.connection import Protocol
 from lava_common.timeout import Timeout
@@ -36,7 +37,10 @@ from lava_common.exceptions import (
     TestError,
     MultinodeProtocolTimeoutError,
 )
-from lava_common.constants import LAVA_MULTINODE_SYSTEM_TIMEOUT
+from lava_common.constants import (
+    LAVA_MULTINODE_SYSTEM_TIMEOUT,
+    LAVA_MULTINODE_WAIT_TIMEOUT,
+)
 
 
 class MultinodeProtocol(Protocol):
@@ -55,6 +59,11 @@ class MultinodeProtocol(Protocol):
         self.system_timeout = Timeout("system", LAVA_MULTINODE_SYSTEM_TIMEOUT)
         self.settings = None
         self.sock = None
+        # Persistent connection to the coordinator
+        self.connection = None
+        self.max_frame = None
+        self.request_id = 0
+        self.responses = {}
         self.base_message = None
         self.logger = logging.getLogger("dispatcher")
         self.delayed_start = False
@@ -93,6 +102,7 @@ class MultinodeProtocol(Protocol):
             "blocksize": 4 * 1024,
             "poll_delay": 1,
             "coordinator_hostname": "localhost",
+            "persistent": False,
         }
         self.logger = logging.getLogger("dispatcher")
         json_default = {}
@@ -112,6 +122,8 @@ class MultinodeProtocol(Protocol):
             settings["poll_delay"] = json_default["poll_delay"]
         if "coordinator_hostname" in json_default:
             settings["coordinator_hostname"] = json_default["coordinator_hostname"]
+        if "persistent" in json_default:
+            settings["persistent"] = bool(json_default["persistent"])
         return settings
 
     def _connect(self, delay):
@@ -173,6 +185,97 @@ class MultinodeProtocol(Protocol):
             return json.dumps({"response": "wait"})
         return response
 
+    def _open_persistent(self):
+        """
+        Negotiate a persistent connection with the coordinator: every
+        request of the job is then sent over this connection. Older
+        coordinators answer "nack" and each request uses a new connection.
+        """
+        message = json.dumps({"request": "persistent"}).encode("utf-8")
+        try:
+            sock = socket.create_connection(
+                (self.settings["coordinator_hostname"], self.settings["port"]),
+                timeout=self.system_timeout.duration,
+            )
+        except OSError as exc:
+            self.logger.warning("Unable to connect to the coordinator: %s", exc)
+            return
+        try:
+            sock.sendall(b"%08X" % len(message) + message)
+            header = self._recv_exactly(sock, 8)
+            reply = json.loads(
+                self._recv_exactly(sock, int(header, 16)).decode("utf-8")
+            )
+        except (OSError, ValueError) as exc:
+            self.logger.warning("Unable to negotiate a persistent connection: %s", exc)
+            sock.close()
+            return
+        if reply.get("response") != "ack":
+            self.logger.debug("Persistent connections not supported by the coordinator")
+            sock.close()
+            return
+        self.logger.debug("Using a persistent connection to the coordinator")
+        self.connection = sock
+        self.max_frame = reply["max_frame"]
+
+    def _close_persistent(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+            self.responses = {}
+
+    def _recv_exactly(self, sock, size):
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed by the coordinator")
+            data += chunk
+        return data
+
+    def _request_persistent(self, data):
+        """
+        Send the request over the persistent connection and return the
+        response. Each frame is the size of the message and the request id
+        (as big-endian 32bits integers) followed by the message.
+        """
+        self.request_id += 1
+        request_id = self.request_id
+        self.connection.sendall(struct.pack("!II", len(data), request_id) + data)
+        # Responses to other requests are kept for later
+        while request_id not in self.responses:
+            (size, response_id) = struct.unpack(
+                "!II", self._recv_exactly(self.connection, 8)
+            )
+            self.responses[response_id] = self._recv_exactly(self.connection, size)
+        return self.responses.pop(request_id).decode("utf-8")
+
+    def _poll_persistent(self, message, timeout):
+        data = message.encode("utf-8")
+        if len(data) > self.max_frame:
+            raise JobError("Message was too long to send!")
+        # The coordinator keeps the request pending for up to "wait_timeout"
+        # seconds: do not wait forever if the coordinator is gone.
+        self.connection.settimeout(
+            min(timeout, LAVA_MULTINODE_WAIT_TIMEOUT) + self.system_timeout.duration
+        )
+        start = time.monotonic()
+        while True:
+            response = self._request_persistent(data)
+            try:
+                json_data = json.loads(response)
+            except ValueError:
+                self.logger.debug("response starting '%s' was not JSON", response[:42])
+                self.finalise_protocol()
+                return response
+            # The coordinator only answers "wait" after waiting for
+            # "wait_timeout" seconds: send the request again straight away.
+            if json_data["response"] != "wait":
+                return response
+            if time.monotonic() - start > timeout:
+                self.finalise_protocol()
+                raise MultinodeProtocolTimeoutError("protocol %s timed out" % self.name)
+
     def poll(self, message, timeout=None):
         """
         Blocking, synchronous polling of the Coordinator on the configured port.
@@ -188,10 +291,27 @@ class MultinodeProtocol(Protocol):
             raise ConfigurationError(
                 "Invalid timeout duration type: %s %s" % (type(timeout), timeout)
             )
+        # Ask the coordinator to keep the request pending until it can be
+        # completed, instead of answering "wait" straight away. Older
+        # coordinators ignore this key.
+        data = json.loads(message)
+        data["wait_timeout"] = min(timeout, LAVA_MULTINODE_WAIT_TIMEOUT)
+        message = json.dumps(data)
+        if self.connection is not None:
+            try:
+                return self._poll_persistent(message, timeout)
+            except OSError as exc:
+                self.logger.warning(
+                    "Persistent connection to the coordinator lost (%s), "
+                    "using a new connection for each request",
+                    exc,
+                )
+                self._close_persistent()
         msg_len = len(message)
         if msg_len > 0xFFFE:
             raise JobError("Message was too long to send!")
         c_iter = 0
+        start = time.monotonic()
         response = None
         delay = self.settings["poll_delay"]
         self.logger.debug(
@@ -231,7 +351,7 @@ class MultinodeProtocol(Protocol):
             else:
                 time.sleep(delay)
             # apply the default timeout to each poll operation.
-            if c_iter > timeout:
+            if time.monotonic() - start > timeout:
                 self.finalise_protocol()
                 raise MultinodeProtocolTimeoutError("protocol %s timed out" % self.name)
         return response
@@ -271,6 +391,8 @@ class MultinodeProtocol(Protocol):
             "group_name": self.parameters["protocols"][self.name]["target_group"],
             "role": self.parameters["protocols"][self.name]["role"],
         }
+        if self.settings["persistent"]:
+            self._open_persistent()
         self.initialise_group()
         if self.delayed_start:
             # delayed start needs to pull the sync timeout from the job parameters.
@@ -345,6 +467,7 @@ class MultinodeProtocol(Protocol):
                 "group_size": self.parameters["protocols"][self.name]["group_size"],
             }
             self._send(fin_msg, True)
+        self._close_persistent()
         self.logger.debug("%s protocol finalised.", self.name)
 
     def _check_data(self, data):
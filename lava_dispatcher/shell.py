@@ -21,6 +21,7 @@
 import contextlib
 import logging
 import pexpect
+from pexpect.expect import Expecter, searcher_re
 import sre_constants
 import time
 from lava_dispatcher.action import Action
@@ -33,7 +34,7 @@ from lava_common.exceptions import (
 )
 from lava_common.timeout import Timeout
 from lava_dispatcher.connection import Connection
-from lava_common.constants import LINE_SEPARATOR
+from lava_common.constants import LINE_SEPARATOR, SPAWN_SEARCH_OVERLAP
 from lava_dispatcher.utils.strings import seconds_to_str
 
 
@@ -49,14 +50,12 @@ class ShellLogger:
         self.is_feedback = False
 
     def write(self, new_line):
-        replacements = {
-            "\n\n": "\n",  # double lines to single
-            "\r": "",
-            '"': '\\"',  # escape double quotes for YAML syntax
-            "\x1b": "",  # remove escape control characters
-        }
-        for key, value in replacements.items():
-            new_line = new_line.replace(key, value)
+        new_line = (
+            new_line.replace("\n\n", "\n")  # double lines to single
+            .replace("\r", "")
+            .replace('"', '\\"')  # escape double quotes for YAML syntax
+            .replace("\x1b", "")  # remove escape control characters
+        )
         lines = self.line + new_line
 
         # Print one full line at a time. A partial line is kept in memory.
@@ -81,6 +80,49 @@ class ShellLogger:
             self.write("\n")
 
 
+class ShellSearcher(searcher_re):
+    """
+    Regular expression searcher that only scans the new data and the last
+    "overlap" characters of the buffer instead of the whole buffer.
+
+    Matches that start more than "overlap" characters before the new data
+    can be missed.
+    """
+
+    def __init__(self, patterns, overlap, stats):
+        super().__init__(patterns)
+        self.overlap = overlap
+        self.stats = stats
+        # pexpect only keeps this number of characters of the buffer (on top
+        # of the new data) when nothing matches.
+        # The extra character is used as context so "^" and "\b" do not match
+        # at the beginning of the window.
+        self.longest_string = overlap + 1
+
+    def search(self, buffer, freshlen, searchwindowsize=None):
+        begin = time.monotonic()
+        searchstart = max(0, len(buffer) - freshlen - self.overlap)
+        first_match = None
+        best_index = -1
+        for index, pattern in self._searches:
+            match = pattern.search(buffer, searchstart)
+            if match is None:
+                continue
+            if first_match is None or match.start() < first_match.start():
+                first_match = match
+                best_index = index
+
+        self.stats["searches"] += 1
+        self.stats["scanned"] += len(buffer) - searchstart
+        self.stats["duration"] += time.monotonic() - begin
+        if first_match is None:
+            return -1
+        self.start = first_match.start()
+        self.end = first_match.end()
+        self.match = first_match
+        return best_index
+
+
 class ShellCommand(pexpect.spawn):
     """
     Run a command over a connection using pexpect instead of
@@ -95,7 +137,15 @@ class ShellCommand(pexpect.spawn):
     A ShellCommand is a raw_connection for a ShellConnection instance.
     """
 
-    def __init__(self, command, lava_timeout, logger=None, cwd=None, window=2000):
+    def __init__(
+        self,
+        command,
+        lava_timeout,
+        logger=None,
+        cwd=None,
+        window=2000,
+        overlap=SPAWN_SEARCH_OVERLAP,
+    ):
         if isinstance(window, str):
             # constants need to be stored as strings.
             try:
@@ -105,6 +155,14 @@ class ShellCommand(pexpect.spawn):
                     "ShellCommand was passed an invalid window size of %s bytes."
                     % window
                 )
+        if isinstance(overlap, str):
+            try:
+                overlap = int(overlap)
+            except ValueError:
+                raise LAVABug(
+                    "ShellCommand was passed an invalid search overlap of %s bytes."
+                    % overlap
+                )
         if not lava_timeout or not isinstance(lava_timeout, Timeout):
             raise LAVABug("ShellCommand needs a timeout set by the calling Action")
         if not logger:
@@ -116,13 +174,19 @@ class ShellCommand(pexpect.spawn):
             cwd=cwd,
             logfile=ShellLogger(logger),
             encoding="utf-8",
-            # Data before searchwindowsize point is preserved, but not searched.
-            searchwindowsize=None,  # pattern match the entire buffer
+            # Only the new data and the last "overlap" characters are
+            # searched, see ShellSearcher.
+            searchwindowsize=None,
             maxread=window,  # limit the size of the buffer. 1 to turn off buffering
             codec_errors="replace",
         )
         self.name = "ShellCommand"
         self.logger = logger
+        self.search_overlap = overlap
+        # Compiled pattern lists, by patterns
+        self.pattern_cache = {}
+        # Matching statistics for this session
+        self.search_stats = {"searches": 0, "scanned": 0, "duration": 0.0}
         # set a default newline character, but allow actions to override as necessary
         self.linesep = LINE_SEPARATOR
         self.lava_timeout = lava_timeout
@@ -164,6 +228,48 @@ class ShellCommand(pexpect.spawn):
             sent = super().send(string)
         return sent
 
+    def compile_pattern_list(self, patterns):
+        """
+        The pattern lists used by the actions are compiled only once.
+        """
+        if isinstance(patterns, list):
+            key = (tuple(patterns), self.ignorecase)
+        else:
+            key = (patterns, self.ignorecase)
+        try:
+            return self.pattern_cache[key]
+        except TypeError:
+            # Unhashable pattern
+            return super().compile_pattern_list(patterns)
+        except KeyError:
+            compiled = super().compile_pattern_list(patterns)
+            if len(self.pattern_cache) >= 256:
+                self.pattern_cache.clear()
+            self.pattern_cache[key] = compiled
+            return compiled
+
+    def expect_list(
+        self, pattern_list, timeout=-1, searchwindowsize=-1, async_=False, **kw
+    ):
+        if async_ or kw or searchwindowsize not in [-1, None]:
+            return super().expect_list(
+                pattern_list, timeout, searchwindowsize, async_, **kw
+            )
+        if timeout == -1:
+            timeout = self.timeout
+        searcher = ShellSearcher(pattern_list, self.search_overlap, self.search_stats)
+        return Expecter(self, searcher, None).expect_loop(timeout)
+
+    def close(self, force=True):
+        if not self.closed and self.search_stats["searches"]:
+            self.logger.debug(
+                "Console matching: %d searches, %d characters scanned in %.3fs",
+                self.search_stats["searches"],
+                self.search_stats["scanned"],
+                self.search_stats["duration"],
+            )
+        super().close(force)
+
     def expect(self, *args, **kw):
         """
         No point doing explicit logging here, the SignalDirector can help
@@ -0,0 +1,219 @@
+# Copyright (C) 2022 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import time
+
+# ioctl used to clone a file on filesystems with copy-on-write support
+# (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def link(src, dst):
+    """
+    Make dst a copy of src, as cheaply as possible: a reflink when the
+    filesystem supports it, otherwise a real copy.
+    Hard links are never used: the jobs modify their files in place (overlays,
+    ramdisks, ...) which would change the file of every other job sharing the
+    inode.
+    Return the method used.
+    """
+    try:
+        with open(src, "rb") as f_src:
+            with open(dst, "wb") as f_dst:
+                fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+        return "reflink"
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.unlink(dst)
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+class DownloadCache:
+    """
+    Cache of the downloaded files, shared by every lava-run on the worker.
+
+    Each entry is stored as <key> (the file) and <key>.json (the metadata).
+    The files are written under a temporary name and renamed when complete,
+    so readers only see complete entries. Each job gets its own copy (or
+    reflink) of the entry and can modify it.
+    The lock on <key>.lock is held while looking up and filling an entry:
+    concurrent jobs downloading the same resource will wait for the first one
+    and then use the cache. The lock files are never removed, otherwise two
+    processes could hold the lock of the same entry on different inodes.
+    The least recently used entries are removed when the cache is larger
+    than the size limit or when they were not used for max_age seconds.
+    """
+
+    def __init__(self, path, size, max_age=None):
+        self.path = pathlib.Path(path)
+        self.size = size
+        self.max_age = max_age
+
+    @classmethod
+    def key(cls, **kwargs):
+        data = json.dumps(kwargs, sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    @contextlib.contextmanager
+    def lock(self, key, blocking=True):
+        self.path.mkdir(mode=0o755, parents=True, exist_ok=True)
+        with open(str(self.path / (key + ".lock")), "w") as f_lock:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(f_lock.fileno(), flags)
+            yield
+
+    def get(self, key, dst):
+        """
+        Copy the entry to dst and return the metadata, or None when the entry
+        does not exist. Should be called with the entry lock held.
+        """
+        data = self.path / key
+        meta = self.path / (key + ".json")
+        try:
+            metadata = json.loads(meta.read_text(encoding="utf-8"))
+            st = data.stat()
+        except (OSError, ValueError):
+            return None
+
+        # The entry was modified or truncated: drop it
+        if st.st_size != metadata["st_size"] or st.st_mtime_ns != metadata["st_mtime"]:
+            self.remove(key)
+            return None
+
+        metadata["method"] = link(str(data), dst)
+        # Used for the LRU eviction
+        os.utime(str(meta))
+        return metadata
+
+    def put(self, key, src, metadata):
+        """
+        Add src to the cache. Should be called with the entry lock held.
+        """
+        data = self.path / key
+        meta = self.path / (key + ".json")
+        tmp = self.path / ("%s.%d.tmp" % (key, os.getpid()))
+        try:
+            link(src, str(tmp))
+            st = tmp.stat()
+            metadata = dict(metadata, st_size=st.st_size, st_mtime=st.st_mtime_ns)
+            tmp_meta = self.path / ("%s.json.%d.tmp" % (key, os.getpid()))
+            tmp_meta.write_text(json.dumps(metadata), encoding="utf-8")
+            tmp_meta.rename(meta)
+            tmp.rename(data)
+        finally:
+            with contextlib.suppress(OSError):
+                tmp.unlink()
+
+    def remove(self, key):
+        # Keep <key>.lock: the caller is holding the lock
+        for suffix in ["", ".json"]:
+            with contextlib.suppress(FileNotFoundError):
+                (self.path / (key + suffix)).unlink()
+
+    def entry_size(self, key):
+        return (self.path / key).stat().st_size
+
+    def entries(self):
+        """
+        Return the list of (key, size, last use), most recently used first.
+        The size is None for incomplete entries.
+        """
+        entries = []
+        for meta in self.path.glob("*.json"):
+            key = meta.name[: -len(".json")]
+            try:
+                last_use = meta.stat().st_mtime
+            except OSError:
+                continue
+            try:
+                entries.append((key, self.entry_size(key), last_use))
+            except OSError:
+                entries.append((key, None, last_use))
+        return sorted(entries, key=lambda e: e[2], reverse=True)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in the
+        size limit, and the entries older than max_age. Entries locked by
+        other processes are kept.
+        Return the number of entries and the size of the cache.
+        """
+        count = size = 0
+        oldest = time.time() - self.max_age if self.max_age else 0
+        with self.lock("cache"):
+            for (key, entry_size, last_use) in self.entries():
+                if (
+                    entry_size is not None
+                    and size + entry_size <= self.size
+                    and last_use >= oldest
+                ):
+                    count += 1
+                    size += entry_size
+                    continue
+                try:
+                    with self.lock(key, blocking=False):
+                        self.remove(key)
+                except BlockingIOError:
+                    if entry_size is not None:
+                        count += 1
+                        size += entry_size
+        return (count, size)
+
+
+class GitCache(DownloadCache):
+    """
+    Bare mirrors of the git repositories, shared by every lava-run on the
+    worker.
+
+    Each entry is stored as <key> (the mirror) and <key>.json (the metadata,
+    updated on each use). The lock on <key>.lock is held while updating the
+    mirror and cloning from it.
+    """
+
+    def mirror(self, key):
+        return self.path / key
+
+    def touch(self, key, metadata):
+        meta = self.path / (key + ".json")
+        tmp_meta = self.path / ("%s.json.%d.tmp" % (key, os.getpid()))
+        tmp_meta.write_text(json.dumps(metadata), encoding="utf-8")
+        tmp_meta.rename(meta)
+
+    def remove(self, key):
+        shutil.rmtree(str(self.path / key), ignore_errors=True)
+        with contextlib.suppress(FileNotFoundError):
+            (self.path / (key + ".json")).unlink()
+
+    def entry_size(self, key):
+        mirror = self.path / key
+        if not mirror.is_dir():
+            raise FileNotFoundError(str(mirror))
+        size = 0
+        for (root, _, files) in os.walk(str(mirror)):
+            for name in files:
+                with contextlib.suppress(OSError):
+                    size += os.lstat(os.path.join(root, name)).st_size
+        return size
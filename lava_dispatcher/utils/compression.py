@@ -24,10 +24,17 @@
 # android images: tar + xz,bz2,gz, or just gz,xz,bzip2
 # vexpress recovery images: any compression though usually zip
 
+import bz2
+import contextlib
+import lzma
 import os
+import shutil
+import stat
 import subprocess  # nosec - internal use.
 import tarfile
+import zlib
 
+from lava_common.constants import DECOMPRESS_CHUNK_SIZE
 from lava_common.exceptions import InfrastructureError, JobError
 
 from lava_dispatcher.utils.contextmanager import chdir
@@ -44,6 +51,71 @@ decompress_command_map = {
 }
 
 
+class StreamDecompressor:
+    """
+    Decompress a stream in-process, one buffer at a time.
+    Concatenated streams (as created by pigz or pixz) are supported and each
+    decompressed chunk is at most DECOMPRESS_CHUNK_SIZE bytes long.
+    """
+
+    factories = {
+        "bz2": bz2.BZ2Decompressor,
+        "gz": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+        "xz": lzma.LZMADecompressor,
+    }
+
+    def __init__(self, compression):
+        self.factory = self.factories[compression]
+        self.decompressor = self.factory()
+        self.started = False
+
+    def _decompress(self, data):
+        try:
+            return self.decompressor.decompress(data, DECOMPRESS_CHUNK_SIZE)
+        except (EOFError, OSError, lzma.LZMAError, zlib.error) as exc:
+            raise JobError("Unable to decompress: %s" % exc)
+
+    def decompress(self, data):
+        if self.decompressor.eof and data.strip(b"\0"):
+            # Beginning of a new stream
+            self.decompressor = self.factory()
+        elif self.decompressor.eof:
+            # Ignore trailing zeros, like gunzip
+            return
+        self.started = self.started or bool(data)
+
+        while True:
+            chunk = self._decompress(data)
+            if chunk:
+                yield chunk
+            if self.decompressor.eof:
+                data = self.decompressor.unused_data
+                if not data.strip(b"\0"):
+                    return
+                self.decompressor = self.factory()
+            elif hasattr(self.decompressor, "needs_input"):
+                # bz2 and lzma keep the remaining input
+                if self.decompressor.needs_input:
+                    return
+                data = b""
+            else:
+                # zlib returns the remaining input
+                data = self.decompressor.unconsumed_tail
+                if not data:
+                    return
+
+    def finish(self):
+        """
+        Return the remaining decompressed data
+        """
+        data = b""
+        if not hasattr(self.decompressor, "needs_input"):
+            data = self.decompressor.flush()
+        if self.started and not self.decompressor.eof:
+            raise JobError("Unable to decompress: truncated input")
+        return data
+
+
 def compress_file(infile, compression):
     if not compression:
         return infile
@@ -145,3 +217,145 @@ def uncpio(filename, directory):
             raise InfrastructureError(
                 "Unable to extract cpio archive %r: %s" % (filename, exc)
             )
+
+
+class CpioNewc:
+    """
+    Write a newc cpio archive, the format of the Linux initramfs, without
+    calling cpio.
+    The kernel accepts a ramdisk made of several (optionally compressed)
+    archives: this is used to append files to a ramdisk without unpacking it.
+    Missing parent directories are added with mode 0755.
+    """
+
+    MAGIC = b"070701"
+    TRAILER = "TRAILER!!!"
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.offset = 0
+        self.ino = 0
+        self.dirs = set()
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def _pad(self):
+        self._write(b"\0" * (-self.offset % 4))
+
+    def _header(self, name, mode, size=0, mtime=0, uid=0, gid=0, nlink=1, rdev=(0, 0)):
+        self.ino += 1
+        name = name.encode("utf-8") + b"\0"
+        fields = [self.ino, mode, uid, gid, nlink, int(mtime), size, 0, 0]
+        fields.extend([rdev[0], rdev[1], len(name), 0])
+        self._write(self.MAGIC + b"".join(b"%08x" % field for field in fields))
+        self._write(name)
+        self._pad()
+
+    def _parents(self, name):
+        parent = os.path.dirname(name)
+        if parent and parent not in self.dirs:
+            self._parents(parent)
+            self.dirs.add(parent)
+            self._header(parent, stat.S_IFDIR | 0o755, nlink=2)
+
+    @classmethod
+    def normalize(cls, path, name):
+        """
+        Return the name of the entry, relative to the root of the ramdisk
+        """
+        name = os.path.normpath(os.path.join("/", path, name)).lstrip("/")
+        return "" if name == "." else name
+
+    def add(self, name, mode, data=b"", **kwargs):
+        self._parents(name)
+        if stat.S_ISDIR(mode):
+            self.dirs.add(name)
+            kwargs.setdefault("nlink", 2)
+        self._header(name, mode, size=len(data), **kwargs)
+        self._write(data)
+        self._pad()
+
+    def add_fileobj(self, name, mode, fileobj, size, **kwargs):
+        self._parents(name)
+        self._header(name, mode, size=size, **kwargs)
+        while True:
+            data = fileobj.read(DECOMPRESS_CHUNK_SIZE)
+            if not data:
+                break
+            self._write(data)
+        self._pad()
+
+    def add_file(self, filename, name):
+        try:
+            st = os.stat(filename)
+            with open(filename, "rb") as f_in:
+                self.add_fileobj(name, st.st_mode, f_in, st.st_size, mtime=st.st_mtime)
+        except OSError as exc:
+            raise InfrastructureError("Unable to add %s: %s" % (filename, str(exc)))
+
+    def add_tar(self, filename, path="/"):
+        """
+        Add the content of the tarball, relative to path
+        """
+        try:
+            with tarfile.open(filename, encoding="utf-8") as tar:
+                for member in tar:
+                    self._add_member(tar, member, path)
+        except tarfile.TarError as exc:
+            raise JobError("Unable to unpack %s: %s" % (filename, str(exc)))
+        except OSError as exc:
+            raise InfrastructureError("Unable to unpack %s: %s" % (filename, str(exc)))
+
+    def _add_member(self, tar, member, path):
+        name = self.normalize(path, member.name)
+        if not name:
+            return
+        mode = member.mode & 0o7777
+        kwargs = {"mtime": member.mtime, "uid": member.uid, "gid": member.gid}
+        if member.isdir():
+            self.add(name, stat.S_IFDIR | mode, **kwargs)
+        elif member.issym():
+            data = member.linkname.encode("utf-8")
+            self.add(name, stat.S_IFLNK | 0o777, data, **kwargs)
+        elif member.islnk():
+            # Stored as a copy of the target
+            data = tar.extractfile(member).read()
+            self.add(name, stat.S_IFREG | mode, data, **kwargs)
+        elif member.isfile():
+            f_in = tar.extractfile(member)
+            self.add_fileobj(name, stat.S_IFREG | mode, f_in, member.size, **kwargs)
+        elif member.ischr() or member.isblk():
+            fmt = stat.S_IFCHR if member.ischr() else stat.S_IFBLK
+            rdev = (member.devmajor, member.devminor)
+            self.add(name, fmt | mode, rdev=rdev, **kwargs)
+        elif member.isfifo():
+            self.add(name, stat.S_IFIFO | mode, **kwargs)
+
+    def close(self):
+        self._header(self.TRAILER, 0)
+
+
+def cpio_append(filename, segment):
+    """
+    Append the segment to the ramdisk. Each segment should start on a four
+    bytes boundary.
+    The ramdisk is copied to a new file that then replaces it: the downloaded
+    file is never modified, even if it is shared with other jobs.
+    """
+    tmp = filename + ".tmp"
+    try:
+        with open(tmp, "wb") as f_out:
+            with open(filename, "rb") as f_in:
+                shutil.copyfileobj(f_in, f_out, DECOMPRESS_CHUNK_SIZE)
+            f_out.write(b"\0" * (-f_out.tell() % 4))
+            with open(segment, "rb") as f_in:
+                shutil.copyfileobj(f_in, f_out, DECOMPRESS_CHUNK_SIZE)
+        os.replace(tmp, filename)
+    except OSError as exc:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise InfrastructureError(
+            "Unable to append %s to %s: %s" % (segment, filename, str(exc))
+        )
@@ -20,8 +20,10 @@
 
 import logging
 import os
+import re
 import shutil
 import subprocess  # nosec - internal use.
+import time
 
 from lava_common.exceptions import InfrastructureError
 
@@ -43,45 +45,161 @@ class GitHelper(VCSHelper):
       commit_id = git.clone('destination')
       commit_id = git.clone('destination2, 'hash')
 
+    When a GitCache is given, the repository is cloned from a local mirror
+    which is only fetched when needed.
+
+    Outside of the main thread, the action timeouts do not apply: set
+    max_end_time and abort (a threading.Event) to kill the git commands when
+    the deadline is reached or when the caller gives up.
+
     This helper will raise a InfrastructureError for any error encountered.
     """
 
-    def __init__(self, url):
+    def __init__(self, url, cache=None):
         super().__init__(url)
         self.binary = "/usr/bin/git"
+        self.cache = cache
+        self.max_end_time = None
+        self.abort = None
 
-    def clone(self, dest_path, shallow=False, revision=None, branch=None, history=True):
-        logger = logging.getLogger("dispatcher")
+    def _run(self, cmd_args):
+        if self.max_end_time is None and self.abort is None:
+            return subprocess.check_output(  # nosec - internal use.
+                cmd_args, stderr=subprocess.STDOUT
+            )
+
+        with subprocess.Popen(  # nosec - internal use.
+            cmd_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        ) as proc:
+            while True:
+                # Check the abort event every second
+                timeout = 1
+                if self.max_end_time is not None:
+                    timeout = min(timeout, max(self.max_end_time - time.time(), 0))
+                try:
+                    output = proc.communicate(timeout=timeout)[0]
+                    break
+                except subprocess.TimeoutExpired:
+                    if self.abort is not None and self.abort.is_set():
+                        reason = "aborted"
+                    elif self.max_end_time is not None and (
+                        time.time() >= self.max_end_time
+                    ):
+                        reason = "timed out"
+                    else:
+                        continue
+                    proc.kill()
+                    proc.communicate()
+                    raise InfrastructureError(
+                        "Unable to fetch git repository '%s': %s" % (self.url, reason)
+                    )
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, cmd_args, output)
+        return output
+
+    def _has_commit(self, mirror, revision):
+        # Branches and tags can move: only trust commit ids
+        if not re.fullmatch(r"[0-9a-f]{7,40}", str(revision)):
+            return False
         try:
-            cmd_args = [self.binary, "clone"]
-            if branch is not None:
-                cmd_args.extend(["-b", branch])
-            if shallow:
-                cmd_args.append("--depth=1")
-            cmd_args.extend([self.url, dest_path])
-
-            logger.debug("Running '%s'", " ".join(cmd_args))
+            self._run(
+                [self.binary, "-C", mirror, "cat-file", "-e", "%s^{commit}" % revision]
+            )
+            return True
+        except subprocess.CalledProcessError:
+            return False
+
+    def _update_mirror(self, key, revision):
+        logger = logging.getLogger("dispatcher")
+        url = os.path.expandvars(self.url)
+        mirror = str(self.cache.mirror(key))
+        if not os.path.isdir(mirror):
+            logger.debug("Running '%s clone --mirror %s'", self.binary, self.url)
+            tmp = "%s.%d.tmp" % (mirror, os.getpid())
+            shutil.rmtree(tmp, ignore_errors=True)
+            try:
+                self._run([self.binary, "clone", "--mirror", url, tmp])
+                os.rename(tmp, mirror)
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+        elif revision is not None and self._has_commit(mirror, revision):
+            logger.debug("Revision %s already in the mirror of %s", revision, self.url)
+        else:
+            logger.debug("Running '%s fetch %s'", self.binary, self.url)
+            self._run(
+                [
+                    self.binary,
+                    "--git-dir",
+                    mirror,
+                    "fetch",
+                    "--prune",
+                    url,
+                    "+refs/*:refs/*",
+                ]
+            )
+        self.cache.touch(key, {"url": self.url})
+        return mirror
+
+    def _clone(self, source, dest_path, shallow, revision, branch, history):
+        logger = logging.getLogger("dispatcher")
+        cmd_args = [self.binary, "clone"]
+        if branch is not None:
+            cmd_args.extend(["-b", branch])
+        if shallow:
+            cmd_args.append("--depth=1")
+        cmd_args.extend([source, dest_path])
+
+        logger.debug("Running '%s'", " ".join(cmd_args))
+        if self.cache is None:
             # Replace shell variables by the corresponding environment variable
             cmd_args[-2] = os.path.expandvars(cmd_args[-2])
-            subprocess.check_output(  # nosec - internal use.
-                cmd_args, stderr=subprocess.STDOUT
+        else:
+            # "--depth" is ignored for local paths
+            cmd_args[-2] = "file://" + cmd_args[-2]
+        self._run(cmd_args)
+
+        if self.cache is not None:
+            # Point to the original repository, not to the mirror
+            self._run(
+                [
+                    self.binary,
+                    "-C",
+                    dest_path,
+                    "remote",
+                    "set-url",
+                    "origin",
+                    os.path.expandvars(self.url),
+                ]
             )
 
-            if revision is not None:
-                logger.debug("Running '%s checkout %s", self.binary, str(revision))
-                subprocess.check_output(  # nosec - internal use.
-                    [self.binary, "-C", dest_path, "checkout", str(revision)],
-                    stderr=subprocess.STDOUT,
-                )
+        if revision is not None:
+            logger.debug("Running '%s checkout %s", self.binary, str(revision))
+            self._run([self.binary, "-C", dest_path, "checkout", str(revision)])
 
-            commit_id = subprocess.check_output(  # nosec - internal use.
-                [self.binary, "-C", dest_path, "log", "-1", "--pretty=%H"],
-                stderr=subprocess.STDOUT,
-            ).strip()
+        commit_id = self._run(
+            [self.binary, "-C", dest_path, "log", "-1", "--pretty=%H"]
+        ).strip()
 
-            if not history:
-                logger.debug("Removing '.git' directory in %s", dest_path)
-                shutil.rmtree(os.path.join(dest_path, ".git"))
+        if not history:
+            logger.debug("Removing '.git' directory in %s", dest_path)
+            shutil.rmtree(os.path.join(dest_path, ".git"))
+        return commit_id
+
+    def clone(self, dest_path, shallow=False, revision=None, branch=None, history=True):
+        logger = logging.getLogger("dispatcher")
+        try:
+            if self.cache is None:
+                commit_id = self._clone(
+                    self.url, dest_path, shallow, revision, branch, history
+                )
+            else:
+                key = self.cache.key(url=self.url)
+                with self.cache.lock(key):
+                    mirror = self._update_mirror(key, revision)
+                    commit_id = self._clone(
+                        mirror, dest_path, shallow, revision, branch, history
+                    )
+                self.cache.evict()
 
         except subprocess.CalledProcessError as exc:
             if exc.stdout:
@@ -91,6 +209,10 @@ class GitHelper(VCSHelper):
             raise InfrastructureError(
                 "Unable to fetch git repository '%s'" % (self.url)
             )
+        except OSError as exc:
+            raise InfrastructureError(
+                "Unable to use the git cache for '%s': %s" % (self.url, str(exc))
+            )
 
         return commit_id.decode("utf-8", errors="replace")
 
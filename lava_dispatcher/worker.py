@@ -20,22 +20,21 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, see <http://www.gnu.org/licenses>.
 
-from typing import Any, Dict, Iterator, List, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import aiohttp
 import asyncio
 import contextlib
 from dataclasses import dataclass
 import getpass
+import itertools
 import json
 import logging
 import logging.handlers
 import os
 from pathlib import Path
-import requests
 import signal
 import shutil
-import subprocess
 import sqlite3
 import sys
 import time
@@ -54,6 +53,8 @@ from lava_common.worker import get_parser
 ###########
 FINISH_MAX_DURATION = 120
 JOBS_CHECK_INTERVAL = 5
+# Time between two http pings when the jobs are pushed by the server
+PUSH_PING_INTERVAL = 5 * 60
 
 TIMEOUT = 60 * 10  # http timeout to 10 minutes
 WORKER_DIR = Path(WORKER_DIR)
@@ -68,7 +69,8 @@ logging.Formatter.convert = time.gmtime
 LOG = logging.getLogger("lava-worker")
 FORMAT = "%(asctime)-15s %(levelname)7s %(message)s"
 
-SESSION = requests.Session()
+# Created by main() as it requires a running event loop
+SESSION: Optional[aiohttp.ClientSession] = None
 
 ping_interval = 20
 debug = False
@@ -83,6 +85,7 @@ STALE_CONFIG = {
 # URLs
 URL_JOBS = "/scheduler/internal/v1/jobs/"
 URL_WORKERS = "/scheduler/internal/v1/workers/"
+URL_WS_WORKERS = "workers/"
 
 ###########
 # Helpers #
@@ -117,37 +120,138 @@ class Response:
     text: str
 
     def json(self):
-        raise NotImplementedError()
+        return json.loads(self.text)
 
 
-def requests_get(
-    url: str, token: str, params: Dict[str, str] = None
-) -> Union[requests.Response, Response]:
-
+async def http_get(url: str, token: str, params: Dict[str, str] = None) -> Response:
     if params is None:
         params = {}
 
     try:
-        headers = {**HEADERS, "LAVA-Token": token}
-        return SESSION.get(url, params=params, headers=headers, timeout=TIMEOUT)
-    except requests.RequestException as exc:
+        async with SESSION.get(
+            url,
+            params=params,
+            headers={"LAVA-Token": token},
+            timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+        ) as ret:
+            return Response(ret.status, await ret.text())
+    except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
         return Response(503, str(exc))
 
 
-def requests_post(
-    url: str, token: Union[str, None], data: Dict[str, str]
-) -> Union[requests.Response, Response]:
+async def http_post(url: str, token: Optional[str], data: Dict[str, str]) -> Response:
     try:
-        headers = {**HEADERS, "LAVA-Token": token}
-        return SESSION.post(url, data=data, headers=headers, timeout=TIMEOUT)
-    except requests.RequestException as exc:
+        async with SESSION.post(
+            url,
+            data=data,
+            headers={} if token is None else {"LAVA-Token": token},
+            timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+        ) as ret:
+            return Response(ret.status, await ret.text())
+    except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
         return Response(503, str(exc))
 
 
+async def post_job_state(
+    url: str, job_id: int, token: str, data: Dict[str, str]
+) -> Response:
+    # Use the server channel when connected
+    ret = await CHANNEL.request(
+        {"type": "state", "job": job_id, "token": token, "data": data}
+    )
+    if ret is not None:
+        return ret
+    return await http_post(f"{url}{URL_JOBS}{job_id}/", token, data=data)
+
+
+async def post_jobs_running(url: str, started: List[Tuple[int, str]]) -> None:
+    if not started:
+        return
+    for (job_id, _) in started:
+        LOG.info("[%d] RUNNING => server", job_id)
+    # Use the batch api when not connected to the server channel
+    if not CHANNEL.connected:
+        ret = await http_post(
+            f"{url}{URL_JOBS}",
+            None,
+            data={
+                "state": json.dumps(
+                    [
+                        {"id": job_id, "token": token, "state": "RUNNING"}
+                        for (job_id, token) in started
+                    ]
+                )
+            },
+        )
+        if ret.status_code == 200:
+            with contextlib.suppress(AttributeError, KeyError, ValueError):
+                for (job_id, data) in ret.json()["state"].items():
+                    if "error" in data:
+                        LOG.error("[%s] -> server error: %s", job_id, data["error"])
+                return
+        # Older servers do not provide the batch api
+        LOG.debug("-> batch api unavailable: code %d", ret.status_code)
+
+    async def post(job_id, token):
+        ret = await post_job_state(url, job_id, token, {"state": "RUNNING"})
+        if ret.status_code != 200:
+            LOG.error("[%d] -> server error: code %d", job_id, ret.status_code)
+            LOG.debug("[%d] --> %s", job_id, ret.text)
+
+    await asyncio.gather(*[post(job_id, token) for (job_id, token) in started])
+
+
+async def fetch_payloads(
+    url: str, starts: List[Dict[str, Any]]
+) -> Dict[int, Dict[str, str]]:
+    """
+    Fetch the payloads of the given jobs in one request.
+    Missing payloads should be fetched one by one.
+    """
+    if not starts:
+        return {}
+    ret = await http_post(
+        f"{url}{URL_JOBS}",
+        None,
+        data={
+            "start": json.dumps(
+                [{"id": job["id"], "token": job["token"]} for job in starts]
+            )
+        },
+    )
+    if ret.status_code != 200:
+        LOG.debug("-> batch api unavailable: code %d", ret.status_code)
+        return {}
+    try:
+        return {
+            int(job_id): data
+            for (job_id, data) in ret.json()["start"].items()
+            if "error" not in data
+        }
+    except (AttributeError, KeyError, ValueError) as exc:
+        LOG.error("-> invalid response: %r", str(exc))
+        return {}
+
+
 ###############
 # job helpers #
 ###############
-def start_job(
+def write_job_files(
+    base_dir: Path, definition: str, device: str, dispatcher: str, env_dut: str
+) -> None:
+    base_dir.mkdir(mode=0o755, exist_ok=True, parents=True)
+
+    # Write back the job, device and dispatcher configuration
+    (base_dir / "job.yaml").write_text(definition, encoding="utf-8")
+    (base_dir / "device.yaml").write_text(device, encoding="utf-8")
+    (base_dir / "dispatcher.yaml").write_text(dispatcher, encoding="utf-8")
+
+    # Dump the environment variables in the tmp file.
+    if env_dut:
+        (base_dir / "env-dut.yaml").write_text(env_dut, encoding="utf-8")
+
+
+async def start_job(
     url: str,
     token: str,
     job_id: int,
@@ -157,24 +261,18 @@ def start_job(
     env_str: str,
     env_dut: str,
     job_log_interval: int,
-) -> Optional[int]:
+) -> Optional[asyncio.subprocess.Process]:
     """
-    Start the lava-run process and return the pid
+    Start the lava-run process and return it
     """
     # Create the base directory
     dispatcher_cfg = yaml_safe_load(dispatcher)
     base_dir = tmp_dir / f"{get_prefix(dispatcher_cfg)}{job_id}"
-    base_dir.mkdir(mode=0o755, exist_ok=True, parents=True)
-
-    # Write back the job, device and dispatcher configuration
-    (base_dir / "job.yaml").write_text(definition, encoding="utf-8")
-    (base_dir / "device.yaml").write_text(device, encoding="utf-8")
-    (base_dir / "dispatcher.yaml").write_text(dispatcher, encoding="utf-8")
-
-    # Dump the environment variables in the tmp file.
-    if env_dut:
-        (base_dir / "env-dut.yaml").write_text(env_dut, encoding="utf-8")
+    await asyncio.get_running_loop().run_in_executor(
+        None, write_job_files, base_dir, definition, device, dispatcher, env_dut
+    )
 
+    out_file = err_file = None
     try:
         if debug:
             out_file = sys.stdout
@@ -202,10 +300,9 @@ def start_job(
         if env_dut:
             args.append("--env-dut=%s" % (base_dir / "env-dut.yaml"))
 
-        proc = subprocess.Popen(
-            args, stdout=out_file, stderr=err_file, env=env, preexec_fn=os.setpgrp
+        return await asyncio.create_subprocess_exec(
+            *args, stdout=out_file, stderr=err_file, env=env, preexec_fn=os.setpgrp
         )
-        return proc.pid
     except Exception as exc:  # pylint: disable=broad-except
         LOG.error("[%d] Unable to start: %s", job_id, args)
         # daemon must always continue running even if the job crashes
@@ -218,6 +315,23 @@ def start_job(
         # The END message will be sent the next time
         # check_job_status is run
         return None
+    finally:
+        # The child process has its own copy
+        if not debug:
+            for f_out in [out_file, err_file]:
+                if f_out is not None:
+                    f_out.close()
+
+
+def remove_job_files(job_id: int, prefix: str) -> None:
+    for directory in STALE_CONFIG:
+        pattern = STALE_CONFIG[directory]
+        dir_name = pattern.format(prefix=prefix, job_id=job_id)
+        dir_path = directory / dir_name
+        if not dir_path.exists():
+            continue
+        LOG.debug("[%d] Removing %s", job_id, dir_path)
+        shutil.rmtree(str(dir_path), ignore_errors=True)
 
 
 #########
@@ -250,7 +364,9 @@ class Job:
 
     def description(self) -> str:
         with contextlib.suppress(OSError):
-            return (self.base_dir / "description.yaml").read_bytes()
+            return (self.base_dir / "description.yaml").read_text(
+                encoding="utf-8", errors="replace"
+            )
         return ""
 
     def result(self) -> Dict[str, Any]:
@@ -278,6 +394,33 @@ class Job:
                 return "lava-run" in fd.read()
         return False
 
+    async def wait(self) -> None:
+        """
+        Wait for a process that was not started by this lava-worker (started
+        before a restart). Children are waited for with the Process object.
+        """
+        if not self.is_running():
+            return
+        try:
+            pidfd = os.pidfd_open(self.pid)
+        except ProcessLookupError:
+            return
+        except (AttributeError, OSError):
+            # pidfd is not available: poll the process
+            while self.is_running():
+                await asyncio.sleep(JOBS_CHECK_INTERVAL)
+            return
+
+        # The pidfd becomes readable when the process exits
+        loop = asyncio.get_running_loop()
+        exited = asyncio.Event()
+        loop.add_reader(pidfd, exited.set)
+        try:
+            await exited.wait()
+        finally:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+
 
 class JobsDB:
     def __init__(self, dbname: str):
@@ -405,6 +548,46 @@ def setup_logger(log_file: str, level: str) -> None:
 #####################
 # Server <-> Worker #
 #####################
+# Tasks waiting for the lava-run processes
+MONITORS: Dict[int, asyncio.Task] = {}
+
+
+def monitor(
+    url: str,
+    jobs: JobsDB,
+    job: Job,
+    proc: Optional[asyncio.subprocess.Process] = None,
+) -> None:
+    """
+    Wait for the job process in the background and report to the server as
+    soon as the process exits.
+    """
+    if job.job_id in MONITORS:
+        return
+
+    async def wait() -> None:
+        try:
+            if proc is None:
+                await job.wait()
+            else:
+                await proc.wait()
+            current = jobs.get(job.job_id)
+            if current is None:
+                return
+            if current.status != Job.FINISHED:
+                LOG.info(
+                    "[%d] %s -> finished",
+                    job.job_id,
+                    "running" if current.status == Job.RUNNING else "canceling",
+                )
+                current = jobs.update(job.job_id, Job.FINISHED)
+            await finish(url, jobs, current)
+        finally:
+            del MONITORS[job.job_id]
+
+    MONITORS[job.job_id] = asyncio.create_task(wait())
+
+
 def cancel(url: str, jobs: JobsDB, job_id: int, token: str) -> None:
     LOG.info("[%d] => CANCEL", job_id)
     job = jobs.get(job_id)
@@ -418,75 +601,61 @@ def cancel(url: str, jobs: JobsDB, job_id: int, token: str) -> None:
             jobs.update(job_id, Job.CANCELING)
 
 
-def check(url: str, jobs: JobsDB) -> None:
-    # Loop on running jobs
+async def check(url: str, jobs: JobsDB) -> None:
+    # Monitor the jobs started before a restart
     for job in jobs.running():
-        if not job.is_running():
-            # wait for the job
-            try:
-                os.waitpid(job.pid, 0)
-            except OSError as exc:
-                LOG.debug(
-                    "[%d] unable to wait for the process: %s", job.job_id, str(exc)
-                )
-            LOG.info("[%d] running -> finished", job.job_id)
-            jobs.update(job.job_id, Job.FINISHED)
+        monitor(url, jobs, job)
 
     # Loop on canceling jobs
     for job in jobs.canceling():
-        if not job.is_running():
-            # wait for the job
-            try:
-                os.waitpid(job.pid, 0)
-            except OSError as exc:
-                LOG.debug(
-                    "[%d] unable to wait for the process: %s", job.job_id, str(exc)
-                )
-            LOG.info("[%d] canceling -> finished", job.job_id)
-            jobs.update(job.job_id, Job.FINISHED)
-
-        elif time.time() - job.last_update > FINISH_MAX_DURATION:
+        monitor(url, jobs, job)
+        if time.time() - job.last_update > FINISH_MAX_DURATION:
             LOG.info("[%d] not finishing => killing", job.job_id)
-            job.kill()
+            with contextlib.suppress(ProcessLookupError):
+                job.kill()
         elif time.time() - job.last_update > FINISH_MAX_DURATION / 2:
             LOG.info("[%d] not finishing => second signal", job.job_id)
-            job.terminate()
-
-    # Loop on finished jobs
-    for job in jobs.finished():
-        LOG.info("[%d] FINISHED => server", job.job_id)
-        result = job.result()
-        # Default error values
-        if result.get("result") == "pass":
-            default_error_type = ""
-        else:
-            default_error_type = LAVABug.error_type
-        data = {
-            "state": "FINISHED",
-            "result": result.get("result", "fail"),
-            "error_type": result.get("error_type", default_error_type),
-            "errors": job.errors(),
-            "description": job.description(),
-        }
+            with contextlib.suppress(ProcessLookupError):
+                job.terminate()
+
+    # Finished jobs that were not sent to the server (lava-run was not
+    # started or the server was not reachable)
+    await asyncio.gather(
+        *[
+            finish(url, jobs, job)
+            for job in jobs.finished()
+            if job.job_id not in MONITORS
+        ]
+    )
 
-        ret = requests_post(f"{url}{URL_JOBS}{job.job_id}/", job.token, data=data)
-        if ret.status_code != 200:
-            LOG.error("[%d] -> server error: code %d", job.job_id, ret.status_code)
-            LOG.debug("[%d] --> %s", job.job_id, ret.text)
-            return
 
-        # Remove stale resources
-        prefix = "" if job is None else job.prefix
-        for directory in STALE_CONFIG:
-            pattern = STALE_CONFIG[directory]
-            dir_name = pattern.format(prefix=prefix, job_id=job.job_id)
-            dir_path = directory / dir_name
-            if not dir_path.exists():
-                continue
-            LOG.debug("[%d] Removing %s", job.job_id, dir_path)
-            shutil.rmtree(str(dir_path), ignore_errors=True)
+async def finish(url: str, jobs: JobsDB, job: Job) -> None:
+    LOG.info("[%d] FINISHED => server", job.job_id)
+    result = job.result()
+    # Default error values
+    if result.get("result") == "pass":
+        default_error_type = ""
+    else:
+        default_error_type = LAVABug.error_type
+    data = {
+        "state": "FINISHED",
+        "result": result.get("result", "fail"),
+        "error_type": result.get("error_type", default_error_type),
+        "errors": job.errors(),
+        "description": job.description(),
+    }
+
+    ret = await post_job_state(url, job.job_id, job.token, data)
+    if ret.status_code != 200:
+        LOG.error("[%d] -> server error: code %d", job.job_id, ret.status_code)
+        LOG.debug("[%d] --> %s", job.job_id, ret.text)
+        return
 
-        jobs.delete(job.job_id)
+    # Remove stale resources
+    await asyncio.get_running_loop().run_in_executor(
+        None, remove_job_files, job.job_id, job.prefix
+    )
+    jobs.delete(job.job_id)
 
 
 class ServerUnavailable(Exception):
@@ -497,9 +666,9 @@ class VersionMismatch(Exception):
     pass
 
 
-def ping(url: str, token: str, name: str) -> Dict[str, List]:
+async def ping(url: str, token: str, name: str) -> Dict[str, List]:
     LOG.info("PING => server")
-    ret = requests_get(
+    ret = await http_get(
         f"{url}{URL_WORKERS}{name}/", token, params={"version": __version__}
     )
 
@@ -519,7 +688,9 @@ def ping(url: str, token: str, name: str) -> Dict[str, List]:
         return {}
 
 
-def register(url: str, name: str, username: str = None, password: str = None) -> str:
+async def register(
+    url: str, name: str, username: str = None, password: str = None
+) -> str:
     data = {"name": name}
     if username is not None and password is not None:
         data["username"] = username
@@ -527,39 +698,51 @@ def register(url: str, name: str, username: str = None, password: str = None) ->
 
     while True:
         LOG.debug("[INIT] Auto register as %r", name)
-        ret = requests_post(f"{url}{URL_WORKERS}", None, data=data)
+        ret = await http_post(f"{url}{URL_WORKERS}", None, data=data)
         if ret.status_code == 200:
             return ret.json()["token"]
         LOG.error("[INIT] -> server error: code %d", ret.status_code)
         LOG.debug("[INIT] --> %s", ret.text)
-        time.sleep(5)
+        await asyncio.sleep(5)
 
 
-def running(
+async def running(
     url: str, jobs: JobsDB, job_id: int, token: str, job_log_interval: int
-) -> None:
+) -> bool:
     job = jobs.get(job_id)
     if job is None:
-        start(url, jobs, job_id, token, job_log_interval)
+        return await start(url, jobs, job_id, token, job_log_interval)
+    return False
 
 
-def start(
-    url: str, jobs: JobsDB, job_id: int, token: str, job_log_interval: int
-) -> None:
+async def start(
+    url: str,
+    jobs: JobsDB,
+    job_id: int,
+    token: str,
+    job_log_interval: int,
+    payload: Optional[Dict[str, str]] = None,
+) -> bool:
+    """
+    Start the job (if needed).
+    Return True when the server should be told that the job is running.
+    """
     LOG.info("[%d] server => START", job_id)
     # Was the job already started?
     job = jobs.get(job_id)
 
     # Start the job
     if job is None:
-        ret = requests_get(f"{url}{URL_JOBS}{job_id}/", token)
-        if ret.status_code != 200:
-            LOG.error("[%d] -> server error: code %d", job_id, ret.status_code)
-            LOG.debug("[%d] --> %s", job_id, ret.text)
-            return
+        # The payload is sent along with the job when pushed by the server
+        if payload is None:
+            ret = await http_get(f"{url}{URL_JOBS}{job_id}/", token)
+            if ret.status_code != 200:
+                LOG.error("[%d] -> server error: code %d", job_id, ret.status_code)
+                LOG.debug("[%d] --> %s", job_id, ret.text)
+                return False
 
         try:
-            data = ret.json()
+            data = ret.json() if payload is None else payload
             definition = data["definition"]
             device = data["device"]
             dispatcher = data["dispatcher"]
@@ -567,7 +750,12 @@ def start(
             env_dut = data["env-dut"]
         except (KeyError, ValueError) as exc:
             LOG.error("[%d] -> invalid response: %r", job_id, str(exc))
-            return
+            return False
+
+        # The job might have been started while waiting for the server
+        if jobs.get(job_id) is not None:
+            LOG.info("[%d] -> already started", job_id)
+            return False
 
         LOG.info("[%d] Starting job", job_id)
         LOG.debug("[%d]         : %s", job_id, yaml_safe_load(definition))
@@ -577,7 +765,7 @@ def start(
         LOG.debug("[%d] env-dut : %s", job_id, yaml_safe_load(env_dut))
 
         # Start the job, grab the pid and create it in the dabatase
-        pid = start_job(
+        proc = await start_job(
             url,
             token,
             job_id,
@@ -590,26 +778,29 @@ def start(
         )
         job = jobs.create(
             job_id,
-            0 if pid is None else pid,
-            Job.FINISHED if pid is None else Job.RUNNING,
+            0 if proc is None else proc.pid,
+            Job.FINISHED if proc is None else Job.RUNNING,
             yaml_safe_load(dispatcher),
             token,
         )
+        if proc is not None and job is not None:
+            monitor(url, jobs, job, proc)
     else:
         LOG.info("[%d] -> already running", job_id)
-
-    # Update the server state
-    LOG.info("[%d] RUNNING => server", job_id)
-    ret = requests_post(f"{url}{URL_JOBS}{job_id}/", token, data={"state": "RUNNING"})
-    if ret.status_code != 200:
-        LOG.error("[%d] -> server error: code %d", job_id, ret.status_code)
-        LOG.debug("[%d] --> %s", job_id, ret.text)
+    return True
 
 
 ###############
 # Entrypoints #
 ###############
-def handle(options, jobs: JobsDB) -> float:
+async def handle(
+    options, jobs: JobsDB, data: Optional[Dict[str, List]] = None
+) -> float:
+    """
+    Handle the jobs sent by the server (data) or, when data is None, ping the
+    server to get them.
+    Return the time to wait before calling handle again.
+    """
     begin: float = time.time()
 
     name: str = options.name
@@ -617,69 +808,234 @@ def handle(options, jobs: JobsDB) -> float:
     url: str = options.url
     job_log_interval: int = options.job_log_interval
 
-    try:
-        data = ping(url, token, name)
-    except ServerUnavailable:
-        LOG.error("-> server unavailable")
-        return max(1 - (time.time() - begin), 0)
-    except VersionMismatch as exc:
-        if options.exit_on_version_mismatch:
-            raise exc
-        return max(ping_interval - (time.time() - begin), 0)
-
-    # running jobs
-    for job in data.get("running", []):
-        running(url, jobs, job["id"], job["token"], job_log_interval)
+    if data is None:
+        try:
+            data = await ping(url, token, name)
+        except ServerUnavailable:
+            LOG.error("-> server unavailable")
+            return max(1 - (time.time() - begin), 0)
+        except VersionMismatch as exc:
+            if options.exit_on_version_mismatch:
+                raise exc
+            return max(ping_interval - (time.time() - begin), 0)
 
     # cancel jobs
     for job in data.get("cancel", []):
         cancel(url, jobs, job["id"], job["token"])
 
-    # start jobs
-    for job in data.get("start", []):
-        start(url, jobs, job["id"], job["token"], job_log_interval)
+    # Fetch the missing payloads at once
+    payloads = await fetch_payloads(
+        url,
+        [
+            job
+            for job in data.get("start", [])
+            if "payload" not in job and jobs.get(job["id"]) is None
+        ],
+    )
+
+    # running and start jobs, concurrently
+    started = await asyncio.gather(
+        *[
+            running(url, jobs, job["id"], job["token"], job_log_interval)
+            for job in data.get("running", [])
+        ],
+        *[
+            start(
+                url,
+                jobs,
+                job["id"],
+                job["token"],
+                job_log_interval,
+                job.get("payload", payloads.get(job["id"])),
+            )
+            for job in data.get("start", [])
+        ],
+    )
+
+    # Update the server states at once
+    await post_jobs_running(
+        url,
+        [
+            (job["id"], job["token"])
+            for (job, ret) in zip(
+                data.get("running", []) + data.get("start", []), started
+            )
+            if ret
+        ],
+    )
 
     # Check job status
     # TODO: store the token and reuse it
-    check(url, jobs)
+    await check(url, jobs)
 
     # Compute the sleep duration
     return max(ping_interval - (time.time() - begin), 0)
 
 
+class Channel:
+    """
+    Persistent connection to the server (lava-publisher).
+
+    The server pushes the jobs to start, cancel and keep running, the worker
+    sends back the job states. The http api is used when not connected.
+    """
+
+    def __init__(self):
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.jobs: Optional[Dict[str, List]] = None
+        self.replies: Dict[int, asyncio.Future] = {}
+        self.ids = itertools.count(1)
+
+    @property
+    def connected(self) -> bool:
+        return self.ws is not None and not self.ws.closed
+
+    def pop_jobs(self) -> Optional[Dict[str, List]]:
+        """
+        Return the last jobs pushed by the server (if any)
+        """
+        (jobs, self.jobs) = (self.jobs, None)
+        return jobs
+
+    async def request(self, data: Dict[str, Any]) -> Optional[Response]:
+        """
+        Send a request and wait for the reply.
+        Return None when the request cannot be sent.
+        """
+        if not self.connected:
+            return None
+        request_id = next(self.ids)
+        self.replies[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            await self.ws.send_json({**data, "id": request_id})
+            return await asyncio.wait_for(self.replies[request_id], TIMEOUT)
+        except (aiohttp.ClientError, ConnectionError, asyncio.TimeoutError) as exc:
+            LOG.warning("[CHANNEL] Unable to send the request: %s", str(exc))
+            return None
+        finally:
+            del self.replies[request_id]
+
+    async def run(self, options, event: asyncio.Event) -> None:
+        """
+        Connect to the server and handle the messages until the connection is
+        closed.
+        Raise aiohttp.WSServerHandshakeError if the server refuses the
+        connection.
+        """
+        async with SESSION.ws_connect(
+            f"{options.ws_url}{URL_WS_WORKERS}{options.name}/",
+            params={"version": __version__},
+            headers={"LAVA-Token": options.token},
+            heartbeat=30,
+        ) as ws:
+            LOG.info("[CHANNEL] Connected")
+            self.ws = ws
+            pinger = asyncio.create_task(self.ping())
+            try:
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        continue
+                    try:
+                        data = json.loads(msg.data)
+                        kind = data["type"]
+                    except (KeyError, TypeError, ValueError):
+                        LOG.warning("[CHANNEL] Invalid message: %s", msg)
+                        continue
+                    if kind == "jobs":
+                        LOG.info("[CHANNEL] server => jobs")
+                        self.jobs = data
+                        event.set()
+                    elif kind == "reply":
+                        future = self.replies.get(data.get("id"))
+                        if future is not None and not future.done():
+                            future.set_result(
+                                Response(
+                                    data.get("status", 500),
+                                    json.dumps(data.get("data", {})),
+                                )
+                            )
+            finally:
+                pinger.cancel()
+                self.ws = None
+                for future in self.replies.values():
+                    if not future.done():
+                        future.set_exception(ConnectionResetError("Disconnected"))
+            LOG.info("[CHANNEL] Disconnected")
+
+    async def ping(self) -> None:
+        # Keep the worker online
+        while True:
+            await asyncio.sleep(ping_interval)
+            with contextlib.suppress(ConnectionError):
+                await self.ws.send_json({"type": "ping", "id": next(self.ids)})
+
+
+CHANNEL = Channel()
+
+
 async def main_loop(options, jobs: JobsDB, event: asyncio.Event) -> None:
+    last_ping = 0.0
     while True:
-        timeout = handle(options, jobs)
+        data = CHANNEL.pop_jobs()
+        if data is None and CHANNEL.connected:
+            # The jobs are pushed by the server: only check the local jobs
+            # and ping the server from time to time as a safety net.
+            if time.time() - last_ping < PUSH_PING_INTERVAL:
+                data = {}
+        if data is None:
+            last_ping = time.time()
+        timeout = await handle(options, jobs, data)
         with contextlib.suppress(asyncio.TimeoutError):
             await asyncio.wait_for(event.wait(), timeout=timeout)
             event.clear()
 
 
 async def listen_for_events(options, event: asyncio.Event) -> None:
+    # Use the worker channel when available, fallback to the events otherwise
+    use_channel = True
     while True:
         with contextlib.suppress(aiohttp.ClientError):
-            async with aiohttp.ClientSession(headers=HEADERS) as session:
-                async with session.ws_connect(f"{options.ws_url}", heartbeat=30) as ws:
-                    async for msg in ws:
-                        if msg.type != aiohttp.WSMsgType.TEXT:
-                            continue
-                        try:
-                            data = json.loads(msg.data)
-                            (topic, _, dt, username, data) = data
-                            data = json.loads(data)
-                        except ValueError:
-                            LOG.warning("[EVENT] Invalid message: %s", msg)
-                            continue
-                        if not topic.endswith(".testjob"):
-                            continue
-                        if data.get("worker") != options.name:
-                            continue
-                        if data.get("state") in ["Scheduled", "Canceling"]:
-                            LOG.info("[EVENT] Worker mentioned")
-                            event.set()
+            if use_channel:
+                try:
+                    await CHANNEL.run(options, event)
+                except aiohttp.WSServerHandshakeError as exc:
+                    # Older servers do not provide the channel (404) and the
+                    # server refuses the connection on version mismatch or
+                    # when the events are disabled (400)
+                    if exc.status not in [400, 404]:
+                        raise
+                    LOG.warning("[CHANNEL] Refused by the server: %s", exc.message)
+                    LOG.warning("[CHANNEL] Fallback to events and polling")
+                    use_channel = False
+                    continue
+                # Ping the server right now: some jobs might have been missed
+                event.set()
+            else:
+                await listen_for_testjobs(options, event)
         await asyncio.sleep(1)
 
 
+async def listen_for_testjobs(options, event: asyncio.Event) -> None:
+    async with SESSION.ws_connect(f"{options.ws_url}", heartbeat=30) as ws:
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            try:
+                data = json.loads(msg.data)
+                (topic, _, dt, username, data) = data
+                data = json.loads(data)
+            except ValueError:
+                LOG.warning("[EVENT] Invalid message: %s", msg)
+                continue
+            if not topic.endswith(".testjob"):
+                continue
+            if data.get("worker") != options.name:
+                continue
+            if data.get("state") in ["Scheduled", "Canceling"]:
+                LOG.info("[EVENT] Worker mentioned")
+                event.set()
+
+
 async def main() -> int:
     # Parse command line
     options = get_parser().parse_args()
@@ -714,11 +1070,13 @@ async def main() -> int:
         global tmp_dir
         tmp_dir = worker_dir / "tmp"
 
+    global SESSION
+    SESSION = aiohttp.ClientSession(headers=HEADERS)
     try:
         if options.username is not None:
             LOG.info("[INIT] Token  : '<auto register with %s>'", options.username)
             password = getpass.getpass()
-            options.token = register(
+            options.token = await register(
                 options.url, options.name, options.username, password
             )
             options.token_file.write_text(options.token, encoding="utf-8")
@@ -734,7 +1092,7 @@ async def main() -> int:
             options.token = options.token_file.read_text(encoding="utf-8").rstrip("\n")
         else:
             LOG.info("[INIT] Token  : '<auto register>'")
-            options.token = register(options.url, options.name)
+            options.token = await register(options.url, options.name)
             options.token_file.write_text(options.token, encoding="utf-8")
             options.token_file.chmod(0o600)
 
@@ -750,7 +1108,7 @@ async def main() -> int:
         if options.wait_jobs:
             LOG.info("[EXIT] Wait for jobs to finish")
             while True:
-                check(options.url, jobs)
+                await check(options.url, jobs)
                 all_ids = jobs.all_ids()
                 LOG.info(
                     "[EXIT] => %d jobs ([%s])",
@@ -759,7 +1117,7 @@ async def main() -> int:
                 )
                 if not all_ids:
                     break
-                time.sleep(ping_interval)
+                await asyncio.sleep(ping_interval)
         return 1
     except VersionMismatch as exc:
         LOG.info("[EXIT] %s" % exc)
@@ -768,6 +1126,8 @@ async def main() -> int:
         LOG.error("[EXIT] %s", exc)
         LOG.exception(exc)
         return 1
+    finally:
+        await SESSION.close()
 
 
 def run():
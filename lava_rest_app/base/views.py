@@ -17,9 +17,16 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
+import contextlib
 import io
+import itertools
 import junit_xml
+import re
 import tap
+import xml.etree.ElementTree as ET
+
+from xml.sax.saxutils import quoteattr
 
 import lava_server.compat  # pylint: disable=unused-import
 from lava_scheduler_app.models import (
@@ -35,7 +42,7 @@ from lava_results_app.models import TestCase
 from lava_scheduler_app.logutils import logs_instance
 from linaro_django_xmlrpc.models import AuthToken
 
-from django.http.response import FileResponse, HttpResponse
+from django.http.response import StreamingHttpResponse
 
 from rest_framework import status, viewsets
 from rest_framework.permissions import BasePermission
@@ -58,6 +65,27 @@ from lava_rest_app import filters
 
 from . import serializers
 
+# Size of the chunks sent by the streamed reports
+STREAM_SIZE = 64 * 1024
+
+# Characters that are not allowed in XML documents, removed from the junit
+# reports like junit_xml.to_xml_report_string does
+ILLEGAL_XML_CHARS = re.compile(
+    "[%s]"
+    % "".join(
+        "%s-%s" % (chr(low), chr(high))
+        for (low, high) in [
+            (0x00, 0x08),
+            (0x0B, 0x1F),
+            (0x7F, 0x84),
+            (0x86, 0x9F),
+            (0xD800, 0xDFFF),
+            (0xFDD0, 0xFDDF),
+        ]
+        + [(plane + 0xFFFE, plane + 0xFFFF) for plane in range(0, 0x110000, 0x10000)]
+    )
+)
+
 
 def safe_str2int(in_value):
     out_value = in_value
@@ -68,6 +96,212 @@ def safe_str2int(in_value):
     return out_value
 
 
+class FailureLogs:
+    """
+    Logs of the failed test cases of a job, read in one pass with
+    Logs.read_many(). The ranges are read by start line, whatever the order
+    the test cases are requested in.
+    """
+
+    def __init__(self, job):
+        rows = list(
+            TestCase.objects.filter(
+                suite__job=job,
+                result=TestCase.RESULT_FAIL,
+                start_log_line__isnull=False,
+                end_log_line__isnull=False,
+            )
+            .order_by("start_log_line", "id")
+            .values_list("id", "start_log_line", "end_log_line")
+        )
+        self.job = job
+        self.ids = {row[0] for row in rows}
+        self.logs = zip(
+            [row[0] for row in rows],
+            logs_instance.read_many(job, [(row[1], row[2]) for row in rows]),
+        )
+        # Logs already read for the test cases that are not yet requested
+        self.pending = {}
+
+    def get(self, case):
+        """
+        Return the logs of the failed test case or None when not available.
+        """
+        if case.start_log_line is None or case.end_log_line is None:
+            return None
+        # The response is already sent: skip the logs that are missing
+        with contextlib.suppress(FileNotFoundError):
+            if case.id not in self.ids:
+                # Test case created after the listing
+                return logs_instance.read(
+                    self.job, case.start_log_line, case.end_log_line
+                )
+            if case.id in self.pending:
+                return self.pending.pop(case.id)
+            for (case_id, logs) in self.logs:
+                if case_id == case.id:
+                    return logs
+                self.pending[case_id] = logs
+        return None
+
+
+def testcase_duration(case):
+    md = case.action_metadata
+    duration = None
+    if md is not None:
+        duration = md.get("duration")
+        if duration is not None:
+            duration = float(duration)
+    return duration
+
+
+def junit_suite(suite, classname_prefix):
+    # Return the test cases and the junit test suite, without the logs of
+    # the failures
+    cases = list(suite.testcase_set.all().order_by("id"))
+    test_cases = []
+    for case in cases:
+        # Grab the duration
+        duration = testcase_duration(case)
+
+        # Build the test case junit object
+        tc = junit_xml.TestCase(
+            case.name,
+            elapsed_sec=duration,
+            classname="%s%s" % (classname_prefix, suite.name),
+            timestamp=case.logged.isoformat(),
+        )
+        if case.result == TestCase.RESULT_FAIL:
+            tc.add_failure_info("failed")
+        elif case.result == TestCase.RESULT_SKIP:
+            tc.add_skipped_info("skipped")
+        test_cases.append(tc)
+    return (
+        cases,
+        junit_xml.TestSuite(
+            suite.name,
+            test_cases=test_cases,
+            timestamp=suite.get_end_datetime().isoformat(),
+        ),
+    )
+
+
+def xml_start_tag(tag, attributes):
+    return "<%s%s>" % (
+        tag,
+        "".join(" %s=%s" % (k, quoteattr(v)) for (k, v) in attributes.items()),
+    )
+
+
+def junit_totals(job, suites):
+    """
+    Return the attributes of the testsuites element, like
+    junit_xml.to_xml_report_string, from the counters of the suites and the
+    durations of the test cases.
+    """
+    # Sum the durations like junit_xml: by suite, then the suite totals
+    durations = collections.defaultdict(int)
+    cases = (
+        TestCase.objects.filter(suite__job=job, metadata__contains="duration")
+        .order_by("suite_id", "id")
+        .only("suite_id", "metadata")
+    )
+    for case in cases.iterator():
+        duration = testcase_duration(case)
+        if duration:
+            durations[case.suite_id] += duration
+
+    if not suites:
+        return {}
+    # The test cases are neither disabled nor errors
+    return {
+        "disabled": 0,
+        "errors": 0,
+        "failures": sum(suite.testcase_count("fail") for suite in suites),
+        "tests": sum(suite.testcase_count() for suite in suites),
+        "time": sum(float(durations[suite.id]) for suite in suites),
+    }
+
+
+def junit_report(job, classname_prefix):
+    """
+    Generate the junit report of the job, one chunk at a time.
+    The logs of the failures are read with one call to Logs.read_many().
+    """
+    suites = list(job.testsuite_set.all().order_by("id"))
+
+    # The totals are needed for the first element
+    totals = junit_totals(job, suites)
+    logs = FailureLogs(job)
+    chunks = ['<?xml version="1.0" encoding="utf-8"?>\n']
+    chunks.append(
+        xml_start_tag("testsuites", {k: str(v) for (k, v) in totals.items()}) + "\n"
+    )
+    size = 0
+    for suite in suites:
+        (cases, test_suite) = junit_suite(suite, classname_prefix)
+        element = test_suite.build_xml_doc(encoding="utf-8")
+        chunks.append("\t" + xml_start_tag("testsuite", element.attrib) + "\n")
+        for (case, child) in zip(cases, list(element)):
+            failure = child.find("failure")
+            if failure is not None:
+                output = logs.get(case)
+                if output:
+                    failure.text = output
+            chunk = "\t\t" + ET.tostring(child, encoding="unicode") + "\n"
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= STREAM_SIZE:
+                yield ILLEGAL_XML_CHARS.sub("", "".join(chunks)).encode("utf-8")
+                chunks = []
+                size = 0
+        chunks.append("\t</testsuite>\n")
+    chunks.append("</testsuites>\n")
+    yield ILLEGAL_XML_CHARS.sub("", "".join(chunks)).encode("utf-8")
+
+
+def tap13_report(job):
+    """
+    Generate the TAP13 report of the job, one test case at a time.
+    The logs of the failures are read with one call to Logs.read_many().
+    """
+    stream = io.StringIO()
+    count = TestCase.objects.filter(suite__job=job).count()
+    tracker = tap.tracker.Tracker(plan=count, streaming=True, stream=stream)
+    logs = FailureLogs(job)
+
+    # Loop on all test cases
+    cases = (
+        TestCase.objects.filter(suite__job=job)
+        .select_related("suite")
+        .order_by("suite_id", "id")
+    )
+    for case in cases.iterator():
+        suite = case.suite
+        if case.result == TestCase.RESULT_FAIL:
+            output = logs.get(case)
+            if output is not None:
+                output = "\n ".join(output.split("\n"))
+                tracker.add_not_ok(
+                    suite.name, case.name, diagnostics=" ---\n " + output + "..."
+                )
+            else:
+                tracker.add_not_ok(suite.name, case.name)
+        elif case.result == TestCase.RESULT_SKIP:
+            tracker.add_skip(suite.name, case.name, "test skipped")
+        elif case.result == TestCase.RESULT_UNKNOWN:
+            tracker.add_not_ok(suite.name, case.name, "TODO unknown result")
+        else:
+            tracker.add_ok(suite.name, case.name)
+
+        # Send what the tracker wrote so far
+        if stream.tell() >= STREAM_SIZE:
+            yield stream.getvalue().encode("utf-8")
+            stream.seek(0)
+            stream.truncate(0)
+    yield stream.getvalue().encode("utf-8")
+
+
 class LavaObtainAuthToken(ObtainAuthToken):
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(
@@ -157,55 +391,14 @@ class TestJobViewSet(viewsets.ModelViewSet):
 
     @detail_route(methods=["get"], suffix="junit")
     def junit(self, request, **kwargs):
-        suites = []
         classname_prefix = request.query_params.get("classname_prefix", "")
         if classname_prefix != "":
             classname_prefix = str(classname_prefix) + "_"
-        for suite in self.get_object().testsuite_set.all().order_by("id"):
-            cases = []
-            for case in suite.testcase_set.all().order_by("id"):
-                # Grab the duration
-                md = case.action_metadata
-                duration = None
-                if md is not None:
-                    duration = md.get("duration")
-                    if duration is not None:
-                        duration = float(duration)
-
-                # Build the test case junit object
-                tc = junit_xml.TestCase(
-                    case.name,
-                    elapsed_sec=duration,
-                    classname="%s%s" % (classname_prefix, case.suite.name),
-                    timestamp=case.logged.isoformat(),
-                )
-                if case.result == TestCase.RESULT_FAIL:
-                    logs = None
-                    # TODO: is this of any use? (yaml inside xml!)
-                    if (
-                        case.start_log_line is not None
-                        and case.end_log_line is not None
-                    ):
-                        logs = logs_instance.read(
-                            self.get_object(), case.start_log_line, case.end_log_line
-                        )
-                    tc.add_failure_info("failed", output=logs)
-                elif case.result == TestCase.RESULT_SKIP:
-                    tc.add_skipped_info("skipped")
-                cases.append(tc)
-            suites.append(
-                junit_xml.TestSuite(
-                    suite.name,
-                    test_cases=cases,
-                    timestamp=suite.get_end_datetime().isoformat(),
-                )
-            )
-
-        data = junit_xml.to_xml_report_string(suites, encoding="utf-8")
-        response = HttpResponse(data, content_type="application/xml")
-        response["Content-Disposition"] = (
-            "attachment; filename=job_%d.xml" % self.get_object().id
+        job = self.get_object()
+        response = StreamingHttpResponse(
+            junit_report(job, classname_prefix), content_type="application/xml"
         )
+        response["Content-Disposition"] = "attachment; filename=job_%d.xml" % job.id
         return response
 
     @detail_route(methods=["get"], suffix="logs")
@@ -213,20 +406,20 @@ class TestJobViewSet(viewsets.ModelViewSet):
         start = safe_str2int(request.query_params.get("start", 0))
         end = safe_str2int(request.query_params.get("end", None))
         try:
-            if start == 0 and end is None:
-                data = logs_instance.open(self.get_object())
-                response = FileResponse(data, content_type="application/yaml")
-            else:
-                data = logs_instance.read(self.get_object(), start, end)
-                response = HttpResponse(data, content_type="application/yaml")
-            if not data:
-                raise NotFound()
-            response["Content-Disposition"] = (
-                "attachment; filename=job_%d.yaml" % self.get_object().id
-            )
-            return response
+            data = logs_instance.stream(self.get_object(), start, end)
         except FileNotFoundError:
             raise NotFound()
+        # Check that the range is not empty before streaming
+        first = next(data, b"")
+        if not first:
+            raise NotFound()
+        response = StreamingHttpResponse(
+            itertools.chain([first], data), content_type="application/yaml"
+        )
+        response["Content-Disposition"] = (
+            "attachment; filename=job_%d.yaml" % self.get_object().id
+        )
+        return response
 
     @detail_route(methods=["get"], suffix="suites")
     def suites(self, request, **kwargs):
@@ -240,40 +433,11 @@ class TestJobViewSet(viewsets.ModelViewSet):
 
     @detail_route(methods=["get"], suffix="tap13")
     def tap13(self, request, **kwargs):
-        stream = io.StringIO()
-        count = TestCase.objects.filter(suite__job=self.get_object()).count()
-        tracker = tap.tracker.Tracker(plan=count, streaming=True, stream=stream)
-
-        # Loop on all test cases
-        for suite in self.get_object().testsuite_set.all().order_by("id"):
-            for case in suite.testcase_set.all().order_by("id"):
-                if case.result == TestCase.RESULT_FAIL:
-                    if (
-                        case.start_log_line is not None
-                        and case.end_log_line is not None
-                    ):
-                        logs = logs_instance.read(
-                            self.get_object(), case.start_log_line, case.end_log_line
-                        )
-                        logs = "\n ".join(logs.split("\n"))
-                        tracker.add_not_ok(
-                            suite.name, case.name, diagnostics=" ---\n " + logs + "..."
-                        )
-                    else:
-                        tracker.add_not_ok(suite.name, case.name)
-                elif case.result == TestCase.RESULT_SKIP:
-                    tracker.add_skip(suite.name, case.name, "test skipped")
-                elif case.result == TestCase.RESULT_UNKNOWN:
-                    tracker.add_not_ok(suite.name, case.name, "TODO unknown result")
-                else:
-                    tracker.add_ok(suite.name, case.name)
-
-        # Send back the stream
-        stream.seek(0)
-        response = HttpResponse(stream, content_type="application/yaml")
-        response["Content-Disposition"] = (
-            "attachment; filename=job_%d.yaml" % self.get_object().id
+        job = self.get_object()
+        response = StreamingHttpResponse(
+            tap13_report(job), content_type="application/yaml"
         )
+        response["Content-Disposition"] = "attachment; filename=job_%d.yaml" % job.id
         return response
 
     @detail_route(methods=["get"], suffix="tests")
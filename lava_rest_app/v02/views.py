@@ -42,7 +42,9 @@ from lava_results_app.utils import (
 from lava_rest_app.base import views as base_views
 from lava_rest_app.base.pasers import PlainTextParser
 from lava_rest_app import filters
-from lava_scheduler_app.dbutils import testjob_submission
+from lava_scheduler_app import environment
+from lava_scheduler_app.api.jobs import submission_error
+from lava_scheduler_app.dbutils import testjob_submission, testjob_submission_many
 from lava_scheduler_app.models import TestJob
 from lava_scheduler_app.schema import SubmissionException
 from lava_scheduler_app.views import __set_device_health__
@@ -89,6 +91,10 @@ class TestJobViewSet(base_views.TestJobViewSet):
 
     * `/jobs/`
 
+    You can submit many jobs at once, with a list of `definitions`, via POST request on:
+
+    * `/jobs/bulk/`
+
     You can validate the given job definition against the schema validator via POST request on:
 
     * `/jobs/validate/`
@@ -251,6 +257,31 @@ class TestJobViewSet(base_views.TestJobViewSet):
             status=status.HTTP_201_CREATED,
         )
 
+    @action(methods=["post"], detail=False, suffix="bulk")
+    def bulk(self, request, **kwargs):
+        definitions = request.data.get("definitions", None)
+        if (
+            not isinstance(definitions, list)
+            or not definitions
+            or not all(isinstance(d, str) and d for d in definitions)
+        ):
+            raise ValidationError(
+                {"definitions": "A list of test job definitions is required."}
+            )
+
+        jobs = []
+        for job in testjob_submission_many(definitions, self.request.user):
+            if isinstance(job, Exception):
+                jobs.append({"error": submission_error(job)})
+            elif isinstance(job, list):
+                jobs.append({"job_ids": [j.sub_id for j in job]})
+            else:
+                jobs.append({"job_ids": [job.id]})
+
+        if not any("job_ids" in job for job in jobs):
+            return Response({"jobs": jobs}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"jobs": jobs}, status=status.HTTP_201_CREATED)
+
     @detail_route(methods=["get"], suffix="cancel")
     def cancel(self, request, **kwargs):
         # django-rest-framework handles django's PermissionDenied error
@@ -406,6 +437,8 @@ class DeviceTypeViewSet(base_views.DeviceTypeViewSet):
                 raise ValidationError({"template": "Device type template is required."})
             try:
                 File("device-type", self.get_object().name).write(template)
+                # The rendered device configurations depend on the templates
+                environment.device_configurations.clear()
                 return Response(
                     {"message": "template updated"}, status=status.HTTP_204_NO_CONTENT
                 )
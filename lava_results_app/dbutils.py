@@ -101,12 +101,14 @@ def create_metadata_store(results, job):
     return meta_filename
 
 
-def map_scanned_results(results, job, starttc, endtc, meta_filename):
+def map_scanned_results(results, job, starttc, endtc, meta_filename, suites=None):
     """
     Sanity checker on the logged results dictionary
     :param results: results logged via the slave
     :param job: the current test job
     :param meta_filename: YAML store for results metadata
+    :param suites: optional dictionary of the TestSuite already fetched for
+                   this job, indexed by name
     :return: the TestCase object that should be saved to the database.
              None on error.
     """
@@ -142,7 +144,11 @@ def map_scanned_results(results, job, starttc, endtc, meta_filename):
         if len(metadata) > 4096:
             metadata = ""
 
-    suite, _ = TestSuite.objects.get_or_create(name=results["definition"], job=job)
+    suite = None if suites is None else suites.get(results["definition"])
+    if suite is None:
+        suite, _ = TestSuite.objects.get_or_create(name=results["definition"], job=job)
+        if suites is not None:
+            suites[suite.name] = suite
     testset = _check_for_testset(results, suite)
 
     name = results["case"].strip()
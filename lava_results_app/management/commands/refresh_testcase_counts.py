@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lava_results_app.models import TestSuite
+
+
+class Command(BaseCommand):
+    """
+    Recompute the test case counters of the test suites
+    """
+
+    help = "Recompute the test case counters of the test suites"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Refresh every suite, not only the suites without counters",
+        )
+        parser.add_argument("--job", type=int, help="Only refresh this job")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of suites refreshed in each transaction",
+        )
+
+    def handle(self, *args, **options):
+        suites = TestSuite.objects.all()
+        if options["job"] is not None:
+            suites = suites.filter(job_id=options["job"])
+        if not options["all"]:
+            suites = suites.filter(count_pass__isnull=True)
+        suite_ids = list(suites.order_by("id").values_list("id", flat=True))
+
+        batch_size = options["batch_size"]
+        for index in range(0, len(suite_ids), batch_size):
+            with transaction.atomic():
+                TestSuite.refresh_counts(suite_ids[index : index + batch_size])
+            self.stdout.write(
+                "* %d/%d" % (min(index + batch_size, len(suite_ids)), len(suite_ids))
+            )
+        self.stdout.write("Refreshed %d suites" % len(suite_ids))
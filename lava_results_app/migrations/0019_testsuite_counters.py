@@ -0,0 +1,57 @@
+# Written by hand, do not regenerate or squash.
+#
+# The columns are added without a default, so the counters of the existing
+# suites stay NULL: they are computed on first use or by
+# "lava-server manage refresh_testcase_counts". The default is only set
+# afterwards, for the new suites. Adding the fields with default=0 directly
+# would set the counters of every existing suite to 0.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("lava_results_app", "0018_drop_buglink")]
+
+    operations = [
+        migrations.AddField(
+            model_name="testsuite",
+            name="count_pass",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="testsuite",
+            name="count_fail",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="testsuite",
+            name="count_skip",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="testsuite",
+            name="count_unknown",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name="testsuite",
+            name="count_pass",
+            field=models.PositiveIntegerField(default=0, null=True),
+        ),
+        migrations.AlterField(
+            model_name="testsuite",
+            name="count_fail",
+            field=models.PositiveIntegerField(default=0, null=True),
+        ),
+        migrations.AlterField(
+            model_name="testsuite",
+            name="count_skip",
+            field=models.PositiveIntegerField(default=0, null=True),
+        ),
+        migrations.AlterField(
+            model_name="testsuite",
+            name="count_unknown",
+            field=models.PositiveIntegerField(default=0, null=True),
+        ),
+    ]
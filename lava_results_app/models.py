@@ -29,6 +29,8 @@ TestCase is a single lava-test-case record or Action result.
 """
 
 from datetime import timedelta
+import hashlib
+import json
 import logging
 from urllib.parse import quote
 import yaml
@@ -38,11 +40,12 @@ from django.conf import settings
 from django.contrib.auth.models import User, Group
 from django.contrib.contenttypes import fields
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models, connection, transaction
-from django.db.models import Case, IntegerField, Lookup, Q, Sum, When
+from django.db.models import Avg, Count, F, Lookup, Max, Q
 from django.db.models.fields import Field
-from django.db.models.signals import pre_save
+from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
@@ -172,44 +175,58 @@ class TestSuite(models.Model, Queryable):
         verbose_name=u"Suite name", blank=True, null=True, default=None, max_length=200
     )
 
+    # Number of test cases for each result, updated when the test cases are
+    # saved. NULL for the suites created before the counters: computed on
+    # first use.
+    count_pass = models.PositiveIntegerField(null=True, default=0)
+    count_fail = models.PositiveIntegerField(null=True, default=0)
+    count_skip = models.PositiveIntegerField(null=True, default=0)
+    count_unknown = models.PositiveIntegerField(null=True, default=0)
+
+    COUNTERS = ["pass", "fail", "skip", "unknown"]
+
+    @classmethod
+    def add_counts(cls, counts):
+        """
+        Add the counts ({suite_id: {result: count}}) to the counters.
+        """
+        for (suite_id, values) in counts.items():
+            updates = {}
+            for (result, count) in values.items():
+                field = "count_%s" % TestCase.RESULT_REVERSE[result]
+                updates[field] = F(field) + count
+            cls.objects.filter(pk=suite_id).update(**updates)
+
+    @classmethod
+    def refresh_counts(cls, suite_ids):
+        """
+        Recompute the counters of the given suites from the test cases.
+        """
+        counts = {suite_id: {} for suite_id in suite_ids}
+        rows = (
+            TestCase.objects.filter(suite_id__in=suite_ids)
+            .order_by()
+            .values_list("suite_id", "result")
+            .annotate(count=Count("id"))
+        )
+        for (suite_id, result, count) in rows:
+            counts[suite_id][result] = count
+        for (suite_id, values) in counts.items():
+            updates = {}
+            for (result, name) in TestCase.RESULT_REVERSE.items():
+                updates["count_%s" % name] = values.get(result, 0)
+            cls.objects.filter(pk=suite_id).update(**updates)
+        return counts
+
     def testcase_count(self, value=None):
-        if not hasattr(self, "_testcase_count"):
-            res = self.testcase_set.values("result")
-            res = res.aggregate(
-                PASS=Sum(
-                    Case(
-                        When(result=TestCase.RESULT_PASS, then=1),
-                        default=0,
-                        output_field=IntegerField(),
-                    )
-                ),
-                FAIL=Sum(
-                    Case(
-                        When(result=TestCase.RESULT_FAIL, then=1),
-                        default=0,
-                        output_field=IntegerField(),
-                    )
-                ),
-                SKIP=Sum(
-                    Case(
-                        When(result=TestCase.RESULT_SKIP, then=1),
-                        default=0,
-                        output_field=IntegerField(),
-                    )
-                ),
-                UNKNOWN=Sum(
-                    Case(
-                        When(result=TestCase.RESULT_UNKNOWN, then=1),
-                        default=0,
-                        output_field=IntegerField(),
-                    )
-                ),
-            )
-            self._testcase_count = {k.lower(): (v or 0) for (k, v) in res.items()}
+        if self.count_pass is None:
+            counts = self.refresh_counts([self.pk])[self.pk]
+            for (result, name) in TestCase.RESULT_REVERSE.items():
+                setattr(self, "count_%s" % name, counts.get(result, 0))
 
         if value is None:
-            return sum([v for (k, v) in self._testcase_count.items()])
-        return self._testcase_count[value]
+            return sum(getattr(self, "count_%s" % name) for name in self.COUNTERS)
+        return getattr(self, "count_%s" % value)
 
     def get_passfail_results(self):
         # Get pass fail results per lava_results_app.testsuite.
@@ -1113,12 +1130,28 @@ class Query(models.Model):
             return True
         return False
 
+    def get_cache_version(self):
+        # The omitted results change the query results without a refresh.
+        # Read from the database: the cache is not shared by the processes.
+        omitted = QueryOmitResult.objects.filter(query=self).aggregate(
+            count=Count("id"), last=Max("id")
+        )
+        return [omitted["count"], omitted["last"]]
+
     def get_absolute_url(self):
         return reverse(
             "lava.results.query_display", args=[self.owner.username, self.name]
         )
 
 
+@receiver(post_save, sender=TestCase)
+def testcase_count_signal(sender, instance, created, raw, **kwargs):
+    # TestCase.objects.bulk_create() does not send this signal: the caller
+    # should update the counters with TestSuite.add_counts()
+    if created and not raw:
+        TestSuite.add_counts({instance.suite_id: {instance.result: 1}})
+
+
 @receiver(pre_save, sender=Query)
 def limit_update_signal(sender, instance, **kwargs):
     # If the object does not exists, this is a new query: ignore
@@ -1308,6 +1341,26 @@ class QueryCondition(models.Model):
         return operators
 
 
+def _load_metadata(metadata):
+    # Same as TestCase.action_metadata
+    if not metadata:
+        return None
+    try:
+        return yaml_load(metadata)
+    except yaml.YAMLError:
+        return None
+
+
+def _add_attribute_result(results, attributes, metadata, fail):
+    # Add the float values of the given attributes, unless already set.
+    if not isinstance(metadata, dict):
+        return
+    for (key, value) in metadata.items():
+        if key in attributes and key not in results:
+            with contextlib.suppress(TypeError, ValueError):
+                results[key] = {"fail": fail, "value": float(value)}
+
+
 def _get_foreign_key_model(model, fieldname):
     """ Returns model if field is a foreign key, otherwise None. """
     field_object = model._meta.get_field(fieldname)
@@ -1467,6 +1520,21 @@ class ChartQuery(models.Model):
 
     ORDER_BY_MAP = {TestJob: "end_time", TestCase: "logged", TestSuite: "job__end_time"}
 
+    # Columns used by the charts
+    CHART_FIELDS = {
+        TestJob: ["id", "sub_id", "end_time", "health"],
+        TestSuite: ["id", "name", "job_id", "job__end_time"],
+        TestCase: [
+            "id",
+            "name",
+            "logged",
+            "suite__job_id",
+            "measurement",
+            "result",
+            "metadata",
+        ],
+    }
+
     DATE_FORMAT = "%d/%m/%Y %H:%M"
 
     def get_data(self, user, content_type=None, conditions=None):
@@ -1481,6 +1549,13 @@ class ChartQuery(models.Model):
         chart_data["basic"] = self.get_basic_chart_data()
         chart_data["user"] = self.get_user_chart_data(user)
 
+        cache_key = self.get_cache_key(user)
+        if cache_key is not None:
+            data = cache.get(cache_key)
+            if data is not None:
+                chart_data["data"] = data
+                return chart_data
+
         # TODO: order by attribute if attribute is used for x-axis.
         if hasattr(self, "query"):
             results = self.query.get_results(user).order_by(
@@ -1505,8 +1580,33 @@ class ChartQuery(models.Model):
         elif self.chart_type == "attributes":
             chart_data["data"] = self.get_chart_attributes_data(user, results)
 
+        if cache_key is not None and "data" in chart_data:
+            cache.set(cache_key, chart_data["data"], settings.CHART_CACHE_TIMEOUT)
+
         return chart_data
 
+    def get_cache_key(self, user):
+        # Only the data of saved and refreshed queries is cached: the query
+        # results only change when the query is refreshed.
+        if not hasattr(self, "query") or self.query.is_live:
+            return None
+        if self.query.last_updated is None:
+            return None
+        key = json.dumps(
+            [
+                self.id,
+                user.id,
+                self.chart_type,
+                self.xaxis_attribute,
+                self.attributes,
+                self.query.last_updated.isoformat(),
+                self.query.get_cache_version(),
+            ]
+        )
+        return "lava_results_app.chart_query.%s" % (
+            hashlib.sha256(key.encode("utf-8")).hexdigest()
+        )
+
     def get_basic_chart_data(self):
         data = {}
         fields = [
@@ -1558,41 +1658,116 @@ class ChartQuery(models.Model):
 
         return data
 
-    def get_chart_passfail_data(self, user, query_results):
+    def get_chart_items(self, query_results):
+        """
+        Return the model and the rows of the query results, in order, with
+        only the columns used by the charts.
+        The charts are computed with a fixed number of queries, whatever the
+        number of results.
+        """
+        model = next(m for m in self.CHART_FIELDS if issubclass(query_results.model, m))
+        items = []
+        for item in query_results.values(*self.CHART_FIELDS[model]):
+            if model == TestJob:
+                item["job_id"] = item["id"]
+                item["link"] = reverse(
+                    "lava.scheduler.job.detail", args=[item["sub_id"] or item["id"]]
+                )
+            elif model == TestSuite:
+                item["end_time"] = item.pop("job__end_time")
+                item["link"] = reverse(
+                    "lava.results.suite", args=[item["job_id"], item["name"]]
+                )
+            else:
+                item["end_time"] = item.pop("logged")
+                item["job_id"] = item.pop("suite__job_id")
+                item["link"] = reverse("lava.results.testcase", args=[item["id"]])
+            items.append(item)
+        return (model, items)
 
-        data = []
-        for item in query_results:
+    def get_chart_dates(self, items):
+        """
+        Return the items with their date and x-axis attribute.
+        """
+        attributes = {}
+        if self.xaxis_attribute:
+            rows = (
+                TestData.objects.filter(
+                    testjob_id__in={item["job_id"] for item in items},
+                    attributes__name=self.xaxis_attribute,
+                )
+                .order_by("attributes__id")
+                .values_list("testjob_id", "attributes__value")
+            )
+            # Like TestJob.get_xaxis_attribute, use the first value
+            for (job_id, value) in rows:
+                attributes.setdefault(job_id, value)
 
+        for item in items:
             # Set attribute based on xaxis_attribute.
-            attribute = item.get_xaxis_attribute(self.xaxis_attribute)
+            attribute = attributes.get(item["job_id"])
             # If xaxis attribute is set and this query item does not have
             # this specific attribute, ignore it.
             if self.xaxis_attribute and not attribute:
                 continue
 
-            date = str(item.get_end_datetime())
-            attribute = attribute if attribute is not None else date
+            date = str(item["end_time"])
+            yield (item, date, attribute if attribute is not None else date)
+
+    def get_chart_suites(self, model, items):
+        """
+        Return the test suites of the jobs (or the test suites themselves)
+        with up to date counters.
+        """
+        if model == TestJob:
+            suites = TestSuite.objects.filter(job_id__in=[i["id"] for i in items])
+        else:
+            suites = TestSuite.objects.filter(id__in=[i["id"] for i in items])
+        # Suites created before the counters
+        outdated = list(
+            suites.filter(count_pass__isnull=True).values_list("id", flat=True)
+        )
+        if outdated:
+            TestSuite.refresh_counts(outdated)
+        return suites.order_by("id")
+
+    def get_chart_passfail_data(self, user, query_results):
+
+        (model, items) = self.get_chart_items(query_results)
+        # Pass/fail charts for testcases do not make sense.
+        if model == TestCase:
+            return []
 
-            passfail_results = item.get_passfail_results()
-            for result in passfail_results:
+        key = "job_id" if model == TestJob else "id"
+        counters = ["count_%s" % name for name in TestSuite.COUNTERS]
+        passfail_results = {}
+        for suite in self.get_chart_suites(model, items).values(
+            "id", "job_id", "name", *counters
+        ):
+            passfail_results.setdefault(suite[key], {})[suite["name"]] = {
+                name: suite["count_%s" % name] for name in TestSuite.COUNTERS
+            }
 
+        data = []
+        for (item, date, attribute) in self.get_chart_dates(items):
+            for (result, counts) in passfail_results.get(item["id"], {}).items():
                 if result:
                     chart_item = {
                         "id": result,
-                        "pk": item.id,
-                        "link": item.get_absolute_url(),
+                        "pk": item["id"],
+                        "link": item["link"],
                         "date": date,
                         "attribute": attribute,
-                        "pass": passfail_results[result]["fail"] == 0,
-                        "passes": passfail_results[result]["pass"],
-                        "failures": passfail_results[result]["fail"],
-                        "skip": passfail_results[result]["skip"],
-                        "unknown": passfail_results[result]["unknown"],
+                        "pass": counts["fail"] == 0,
+                        "passes": counts["pass"],
+                        "failures": counts["fail"],
+                        "skip": counts["skip"],
+                        "unknown": counts["unknown"],
                         "total": (
-                            passfail_results[result]["pass"]
-                            + passfail_results[result]["fail"]
-                            + passfail_results[result]["unknown"]
-                            + passfail_results[result]["skip"]
+                            counts["pass"]
+                            + counts["fail"]
+                            + counts["unknown"]
+                            + counts["skip"]
                         ),
                     }
                     data.append(chart_item)
@@ -1601,54 +1776,122 @@ class ChartQuery(models.Model):
 
     def get_chart_measurement_data(self, user, query_results):
 
-        data = []
-        for item in query_results:
-
-            # Set attribute based on xaxis_attribute.
-            attribute = item.get_xaxis_attribute(self.xaxis_attribute)
-            # If xaxis attribute is set and this query item does not have
-            # this specific attribute, ignore it.
-            if self.xaxis_attribute and not attribute:
-                continue
-
-            date = str(item.get_end_datetime())
-            attribute = attribute if attribute is not None else date
-
-            measurement_results = item.get_measurement_results()
-            for result in measurement_results:
+        (model, items) = self.get_chart_items(query_results)
+        measurement_results = {}
+        if model == TestJob:
+            # Average of the measurements of each suite
+            rows = (
+                self.get_chart_suites(model, items)
+                .annotate(test_case_avg=Avg("testcase__measurement"))
+                .values_list("job_id", "name", "test_case_avg", "count_fail")
+            )
+            for (job_id, name, measurement, fail) in rows:
+                measurement_results.setdefault(job_id, {})[name] = {
+                    "measurement": measurement,
+                    "fail": fail,
+                }
+        elif model == TestSuite:
+            rows = (
+                TestCase.objects.filter(suite_id__in=[i["id"] for i in items])
+                .order_by("id")
+                .values_list("suite_id", "name", "measurement", "result")
+            )
+            for (suite_id, name, measurement, result) in rows:
+                measurement_results.setdefault(suite_id, {})[name] = {
+                    "measurement": measurement,
+                    "fail": result != TestCase.RESULT_PASS,
+                }
+        else:
+            for item in items:
+                measurement_results[item["id"]] = {
+                    item["name"]: {
+                        "measurement": item["measurement"],
+                        "fail": item["result"] != TestCase.RESULT_PASS,
+                    }
+                }
 
+        data = []
+        for (item, date, attribute) in self.get_chart_dates(items):
+            for (result, values) in measurement_results.get(item["id"], {}).items():
                 if result:
                     chart_item = {
                         "id": result,
-                        "pk": item.id,
-                        "link": item.get_absolute_url(),
+                        "pk": item["id"],
+                        "link": item["link"],
                         "date": date,
                         "attribute": attribute,
-                        "pass": measurement_results[result]["fail"] == 0,
-                        "measurement": measurement_results[result]["measurement"],
+                        "pass": values["fail"] == 0,
+                        "measurement": values["measurement"],
                     }
-                data.append(chart_item)
+                    data.append(chart_item)
 
         return data
 
     def get_chart_attributes_data(self, user, query_results):
 
-        data = []
-        for item in query_results:
+        (model, items) = self.get_chart_items(query_results)
+        attributes = [x.strip() for x in (self.attributes or "").split(",")]
+        attribute_results = {}
+        if model == TestJob:
+            health = {item["id"]: item["health"] for item in items}
+            rows = (
+                TestData.objects.filter(
+                    testjob_id__in=health.keys(), attributes__name__in=attributes
+                )
+                .order_by("attributes__id")
+                .values_list("testjob_id", "attributes__name", "attributes__value")
+            )
+            # Like TestJob.get_attribute_results, use the last value
+            values = {}
+            for (job_id, name, value) in rows:
+                values.setdefault(job_id, {})[name] = value
+            for (job_id, metadata) in values.items():
+                _add_attribute_result(
+                    attribute_results.setdefault(job_id, {}),
+                    attributes,
+                    metadata,
+                    health[job_id] != TestJob.HEALTH_COMPLETE,
+                )
+        elif model == TestSuite:
+            # Use only the metadata from the first testcase atm.
+            rows = (
+                TestCase.objects.filter(suite_id__in=[i["id"] for i in items])
+                .exclude(metadata__isnull=True)
+                .exclude(metadata="")
+                .order_by("id")
+                .values_list("suite_id", "result", "metadata")
+            )
+            for (suite_id, result, metadata) in rows:
+                _add_attribute_result(
+                    attribute_results.setdefault(suite_id, {}),
+                    attributes,
+                    _load_metadata(metadata),
+                    result != TestCase.RESULT_PASS,
+                )
+        else:
+            for item in items:
+                _add_attribute_result(
+                    attribute_results.setdefault(item["id"], {}),
+                    attributes,
+                    _load_metadata(item["metadata"]),
+                    item["result"] != TestCase.RESULT_PASS,
+                )
 
-            attribute_results = item.get_attribute_results(self.attributes)
-            for result in attribute_results:
+        data = []
+        for item in items:
+            date = str(item["end_time"])
+            for (result, values) in attribute_results.get(item["id"], {}).items():
                 if result:
                     chart_item = {
                         "id": result,
-                        "pk": item.id,
-                        "attribute": str(item.get_end_datetime()),
-                        "link": item.get_absolute_url(),
-                        "date": str(item.get_end_datetime()),
-                        "pass": attribute_results[result]["fail"] == 0,
-                        "attr_value": attribute_results[result]["value"],
+                        "pk": item["id"],
+                        "attribute": date,
+                        "link": item["link"],
+                        "date": date,
+                        "pass": values["fail"] == 0,
+                        "attr_value": values["value"],
                     }
-                data.append(chart_item)
+                    data.append(chart_item)
 
         return data
 
@@ -19,7 +19,6 @@
 # along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import annotations
 
-import os
 import xmlrpc.client
 from functools import wraps
 
@@ -35,6 +34,7 @@ from lava_scheduler_app.dbutils import (
     device_type_summary,
     testjob_submission,
 )
+from lava_scheduler_app.logutils import logs_instance
 from lava_scheduler_app.models import (
     Device,
     DevicesUnavailableException,
@@ -275,12 +275,11 @@ class SchedulerAPI(ExposedV2API):
             )
 
         # Open the logs
-        output_path = os.path.join(job.output_dir, "output.yaml")
         try:
-            with open(output_path, encoding="utf-8", errors="replace") as f_logs:
-                if f_logs:
-                    f_logs.seek(offset)
-                return xmlrpc.client.Binary(f_logs.read().encode("UTF-8"))
+            with logs_instance.open(job) as f_logs:
+                f_logs.seek(offset)
+                data = f_logs.read().decode("utf-8", errors="replace")
+                return xmlrpc.client.Binary(data.encode("UTF-8"))
         except OSError:
             raise xmlrpc.client.Fault(404, "Job output not found.")
 
@@ -25,6 +25,7 @@ from django.db import IntegrityError
 from django.forms import ValidationError
 
 from linaro_django_xmlrpc.models import ExposedV2API
+from lava_scheduler_app import environment
 from lava_scheduler_app.api import check_perm
 from lava_scheduler_app.models import Alias, DeviceType
 from lava_server.files import File
@@ -267,6 +268,8 @@ class SchedulerDeviceTypesAPI(ExposedV2API):
 
         try:
             File("device-type", name).write(config)
+            # The rendered device configurations depend on the templates
+            environment.device_configurations.clear()
         except OSError as exc:
             raise xmlrpc.client.Fault(
                 400, "Unable to write device-type configuration: %s" % exc.strerror
@@ -21,6 +21,7 @@ import os
 from datetime import timedelta
 import voluptuous
 import xmlrpc.client
+import yaml
 
 from django.conf import settings
 from django.utils import timezone
@@ -30,11 +31,33 @@ from linaro_django_xmlrpc.models import ExposedV2API
 from lava_common.compat import yaml_safe_load
 import lava_common.schemas as schemas
 from lava_scheduler_app.api import SchedulerAPI
+from lava_scheduler_app.dbutils import testjob_submission_many
 from lava_scheduler_app.logutils import logs_instance
-from lava_scheduler_app.models import TestJob
+from lava_scheduler_app.models import (
+    Device,
+    DeviceType,
+    DevicesUnavailableException,
+    TestJob,
+)
+from lava_scheduler_app.schema import SubmissionException
 from lava_results_app.models import TestCase
 
 
+def submission_error(exc):
+    # Same messages as scheduler.jobs.submit
+    if isinstance(exc, SubmissionException):
+        return "Problem with submitted job data: %s" % exc
+    if isinstance(exc, ValueError):
+        return "Decoding job submission failed: %s." % exc
+    if isinstance(exc, yaml.YAMLError):
+        return "Invalid job definition: %s." % exc
+    if isinstance(exc, (Device.DoesNotExist, DeviceType.DoesNotExist)):
+        return "Specified device or device type not found."
+    if isinstance(exc, DevicesUnavailableException):
+        return "Device unavailable: %s" % exc
+    return "Job submission failed: %s." % exc
+
+
 def load_optional_file(filename):
     try:
         with open(filename, "r") as f_in:
@@ -472,6 +495,48 @@ class SchedulerJobsAPI(ExposedV2API):
         cls = SchedulerAPI(self._context)
         return cls.submit_job(definition)
 
+    def submit_many(self, definitions):
+        """
+        Name
+        ----
+        `scheduler.jobs.submit_many` (`definitions`)
+
+        Description
+        -----------
+        Submit the given list of job data which are in LAVA job JSON or YAML
+        format as new jobs to LAVA scheduler.
+        Faster than calling `scheduler.jobs.submit` for each job: the jobs are
+        created at once.
+
+        Arguments
+        ---------
+        `definitions`: array of strings
+            Job JSON or YAML strings.
+
+        Return value
+        ------------
+        This function returns an array with one dictionary for each job
+        definition, provided the user is authenticated with an username and
+        token. The dictionary has either the key `job_ids`, the list of the
+        newly created job ids (more than one for multinode jobs), or the key
+        `error` with the reason why the job was rejected.
+        """
+        self._authenticate()
+        if not isinstance(definitions, list) or not all(
+            isinstance(d, str) for d in definitions
+        ):
+            raise xmlrpc.client.Fault(400, "'definitions' should be a list of strings")
+
+        ret = []
+        for job in testjob_submission_many(definitions, self.user):
+            if isinstance(job, Exception):
+                ret.append({"error": submission_error(job)})
+            elif isinstance(job, list):
+                ret.append({"job_ids": [j.sub_id for j in job]})
+            else:
+                ret.append({"job_ids": [job.id]})
+        return ret
+
     def validate(self, definition, strict=False):
         """
         Name
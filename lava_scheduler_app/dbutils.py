@@ -26,30 +26,40 @@ Used to allow models.py to be shortened and easier to follow.
 
 import contextlib
 import os
+from pathlib import Path
 import yaml
 import jinja2
 import logging
 
+from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
 from django.db.models import Q, Case, When, IntegerField, Sum
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 from django.contrib.sites.models import Site
+from django.utils import timezone
 
-from lava_common.compat import yaml_load, yaml_safe_load
+from lava_common.compat import yaml_load, yaml_safe_dump, yaml_safe_load
 from lava_common.decorators import nottest
+from lava_common.version import __version__
 import lava_scheduler_app.environment as environment
 from lava_scheduler_app.models import (
     Device,
     DeviceType,
+    DevicesUnavailableException,
     NotificationRecipient,
+    RemoteArtifactsAuth,
+    SubmissionLookups,
     TestJob,
     Worker,
+    _singlenode_job,
 )
 from lava_scheduler_app.schema import validate_submission, SubmissionException
 from lava_results_app.dbutils import map_metadata
 from lava_results_app.models import Query
+from lava_server.files import File
 
 
 def match_vlan_interface(device, job_def):
@@ -114,12 +124,89 @@ def testjob_submission(job_definition, user, original_job=None):
         DeviceType.DoesNotExist, DevicesUnavailableException,
         ValueError
     """
-    validate_job(job_definition)
+    job_data = validate_job(job_definition)
     # returns a single job or a list (not a QuerySet) of job objects.
-    job = TestJob.from_yaml_and_user(job_definition, user, original_job=original_job)
+    job = TestJob.from_yaml_and_user(
+        job_definition, user, original_job=original_job, job_data=job_data
+    )
     return job
 
 
+@nottest
+def testjob_submission_many(job_definitions, user):
+    """
+    Bulk submission frontend for YAML
+    The database lookups are shared by every submission and the singlenode
+    jobs are created at once, in the same transaction.
+    :param job_definitions: list of strings of the job submissions
+    :param user: user attempting the submissions
+    :return: for each submission, a job, a list of jobs or the exception
+        raised by the submission (see testjob_submission)
+    """
+    # Avoid a circular import
+    from lava_scheduler_app.signals import send_testjob_events
+
+    lookups = SubmissionLookups(user)
+    results = []
+    pending = []
+    with transaction.atomic():
+        for job_definition in job_definitions:
+            try:
+                job_data = validate_job(job_definition)
+                if "visibility" not in job_data:
+                    raise SubmissionException("Job visibility must be specified.")
+                if "lava-multinode" in job_data.get("protocols", {}):
+                    # The sub jobs are created one by one: the sub_id is
+                    # computed from the id of the first one.
+                    with transaction.atomic():
+                        results.append(
+                            TestJob.from_yaml_and_user(
+                                job_definition, user, job_data=job_data, lookups=lookups
+                            )
+                        )
+                    continue
+                if "device_type" not in job_data:
+                    raise SubmissionException("Job device_type must be specified.")
+                (job, taglist, viewing_groups) = _singlenode_job(
+                    job_definition, job_data, user, lookups=lookups
+                )
+            except (
+                SubmissionException,
+                Device.DoesNotExist,
+                DeviceType.DoesNotExist,
+                DevicesUnavailableException,
+                ValueError,
+                yaml.YAMLError,
+            ) as exc:
+                results.append(exc)
+                continue
+            # bulk_create does not send the signals updating the visibility
+            job.visibility = lookups.visibility(job, viewing_groups)
+            results.append(job)
+            pending.append((job, taglist, viewing_groups))
+
+        TestJob.objects.bulk_create([job for (job, _, _) in pending])
+        # The tags can be duplicated in the definitions: "job.tags.add()" in
+        # the single submission ignores them
+        TestJob.tags.through.objects.bulk_create(
+            [
+                TestJob.tags.through(testjob_id=job.id, tag_id=tag_id)
+                for (job, taglist, _) in pending
+                for tag_id in sorted({tag.id for tag in taglist})
+            ]
+        )
+        TestJob.viewing_groups.through.objects.bulk_create(
+            [
+                TestJob.viewing_groups.through(testjob_id=job.id, group_id=group.id)
+                for (job, _, viewing_groups) in pending
+                for group in viewing_groups
+            ]
+        )
+
+    send_testjob_events([job for (job, _, _) in pending])
+    return results
+
+
 def parse_job_description(job):
     filename = os.path.join(job.output_dir, "description.yaml")
     logger = logging.getLogger("lava-master")
@@ -305,6 +392,7 @@ def validate_job(data):
     # validate against the submission schema.
     validate_submission(yaml_data)  # raises SubmissionException if invalid.
     validate_yaml(yaml_data)  # raises SubmissionException if invalid.
+    return yaml_data
 
 
 def validate_yaml(yaml_data):
@@ -378,3 +466,254 @@ def get_domain():
         domain = site.domain
 
     return domain
+
+
+def worker_ping(worker, version):
+    """
+    Record a ping from the worker and return True if the worker version does
+    not match the server version.
+    """
+    version_mismatch = bool(version != __version__)
+
+    # Save worker version
+    worker.version = version
+    if version_mismatch and not settings.ALLOW_VERSION_MISMATCH:
+        # If the version does not match, go offline
+        worker.go_state_offline()
+    else:
+        # Set last_ping
+        worker.last_ping = timezone.now()
+
+        # Go online if needed
+        if worker.state == Worker.STATE_OFFLINE:
+            worker.go_state_online()
+    worker.save()
+    return version_mismatch
+
+
+def worker_jobs(worker, start=True, payload=False, sent=()):
+    """
+    Return the jobs to start, cancel and keep running on this worker.
+    When payload is True, the start payload (see job_start_payload) is
+    added to every job to start, except for the jobs in "sent" whose payload
+    was already sent to the worker.
+    """
+    # Grab the jobs for this dispatcher
+    query = TestJob.objects.filter(actual_device__worker_host=worker)
+
+    # Scheduled
+    starts = []
+    if start:
+        start_query = query.filter(state=TestJob.STATE_SCHEDULED)
+        starts = list(start_query.values("id", "token"))
+        for job in start_query.filter(target_group__isnull=False):
+            starts += [{"id": j.id, "token": j.token} for j in job.dynamic_jobs()]
+        if payload:
+            payloads = jobs_start_payloads(
+                [s["id"] for s in starts if s["id"] not in sent]
+            )
+            for data in starts:
+                # Let the worker fetch the payload itself on error
+                if data["id"] in payloads and "error" not in payloads[data["id"]]:
+                    data["payload"] = payloads[data["id"]]
+
+    # Canceling
+    cancel_query = query.filter(state=TestJob.STATE_CANCELING)
+    cancels = list(cancel_query.values("id", "token"))
+    for job in cancel_query.filter(target_group__isnull=False):
+        cancels += [{"id": j.id, "token": j.token} for j in job.dynamic_jobs()]
+
+    # Running
+    running_query = query.filter(state=TestJob.STATE_RUNNING)
+    runnings = list(running_query.values("id", "token"))
+    for job in running_query.filter(target_group__isnull=False):
+        runnings += [{"id": j.id, "token": j.token} for j in job.dynamic_jobs()]
+
+    return {"cancel": cancels, "running": runnings, "start": starts}
+
+
+def worker_config(hostname):
+    """
+    Return the dispatcher, env and env-dut configuration files of the worker.
+    Raise OSError when a configuration file is invalid.
+    """
+
+    def config(kind):
+        try:
+            data = File(kind, hostname).read(raising=False)
+            yaml_safe_load(data)
+            return data
+        except yaml.YAMLError:
+            # Raise an OSError because the caller uses yaml.YAMLError for a
+            # specific usage. Allows here to specify the faulty filename.
+            raise OSError("", f"Invalid YAML file for {hostname}: {kind} file")
+
+    return {
+        "dispatcher": config("dispatcher"),
+        "env": config("env"),
+        "env-dut": config("env-dut"),
+    }
+
+
+def job_start_payload(job, configs=None, remote_tokens=None):
+    """
+    Return the definition and the configuration files needed by the worker
+    to start the job. A copy is saved in the job output directory.
+    Raise OSError when a configuration file is invalid.
+
+    configs and remote_tokens are caches of the worker configurations (by
+    hostname) and of the remote artifact tokens (by submitter) that can be
+    shared between calls.
+    """
+    if configs is None:
+        configs = {}
+    if remote_tokens is None:
+        remote_tokens = {}
+
+    job_def = yaml_safe_load(job.definition)
+    job_def["compatibility"] = job.pipeline_compatibility
+    job_def_str_safe = yaml_safe_dump(job_def)
+
+    if job.submitter_id not in remote_tokens:
+        remote_tokens[job.submitter_id] = {
+            x["name"]: x["token"]
+            for x in RemoteArtifactsAuth.objects.filter(
+                user_id=job.submitter_id
+            ).values("name", "token")
+        }
+    tokens = remote_tokens[job.submitter_id]
+
+    def update_token(headers_dict):
+        for key in headers_dict["headers"]:
+            token_name = headers_dict["headers"][key]
+            if token_name in tokens.keys():
+                headers_dict["headers"][key] = tokens[token_name]
+
+    if "actions" in job_def:
+        for action in job_def["actions"]:
+            for k, v in action.items():
+                if k == "deploy":
+                    for a, b in v.items():
+                        if isinstance(b, dict):
+                            if "url" in b and "headers" in b:
+                                update_token(b)
+                            for i, j in b.items():
+                                if isinstance(j, dict):
+                                    if "url" in j and "headers" in j:
+                                        update_token(j)
+
+    if "secrets" in job_def:
+        for k, v in job_def["secrets"].items():
+            if v in tokens.keys():
+                job_def["secrets"][k] = tokens[v]
+
+    job_def_str = yaml_safe_dump(job_def)
+    job_ctx = job_def.get("context", {})
+
+    if job.dynamic_connection:
+        host = job.dynamic_host()
+        device = host.actual_device
+        worker = device.worker_host
+        host_device_cfg = device.load_configuration(job_ctx)
+        device_cfg_str = yaml_safe_dump(device.minimise_configuration(host_device_cfg))
+    else:
+        device = job.actual_device
+        worker = device.worker_host
+        device_cfg_str = device.load_configuration(job_ctx, output_format="yaml")
+
+    if worker.hostname not in configs:
+        configs[worker.hostname] = worker_config(worker.hostname)
+    env_str = configs[worker.hostname]["env"]
+    env_dut_str = configs[worker.hostname]["env-dut"]
+    dispatcher_cfg = configs[worker.hostname]["dispatcher"]
+
+    # Save the configuration
+    path = Path(job.output_dir)
+    path.mkdir(mode=0o755, parents=True, exist_ok=True)
+    (path / "job.yaml").write_text(job_def_str_safe, encoding="utf-8")
+    (path / "device.yaml").write_text(device_cfg_str, encoding="utf-8")
+    if dispatcher_cfg:
+        (path / "dispatcher.yaml").write_text(dispatcher_cfg, encoding="utf-8")
+    if env_str:
+        (path / "env.yaml").write_text(env_str)
+    if env_dut_str:
+        (path / "env-dut.yaml").write_text(env_dut_str, encoding="utf-8")
+
+    return {
+        "definition": job_def_str,
+        "device": device_cfg_str,
+        "dispatcher": dispatcher_cfg,
+        "env": env_str,
+        "env-dut": env_dut_str,
+    }
+
+
+def jobs_start_payloads(pks):
+    """
+    Return the start payloads (see job_start_payload) of the given jobs,
+    indexed by job id. The configuration of each worker is only read once.
+    Jobs that cannot be started get {"error": "..."} instead.
+    """
+    jobs = TestJob.objects.select_related("actual_device__worker_host").in_bulk(pks)
+    configs = {}
+    tokens = {}
+    payloads = {}
+    for pk in pks:
+        if pk not in jobs:
+            payloads[pk] = {"error": f"Unknown job '{pk}'"}
+            continue
+        try:
+            payloads[pk] = job_start_payload(jobs[pk], configs, tokens)
+        except OSError as exc:
+            payloads[pk] = {"error": exc.strerror}
+        except Exception as exc:
+            # Only this job is affected, like a broken device configuration
+            logger = logging.getLogger("lava-master")
+            logger.exception("[%d] unable to build the start payload", pk)
+            payloads[pk] = {"error": f"Unable to build the payload: {exc}"}
+    return payloads
+
+
+def job_update_state(pk, data):
+    """
+    Update the job state as reported by the worker.
+    Raise ValueError when the data is invalid.
+    """
+    state = data.get("state", "").capitalize()
+    if state not in TestJob.STATE_REVERSE:
+        raise ValueError(f"Invalid state '{state}'")
+
+    with transaction.atomic():
+        # TODO: find a way to lock actual_device
+        job = TestJob.objects.select_for_update().get(pk=pk)
+        if TestJob.STATE_REVERSE[state] == TestJob.STATE_RUNNING:
+            job.go_state_running()
+        elif TestJob.STATE_REVERSE[state] == TestJob.STATE_FINISHED:
+            # Check the result
+            health = data.get("result", "")
+            error_type = data.get("error_type", "")
+            errors = data.get("errors")
+            description = data.get("description", "")
+            if health not in ["pass", "fail"]:
+                raise ValueError(f"Invalid health '{health}'")
+
+            health = (
+                TestJob.HEALTH_COMPLETE
+                if health == "pass"
+                else TestJob.HEALTH_INCOMPLETE
+            )
+            infrastructure_error = error_type in [
+                "Bug",
+                "Configuration",
+                "Infrastructure",
+            ]
+            job.go_state_finished(health, infrastructure_error)
+            if errors:
+                job.failure_comment = errors
+            Path(job.output_dir).mkdir(mode=0o755, parents=True, exist_ok=True)
+            (Path(job.output_dir) / "description.yaml").write_text(
+                description, encoding="utf-8"
+            )
+        else:
+            raise ValueError(f"Not handled state '{state}'")
+        job.save()
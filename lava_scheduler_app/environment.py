@@ -19,7 +19,14 @@
 from __future__ import annotations
 
 import jinja2
+import jinja2.meta
+import os
+import simplejson
+import threading
+from collections import OrderedDict
 from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
 
 from lava_server.files import File
 
@@ -57,3 +64,158 @@ def device_types():
         )
         device_types_jinja_env.set(device_types_env)
         return device_types_env
+
+
+UNSET = object()
+
+
+@dataclass
+class DeviceConfiguration:
+    # (path, (st_mtime_ns, st_size) or None) for every file that the rendering
+    # depends on, including the paths that were looked up but missing.
+    fingerprint: Tuple[Tuple[str, Optional[Tuple[int, int]]], ...]
+    # None when the template cannot be rendered
+    rendered: Optional[str]
+    # Filled lazily by the callers
+    data: Any = UNSET
+    valid: Any = UNSET
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+class DeviceConfigurationCache:
+    """
+    Cache the rendered device configurations.
+
+    An entry is only reused if none of the files used to render it (the device
+    dictionary, the extended and included device-type templates and the
+    higher-priority paths where these templates could appear) has changed.
+    Checking an entry only costs a few stat() calls. This works across
+    processes as File.write() updates the files on disk. The APIs writing the
+    device-type templates also clear the cache explicitly.
+    """
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.resolved = {}
+        self.templates = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.resolved.clear()
+            self.templates.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def invalidate(self, hostname):
+        with self.lock:
+            for key in [k for k in self.entries if k[1] == hostname]:
+                del self.entries[key]
+
+    def references(self, env, filename, stat):
+        # Templates are shared by many devices: only parse them once
+        key = (filename, stat)
+        with self.lock:
+            if key in self.templates:
+                return self.templates[key]
+        try:
+            with open(filename, encoding="utf-8") as f_in:
+                ast = env.parse(f_in.read())
+            refs = [
+                ref
+                for ref in jinja2.meta.find_referenced_templates(ast)
+                if ref is not None
+            ]
+        except (OSError, jinja2.TemplateError):
+            refs = []
+        with self.lock:
+            self.templates[key] = refs
+        return refs
+
+    def fingerprint(self, env, name):
+        searchpath = env.loader.searchpath
+        fingerprint = []
+        seen = set()
+        todo = [name]
+        while todo:
+            name = todo.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            pieces = jinja2.loaders.split_template_path(name)
+            resolved = None
+            for path in searchpath:
+                filename = os.path.join(path, *pieces)
+                stat = _stat(filename)
+                fingerprint.append((filename, stat))
+                if stat is not None:
+                    resolved = filename
+                    todo.extend(self.references(env, filename, stat))
+                    break
+            # jinja2 only checks that the file it loaded is up to date. Drop
+            # its cache when a template is now found in another path.
+            key = (tuple(searchpath), name)
+            with self.lock:
+                previous = self.resolved.get(key, resolved)
+                self.resolved[key] = resolved
+            if previous != resolved and env.cache is not None:
+                env.cache.clear()
+        return tuple(fingerprint)
+
+    def get(self, hostname, job_ctx):
+        env = devices()
+        # Only templates from the filesystem can be checked for changes
+        if not isinstance(env.loader, jinja2.FileSystemLoader):
+            return DeviceConfiguration(
+                fingerprint=(), rendered=self.render(env, hostname, job_ctx)
+            )
+
+        key = (
+            tuple(env.loader.searchpath),
+            hostname,
+            simplejson.dumps(job_ctx, sort_keys=True, default=str),
+        )
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and all(
+            _stat(path) == stat for (path, stat) in entry.fingerprint
+        ):
+            with self.lock:
+                self.hits += 1
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+            return entry
+
+        # Compute the fingerprint before rendering: a concurrent update will
+        # then only invalidate the new entry.
+        fingerprint = self.fingerprint(env, "%s.jinja2" % hostname)
+        entry = DeviceConfiguration(
+            fingerprint=fingerprint, rendered=self.render(env, hostname, job_ctx)
+        )
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = entry
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return entry
+
+    def render(self, env, hostname, job_ctx):
+        try:
+            template = env.get_template("%s.jinja2" % hostname)
+            return template.render(**job_ctx)
+        except jinja2.TemplateError:
+            return None
+
+
+device_configurations = DeviceConfigurationCache()
@@ -19,14 +19,17 @@
 
 import contextlib
 import datetime
+import fcntl
 import io
 import json
 import lzma
 import os
 import pathlib
+import re
 import requests
 import simplejson
 import struct
+import zlib
 
 from django.conf import settings
 from importlib import import_module
@@ -35,6 +38,42 @@ from lava_common.compat import yaml_dump, yaml_load
 from lava_common.exceptions import ConfigurationError
 
 
+# Prefix of the lines sent by lava-run: "- " followed by a record dumped by
+# lava_common.log.dump, in flow style with double-quoted scalars.
+LOG_LINE_PATTERN = re.compile(r'- \{(?:"dt": "[^"\\]*", )?"lvl": "([a-z_]+)", "msg": ')
+
+
+def parse_line(string, levels=("event", "results")):
+    """
+    Parse one log line sent by lava-run.
+    Only the records with a level in "levels" are fully parsed. For the other
+    records, return a dictionary with only the "lvl" key.
+    """
+    match = LOG_LINE_PATTERN.match(string)
+    if match is not None and match.group(1) not in levels:
+        return {"lvl": match.group(1)}
+    # Not a standard line or the message is needed: use the YAML parser
+    return yaml_load(string)[0]
+
+
+def parse_records(chunks):
+    """
+    Parse the logs returned by Logs.stream() one record at a time.
+    """
+    record = []
+    for chunk in chunks:
+        for line in chunk.decode("utf-8").splitlines(keepends=True):
+            # Records can span many lines (depending on the backend)
+            if line.startswith("- ") and record:
+                yield yaml_load("".join(record))[0]
+                record = []
+            record.append(line)
+    if record:
+        data = yaml_load("".join(record))
+        if data:
+            yield data[0]
+
+
 class Logs:
     def line_count(self, job):
         raise NotImplementedError("Should implement this method")
@@ -45,17 +84,50 @@ class Logs:
     def read(self, job, start=0, end=None):
         raise NotImplementedError("Should implement this method")
 
+    def read_many(self, job, ranges):
+        """
+        Return an iterator over the logs of each (start, end) range of lines,
+        as returned by read().
+        The ranges should be sorted by start line so the backends can read
+        the logs in one pass.
+        Backends should override this function when they can avoid reading
+        the logs again for every range.
+        """
+        for (start, end) in ranges:
+            yield self.read(job, start, end)
+
     def size(self, job, start=0, end=None):
         raise NotImplementedError("Should implement this method")
 
+    def stream(self, job, start=0, end=None):
+        """
+        Return an iterator over the logs, as chunks of bytes ending on a line
+        boundary.
+        Errors like missing logs are raised when calling this function, not
+        while iterating.
+        Backends should override this function when they can avoid loading
+        the whole logs in memory.
+        """
+        return iter([self.read(job, start, end).encode("utf-8")])
+
     def write(self, job, line, output=None, idx=None):
         raise NotImplementedError("Should implement this method")
 
+    def write_many(self, job, lines):
+        """
+        Append a list of lines (bytes, each ending with a new line)
+        Backends should override this function when they can store all the
+        lines in one operation.
+        """
+        for line in lines:
+            self.write(job, line)
+
 
 class LogsFilesystem(Logs):
 
     PACK_FORMAT = "=Q"
     PACK_SIZE = struct.calcsize(PACK_FORMAT)
+    STREAM_SIZE = 64 * 1024
 
     def __init__(self):
         self.index_filename = "output.idx"
@@ -83,7 +155,10 @@ class LogsFilesystem(Logs):
             return None
 
     def line_count(self, job):
-        st = (pathlib.Path(job.output_dir) / self.index_filename).stat()
+        try:
+            st = (pathlib.Path(job.output_dir) / self.index_filename).stat()
+        except FileNotFoundError:
+            return 0
         return int(st.st_size / self.PACK_SIZE)
 
     def open(self, job):
@@ -119,6 +194,99 @@ class LogsFilesystem(Logs):
                     return ""
                 return f_log.read(end_offset - start_offset).decode("utf-8")
 
+    def read_many(self, job, ranges):
+        directory = pathlib.Path(job.output_dir)
+        with self.open(job) as f_log:
+            if not (directory / self.index_filename).exists():
+                self._build_index(job)
+            # Bytes read from the log, starting at "base" and ending at the
+            # current position of the log
+            (base, data) = (0, b"")
+            with open(str(directory / self.index_filename), "rb") as f_idx:
+                for (start, end) in ranges:
+                    (start_offset, end_offset) = self._get_range_offsets(
+                        f_idx, start, end
+                    )
+                    if start_offset is None:
+                        yield ""
+                        continue
+                    # Seeking forward in a compressed log does not restart
+                    # from the beginning: sorted ranges are read in one pass.
+                    # The overlapping parts of the ranges are kept in "data"
+                    # and not read again. Unsorted ranges have to seek
+                    # backward, decompressing the log again from the start.
+                    position = base + len(data)
+                    if not base <= start_offset <= position:
+                        f_log.seek(start_offset)
+                        (base, data) = (start_offset, b"")
+                        position = start_offset
+                    if end_offset is None:
+                        data += f_log.read()
+                    elif end_offset > position:
+                        data += f_log.read(end_offset - position)
+                    # The next ranges do not start before this one
+                    (base, data) = (start_offset, data[start_offset - base :])
+                    if end_offset is None:
+                        yield data.decode("utf-8")
+                    else:
+                        yield data[: end_offset - start_offset].decode("utf-8")
+
+    def _get_offsets(self, job, start, end):
+        # Return the offsets of the "start" and "end" lines. Return None for
+        # "start" when the range is empty and None for "end" when reading up
+        # to the end of the file.
+        if start == 0 and end is None:
+            return (0, None)
+
+        directory = pathlib.Path(job.output_dir)
+        if not (directory / self.index_filename).exists():
+            self._build_index(job)
+        with open(str(directory / self.index_filename), "rb") as f_idx:
+            return self._get_range_offsets(f_idx, start, end)
+
+    def _get_range_offsets(self, f_idx, start, end):
+        # Same as _get_offsets with an already opened index
+        start_offset = self._get_line_offset(f_idx, start)
+        if start_offset is None:
+            return (None, None)
+        if end is None:
+            return (start_offset, None)
+        end_offset = self._get_line_offset(f_idx, end)
+        if end_offset is not None and end_offset <= start_offset:
+            return (None, None)
+        return (start_offset, end_offset)
+
+    def stream(self, job, start=0, end=None):
+        f_log = self.open(job)
+        try:
+            (start_offset, end_offset) = self._get_offsets(job, start, end)
+        except Exception:
+            f_log.close()
+            raise
+        if start_offset is None:
+            f_log.close()
+            return iter([])
+        return self._iter_file(f_log, start_offset, end_offset)
+
+    def _iter_file(self, f_log, start, end):
+        with f_log:
+            f_log.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                size = (
+                    self.STREAM_SIZE
+                    if remaining is None
+                    else min(self.STREAM_SIZE, remaining)
+                )
+                # Always end the chunks on a line boundary
+                chunk = f_log.read(size) + f_log.readline()
+                if not chunk:
+                    break
+                if remaining is not None:
+                    chunk = chunk[:remaining]
+                    remaining -= len(chunk)
+                yield chunk
+
     def size(self, job):
         directory = pathlib.Path(job.output_dir)
         with contextlib.suppress(FileNotFoundError):
@@ -133,6 +301,409 @@ class LogsFilesystem(Logs):
         output.write(line)
         output.flush()
 
+    def write_many(self, job, lines):
+        directory = pathlib.Path(job.output_dir)
+        directory.mkdir(mode=0o755, parents=True, exist_ok=True)
+        with open(str(directory / self.log_filename), "ab") as f_log:
+            offsets = []
+            offset = f_log.tell()
+            for line in lines:
+                offsets.append(offset)
+                offset += len(line)
+            with open(str(directory / self.index_filename), "ab") as f_idx:
+                # Same as PACK_FORMAT, repeated for every line
+                f_idx.write(struct.pack("=%dQ" % len(offsets), *offsets))
+            f_log.write(b"".join(lines))
+
+
+class BlocksReader(io.RawIOBase):
+    """
+    Read-only file object over the logs stored by LogsBlocks.
+    The blocks are decompressed while reading: the logs are never fully
+    loaded in memory.
+    """
+
+    def __init__(self, logs, directory):
+        super().__init__()
+        self.logs = logs
+        self.directory = directory
+        self.position = 0
+        self.chunks = None
+        self.chunk = b""
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.logs._size(self.directory) or 0
+        elif whence != io.SEEK_SET:
+            raise ValueError("invalid whence (%r)" % whence)
+        if offset < 0:
+            raise ValueError("negative seek position %d" % offset)
+        if offset != self.position:
+            self._reset()
+            self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.chunks is None:
+            self.chunks = self.logs._iter_bytes(self.directory, self.position)
+        while not self.chunk:
+            try:
+                self.chunk = next(self.chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        # Avoid copying the rest of the chunk
+        self.chunk = memoryview(self.chunk)[size:]
+        self.position += size
+        return size
+
+    def close(self):
+        self._reset()
+        super().close()
+
+    def _reset(self):
+        if self.chunks is not None:
+            self.chunks.close()
+        self.chunks = None
+        self.chunk = b""
+
+
+class LogsBlocks(LogsFilesystem):
+    """
+    Store the logs as a sequence of independently compressed blocks.
+
+    * output.idx: offset (in the uncompressed log) of every line, like
+      LogsFilesystem
+    * output.yaml.blocks: compressed blocks, each one holding complete lines
+    * output.yaml.blocks.idx: for every block, the uncompressed offset and
+      size followed by the compressed offset and size
+    * output.yaml.tail: the uncompressed offset of its first line followed by
+      the lines that are not yet compressed
+    * output.yaml.lock: held by the writers
+
+    Reading a range of lines only decompresses the blocks covering that range.
+    When compressing the tail, the new blocks are appended then the tail is
+    replaced atomically. The readers only use the blocks before the offset
+    recorded in the tail, so they always get a consistent view of the logs.
+    Jobs with a log in the LogsFilesystem format (output.yaml or
+    output.yaml.xz) are handled by LogsFilesystem.
+    """
+
+    BLOCK_SIZE = 128 * 1024
+    BLOCK_FORMAT = "=QQQQ"
+    BLOCK_ENTRY_SIZE = struct.calcsize(BLOCK_FORMAT)
+    TAIL_FORMAT = "=Q"
+    TAIL_HEADER_SIZE = struct.calcsize(TAIL_FORMAT)
+
+    def __init__(self):
+        super().__init__()
+        self.blocks_filename = "output.yaml.blocks"
+        self.blocks_index_filename = "output.yaml.blocks.idx"
+        self.tail_filename = "output.yaml.tail"
+        self.lock_filename = "output.yaml.lock"
+
+    def _legacy(self, directory):
+        return (directory / self.log_filename).exists() or (
+            directory / self.compressed_log_filename
+        ).exists()
+
+    def _get_block(self, f_bidx, block):
+        f_bidx.seek(self.BLOCK_ENTRY_SIZE * block)
+        return struct.unpack(self.BLOCK_FORMAT, f_bidx.read(self.BLOCK_ENTRY_SIZE))
+
+    def _open_tail(self, directory):
+        # Return the tail (positioned after the header) and the uncompressed
+        # offset of its first line. The tail is None when missing.
+        try:
+            f_tail = open(str(directory / self.tail_filename), "rb")
+        except FileNotFoundError:
+            return (None, 0)
+        (offset,) = struct.unpack(self.TAIL_FORMAT, f_tail.read(self.TAIL_HEADER_SIZE))
+        return (f_tail, offset)
+
+    def _tail_offset(self, directory):
+        # Uncompressed offset of the first line of the tail
+        (f_tail, offset) = self._open_tail(directory)
+        if f_tail is not None:
+            f_tail.close()
+        return offset
+
+    def _replace_tail(self, directory, offset, data):
+        # Write the new tail aside then replace the current one: the readers
+        # get either the old or the new tail, with the matching offset.
+        filename = directory / (self.tail_filename + ".tmp")
+        with open(str(filename), "wb") as f_tmp:
+            f_tmp.write(struct.pack(self.TAIL_FORMAT, offset) + data)
+            f_tmp.flush()
+            os.fsync(f_tmp.fileno())
+        os.replace(str(filename), str(directory / self.tail_filename))
+
+    @contextlib.contextmanager
+    def _lock(self, directory):
+        # Only one writer at a time: appending and compressing the tail
+        # should not interleave
+        with open(str(directory / self.lock_filename), "ab") as f_lock:
+            fcntl.flock(f_lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f_lock.fileno(), fcntl.LOCK_UN)
+
+    def _iter_bytes(self, directory, start, end=None, cache=None):
+        # Return an iterator over the uncompressed log between two offsets,
+        # one block at a time. When given, "cache" keeps the last
+        # decompressed block for the next call.
+        # Open the tail first: the blocks are always written before the tail
+        # that follows them.
+        (f_tail, tail_offset) = self._open_tail(directory)
+        try:
+            yield from self._iter_blocks(directory, start, end, tail_offset, cache)
+            if f_tail is not None and (end is None or end > tail_offset):
+                f_tail.seek(self.TAIL_HEADER_SIZE + max(start - tail_offset, 0))
+                if end is None:
+                    yield f_tail.read()
+                else:
+                    yield f_tail.read(end - max(start, tail_offset))
+        finally:
+            if f_tail is not None:
+                f_tail.close()
+
+    def _iter_blocks(self, directory, start, end, tail_offset, cache):
+        # Blocks after the tail offset are left by an interrupted compression
+        end = tail_offset if end is None else min(end, tail_offset)
+        if start < end:
+            with open(str(directory / self.blocks_index_filename), "rb") as f_bidx:
+                # Binary search for the block holding "start"
+                low = 0
+                high = os.fstat(f_bidx.fileno()).st_size // self.BLOCK_ENTRY_SIZE
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if self._get_block(f_bidx, middle)[0] <= start:
+                        low = middle
+                    else:
+                        high = middle
+
+                with open(str(directory / self.blocks_filename), "rb") as f_blocks:
+                    block = low
+                    while True:
+                        try:
+                            (offset, size, c_offset, c_size) = self._get_block(
+                                f_bidx, block
+                            )
+                        except struct.error:
+                            break
+                        if offset >= end:
+                            break
+                        if cache is not None and block in cache:
+                            chunk = cache[block]
+                        else:
+                            f_blocks.seek(c_offset)
+                            chunk = zlib.decompress(f_blocks.read(c_size))
+                            if cache is not None:
+                                cache.clear()
+                                cache[block] = chunk
+                        yield chunk[max(start - offset, 0) : end - offset]
+                        block += 1
+
+    def _exists(self, directory):
+        return (directory / self.tail_filename).exists() or (
+            directory / self.blocks_index_filename
+        ).exists()
+
+    def open(self, job):
+        directory = pathlib.Path(job.output_dir)
+        if self._legacy(directory) or not self._exists(directory):
+            return super().open(job)
+        return io.BufferedReader(BlocksReader(self, directory), self.STREAM_SIZE)
+
+    def read(self, job, start=0, end=None):
+        directory = pathlib.Path(job.output_dir)
+        if self._legacy(directory) or not self._exists(directory):
+            return super().read(job, start, end)
+        return b"".join(self.stream(job, start, end)).decode("utf-8")
+
+    def read_many(self, job, ranges):
+        directory = pathlib.Path(job.output_dir)
+        if self._legacy(directory) or not self._exists(directory):
+            yield from super().read_many(job, ranges)
+            return
+
+        if not (directory / self.index_filename).exists():
+            self._build_index(job)
+        # Consecutive ranges are usually in the same block: only decompress
+        # it once
+        cache = {}
+        with open(str(directory / self.index_filename), "rb") as f_idx:
+            for (start, end) in ranges:
+                (start_offset, end_offset) = self._get_range_offsets(f_idx, start, end)
+                if start_offset is None:
+                    yield ""
+                    continue
+                yield b"".join(
+                    self._iter_bytes(directory, start_offset, end_offset, cache)
+                ).decode("utf-8")
+
+    def stream(self, job, start=0, end=None):
+        directory = pathlib.Path(job.output_dir)
+        if self._legacy(directory) or not self._exists(directory):
+            return super().stream(job, start, end)
+
+        (start_offset, end_offset) = self._get_offsets(job, start, end)
+        if start_offset is None:
+            return iter([])
+        return self._iter_bytes(directory, start_offset, end_offset)
+
+    def size(self, job):
+        directory = pathlib.Path(job.output_dir)
+        if self._legacy(directory):
+            return super().size(job)
+        return self._size(directory)
+
+    def _size(self, directory):
+        (f_tail, offset) = self._open_tail(directory)
+        if f_tail is None:
+            return None
+        with f_tail:
+            return offset + os.fstat(f_tail.fileno()).st_size - self.TAIL_HEADER_SIZE
+
+    def write(self, job, line, output=None, idx=None):
+        self.write_many(job, [line])
+
+    def write_many(self, job, lines):
+        directory = pathlib.Path(job.output_dir)
+        if self._legacy(directory):
+            return super().write_many(job, lines)
+
+        directory.mkdir(mode=0o755, parents=True, exist_ok=True)
+        with self._lock(directory):
+            if not (directory / self.tail_filename).exists():
+                self._replace_tail(directory, 0, b"")
+            tail_offset = self._tail_offset(directory)
+            with open(str(directory / self.tail_filename), "ab") as f_tail:
+                offsets = []
+                offset = tail_offset + f_tail.tell() - self.TAIL_HEADER_SIZE
+                for line in lines:
+                    offsets.append(offset)
+                    offset += len(line)
+                f_tail.write(b"".join(lines))
+                tail_size = f_tail.tell() - self.TAIL_HEADER_SIZE
+            # Index the lines once they are written
+            with open(str(directory / self.index_filename), "ab") as f_idx:
+                # Same as PACK_FORMAT, repeated for every line
+                f_idx.write(struct.pack("=%dQ" % len(offsets), *offsets))
+
+            if tail_size >= self.BLOCK_SIZE:
+                self._compress_tail(directory, tail_offset)
+
+    def _compress_tail(self, directory, tail_offset):
+        self._truncate_blocks(directory, tail_offset)
+        with open(str(directory / self.tail_filename), "rb") as f_tail:
+            f_tail.seek(self.TAIL_HEADER_SIZE)
+            with open(str(directory / self.blocks_filename), "ab") as f_blocks:
+                with open(str(directory / self.blocks_index_filename), "ab") as f_bidx:
+                    (offset, tail) = self._write_blocks(
+                        f_tail, f_blocks, f_bidx, tail_offset
+                    )
+                    self._sync(f_blocks, f_bidx)
+        # Keep the lines that do not fill a block
+        self._replace_tail(directory, offset, tail)
+
+    def _truncate_blocks(self, directory, tail_offset):
+        # Drop the blocks written after the tail offset by an interrupted
+        # compression
+        with contextlib.suppress(FileNotFoundError):
+            with open(str(directory / self.blocks_index_filename), "r+b") as f_bidx:
+                count = os.fstat(f_bidx.fileno()).st_size // self.BLOCK_ENTRY_SIZE
+                c_end = 0
+                while count > 0:
+                    (offset, _, c_offset, c_size) = self._get_block(f_bidx, count - 1)
+                    if offset < tail_offset:
+                        c_end = c_offset + c_size
+                        break
+                    count -= 1
+                f_bidx.truncate(count * self.BLOCK_ENTRY_SIZE)
+            with open(str(directory / self.blocks_filename), "r+b") as f_blocks:
+                f_blocks.truncate(c_end)
+
+    def _sync(self, *files):
+        for f_out in files:
+            f_out.flush()
+            os.fsync(f_out.fileno())
+
+    def _write_blocks(self, f_log, f_blocks, f_bidx, offset):
+        # Split the logs into blocks of complete lines. Return the offset of
+        # the last lines, when they are too small to fill a block, and these
+        # lines.
+        block = []
+        block_size = 0
+        for line in f_log:
+            block.append(line)
+            block_size += len(line)
+            if block_size >= self.BLOCK_SIZE:
+                compressed = zlib.compress(b"".join(block))
+                f_bidx.write(
+                    struct.pack(
+                        self.BLOCK_FORMAT,
+                        offset,
+                        block_size,
+                        f_blocks.tell(),
+                        len(compressed),
+                    )
+                )
+                f_blocks.write(compressed)
+                offset += block_size
+                block = []
+                block_size = 0
+        return (offset, b"".join(block))
+
+    def convert(self, job):
+        """
+        Convert a log stored by LogsFilesystem into blocks
+        Return False if there is nothing to convert.
+        """
+        directory = pathlib.Path(job.output_dir)
+        if not self._legacy(directory):
+            return False
+
+        with self._lock(directory):
+            with super().open(job) as f_log:
+                with open(str(directory / self.blocks_filename), "wb") as f_blocks:
+                    with open(
+                        str(directory / self.blocks_index_filename), "wb"
+                    ) as f_bidx:
+                        (offset, tail) = self._write_blocks(f_log, f_blocks, f_bidx, 0)
+                        self._sync(f_blocks, f_bidx)
+            self._replace_tail(directory, offset, tail)
+            # Rebuild the index from the new files
+            with open(str(directory / self.index_filename), "wb") as f_idx:
+                offset = 0
+                for chunk in self._iter_bytes(directory, 0):
+                    for line in chunk.splitlines(keepends=True):
+                        f_idx.write(struct.pack(self.PACK_FORMAT, offset))
+                        offset += len(line)
+
+            # Remove the old files
+            for filename in [
+                self.log_filename,
+                self.compressed_log_filename,
+                self.log_size_filename,
+            ]:
+                with contextlib.suppress(FileNotFoundError):
+                    (directory / filename).unlink()
+        return True
+
 
 class LogsMongo(Logs):
     def __init__(self):
@@ -184,21 +755,37 @@ class LogsMongo(Logs):
 
         return yaml_dump(list(docs))
 
+    def stream(self, job, start=0, end=None):
+        return (
+            yaml_dump([doc]).encode("utf-8") for doc in self._get_docs(job, start, end)
+        )
+
     def size(self, job, start=0, end=None):
         docs = self._get_docs(job, start, end)
         return len(yaml_dump(list(docs)).encode("utf-8"))
 
-    def write(self, job, line, output=None, idx=None):
+    def _doc(self, job, line):
         line = yaml_load(line)[0]
+        return {
+            "job_id": job.id,
+            "dt": line["dt"],
+            "lvl": line["lvl"],
+            "msg": line["msg"],
+        }
 
-        self.db.logs.insert_one(
-            {"job_id": job.id, "dt": line["dt"], "lvl": line["lvl"], "msg": line["msg"]}
-        )
+    def write(self, job, line, output=None, idx=None):
+        self.db.logs.insert_one(self._doc(job, line))
+
+    def write_many(self, job, lines):
+        if lines:
+            self.db.logs.insert_many([self._doc(job, line) for line in lines])
 
 
 class LogsElasticsearch(Logs):
 
     MAX_RESULTS = 1000000
+    # Number of documents fetched by each request in stream()
+    STREAM_PAGE_SIZE = 1000
 
     def __init__(self):
         self.api_url = "%s%s/" % (
@@ -274,20 +861,52 @@ class LogsElasticsearch(Logs):
 
         return yaml_dump(docs)
 
+    def stream(self, job, start=0, end=None):
+        if end is not None and end <= start:
+            return iter([])
+        # Fetch the first page right away so errors are raised now
+        docs = self._get_docs(job, start, self._page_end(start, end))
+        return self._iter_pages(job, docs, start, end)
+
+    def _page_end(self, start, end):
+        page_end = start + self.STREAM_PAGE_SIZE
+        return page_end if end is None else min(page_end, end)
+
+    def _iter_pages(self, job, docs, start, end):
+        while docs:
+            yield yaml_dump(docs).encode("utf-8")
+            start += len(docs)
+            if len(docs) < self.STREAM_PAGE_SIZE:
+                break
+            if end is not None and start >= end:
+                break
+            docs = self._get_docs(job, start, self._page_end(start, end))
+
     def size(self, job, start=0, end=None):
         docs = self._get_docs(job, start, end)
         return len(yaml_dump(docs).encode("utf-8"))
 
-    def write(self, job, line, output=None, idx=None):
+    def _doc(self, job, line):
         line = yaml_load(line)[0]
         dt = datetime.datetime.strptime(line["dt"], "%Y-%m-%dT%H:%M:%S.%f")
         line.update({"job_id": job.id, "dt": int(dt.timestamp() * 1000)})
         if line["lvl"] == "results":
             line.update({"msg": str(line["msg"])})
-        data = simplejson.dumps(line)
+        return simplejson.dumps(line)
 
+    def write(self, job, line, output=None, idx=None):
+        data = self._doc(job, line)
         requests.post("%s_doc/" % self.api_url, data=data, headers=self.headers)
 
+    def write_many(self, job, lines):
+        if not lines:
+            return
+        # The bulk API expects an action line before each document
+        data = "".join('{"index": {}}\n%s\n' % self._doc(job, line) for line in lines)
+        headers = dict(self.headers)
+        headers["Content-type"] = "application/x-ndjson"
+        requests.post("%s_bulk/" % self.api_url, data=data, headers=headers)
+
 
 class LogsFirestore(Logs):
     def __init__(self):
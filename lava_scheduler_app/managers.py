@@ -84,7 +84,12 @@ class GroupObjectPermissionManager(models.Manager):
             kwargs["group"] = group
             to_add.append(self.model(**kwargs))
 
-        return self.model.objects.bulk_create(to_add)
+        ret = self.model.objects.bulk_create(to_add)
+        # bulk_create does not send the post_save signal
+        from lava_scheduler_app.models import TestJobVisibility
+
+        TestJobVisibility.refresh_for(obj)
+        return ret
 
     def remove_perm(self, perm, group, obj):
         """
@@ -284,6 +289,22 @@ class RestrictedTestJobQuerySet(RestrictedObjectQuerySet):
 
             return self.filter(filters)
 
+    def visible_by_user(self, user):
+        """
+        Same as accessible_by_user(user, VIEW_PERMISSION) but using the
+        precomputed visibility of the jobs.
+        """
+        from lava_scheduler_app.models import TestJob, TestJobVisibility
+
+        if user.is_superuser or TestJob.VIEW_PERMISSION in user.get_all_permissions():
+            return self
+
+        filters = Q(visibility__in=TestJobVisibility.visible_by_user(user))
+        # Private jobs are visible by the submitter
+        if user.is_authenticated:
+            filters |= Q(is_public=False) & Q(submitter=user)
+        return self.filter(filters)
+
 
 class RestrictedTestCaseQuerySet(models.QuerySet):
     def visible_by_user(self, user):
@@ -0,0 +1,59 @@
+# Written by hand, do not regenerate or squash.
+#
+# The facts of the pending jobs are computed with a frozen copy of
+# lava_scheduler_app.utils.definition_facts, so that this migration does not
+# change when the helper does.
+
+from django.db import migrations
+
+from lava_common.compat import yaml_safe_load
+from lava_server.compat import JSONField
+
+# TestJob.STATE_FINISHED
+STATE_FINISHED = 5
+
+
+def definition_facts(job_data, tags):
+    # Same as lava_scheduler_app.utils.definition_facts when this migration
+    # was written
+    protocols = job_data.get("protocols", {})
+    multinode = protocols.get("lava-multinode", {})
+    return {
+        "dynamic_connection": "connection" in job_data,
+        "essential": bool("role" in multinode and multinode.get("essential")),
+        "host_role": job_data.get("host_role"),
+        "role": multinode.get("role"),
+        "tags": sorted(tags),
+        "vland": protocols.get("lava-vland"),
+    }
+
+
+def forwards_func(apps, schema_editor):
+    # Only jobs that are not finished are used by the scheduler and the
+    # workers. Other jobs will be handled by TestJob.facts when needed.
+    TestJob = apps.get_model("lava_scheduler_app", "TestJob")
+    jobs = TestJob.objects.exclude(state=STATE_FINISHED)
+    jobs = jobs.prefetch_related("tags")
+    for job in jobs:
+        job.definition_facts = definition_facts(
+            yaml_safe_load(job.definition), [t.name for t in job.tags.all()]
+        )
+        job.save(update_fields=["definition_facts"])
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("lava_scheduler_app", "0056_testjob_queue_timeout")]
+
+    operations = [
+        migrations.AddField(
+            model_name="testjob",
+            name="definition_facts",
+            field=JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(forwards_func, noop, elidable=True),
+    ]
@@ -0,0 +1,142 @@
+# Generated by Django 2.2.24 on 2022-10-18 11:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def permissions(perms, codename):
+    # Same as TestJobVisibility._permissions
+    groups = set(perms.values_list("group_id", flat=True))
+    restricted = perms.filter(permission__codename=codename).exists()
+    return (restricted, groups)
+
+
+def forwards_func(apps, schema_editor):
+    Device = apps.get_model("lava_scheduler_app", "Device")
+    DeviceType = apps.get_model("lava_scheduler_app", "DeviceType")
+    GroupDevicePermission = apps.get_model(
+        "lava_scheduler_app", "GroupDevicePermission"
+    )
+    GroupDeviceTypePermission = apps.get_model(
+        "lava_scheduler_app", "GroupDeviceTypePermission"
+    )
+    TestJob = apps.get_model("lava_scheduler_app", "TestJob")
+    TestJobVisibility = apps.get_model("lava_scheduler_app", "TestJobVisibility")
+
+    # Same as TestJobVisibility.refresh
+    device_types = {}
+    for dt in DeviceType.objects.all():
+        (restricted, groups) = permissions(
+            GroupDeviceTypePermission.objects.filter(devicetype=dt),
+            "view_devicetype",
+        )
+        device_types[dt.name] = (restricted, groups)
+        visibility = TestJobVisibility.objects.create(
+            device_type=dt, is_public=not restricted
+        )
+        if restricted:
+            visibility.groups.set(groups)
+        TestJob.objects.filter(
+            is_public=True,
+            viewing_groups__isnull=True,
+            actual_device__isnull=True,
+            requested_device_type=dt,
+        ).update(visibility=visibility)
+
+    for device in Device.objects.all():
+        (restricted, groups) = permissions(
+            GroupDevicePermission.objects.filter(device=device), "view_device"
+        )
+        is_public = False
+        if not restricted:
+            (restricted, type_groups) = device_types[device.device_type_id]
+            is_public = not restricted
+            groups |= type_groups
+        visibility = TestJobVisibility.objects.create(
+            device=device, is_public=is_public
+        )
+        if not is_public:
+            visibility.groups.set(groups)
+        TestJob.objects.filter(
+            is_public=True, viewing_groups__isnull=True, actual_device=device
+        ).update(visibility=visibility)
+
+    jobs = TestJob.objects.filter(viewing_groups__isnull=False).distinct()
+    for job in jobs.prefetch_related("viewing_groups"):
+        viewing_groups = sorted(g.id for g in job.viewing_groups.all())
+        (visibility, created) = TestJobVisibility.objects.get_or_create(
+            viewing_groups=",".join(str(g) for g in viewing_groups)
+        )
+        if created:
+            visibility.groups.set(viewing_groups)
+        job.visibility = visibility
+        job.save(update_fields=["visibility"])
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0011_update_proxy_permissions"),
+        ("lava_scheduler_app", "0057_testjob_definition_facts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestJobVisibility",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("viewing_groups", models.TextField(null=True, unique=True)),
+                ("is_public", models.BooleanField(default=False)),
+                (
+                    "device",
+                    models.OneToOneField(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="lava_scheduler_app.Device",
+                    ),
+                ),
+                (
+                    "device_type",
+                    models.OneToOneField(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="lava_scheduler_app.DeviceType",
+                    ),
+                ),
+                (
+                    "groups",
+                    models.ManyToManyField(
+                        related_name="_testjobvisibility_groups_+", to="auth.Group"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="testjob",
+            name="visibility",
+            field=models.ForeignKey(
+                blank=True,
+                default=None,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="lava_scheduler_app.TestJobVisibility",
+            ),
+        ),
+        migrations.RunPython(forwards_func, noop, elidable=True),
+    ]
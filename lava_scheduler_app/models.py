@@ -20,6 +20,7 @@
 
 
 import contextlib
+import copy
 import datetime
 import jinja2
 import logging
@@ -65,7 +66,7 @@ from lava_scheduler_app.managers import (
     GroupObjectPermissionManager,
 )
 from lava_scheduler_app.schema import SubmissionException, validate_device
-from lava_server.compat import add_permissions
+from lava_server.compat import JSONField, add_permissions
 from lava_server.files import File
 
 import requests
@@ -741,12 +742,14 @@ class Device(RestrictedObject):
         return False
 
     def is_valid(self):
-        try:
-            rendered = self.load_configuration()
-            validate_device(rendered)
-        except (SubmissionException, yaml.YAMLError):
-            return False
-        return True
+        entry = environment.device_configurations.get(self.hostname, {})
+        if entry.valid is environment.UNSET:
+            try:
+                validate_device(self._parse_configuration(entry))
+                entry.valid = True
+            except (SubmissionException, yaml.YAMLError):
+                entry.valid = False
+        return entry.valid
 
     def log_admin_entry(self, user, reason):
         if user is None:
@@ -878,16 +881,22 @@ class Device(RestrictedObject):
                 return File("device", self.hostname).read()
             return None
 
-        try:
-            template = environment.devices().get_template("%s.jinja2" % self.hostname)
-            device_template = template.render(**job_ctx)
-        except jinja2.TemplateError:
+        entry = environment.device_configurations.get(self.hostname, job_ctx)
+        if entry.rendered is None:
             return None
 
         if output_format == "yaml":
-            return device_template
+            return entry.rendered
         else:
-            return yaml_safe_load(device_template)
+            # The cached dict is shared: return a copy that callers can modify
+            return copy.deepcopy(self._parse_configuration(entry))
+
+    def _parse_configuration(self, entry):
+        if entry.rendered is None:
+            return None
+        if entry.data is environment.UNSET:
+            entry.data = yaml_safe_load(entry.rendered)
+        return entry.data
 
     def minimise_configuration(self, data):
         """
@@ -923,6 +932,7 @@ class Device(RestrictedObject):
     def save_configuration(self, data):
         try:
             File("device", self.hostname).write(data)
+            environment.device_configurations.invalidate(self.hostname)
             return True
         except OSError as exc:
             logger = logging.getLogger("lava_scheduler_app")
@@ -1129,7 +1139,86 @@ def _get_device_type(user, name):
     return device_type
 
 
-def _create_pipeline_job(
+class SubmissionLookups:
+    """
+    Cache the database lookups done while submitting test jobs for the given
+    user, so that they are shared by every job of a bulk submission.
+    Only successful lookups are cached.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._device_types = {}
+        self._devices = {}
+        self._tags = {}
+        self._tag_devices = {}
+        self._groups = {}
+        self._personal_group = None
+        self._visibilities = {}
+
+    def device_type(self, name):
+        if name not in self._device_types:
+            self._device_types[name] = _get_device_type(self.user, name)
+        return self._device_types[name]
+
+    def submit_devices(self, device_type):
+        """
+        Devices of the given type that the user can submit to, see
+        _check_submit_to_devices.
+        """
+        if device_type.name not in self._devices:
+            devices = Device.objects.filter(
+                Q(device_type=device_type), ~Q(health=Device.HEALTH_RETIRED)
+            )
+            self._devices[device_type.name] = _check_submit_to_devices(
+                devices, self.user
+            )
+        return self._devices[device_type.name]
+
+    def tag_list(self, tags):
+        if not isinstance(tags, list):
+            return _get_tag_list(tags)
+        missing = [name for name in tags if name not in self._tags]
+        if missing:
+            self._tags.update(zip(missing, _get_tag_list(missing)))
+        return [self._tags[name] for name in tags]
+
+    def tag_devices(self, taglist, device_type):
+        key = (device_type.name, frozenset(t.name for t in taglist))
+        if key not in self._tag_devices:
+            self._tag_devices[key] = _check_tags(taglist, device_type=device_type)
+        return self._tag_devices[key]
+
+    def personal_group(self):
+        if self._personal_group is None:
+            (self._personal_group, _) = Group.objects.get_or_create(
+                name=self.user.username
+            )
+        return self._personal_group
+
+    def groups(self, names):
+        key = frozenset(names)
+        if key not in self._groups:
+            self._groups[key] = list(Group.objects.filter(name__in=names))
+        return self._groups[key]
+
+    def visibility(self, job, viewing_groups):
+        """
+        Visibility of a job that is not saved yet, see TestJobVisibility.for_job.
+        """
+        groups = sorted(g.id for g in viewing_groups)
+        key = (
+            tuple(groups),
+            job.is_public,
+            job.actual_device_id,
+            job.requested_device_type_id,
+        )
+        if key not in self._visibilities:
+            self._visibilities[key] = TestJobVisibility.for_job(job, groups)
+        return self._visibilities[key]
+
+
+def _pipeline_job(
     job_data,
     user,
     taglist,
@@ -1138,8 +1227,13 @@ def _create_pipeline_job(
     target_group=None,
     orig=None,
     health_check=False,
+    lookups=None,
 ):
-
+    """
+    Build the TestJob for the given job data, without saving it.
+    :return: a tuple with the TestJob, the tags and the viewing groups to
+    add once the job is saved, or None
+    """
     if not isinstance(job_data, dict):
         # programming error
         raise RuntimeError("Invalid job data %s" % job_data)
@@ -1171,8 +1265,12 @@ def _create_pipeline_job(
             if priority is None:
                 raise SubmissionException("Invalid job priority: %r" % key)
 
+    definition = yaml_safe_dump(job_data)
     if not orig:
-        orig = yaml_safe_dump(job_data)
+        orig = definition
+
+    if lookups is None:
+        lookups = SubmissionLookups(user)
 
     is_public = False
     viewing_groups = []
@@ -1181,11 +1279,10 @@ def _create_pipeline_job(
         if param == "public":
             is_public = True
         else:
-            group, _ = Group.objects.get_or_create(name=user.username)
-            viewing_groups = [group]
+            viewing_groups = [lookups.personal_group()]
     elif isinstance(param, dict):
         if "group" in param:
-            viewing_groups = list(Group.objects.filter(name__in=param["group"]))
+            viewing_groups = lookups.groups(param["group"])
             if not viewing_groups:
                 raise SubmissionException(
                     "No known groups were found in the visibility list."
@@ -1196,19 +1293,24 @@ def _create_pipeline_job(
     if "timeouts" in job_data and "queue" in job_data["timeouts"]:
         queue_timeout = Timeout.parse(job_data["timeouts"]["queue"])
 
+    job = TestJob(
+        definition=definition,
+        original_definition=orig,
+        submitter=user,
+        requested_device_type=device_type,
+        target_group=target_group,
+        description=job_data["job_name"],
+        health_check=health_check,
+        priority=priority,
+        is_public=is_public,
+        queue_timeout=queue_timeout,
+        definition_facts=utils.definition_facts(job_data, [t.name for t in taglist]),
+    )
+    return (job, taglist, viewing_groups)
+
+
+def _save_pipeline_job(job, taglist, viewing_groups):
     with transaction.atomic():
-        job = TestJob(
-            definition=yaml_safe_dump(job_data),
-            original_definition=orig,
-            submitter=user,
-            requested_device_type=device_type,
-            target_group=target_group,
-            description=job_data["job_name"],
-            health_check=health_check,
-            priority=priority,
-            is_public=is_public,
-            queue_timeout=queue_timeout,
-        )
         job.save()
 
         # need a valid job (with a primary_key) before tags and groups can be
@@ -1219,7 +1321,71 @@ def _create_pipeline_job(
     return job
 
 
-def _pipeline_protocols(job_data, user, yaml_data=None):
+def _create_pipeline_job(
+    job_data,
+    user,
+    taglist,
+    device=None,
+    device_type=None,
+    target_group=None,
+    orig=None,
+    health_check=False,
+    lookups=None,
+):
+    data = _pipeline_job(
+        job_data,
+        user,
+        taglist,
+        device=device,
+        device_type=device_type,
+        target_group=target_group,
+        orig=orig,
+        health_check=health_check,
+        lookups=lookups,
+    )
+    if data is None:
+        return None
+    return _save_pipeline_job(*data)
+
+
+def _singlenode_job(yaml_data, job_data, user, original_job=None, lookups=None):
+    """
+    Runs the submission checks of a singlenode job and builds the TestJob,
+    see _pipeline_job.
+    """
+    if lookups is None:
+        lookups = SubmissionLookups(user)
+    device_type = lookups.device_type(job_data["device_type"])
+    allow = lookups.submit_devices(device_type)
+    if not allow:
+        raise DevicesUnavailableException(
+            "No devices of type %s are available." % device_type
+        )
+    taglist = lookups.tag_list(job_data.get("tags", []))
+    if taglist:
+        supported = lookups.tag_devices(taglist, device_type)
+        _check_tags_support(supported, allow)
+    if original_job:
+        # Add old job absolute url to metadata
+        job_url = str(original_job.get_absolute_url())
+        with contextlib.suppress(Site.DoesNotExist, ImproperlyConfigured):
+            site = Site.objects.get_current()
+            job_url = "http://%s%s" % (site.domain, job_url)
+
+        job_data.setdefault("metadata", {}).setdefault("job.original", job_url)
+
+    return _pipeline_job(
+        job_data,
+        user,
+        taglist,
+        device=None,
+        device_type=device_type,
+        orig=yaml_data,
+        lookups=lookups,
+    )
+
+
+def _pipeline_protocols(job_data, user, yaml_data=None, lookups=None):
     """
     Handle supported pipeline protocols
     Check supplied parameters and change the device selection if necessary.
@@ -1257,6 +1423,8 @@ def _pipeline_protocols(job_data, user, yaml_data=None):
 
     if not yaml_data:
         yaml_data = yaml_safe_dump(job_data)
+    if lookups is None:
+        lookups = SubmissionLookups(user)
     role_dictionary = {}  # map of the multinode group
     if "lava-multinode" in job_data["protocols"]:
         # create target_group uuid, just a label for the coordinator.
@@ -1280,23 +1448,20 @@ def _pipeline_protocols(job_data, user, yaml_data=None):
                             "connection specified without a host_role"
                         )
                     continue
-                device_type = _get_device_type(user, params["device_type"])
+                device_type = lookups.device_type(params["device_type"])
                 role_dictionary[role]["device_type"] = device_type
 
-                device_list = Device.objects.filter(
-                    Q(device_type=device_type), ~Q(health=Device.HEALTH_RETIRED)
-                )
-                allowed_devices = _check_submit_to_devices(device_list, user)
+                allowed_devices = lookups.submit_devices(device_type)
 
                 if len(allowed_devices) < params["count"]:
                     raise DevicesUnavailableException(
                         "Not enough devices of type %s are currently "
                         "available to user %s" % (device_type, user)
                     )
-                role_dictionary[role]["tags"] = _get_tag_list(params.get("tags", []))
+                role_dictionary[role]["tags"] = lookups.tag_list(params.get("tags", []))
                 if role_dictionary[role]["tags"]:
-                    supported = _check_tags(
-                        role_dictionary[role]["tags"], device_type=device_type
+                    supported = lookups.tag_devices(
+                        role_dictionary[role]["tags"], device_type
                     )
                     _check_tags_support(supported, allowed_devices, params["count"])
 
@@ -1330,6 +1495,7 @@ def _pipeline_protocols(job_data, user, yaml_data=None):
                     taglist=role_dict["tags"],
                     device_type=role_dict.get("device_type"),
                     orig=None,  # store the dump of the split yaml as the job definition
+                    lookups=lookups,
                 )
                 if not job:
                     raise SubmissionException("Unable to create job for %s" % node_data)
@@ -1409,6 +1575,18 @@ class TestJob(models.Model):
         editable=True,
     )
 
+    # Computed from is_public, viewing_groups, actual_device and
+    # requested_device_type. None when only the submitter can view the job.
+    visibility = models.ForeignKey(
+        "TestJobVisibility",
+        null=True,
+        blank=True,
+        default=None,
+        editable=False,
+        related_name="+",
+        on_delete=models.SET_NULL,
+    )
+
     description = models.CharField(
         verbose_name=_("Description"),
         max_length=200,
@@ -1438,8 +1616,7 @@ class TestJob(models.Model):
         """
         if not self.is_multinode or not self.definition:
             return False
-        job_data = yaml_safe_load(self.definition)
-        return "connection" in job_data
+        return self.facts["dynamic_connection"]
 
     tags = models.ManyToManyField(Tag, blank=True)
 
@@ -1708,6 +1885,19 @@ class TestJob(models.Model):
         verbose_name=_("Queue timeout"), null=True, blank=True, editable=False
     )
 
+    # Facts extracted from the definition at submission time, used by the
+    # scheduler instead of parsing the definition again.
+    definition_facts = JSONField(default=dict, blank=True, editable=False)
+
+    @property
+    def facts(self):
+        if self.definition_facts:
+            return self.definition_facts
+        # Jobs created without _create_pipeline_job
+        return utils.definition_facts(
+            yaml_safe_load(self.definition), [t.name for t in self.tags.all()]
+        )
+
     @property
     def size_limit(self):
         return settings.LOG_SIZE_LIMIT * 1024 * 1024
@@ -1744,34 +1934,19 @@ class TestJob(models.Model):
     def essential_role(self):
         if not self.is_multinode:
             return False
-        data = yaml_safe_load(self.definition)
-        # would be nice to use reduce here but raising and catching TypeError is slower
-        # than checking 'if .. in ' - most jobs will return False.
-        if "protocols" not in data:
-            return False
-        if "lava-multinode" not in data["protocols"]:
-            return False
-        if "role" not in data["protocols"]["lava-multinode"]:
-            return False
-        if "essential" not in data["protocols"]["lava-multinode"]:
-            return False
-        return data["protocols"]["lava-multinode"]["essential"]
+        return self.facts["essential"]
 
     @property
     def device_role(self):
         if not self.is_multinode:
             return "Error"
         try:
-            data = yaml_safe_load(self.definition)
+            role = self.facts["role"]
         except yaml.YAMLError:
             return "Error"
-        if "protocols" not in data:
-            return "Error"
-        if "lava-multinode" not in data["protocols"]:
-            return "Error"
-        if "role" not in data["protocols"]["lava-multinode"]:
+        if role is None:
             return "Error"
-        return data["protocols"]["lava-multinode"]["role"]
+        return role
 
     def __str__(self):
         job_type = "health_check" if self.health_check else "test"
@@ -1792,58 +1967,36 @@ class TestJob(models.Model):
         return reverse("lava.scheduler.job.detail", args=[self.display_id])
 
     @classmethod
-    def from_yaml_and_user(cls, yaml_data, user, original_job=None):
+    def from_yaml_and_user(
+        cls, yaml_data, user, original_job=None, job_data=None, lookups=None
+    ):
         """
         Runs the submission checks on incoming jobs.
         Either rejects the job with a DevicesUnavailableException (which the caller is expected to handle), or
         creates a TestJob object for the submission and saves that testjob into the database.
         This function must *never* be involved in setting the state of this job or the state of any associated device.
         Retains yaml_data as the original definition to retain comments.
+        job_data, when given, is the already parsed yaml_data and is modified
+        in place. lookups is a SubmissionLookups shared by many submissions.
 
         :return: a single TestJob object or a list
         (explicitly, a list, not a QuerySet) of evaluated TestJob objects
         """
-        job_data = yaml_safe_load(yaml_data)
+        if job_data is None:
+            job_data = yaml_safe_load(yaml_data)
 
         # visibility checks
         if "visibility" not in job_data:
             raise SubmissionException("Job visibility must be specified.")
 
         # pipeline protocol handling, e.g. lava-multinode
-        job_list = _pipeline_protocols(job_data, user, yaml_data)
+        job_list = _pipeline_protocols(job_data, user, yaml_data, lookups)
         if job_list:
             # explicitly a list, not a QuerySet.
             return job_list
         # singlenode only
-        device_type = _get_device_type(user, job_data["device_type"])
-        devices = Device.objects.filter(
-            Q(device_type=device_type), ~Q(health=Device.HEALTH_RETIRED)
-        )
-        allow = _check_submit_to_devices(devices, user)
-        if not allow:
-            raise DevicesUnavailableException(
-                "No devices of type %s are available." % device_type
-            )
-        taglist = _get_tag_list(job_data.get("tags", []))
-        if taglist:
-            supported = _check_tags(taglist, device_type=device_type)
-            _check_tags_support(supported, allow)
-        if original_job:
-            # Add old job absolute url to metadata
-            job_url = str(original_job.get_absolute_url())
-            with contextlib.suppress(Site.DoesNotExist, ImproperlyConfigured):
-                site = Site.objects.get_current()
-                job_url = "http://%s%s" % (site.domain, job_url)
-
-            job_data.setdefault("metadata", {}).setdefault("job.original", job_url)
-
-        return _create_pipeline_job(
-            job_data,
-            user,
-            taglist,
-            device=None,
-            device_type=device_type,
-            orig=yaml_data,
+        return _save_pipeline_job(
+            *_singlenode_job(yaml_data, job_data, user, original_job, lookups)
         )
 
     def can_view(self, user):
@@ -2002,24 +2155,22 @@ class TestJob(models.Model):
         if not self.is_multinode:
             return []
         try:
-            data = yaml_safe_load(self.definition)
+            role = self.facts["role"]
         except yaml.YAMLError:
             return []
-        try:
-            role = data["protocols"]["lava-multinode"]["role"]
-        except (KeyError, TypeError):
+        if role is None:
             return []
 
         for job in self.sub_jobs_list:
             if job == self:
                 continue
             try:
-                sub_data = yaml_safe_load(job.definition)
+                facts = job.facts
             except yaml.YAMLError:
                 continue
-            if not "connection" in sub_data:
+            if not facts["dynamic_connection"]:
                 continue
-            if role == sub_data.get("host_role"):
+            if role == facts["host_role"]:
                 yield job
 
     def dynamic_host(self):
@@ -2027,10 +2178,9 @@ class TestJob(models.Model):
             return self.actual_device.worker_host
 
         try:
-            data = yaml_safe_load(self.definition)
+            host_role = self.facts["host_role"]
         except yaml.YAMLError:
             return None
-        host_role = data.get("host_role")
         if not host_role:
             return None
 
@@ -2038,10 +2188,9 @@ class TestJob(models.Model):
             if job == self:
                 continue
             try:
-                data = yaml_safe_load(job.definition)
+                role = job.facts["role"]
             except yaml.YAMLError:
                 continue
-            role = data.get("protocols", {}).get("lava-multinode", {}).get("role")
             if role == host_role:
                 return job
         return None
@@ -2081,6 +2230,21 @@ class TestJob(models.Model):
         else:
             return self.definition
 
+    def testcase_count(self, value=None):
+        """
+        Number of test cases of this job, from the counters of the suites.
+        """
+        suites = self.testsuite_set.all()
+        # Suites created before the counters
+        outdated = [s.pk for s in suites.filter(count_pass__isnull=True).only("pk")]
+        if outdated:
+            suites.model.refresh_counts(outdated)
+        values = [value] if value is not None else suites.model.COUNTERS
+        counts = suites.aggregate(
+            **{name: models.Sum("count_%s" % name) for name in values}
+        )
+        return sum(v or 0 for v in counts.values())
+
     def get_passfail_results(self):
         # Get pass fail results per lava_scheduler_app.testjob.
         results = {}
@@ -2506,6 +2670,164 @@ class GroupWorkerPermission(GroupObjectPermission):
         return "Permission '%s' for worker %s" % (self.permission.codename, self.worker)
 
 
+class TestJobVisibility(models.Model):
+    """
+    Users allowed to view the test jobs, shared by every job running on the
+    same device, requested to the same device type or with the same viewing
+    groups.
+
+    The rows are updated when the permissions of the devices and device
+    types change, so listing the jobs visible by a user is a join on this
+    small table instead of checking the permissions of every job.
+    """
+
+    device = models.OneToOneField(
+        Device, null=True, on_delete=models.CASCADE, related_name="+"
+    )
+    device_type = models.OneToOneField(
+        DeviceType, null=True, on_delete=models.CASCADE, related_name="+"
+    )
+    # Sorted ids of the viewing groups
+    viewing_groups = models.TextField(null=True, unique=True)
+
+    # Visible by every user, including anonymous users
+    is_public = models.BooleanField(default=False)
+    # Visible by the members of any of these groups or, for the viewing
+    # groups, by the members of all of them.
+    groups = models.ManyToManyField(Group, related_name="+")
+
+    def __str__(self):
+        if self.device_id is not None:
+            return "Visibility of device %s" % self.device_id
+        if self.device_type_id is not None:
+            return "Visibility of device type %s" % self.device_type_id
+        return "Visibility of viewing groups %s" % self.viewing_groups
+
+    @classmethod
+    def visible_by_user(cls, user):
+        groups = [g.id for g in user.groups.all()]
+        # The user should be part of every viewing group. Use an explicit
+        # subquery: the one generated for ~Q(groups__in=...) would be
+        # correlated with the join of the previous condition.
+        nonuser_groups = cls.groups.through.objects.exclude(group_id__in=groups)
+        return cls.objects.filter(
+            Q(is_public=True)
+            | Q(viewing_groups__isnull=True, groups__in=groups)
+            | (
+                Q(viewing_groups__isnull=False)
+                & ~Q(pk__in=nonuser_groups.values("testjobvisibility_id"))
+            )
+        ).distinct()
+
+    @classmethod
+    def for_job(cls, job, viewing_groups):
+        """
+        Return the visibility of the job or None if only the submitter can
+        view it.
+        """
+        if viewing_groups:
+            key = ",".join(str(g) for g in sorted(viewing_groups))
+            (visibility, created) = cls.objects.get_or_create(viewing_groups=key)
+            if created:
+                visibility.groups.set(viewing_groups)
+            return visibility
+        if not job.is_public:
+            return None
+        if job.actual_device_id is not None:
+            (visibility, created) = cls.objects.get_or_create(
+                device_id=job.actual_device_id
+            )
+        elif job.requested_device_type_id is not None:
+            (visibility, created) = cls.objects.get_or_create(
+                device_type_id=job.requested_device_type_id
+            )
+        else:
+            return None
+        if created:
+            visibility.refresh()
+        return visibility
+
+    @classmethod
+    def update_job(cls, job, viewing_groups=None):
+        """
+        Compute and save the visibility of the job.
+        """
+        if viewing_groups is None:
+            viewing_groups = list(job.viewing_groups.values_list("id", flat=True))
+        visibility = cls.for_job(job, viewing_groups)
+        visibility_id = None if visibility is None else visibility.id
+        if job.visibility_id != visibility_id:
+            TestJob.objects.filter(pk=job.pk).update(visibility=visibility_id)
+            job.visibility = visibility
+
+    @classmethod
+    def refresh_for(cls, obj):
+        """
+        Update the visibilities after a change of the permissions of the
+        given device or device type.
+        """
+        if isinstance(obj, Device):
+            rows = cls.objects.filter(device=obj)
+        elif isinstance(obj, DeviceType):
+            # Devices without restrictions inherit the device type ones
+            rows = cls.objects.filter(Q(device_type=obj) | Q(device__device_type=obj))
+        else:
+            return
+        for visibility in rows:
+            visibility.refresh()
+
+    @classmethod
+    def _permissions(cls, perms, codename):
+        # Return if the view permission is restricted and the groups with any
+        # permission (that all imply view)
+        groups = set(perms.values_list("group_id", flat=True))
+        restricted = perms.filter(permission__codename=codename).exists()
+        return (restricted, groups)
+
+    def refresh(self):
+        """
+        Compute the users allowed to view the jobs of the device or device
+        type, see RestrictedDeviceQuerySet.accessible_by_user.
+        """
+        if self.device_id is not None:
+            (restricted, groups) = self._permissions(
+                GroupDevicePermission.objects.filter(device_id=self.device_id),
+                Device.VIEW_PERMISSION.split(".", 1)[-1],
+            )
+            is_public = False
+            if not restricted:
+                device_type_id = (
+                    Device.objects.filter(pk=self.device_id)
+                    .values_list("device_type_id", flat=True)
+                    .first()
+                )
+                (restricted, type_groups) = self._permissions(
+                    GroupDeviceTypePermission.objects.filter(
+                        devicetype_id=device_type_id
+                    ),
+                    DeviceType.VIEW_PERMISSION.split(".", 1)[-1],
+                )
+                is_public = not restricted
+                groups |= type_groups
+        elif self.device_type_id is not None:
+            (restricted, groups) = self._permissions(
+                GroupDeviceTypePermission.objects.filter(
+                    devicetype_id=self.device_type_id
+                ),
+                DeviceType.VIEW_PERMISSION.split(".", 1)[-1],
+            )
+            is_public = not restricted
+        else:
+            return
+
+        if is_public:
+            groups = set()
+        if is_public != self.is_public:
+            self.is_public = is_public
+            self.save(update_fields=["is_public"])
+        self.groups.set(groups)
+
+
 class RemoteArtifactsAuth(models.Model):
     class Meta:
         unique_together = ("name", "user")
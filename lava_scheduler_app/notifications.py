@@ -208,9 +208,9 @@ def get_notification_args(job):
             left_suites_count = {}
             for suite in left_suites_intersection:
                 left_suites_count[suite.name] = (
-                    suite.testcase_set.filter(result=TestCase.RESULT_PASS).count(),
-                    suite.testcase_set.filter(result=TestCase.RESULT_FAIL).count(),
-                    suite.testcase_set.filter(result=TestCase.RESULT_SKIP).count(),
+                    suite.testcase_count("pass"),
+                    suite.testcase_count("fail"),
+                    suite.testcase_count("skip"),
                 )
 
             right_suites_intersection = old_suites.filter(
@@ -221,9 +221,9 @@ def get_notification_args(job):
             right_suites_count = {}
             for suite in right_suites_intersection:
                 right_suites_count[suite.name] = (
-                    suite.testcase_set.filter(result=TestCase.RESULT_PASS).count(),
-                    suite.testcase_set.filter(result=TestCase.RESULT_FAIL).count(),
-                    suite.testcase_set.filter(result=TestCase.RESULT_SKIP).count(),
+                    suite.testcase_count("pass"),
+                    suite.testcase_count("fail"),
+                    suite.testcase_count("skip"),
                 )
 
             args["query"]["left_suites_count"] = left_suites_count
@@ -18,6 +18,7 @@
 # along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
 
 from dataclasses import dataclass
+from typing import Optional, Set
 import datetime
 
 from django.contrib.auth.models import User
@@ -263,16 +264,52 @@ def schedule_jobs(logger, available_devices, workers):
     logger.info("done")
 
 
+@dataclass
+class QueuedJob:
+    job: TestJob
+    tags: Set[str]
+    vland: Optional[dict]
+
+
+def load_queue(dt):
+    """
+    Load the queue for the given device type in a constant number of queries.
+    The returned list is sorted by scheduling order.
+    """
+    jobs = TestJob.objects.filter(state=TestJob.STATE_SUBMITTED)
+    jobs = jobs.filter(actual_device__isnull=True)
+    jobs = jobs.filter(requested_device_type__pk=dt.pk)
+    jobs = jobs.select_related("submitter")
+    jobs = jobs.order_by("-priority", "submit_time", "sub_id", "id")
+
+    # Share the User objects between jobs so that permission caches are
+    # populated once per submitter.
+    submitters = {}
+    queue = []
+    for job in jobs:
+        job.submitter = submitters.setdefault(job.submitter_id, job.submitter)
+        facts = job.facts
+        vland = None
+        if facts["vland"]:
+            vland = {"protocols": {"lava-vland": facts["vland"]}}
+        queue.append(QueuedJob(job, set(facts["tags"]), vland))
+    return queue
+
+
 def schedule_jobs_for_device_type(logger, dt, available_devices, workers):
     devices = dt.device_set.select_for_update()
     devices = filter_devices(devices, workers)
     devices = devices.filter(health__in=[Device.HEALTH_GOOD, Device.HEALTH_UNKNOWN])
+    devices = devices.select_related("device_type")
+    devices = devices.prefetch_related("tags")
     # Add a random sort: with N devices and num(jobs) < N, if we don't sort
     # randomly, the same devices will always be used while the others will
     # never be used.
     devices = devices.order_by("?")
 
     workers_limit = worker_summary()
+    queue = None
+    can_submit = {}
 
     print_header = True
     for device in devices:
@@ -284,14 +321,14 @@ def schedule_jobs_for_device_type(logger, dt, available_devices, workers):
         if device.hostname not in available_devices:
             continue
 
-        if workers_limit[device.worker_host.hostname].overused():
+        if workers_limit[device.worker_host_id].overused():
             logger.debug(
                 "SKIP %s due to %s having %d jobs (greater than %d)"
                 % (
                     device.hostname,
-                    device.worker_host,
-                    workers_limit[device.worker_host.hostname].busy,
-                    workers_limit[device.worker_host.hostname].limit,
+                    device.worker_host_id,
+                    workers_limit[device.worker_host_id].busy,
+                    workers_limit[device.worker_host_id].limit,
                 )
             )
             continue
@@ -311,30 +348,37 @@ def schedule_jobs_for_device_type(logger, dt, available_devices, workers):
             )
             continue
 
-        if schedule_jobs_for_device(logger, device, print_header) is not None:
-            print_header = False
-            workers_limit[device.worker_host.hostname].busy += 1
+        # Only load the queue when at least one device can take a job
+        if queue is None:
+            queue = load_queue(dt)
 
+        if (
+            schedule_jobs_for_device(logger, device, print_header, queue, can_submit)
+            is not None
+        ):
+            print_header = False
+            workers_limit[device.worker_host_id].busy += 1
 
-def schedule_jobs_for_device(logger, device, print_header):
-    jobs = TestJob.objects.filter(state=TestJob.STATE_SUBMITTED)
-    jobs = jobs.filter(actual_device__isnull=True)
-    jobs = jobs.filter(requested_device_type__pk=device.device_type.pk)
-    jobs = jobs.select_related("submitter")
-    jobs = jobs.order_by("-priority", "submit_time", "sub_id", "id")
 
-    device_tags = set(device.tags.all())
-    for job in jobs:
-        if not device.can_submit(job.submitter):
+def schedule_jobs_for_device(logger, device, print_header, queue, can_submit):
+    """
+    Pick the first job of the in-memory queue that can run on this device.
+    The selected job is removed from the queue.
+    """
+    device_tags = {t.name for t in device.tags.all()}
+    for index, queued in enumerate(queue):
+        job = queued.job
+        key = (device.hostname, job.submitter_id)
+        if key not in can_submit:
+            can_submit[key] = device.can_submit(job.submitter)
+        if not can_submit[key]:
             continue
 
-        job_tags = set(job.tags.all())
-        if not job_tags.issubset(device_tags):
+        if not queued.tags.issubset(device_tags):
             continue
 
-        job_dict = yaml_safe_load(job.definition)
-        if "protocols" in job_dict and "lava-vland" in job_dict["protocols"]:
-            if not match_vlan_interface(device, job_dict):
+        if queued.vland is not None:
+            if not match_vlan_interface(device, queued.vland):
                 continue
 
         if print_header:
@@ -353,6 +397,7 @@ def schedule_jobs_for_device(logger, device, print_header):
         else:
             job.go_state_scheduled(device)
         job.save()
+        del queue[index]
         return job.id
     return None
 
@@ -385,8 +430,7 @@ def transition_multinode_jobs(logger):
             # build a list of all devices in this group
             if sub_job.dynamic_connection:
                 continue
-            definition = yaml_safe_load(sub_job.definition)
-            devices[str(sub_job.id)] = definition["protocols"]["lava-multinode"]["role"]
+            devices[str(sub_job.id)] = sub_job.facts["role"]
 
         for sub_job in sub_jobs:
             # apply the complete list to all jobs in this group
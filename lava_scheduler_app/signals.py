@@ -29,9 +29,24 @@ from zmq.utils.strtypes import b
 
 from django.conf import settings
 from django.db import transaction
-from django.db.models.signals import post_init, post_save, pre_delete, pre_save
+from django.contrib.auth.models import Group
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 
-from lava_scheduler_app.models import Device, TestJob, Worker
+from lava_scheduler_app.models import (
+    Device,
+    GroupDevicePermission,
+    GroupDeviceTypePermission,
+    TestJob,
+    TestJobVisibility,
+    Worker,
+)
 from lava_scheduler_app.tasks import async_send_notifications
 
 
@@ -55,6 +70,11 @@ zmq_socket: ContextVar[zmq.Socket] = ContextVar("zmq_socket")
 
 
 def send_event(topic, user, data):
+    send_events(topic, [(user, data)])
+
+
+def send_events(topic, events):
+    # Send a list of (user, data) events for the same topic
     # Get back the thread local storage
     try:
         context = zmq_context.get()
@@ -68,21 +88,22 @@ def send_event(topic, user, data):
         zmq_context.set(context)
         zmq_socket.set(socket)
 
-    try:
-        # The format is [topic, uuid, datetime, username, data as json]
-        msg = [
-            b(settings.EVENT_TOPIC + topic),
-            b(str(uuid.uuid1())),
-            b(datetime.datetime.utcnow().isoformat()),
-            b(user),
-            b(simplejson.dumps(data)),
-        ]
-        # Send the message in the non-blockng mode.
-        # If the consumer (lava-publisher) is not active, the message will be lost.
-        socket.send_multipart(msg, zmq.DONTWAIT)
-    except (TypeError, ValueError, zmq.ZMQError):
-        # The event can't be send, just skip it
-        print("Unable to send the zmq event %s" % (settings.EVENT_TOPIC + topic))
+    for (user, data) in events:
+        try:
+            # The format is [topic, uuid, datetime, username, data as json]
+            msg = [
+                b(settings.EVENT_TOPIC + topic),
+                b(str(uuid.uuid1())),
+                b(datetime.datetime.utcnow().isoformat()),
+                b(user),
+                b(simplejson.dumps(data)),
+            ]
+            # Send the message in the non-blockng mode.
+            # If the consumer (lava-publisher) is not active, the message will be lost.
+            socket.send_multipart(msg, zmq.DONTWAIT)
+        except (TypeError, ValueError, zmq.ZMQError):
+            # The event can't be send, just skip it
+            print("Unable to send the zmq event %s" % (settings.EVENT_TOPIC + topic))
 
 
 @log_exception
@@ -174,32 +195,41 @@ def testjob_post_handler(sender, **kwargs):
         instance._old_health = instance.health
         instance._old_state = instance.state
 
-        # Create the message
-        data = {
-            "health": instance.get_health_display(),
-            "state": instance.get_state_display(),
-            "job": instance.id,
-            "description": instance.description,
-            "priority": instance.priority,
-            "submit_time": instance.submit_time.isoformat(),
-            "submitter": str(instance.submitter),
-            "health_check": instance.health_check,
-        }
-        if instance.is_multinode:
-            data["sub_id"] = instance.sub_id
-        if instance.actual_device:
-            data["device"] = instance.actual_device.hostname
-            if instance.actual_device.worker_host:
-                data["worker"] = instance.actual_device.worker_host.hostname
-        if instance.requested_device_type:
-            data["device_type"] = instance.requested_device_type.name
-        if instance.start_time:
-            data["start_time"] = instance.start_time.isoformat()
-        if instance.end_time:
-            data["end_time"] = instance.end_time.isoformat()
-
         # Send the event
-        send_event(".testjob", str(instance.submitter), data)
+        send_event(".testjob", str(instance.submitter), testjob_event(instance))
+
+
+def testjob_event(instance):
+    data = {
+        "health": instance.get_health_display(),
+        "state": instance.get_state_display(),
+        "job": instance.id,
+        "description": instance.description,
+        "priority": instance.priority,
+        "submit_time": instance.submit_time.isoformat(),
+        "submitter": str(instance.submitter),
+        "health_check": instance.health_check,
+    }
+    if instance.is_multinode:
+        data["sub_id"] = instance.sub_id
+    if instance.actual_device:
+        data["device"] = instance.actual_device.hostname
+        if instance.actual_device.worker_host:
+            data["worker"] = instance.actual_device.worker_host.hostname
+    if instance.requested_device_type:
+        data["device_type"] = instance.requested_device_type.name
+    if instance.start_time:
+        data["start_time"] = instance.start_time.isoformat()
+    if instance.end_time:
+        data["end_time"] = instance.end_time.isoformat()
+    return data
+
+
+def send_testjob_events(jobs):
+    # Events of the jobs created with bulk_create, that does not send the
+    # post_save signal
+    if settings.EVENT_NOTIFICATION:
+        send_events(".testjob", [(str(j.submitter), testjob_event(j)) for j in jobs])
 
 
 @log_exception
@@ -243,6 +273,84 @@ def worker_post_handler(sender, **kwargs):
         send_event(".worker", "lavaserver", data)
 
 
+# The visibility handlers are not using log_exception: the visibility of the
+# jobs should always be up to date.
+VISIBILITY_FIELDS = ["is_public", "actual_device_id", "requested_device_type_id"]
+
+
+def testjob_visibility_init_handler(sender, instance, **kwargs):
+    # Do not load the deferred fields
+    instance._old_visibility = [instance.__dict__.get(f) for f in VISIBILITY_FIELDS]
+
+
+def testjob_visibility_handler(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    current = [getattr(instance, f) for f in VISIBILITY_FIELDS]
+    if created:
+        # The viewing groups are added after the creation
+        TestJobVisibility.update_job(instance, [])
+    elif current != instance._old_visibility:
+        TestJobVisibility.update_job(instance)
+    instance._old_visibility = current
+
+
+def testjob_viewing_groups_handler(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # The jobs of the group are not known after the clear
+        instance._visibility_jobs = list(
+            instance.viewing_groups.values_list("id", flat=True)
+        )
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    if not reverse:
+        TestJobVisibility.update_job(instance)
+        return
+    if action == "post_clear":
+        pk_set = instance._visibility_jobs
+    for job in TestJob.objects.filter(pk__in=pk_set):
+        TestJobVisibility.update_job(job)
+
+
+def group_pre_delete_handler(sender, instance, **kwargs):
+    # Jobs that will loose one of their viewing groups
+    instance._visibility_jobs = list(
+        instance.viewing_groups.values_list("id", flat=True)
+    )
+    TestJobVisibility.objects.filter(
+        viewing_groups__isnull=False, groups=instance
+    ).delete()
+
+
+def group_post_delete_handler(sender, instance, **kwargs):
+    for job in TestJob.objects.filter(pk__in=instance._visibility_jobs):
+        TestJobVisibility.update_job(job)
+
+
+def device_visibility_init_handler(sender, instance, **kwargs):
+    instance._old_device_type_id = instance.__dict__.get("device_type_id")
+
+
+def device_visibility_handler(sender, instance, created, raw, **kwargs):
+    if raw or created:
+        return
+    if instance.device_type_id != instance._old_device_type_id:
+        TestJobVisibility.refresh_for(instance)
+        instance._old_device_type_id = instance.device_type_id
+
+
+def device_permission_handler(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    TestJobVisibility.refresh_for(instance.device)
+
+
+def device_type_permission_handler(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    TestJobVisibility.refresh_for(instance.devicetype)
+
+
 pre_delete.connect(
     testjob_pre_delete_handler,
     sender=TestJob,
@@ -263,6 +371,64 @@ pre_save.connect(
     dispatch_uid="testjob_notifications",
 )
 
+
+# Keep the visibility of the jobs up to date
+post_init.connect(
+    testjob_visibility_init_handler,
+    sender=TestJob,
+    weak=False,
+    dispatch_uid="testjob_visibility_init_handler",
+)
+post_save.connect(
+    testjob_visibility_handler,
+    sender=TestJob,
+    weak=False,
+    dispatch_uid="testjob_visibility_handler",
+)
+m2m_changed.connect(
+    testjob_viewing_groups_handler,
+    sender=TestJob.viewing_groups.through,
+    weak=False,
+    dispatch_uid="testjob_viewing_groups_handler",
+)
+pre_delete.connect(
+    group_pre_delete_handler,
+    sender=Group,
+    weak=False,
+    dispatch_uid="group_pre_delete_handler",
+)
+post_delete.connect(
+    group_post_delete_handler,
+    sender=Group,
+    weak=False,
+    dispatch_uid="group_post_delete_handler",
+)
+post_init.connect(
+    device_visibility_init_handler,
+    sender=Device,
+    weak=False,
+    dispatch_uid="device_visibility_init_handler",
+)
+post_save.connect(
+    device_visibility_handler,
+    sender=Device,
+    weak=False,
+    dispatch_uid="device_visibility_handler",
+)
+for signal in [post_save, post_delete]:
+    signal.connect(
+        device_permission_handler,
+        sender=GroupDevicePermission,
+        weak=False,
+        dispatch_uid="device_permission_handler",
+    )
+    signal.connect(
+        device_type_permission_handler,
+        sender=GroupDeviceTypePermission,
+        weak=False,
+        dispatch_uid="device_type_permission_handler",
+    )
+
 # Only activate these signals when EVENT_NOTIFICATION is in use
 if settings.EVENT_NOTIFICATION:
     post_init.connect(
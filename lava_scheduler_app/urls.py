@@ -287,6 +287,11 @@ urlpatterns = [
         similar_jobs,
         name="lava.scheduler.job.similar_jobs",
     ),
+    url(
+        r"internal/v1/jobs/$",
+        internal_v1_jobs,
+        name="lava.scheduler.internal.v1.jobs",
+    ),
     url(
         r"internal/v1/jobs/(?P<pk>[0-9]+|[0-9]+.[0-9]+)/$",
         internal_v1_jobs,
@@ -61,6 +61,28 @@ def _split_multinode_vland(submission, jobs):
     return jobs
 
 
+def definition_facts(job_data, tags):
+    """
+    Extract from a job definition the facts needed by the scheduler so that
+    the definition does not have to be parsed again.
+    parameters:
+      job_data - the dictionary of the job definition
+      tags - the list of tag names required by the job
+    return:
+      a dictionary that can be stored in TestJob.definition_facts
+    """
+    protocols = job_data.get("protocols", {})
+    multinode = protocols.get("lava-multinode", {})
+    return {
+        "dynamic_connection": "connection" in job_data,
+        "essential": bool("role" in multinode and multinode.get("essential")),
+        "host_role": job_data.get("host_role"),
+        "role": multinode.get("role"),
+        "tags": sorted(tags),
+        "vland": protocols.get("lava-vland"),
+    }
+
+
 def split_multinode_yaml(submission, target_group):
     """
     Handles the lava-multinode protocol requirements.
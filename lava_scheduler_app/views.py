@@ -24,7 +24,6 @@ import datetime
 import io
 import logging
 import os
-from pathlib import Path
 import simplejson
 import tarfile
 import re
@@ -51,6 +50,7 @@ from django.http import (
     HttpResponseForbidden,
     HttpResponseRedirect,
     JsonResponse,
+    StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404, redirect, render
 from django.db.models import Q
@@ -60,7 +60,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods, require_POST
 from django_tables2 import RequestConfig
 
-from lava_common.compat import yaml_load, yaml_safe_dump, yaml_safe_load
+from lava_common.compat import yaml_load, yaml_safe_load
 from lava_common.log import dump
 from lava_common.schemas import validate
 from lava_common.version import __version__
@@ -69,12 +69,10 @@ from lava_results_app.dbutils import map_scanned_results, create_metadata_store
 from lava_server.views import index as lava_index
 from lava_server.bread_crumbs import BreadCrumb, BreadCrumbTrail
 from lava_server.compat import djt2_paginator_class, is_ajax
-from lava_server.files import File
 
 from lava_scheduler_app.models import (
     Device,
     DeviceType,
-    RemoteArtifactsAuth,
     Tag,
     TestJob,
     TestJobUser,
@@ -83,12 +81,17 @@ from lava_scheduler_app.models import (
 from lava_scheduler_app.dbutils import (
     device_type_summary,
     invalid_template,
+    job_start_payload,
+    job_update_state,
+    jobs_start_payloads,
     load_devicetype_template,
     testjob_submission,
     validate_job,
+    worker_jobs,
+    worker_ping,
 )
 from lava_scheduler_app.utils import get_user_ip, is_ip_allowed
-from lava_scheduler_app.logutils import logs_instance
+from lava_scheduler_app.logutils import logs_instance, parse_line, parse_records
 from lava_scheduler_app.signals import send_event
 from lava_scheduler_app.templatetags.utils import udecode
 
@@ -104,6 +107,7 @@ from lava_results_app.models import (
     QueryCondition,
     TestCase,
     TestData,
+    TestSuite,
 )
 
 from django.contrib.auth.models import User
@@ -1090,7 +1094,12 @@ def health_job_list(request, pk):
 
 @require_http_methods(["GET", "POST"])
 @csrf_exempt
-def internal_v1_jobs(request, pk):
+def internal_v1_jobs(request, pk=None):
+    if pk is None:
+        if request.method == "GET":
+            return JsonResponse({"error": "GET is forbidden for such url"}, status=403)
+        return internal_v1_jobs_many(request)
+
     try:
         job = TestJob.objects.get(pk=pk)
     except TestJob.DoesNotExist:
@@ -1103,140 +1112,65 @@ def internal_v1_jobs(request, pk):
         return JsonResponse({"error": "Invalid 'token'"}, status=400)
 
     if request.method == "GET":
-        job_def = yaml_safe_load(job.definition)
-        job_def["compatibility"] = job.pipeline_compatibility
-        job_def_str_safe = yaml_safe_dump(job_def)
-
-        tokens = {
-            x["name"]: x["token"]
-            for x in RemoteArtifactsAuth.objects.filter(user=job.submitter).values(
-                "name", "token"
-            )
-        }
-
-        def update_token(headers_dict):
-            for key in headers_dict["headers"]:
-                token_name = headers_dict["headers"][key]
-                if token_name in tokens.keys():
-                    headers_dict["headers"][key] = tokens[token_name]
-
-        if "actions" in job_def:
-            for action in job_def["actions"]:
-                for k, v in action.items():
-                    if k == "deploy":
-                        for a, b in v.items():
-                            if isinstance(b, dict):
-                                if "url" in b and "headers" in b:
-                                    update_token(b)
-                                for i, j in b.items():
-                                    if isinstance(j, dict):
-                                        if "url" in j and "headers" in j:
-                                            update_token(j)
-
-        if "secrets" in job_def:
-            for k, v in job_def["secrets"].items():
-                if v in tokens.keys():
-                    job_def["secrets"][k] = tokens[v]
-
-        job_def_str = yaml_safe_dump(job_def)
-        job_ctx = job_def.get("context", {})
-
-        if job.dynamic_connection:
-            host = job.dynamic_host()
-            device = host.actual_device
-            worker = device.worker_host
-            host_device_cfg = device.load_configuration(job_ctx)
-            device_cfg_str = yaml_safe_dump(
-                device.minimise_configuration(host_device_cfg)
-            )
-        else:
-            device = job.actual_device
-            worker = device.worker_host
-            device_cfg_str = device.load_configuration(job_ctx, output_format="yaml")
-
-        def config(kind):
-            try:
-                data = File(kind, worker.hostname).read(raising=False)
-                yaml_safe_load(data)
-                return data
-            except yaml.YAMLError:
-                # Raise an OSError because the caller uses yaml.YAMLError for a
-                # specific usage. Allows here to specify the faulty filename.
-                raise OSError(
-                    "", f"Invalid YAML file for {worker.hostname}: {kind} file"
-                )
-
-        env_str = config("env")
-        env_dut_str = config("env-dut")
-        dispatcher_cfg = config("dispatcher")
-
-        # Save the configuration
-        path = Path(job.output_dir)
-        path.mkdir(mode=0o755, parents=True, exist_ok=True)
-        (path / "job.yaml").write_text(job_def_str_safe, encoding="utf-8")
-        (path / "device.yaml").write_text(device_cfg_str, encoding="utf-8")
-        if dispatcher_cfg:
-            (path / "dispatcher.yaml").write_text(dispatcher_cfg, encoding="utf-8")
-        if env_str:
-            (path / "env.yaml").write_text(env_str)
-        if env_dut_str:
-            (path / "env-dut.yaml").write_text(env_dut_str, encoding="utf-8")
-
-        return JsonResponse(
-            {
-                "definition": job_def_str,
-                "device": device_cfg_str,
-                "dispatcher": dispatcher_cfg,
-                "env": env_str,
-                "env-dut": env_dut_str,
-            }
-        )
+        return JsonResponse(job_start_payload(job))
     else:
         # POST request
-        state = request.POST.get("state", "").capitalize()
-        if state not in TestJob.STATE_REVERSE:
-            return JsonResponse({"error": f"Invalid state '{state}'"}, status=400)
+        try:
+            job_update_state(pk, request.POST)
+        except ValueError as exc:
+            return JsonResponse({"error": str(exc)}, status=400)
+        return JsonResponse({})
 
-        with transaction.atomic():
-            # TODO: find a way to lock actual_device
-            job = TestJob.objects.select_for_update().get(pk=pk)
-            if TestJob.STATE_REVERSE[state] == TestJob.STATE_RUNNING:
-                job.go_state_running()
-            elif TestJob.STATE_REVERSE[state] == TestJob.STATE_FINISHED:
-                # Check the result
-                health = request.POST.get("result", "")
-                error_type = request.POST.get("error_type", "")
-                errors = request.POST.get("errors")
-                description = request.POST.get("description", "")
-                if health not in ["pass", "fail"]:
-                    return JsonResponse(
-                        {"error": f"Invalid health '{health}'"}, status=400
-                    )
 
-                health = (
-                    TestJob.HEALTH_COMPLETE
-                    if health == "pass"
-                    else TestJob.HEALTH_INCOMPLETE
-                )
-                infrastructure_error = error_type in [
-                    "Bug",
-                    "Configuration",
-                    "Infrastructure",
-                ]
-                job.go_state_finished(health, infrastructure_error)
-                if errors:
-                    job.failure_comment = errors
-                Path(job.output_dir).mkdir(mode=0o755, parents=True, exist_ok=True)
-                (Path(job.output_dir) / "description.yaml").write_text(
-                    description, encoding="utf-8"
-                )
+def internal_v1_jobs_many(request):
+    """
+    Batch version of internal_v1_jobs for many jobs at once:
+    * "start": json list of {"id": ..., "token": ...} of the jobs to start
+    * "state": json list of {"id": ..., "token": ..., "state": ..., ...} with
+      the new states to apply, all in one transaction
+    The response contains, for each job id, the payload (or the empty
+    dictionary for the states) or {"error": "..."}.
+    """
+    try:
+        starts = simplejson.loads(request.POST.get("start", "[]"))
+        states = simplejson.loads(request.POST.get("state", "[]"))
+        ids = {int(data["id"]) for data in starts + states}
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({"error": "Invalid 'start' or 'state'"}, status=400)
+
+    jobs = TestJob.objects.only("id", "token").in_bulk(ids)
+
+    def check(data):
+        job = jobs.get(int(data["id"]))
+        if job is None:
+            return f"Unknown job '{data['id']}'"
+        if data.get("token") != job.token:
+            return "Invalid 'token'"
+        return None
+
+    ret = {"start": {}, "state": {}}
+    valid = []
+    for data in starts:
+        error = check(data)
+        if error is None:
+            valid.append(int(data["id"]))
+        else:
+            ret["start"][data["id"]] = {"error": error}
+    ret["start"].update(jobs_start_payloads(valid))
+
+    with transaction.atomic():
+        for data in states:
+            error = check(data)
+            if error is None:
+                try:
+                    job_update_state(int(data["id"]), data)
+                    ret["state"][data["id"]] = {}
+                except ValueError as exc:
+                    ret["state"][data["id"]] = {"error": str(exc)}
             else:
-                return JsonResponse(
-                    {"error": f"Not handled state '{state}'"}, status=400
-                )
-            job.save()
+                ret["state"][data["id"]] = {"error": error}
 
-        return JsonResponse({})
+    return JsonResponse(ret)
 
 
 @require_POST
@@ -1267,19 +1201,18 @@ def internal_v1_jobs_logs(request, pk):
     except ValueError:
         return JsonResponse({"error": "Invalid 'index'"}, status=400)
 
-    # TODO: leaky logutils abstraction
-    path = Path(job.output_dir)
-    path.mkdir(mode=0o755, parents=True, exist_ok=True)
-    output = (path / "output.yaml").open("ab")
-    index = (path / "output.idx").open("ab")
     line_skip = logs_instance.line_count(job) - line_idx
 
-    # TODO: use a database transaction so all or none objects are saved
     # TODO: except exceptions and return the number
     #       of lines that where actually parsed !!
-    test_cases = []
+    records = []
+    results = []
     line_count = 0
-    for (line, string) in zip(yaml_load(lines), lines.split("\n")):
+    for string in lines.split("\n"):
+        if not string:
+            continue
+        # Only parse what is needed
+        line = parse_line(string)
         # skip lines that where already saved to disk
         if line_skip > 0:
             line_skip -= 1
@@ -1292,38 +1225,57 @@ def internal_v1_jobs_logs(request, pk):
                 line["lvl"] = "debug"
                 string = "- " + dump(line)
 
-            # Save the log line
-            logs_instance.write(job, (string + "\n").encode("utf-8"), output, index)
+            records.append((string + "\n").encode("utf-8"))
 
         # handle test case results
         if line["lvl"] == "results":
+            results.append(line["msg"])
+        line_count += 1
+
+    # Save the log lines
+    if records:
+        logs_instance.write_many(job, records)
+
+    # Save the new test cases in one transaction. If the bulk insert fails,
+    # fallback to saving them one by one, skipping the ones that are invalid.
+    with transaction.atomic():
+        test_cases = []
+        suites = {}
+        for result in results:
             starttc = endtc = None
             with contextlib.suppress(KeyError):
-                starttc = line["msg"]["starttc"]
-                del line["msg"]["starttc"]
+                starttc = result["starttc"]
+                del result["starttc"]
             with contextlib.suppress(KeyError):
-                endtc = line["msg"]["endtc"]
-                del line["msg"]["endtc"]
-            meta_filename = create_metadata_store(line["msg"], job)
+                endtc = result["endtc"]
+                del result["endtc"]
+            meta_filename = create_metadata_store(result, job)
             new_test_case = map_scanned_results(
-                results=line["msg"],
+                results=result,
                 job=job,
                 starttc=starttc,
                 endtc=endtc,
                 meta_filename=meta_filename,
+                suites=suites,
             )
 
             if new_test_case is not None:
                 test_cases.append(new_test_case)
-        line_count += 1
 
-    # Save the new test cases
-    try:
-        TestCase.objects.bulk_create(test_cases)
-    except (DatabaseError, ValueError):
-        for tc in test_cases:
-            with contextlib.suppress(DatabaseError, ValueError):
-                tc.save()
+        try:
+            with transaction.atomic():
+                TestCase.objects.bulk_create(test_cases)
+                # bulk_create does not send the post_save signal
+                counts = {}
+                for tc in test_cases:
+                    suite_counts = counts.setdefault(tc.suite_id, {})
+                    suite_counts[tc.result] = suite_counts.get(tc.result, 0) + 1
+                TestSuite.add_counts(counts)
+        except (DatabaseError, ValueError):
+            for tc in test_cases:
+                with contextlib.suppress(DatabaseError, ValueError):
+                    with transaction.atomic():
+                        tc.save()
 
     return JsonResponse({"line_count": line_count})
 
@@ -1348,45 +1300,12 @@ def internal_v1_workers(request, pk=None):
         if version is None:
             return JsonResponse({"error": "Missing 'version'"}, status=400)
 
-        # Check the version
-        version_mismatch = bool(version != __version__)
-
-        # Save worker version
-        worker.version = version
-        if version_mismatch and not settings.ALLOW_VERSION_MISMATCH:
-            # If the version does not match, go offline
-            worker.go_state_offline()
-        else:
-            # Set last_ping
-            worker.last_ping = timezone.now()
-
-            # Go online if needed
-            if worker.state == Worker.STATE_OFFLINE:
-                worker.go_state_online()
-        worker.save()
-
-        # Grab the jobs for this dispatcher
-        query = TestJob.objects.filter(actual_device__worker_host=worker)
-
-        # Scheduled
-        starts = []
-        if not version_mismatch or settings.ALLOW_VERSION_MISMATCH:
-            start_query = query.filter(state=TestJob.STATE_SCHEDULED)
-            starts = list(start_query.values("id", "token"))
-            for job in start_query.filter(target_group__isnull=False):
-                starts += [{"id": j.id, "token": j.token} for j in job.dynamic_jobs()]
-
-        # Canceling
-        cancel_query = query.filter(state=TestJob.STATE_CANCELING)
-        cancels = list(cancel_query.values("id", "token"))
-        for job in cancel_query.filter(target_group__isnull=False):
-            cancels += [{"id": j.id, "token": j.token} for j in job.dynamic_jobs()]
-
-        # Running
-        running_query = query.filter(state=TestJob.STATE_RUNNING)
-        runnings = list(running_query.values("id", "token"))
-        for job in running_query.filter(target_group__isnull=False):
-            runnings += [{"id": j.id, "token": j.token} for j in job.dynamic_jobs()]
+        version_mismatch = worker_ping(worker, version)
+        data = worker_jobs(
+            worker, start=not version_mismatch or settings.ALLOW_VERSION_MISMATCH
+        )
+        cancels = data["cancel"]
+        runnings = data["running"]
 
         if (
             version_mismatch
@@ -1400,7 +1319,7 @@ def internal_v1_workers(request, pk=None):
             )
 
         # Return starting, canceling and running jobs
-        return JsonResponse({"cancel": cancels, "running": runnings, "start": starts})
+        return JsonResponse(data)
 
     else:
         if pk is not None:
@@ -1607,10 +1526,10 @@ def job_submit(request):
             warnings = ""
             errors = ""
             try:
-                validate_job(request.POST.get("definition-input"))
+                data = validate_job(request.POST.get("definition-input"))
                 try:
                     validate(
-                        yaml_safe_load(request.POST.get("definition-input")),
+                        data,
                         extra_context_variables=settings.EXTRA_CONTEXT_VARIABLES,
                     )
                 except voluptuous.Invalid as exc:
@@ -1734,15 +1653,14 @@ def job_detail(request, pk):
             log_data = []
             data["size_warning"] = True
         else:
-            log_data = logs_instance.read(job)
-            log_data = yaml_load(log_data)
+            log_data = list(parse_records(logs_instance.stream(job)))
     except OSError:
         log_data = []
     except yaml.YAMLError:
         log_data = None
 
     if log_data:
-        test_case_count = TestCase.objects.filter(suite__job=job).count()
+        test_case_count = job.testcase_count()
         if test_case_count <= settings.TESTCASE_COUNT_LIMIT:
             results = {
                 (t.suite.name, t.name): t.id
@@ -1850,10 +1768,8 @@ def job_fetch_data(request, pk):
     path = os.path.join(job.output_dir, "job_data.gz")
     if not os.path.exists(path):
         raise Http404()
-    # FileResponse could be used here with Django2.0 but
-    # currently it doesn't set a useful extension.
-    with open(path, "rb") as data:
-        response = HttpResponse(data, content_type="application/gzip")
+    # Stream the file instead of loading it in memory
+    response = FileResponse(open(path, "rb"), content_type="application/gzip")
     response["Content-Disposition"] = 'attachment; filename="%s"' % os.path.basename(
         path
     )
@@ -2169,12 +2085,12 @@ def job_configuration(request, pk):
 def job_log_file_plain(request, pk):
     job = get_restricted_job(request.user, pk, request=request)
     try:
-        data = logs_instance.open(job)
-        response = FileResponse(data, content_type="application/yaml")
-        response["Content-Disposition"] = "attachment; filename=job_%d.log" % job.id
-        return response
+        data = logs_instance.stream(job)
     except OSError:
         raise Http404
+    response = StreamingHttpResponse(data, content_type="application/yaml")
+    response["Content-Disposition"] = "attachment; filename=job_%d.log" % job.id
+    return response
 
 
 def job_log_incremental(request, pk):
@@ -2293,10 +2209,10 @@ def job_resubmit(request, pk):
                 warnings = ""
                 errors = ""
                 try:
-                    validate_job(request.POST.get("definition-input"))
+                    data = validate_job(request.POST.get("definition-input"))
                     try:
                         validate(
-                            yaml_safe_load(request.POST.get("definition-input")),
+                            data,
                             extra_context_variables=settings.EXTRA_CONTEXT_VARIABLES,
                         )
                     except voluptuous.Invalid as exc:
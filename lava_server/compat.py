@@ -36,6 +36,13 @@ except ImportError:
     # pylint: disable=unused-import
     from django.conf.urls import url  # noqa
 
+try:
+    # pylint: disable=unused-import
+    from django.db.models import JSONField  # noqa
+except ImportError:
+    # pylint: disable=unused-import
+    from django.contrib.postgres.fields import JSONField  # noqa
+
 # Handles compatibility for django_restframework_filters
 try:
     from rest_framework_filters.backends import RestFrameworkFilterBackend  # noqa
@@ -21,6 +21,7 @@ import aiohttp
 from aiohttp import web
 import asyncio
 import contextlib
+import json
 import signal
 import weakref
 import zmq
@@ -28,8 +29,11 @@ import zmq.asyncio
 from zmq.utils.strtypes import u
 
 from django.conf import settings
+from django.db import close_old_connections
 
 from lava_common.version import __version__
+from lava_scheduler_app import dbutils
+from lava_scheduler_app.models import TestJob, Worker
 from lava_server.cmdutils import LAVADaemonCommand
 
 
@@ -73,6 +77,7 @@ async def zmq_proxy(app):
     async def forward_event(msg):
         app["logger"].debug("[PROXY] Forwarding: %s", msg)
         data = [s.decode("utf-8") for s in msg]
+        notify_worker(app, data)
         futures = [
             pub.send_multipart(msg),
             *[ws.send_json(data) for ws in app["websockets"]],
@@ -140,6 +145,160 @@ async def websocket_handler(request):
     return ws
 
 
+def notify_worker(app, msg):
+    # Wake up the worker connections when one of their jobs is scheduled or
+    # canceled
+    if not app["workers"] or not msg[0].endswith(".testjob"):
+        return
+    with contextlib.suppress(IndexError, TypeError, ValueError):
+        data = json.loads(msg[4])
+        if data.get("state") not in ["Scheduled", "Canceling"]:
+            return
+        for wake_up in app["workers"].get(data.get("worker"), []):
+            wake_up.set()
+
+
+def database(func, *args):
+    # The ORM is synchronous: run it in a thread and close the connection
+    # afterward
+    def wrapper():
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    return asyncio.get_running_loop().run_in_executor(None, wrapper)
+
+
+def worker_connect(name, token, version):
+    if not settings.EVENT_NOTIFICATION:
+        # Without events, the jobs would only be sent on the periodic pings:
+        # let the worker fallback to the http api
+        return "Event notifications are disabled"
+    try:
+        worker = Worker.objects.get(hostname=name)
+    except Worker.DoesNotExist:
+        return f"Unknown worker '{name}'"
+    if token != worker.token:
+        return "Invalid 'token'"
+    if version is None:
+        return "Missing 'version'"
+    if dbutils.worker_ping(worker, version) and not settings.ALLOW_VERSION_MISMATCH:
+        # Let the worker fallback to the http api
+        return f"Version mismatch '{version}' vs '{__version__}'"
+    return None
+
+
+def worker_ping(name, version):
+    dbutils.worker_ping(Worker.objects.get(hostname=name), version)
+
+
+def worker_jobs(name, sent):
+    return dbutils.worker_jobs(
+        Worker.objects.get(hostname=name), payload=True, sent=sent
+    )
+
+
+def job_update_state(data):
+    try:
+        job = TestJob.objects.get(pk=data.get("job"))
+    except (TestJob.DoesNotExist, ValueError):
+        return (404, {"error": f"Unknown job '{data.get('job')}'"})
+    if data.get("token") != job.token:
+        return (400, {"error": "Invalid 'token'"})
+    try:
+        dbutils.job_update_state(job.id, data.get("data", {}))
+    except ValueError as exc:
+        return (400, {"error": str(exc)})
+    return (200, {})
+
+
+async def worker_handler(request):
+    """
+    Persistent connection with a worker.
+
+    The server sends the jobs to start (with the job payload), cancel or keep
+    running when the connection is created and every time one of the worker
+    jobs is scheduled or canceled:
+        {"type": "jobs", "start": [...], "cancel": [...], "running": [...]}
+
+    The worker sends requests:
+        {"type": "ping", "id": 1}
+        {"type": "state", "id": 2, "job": 12, "token": "...", "data": {...}}
+    that are answered with the same "id":
+        {"type": "reply", "id": 2, "status": 200, "data": {}}
+    """
+    logger = request.app["logger"]
+    name = request.match_info["name"]
+    version = request.query.get("version")
+
+    error = await database(
+        worker_connect, name, request.headers.get("LAVA-Token"), version
+    )
+    if error is not None:
+        logger.warning("[WORKER] %s: %s", name, error)
+        raise web.HTTPBadRequest(text=json.dumps({"error": error}))
+
+    logger.info("[WORKER] %s: connection from %r", name, request.remote)
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+
+    wake_up = asyncio.Event()
+    wake_up.set()
+    request.app["workers"].setdefault(name, set()).add(wake_up)
+
+    async def send_jobs():
+        # Jobs to start whose payload was already sent on this connection
+        sent = set()
+        while True:
+            await wake_up.wait()
+            wake_up.clear()
+            try:
+                data = await database(worker_jobs, name, frozenset(sent))
+            except Exception as exc:
+                logger.error("[WORKER] %s: unable to list the jobs: %s", name, exc)
+                continue
+            try:
+                await ws.send_json({"type": "jobs", **data})
+            except ConnectionResetError:
+                return
+            sent = {s["id"] for s in data["start"] if "payload" in s or s["id"] in sent}
+
+    sender = asyncio.create_task(send_jobs())
+    try:
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.ERROR:
+                logger.exception(ws.exception())
+                continue
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            try:
+                data = json.loads(msg.data)
+                kind = data["type"]
+            except (KeyError, TypeError, ValueError):
+                logger.warning("[WORKER] %s: invalid message %r", name, msg.data)
+                continue
+
+            if kind == "ping":
+                await database(worker_ping, name, version)
+                (status, ret) = (200, {})
+            elif kind == "state":
+                (status, ret) = await database(job_update_state, data)
+            else:
+                (status, ret) = (400, {"error": f"Unknown type '{kind}'"})
+            await ws.send_json(
+                {"type": "reply", "id": data.get("id"), "status": status, "data": ret}
+            )
+    finally:
+        sender.cancel()
+        request.app["workers"][name].discard(wake_up)
+        if not request.app["workers"][name]:
+            del request.app["workers"][name]
+
+    logger.info("[WORKER] %s: connection closed", name)
+    return ws
+
+
 async def on_startup(app):
     app["zmq_proxy"] = asyncio.create_task(zmq_proxy(app))
 
@@ -188,10 +347,16 @@ class Command(LAVADaemonCommand):
         # Variables
         app["logger"] = self.logger
         app["websockets"] = weakref.WeakSet()
+        app["workers"] = {}
         app["zmq_proxy"] = None
 
         # Routes
-        app.add_routes([web.get("/ws/", websocket_handler)])
+        app.add_routes(
+            [
+                web.get("/ws/", websocket_handler),
+                web.get("/ws/workers/{name}/", worker_handler),
+            ]
+        )
 
         # signals
         app.on_startup.append(on_startup)
@@ -18,8 +18,10 @@
 # along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from lava_scheduler_app import logutils
+from lava_scheduler_app.logutils import LogsBlocks
 from lava_scheduler_app.models import TestJob
 from lava_scheduler_app.utils import mkdir
 
@@ -43,8 +45,26 @@ class Command(BaseCommand):
             action="store_true",
             help="Be nice with the system by sleeping regularly",
         )
+        parser.add_argument(
+            "--blocks",
+            default=False,
+            action="store_true",
+            help="Convert the logs of finished jobs to the LogsBlocks format "
+            "(only when LAVA_LOG_BACKEND is LogsBlocks)",
+        )
 
     def handle(self, *_, **options):
+        if options["blocks"]:
+            # The original files are removed by the conversion: only the
+            # LogsBlocks backend can read the converted logs.
+            if not isinstance(logutils.logs_instance, LogsBlocks):
+                raise CommandError(
+                    "--blocks requires LAVA_LOG_BACKEND to be "
+                    "'lava_scheduler_app.logutils.LogsBlocks'"
+                )
+            self.convert_blocks(options["dry_run"], options["slow"])
+            return
+
         base_dir = "/var/lib/lava-server/default/media/job-output/"
         len_base_dir = len(base_dir)
         jobs = TestJob.objects.all().order_by("id")
@@ -86,3 +106,24 @@ class Command(BaseCommand):
             if options["slow"]:
                 self.stdout.write("sleeping 2s...")
                 time.sleep(2)
+
+    def convert_blocks(self, dry_run, slow):
+        logs = logutils.logs_instance
+        jobs = TestJob.objects.filter(state=TestJob.STATE_FINISHED).order_by("id")
+
+        self.stdout.write("Converting logs to blocks")
+        for (index, job) in enumerate(jobs.iterator()):
+            if dry_run:
+                self.stdout.write("* %d" % job.id)
+                continue
+            try:
+                if logs.convert(job):
+                    self.stdout.write("* %d" % job.id)
+                else:
+                    self.stdout.write("* %d skip" % job.id)
+            except OSError as exc:
+                self.stderr.write("* %d unable to convert: %s" % (job.id, str(exc)))
+
+            if slow and index % 100 == 99:
+                self.stdout.write("sleeping 2s...")
+                time.sleep(2)
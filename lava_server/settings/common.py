@@ -192,6 +192,10 @@ MOUNT_POINT = ""
 # resolved.
 TESTCASE_COUNT_LIMIT = 10000
 
+# Number of seconds the chart data of a query is cached for. The cache is also
+# invalidated when the query is refreshed.
+CHART_CACHE_TIMEOUT = 3600
+
 # Branding support
 BRANDING_ALT = "LAVA Software logo"
 BRANDING_ICON = "lava_server/images/logo.png"
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the duration and the number of sql queries needed to compute the data
+of a chart over a growing number of test jobs: calling the methods of each
+job (as done previously) or with the aggregated queries of ChartQuery.
+"""
+
+import argparse
+import datetime
+
+from common import Timer, benchmark_database, print_table, setup_django
+
+
+SUITES = 3
+CASES = 10
+
+
+def populate(jobs):
+    from django.contrib.auth.models import User
+    from django.contrib.contenttypes.models import ContentType
+    from django.utils import timezone
+
+    from lava_results_app.models import NamedTestAttribute, TestCase, TestData
+    from lava_results_app.models import TestSuite
+    from lava_scheduler_app.models import DeviceType, TestJob
+
+    user = User.objects.create(username="benchmark")
+    dt = DeviceType.objects.create(name="qemu")
+    now = timezone.now()
+    objs = TestJob.objects.bulk_create(
+        [
+            TestJob(
+                definition="job_name: benchmark",
+                submitter=user,
+                requested_device_type=dt,
+                is_public=True,
+                state=TestJob.STATE_FINISHED,
+                health=TestJob.HEALTH_COMPLETE,
+                end_time=now + datetime.timedelta(seconds=i),
+            )
+            for i in range(jobs)
+        ]
+    )
+    data = TestData.objects.bulk_create([TestData(testjob=job) for job in objs])
+    content_type = ContentType.objects.get_for_model(TestData)
+    NamedTestAttribute.objects.bulk_create(
+        [
+            NamedTestAttribute(
+                name=name, value=str(i), content_type=content_type, object_id=d.id
+            )
+            for (i, d) in enumerate(data)
+            for name in ["build", "boot-time"]
+        ]
+    )
+    suites = TestSuite.objects.bulk_create(
+        [
+            TestSuite(
+                job=job,
+                name="suite-%d" % s,
+                count_pass=CASES - 2,
+                count_fail=1,
+                count_skip=1,
+                count_unknown=0,
+            )
+            for job in objs
+            for s in range(SUITES)
+        ]
+    )
+    TestCase.objects.bulk_create(
+        [
+            TestCase(
+                suite=suite,
+                name="case-%d" % c,
+                result=[TestCase.RESULT_FAIL, TestCase.RESULT_SKIP][c]
+                if c < 2
+                else TestCase.RESULT_PASS,
+                measurement=c,
+            )
+            for suite in suites
+            for c in range(CASES)
+        ]
+    )
+    return user
+
+
+def legacy(chart_query, results):
+    # The previous implementation: call the methods of each job
+    data = []
+    for item in results:
+        attribute = item.get_xaxis_attribute(chart_query.xaxis_attribute)
+        if chart_query.xaxis_attribute and not attribute:
+            continue
+        date = str(item.get_end_datetime())
+        attribute = attribute if attribute is not None else date
+        if chart_query.chart_type == "pass/fail":
+            values = item.get_passfail_results()
+        elif chart_query.chart_type == "measurement":
+            values = item.get_measurement_results()
+        else:
+            values = item.get_attribute_results(chart_query.attributes)
+        for result in values:
+            data.append(
+                {
+                    "id": result,
+                    "pk": item.id,
+                    "link": item.get_absolute_url(),
+                    "date": date,
+                    "attribute": attribute,
+                    "pass": values[result]["fail"] == 0,
+                }
+            )
+    return data
+
+
+class QueryCounter:
+    # CaptureQueriesContext only keeps the last 9000 queries
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run(jobs, chart_type):
+    from django.contrib.contenttypes.models import ContentType
+    from django.db import connection, transaction
+
+    from lava_results_app.models import Chart, ChartQuery, Query
+    from lava_scheduler_app.models import TestJob
+
+    rows = []
+    with transaction.atomic():
+        user = populate(jobs)
+        # Up to date statistics for the query planner
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        content_type = ContentType.objects.get_for_model(TestJob)
+        chart_query = ChartQuery(
+            id=0,
+            chart=Chart(name="Custom"),
+            chart_type=chart_type,
+            xaxis_attribute="build",
+            attributes="boot-time",
+        )
+        results = Query.get_queryset(
+            content_type, [], order_by=["end_time"]
+        ).visible_by_user(user)
+
+        for (name, func) in [
+            ("before", lambda: legacy(chart_query, results)),
+            ("after", lambda: chart_query.get_data(user, content_type, [])),
+        ]:
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                with Timer() as timer:
+                    func()
+            rows.append((jobs, chart_type, name, "%.3f" % timer.wall, queries.count))
+            print("* %d jobs, %s (%s): %.3fs" % (jobs, chart_type, name, timer.wall))
+        transaction.set_rollback(True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        nargs="+",
+        default=[1000, 5000, 10000],
+        help="number of test jobs in the chart",
+    )
+    parser.add_argument(
+        "--types",
+        nargs="+",
+        default=["pass/fail", "measurement", "attributes"],
+        help="chart types to benchmark",
+    )
+    options = parser.parse_args()
+
+    setup_django()
+
+    rows = []
+    with benchmark_database():
+        for jobs in options.jobs:
+            for chart_type in options.types:
+                rows.extend(run(jobs, chart_type))
+
+    print()
+    print_table(["jobs", "chart", "version", "wall (s)", "queries"], rows)
+
+
+if __name__ == "__main__":
+    main()
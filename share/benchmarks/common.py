@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Helpers shared by the benchmark scripts.
+
+The benchmarks are run from a source checkout:
+
+    python3 share/benchmarks/<name>.py
+
+Benchmarks that need the database use the development settings and create a
+throw-away database (named "benchmark_<NAME>") that is dropped at the end.
+"""
+
+import contextlib
+import os
+import pathlib
+import sys
+import time
+
+ROOT = (pathlib.Path(__file__).parent / ".." / "..").resolve()
+
+
+def setup_path():
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+
+def setup_django():
+    setup_path()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lava_server.settings.dev")
+    import django
+
+    django.setup()
+
+
+@contextlib.contextmanager
+def benchmark_database():
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.settings_dict.setdefault("TEST", {})
+    connection.settings_dict["TEST"]["NAME"] = "benchmark_%s" % old_name
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+class Timer:
+    """
+    Measure the wall clock and the cpu time of a block
+    """
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, *args):
+        self.wall = time.perf_counter() - self.start
+        self.cpu = time.process_time() - self.start_cpu
+
+
+def print_table(headers, rows):
+    widths = [len(h) for h in headers]
+    for row in rows:
+        widths = [max(w, len(str(c))) for (w, c) in zip(widths, row)]
+    fmt = "  ".join("%%%ds" % w for w in widths)
+    print(fmt % tuple(headers))
+    print(fmt % tuple("-" * w for w in widths))
+    for row in rows:
+        print(fmt % tuple(row))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Load test of lava-coordinator: N multinode groups of M roles, each node
+synchronizing several times with the rest of its group.
+Compare clients polling the coordinator (the coordinator answers "wait"
+straight away, as done previously) with blocking requests.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from common import Timer, print_table, setup_path
+
+
+class Client:
+    def __init__(self, port, group, size, index, wait_timeout, poll_delay):
+        self.port = port
+        self.wait_timeout = wait_timeout
+        self.poll_delay = poll_delay
+        self.base = {
+            "group_name": group,
+            "group_size": size,
+            "client_name": "%s-%d" % (group, index),
+            "hostname": "localhost",
+            "role": "role-%d" % index,
+            "poll_delay": poll_delay,
+        }
+        self.connections = 0
+        self.syncs = []
+
+    async def request(self, message):
+        message = dict(self.base, **message)
+        if self.wait_timeout:
+            message["wait_timeout"] = self.wait_timeout
+        data = json.dumps(message).encode("utf-8")
+        while True:
+            self.connections += 1
+            (reader, writer) = await asyncio.open_connection("127.0.0.1", self.port)
+            writer.write(b"%08X" % len(data) + data)
+            header = await reader.readexactly(8)
+            response = json.loads(
+                (await reader.readexactly(int(header, 16))).decode("utf-8")
+            )
+            writer.close()
+            if response["response"] != "wait":
+                return response
+            # Same as MultinodeProtocol.poll
+            await asyncio.sleep(self.poll_delay)
+
+    async def run(self, syncs, work):
+        await self.request({"request": "group_data"})
+        for index in range(syncs):
+            # Each node needs a different time to reach the synchronization
+            await asyncio.sleep(random.uniform(0, work))
+            start = time.monotonic()
+            await self.request({"request": "lava_sync", "messageID": "sync-%d" % index})
+            self.syncs.append((start, time.monotonic()))
+        await self.request({"request": "clear_group"})
+
+
+async def run(groups, roles, syncs, work, poll_delay, blocking):
+    from lava.coordinator import LavaCoordinator
+
+    coordinator = LavaCoordinator("localhost", 0, 4096)
+    if not blocking:
+        coordinator.max_wait = 0
+    server = await coordinator.start()
+    port = server.sockets[0].getsockname()[1]
+    clients = [
+        Client(port, group, roles, index, 60 if blocking else None, poll_delay)
+        for group in [str(uuid.uuid4()) for _ in range(groups)]
+        for index in range(roles)
+    ]
+    with Timer() as timer:
+        await asyncio.gather(*[client.run(syncs, work) for client in clients])
+    server.close()
+    await server.wait_closed()
+
+    # Time between the arrival of the last node of the group and the end of
+    # the synchronization for every node
+    latencies = [
+        max(c.syncs[index][1] for c in clients[g : g + roles])
+        - max(c.syncs[index][0] for c in clients[g : g + roles])
+        for g in range(0, len(clients), roles)
+        for index in range(syncs)
+    ]
+    return (
+        timer.wall,
+        sum(c.connections for c in clients),
+        sum(latencies) / len(latencies),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--groups", type=int, nargs="+", default=[1, 10, 50], help="number of groups"
+    )
+    parser.add_argument(
+        "--roles", type=int, nargs="+", default=[2, 20], help="nodes per group"
+    )
+    parser.add_argument("--syncs", type=int, default=5, help="lava-sync per node")
+    parser.add_argument(
+        "--work", type=float, default=2, help="maximum duration between two syncs"
+    )
+    parser.add_argument("--poll-delay", type=float, default=1, help="poll delay")
+    options = parser.parse_args()
+
+    setup_path()
+
+    rows = []
+    for groups in options.groups:
+        for roles in options.roles:
+            for (name, blocking) in [("polling", False), ("blocking", True)]:
+                (wall, connections, latency) = asyncio.run(
+                    run(
+                        groups,
+                        roles,
+                        options.syncs,
+                        options.work,
+                        options.poll_delay,
+                        blocking,
+                    )
+                )
+                rows.append(
+                    (
+                        groups,
+                        roles,
+                        name,
+                        "%.3f" % wall,
+                        connections,
+                        "%.3f" % latency,
+                    )
+                )
+                print(
+                    "* %d groups x %d roles (%s): %.3fs" % (groups, roles, name, wall)
+                )
+
+    print()
+    print_table(
+        ["groups", "roles", "version", "wall (s)", "connections", "sync latency (s)"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
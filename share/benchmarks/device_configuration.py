@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the cost of the device configuration in a scheduling pass, with the
+device configuration cache cold (first pass after a restart or after every
+device dictionary was modified) and warm.
+"""
+
+import argparse
+import logging
+import tempfile
+
+from common import Timer, benchmark_database, print_table, setup_django
+from scheduler import populate
+
+
+def new_environment():
+    from lava_scheduler_app import environment
+    from lava_server.files import File
+
+    environment.devices_jinja_env.set(
+        environment.jinja2.Environment(
+            loader=File("device").loader(),
+            autoescape=False,
+            trim_blocks=True,
+            cache_size=-1,
+        )
+    )
+    environment.device_configurations.clear()
+
+
+def run(tmpdir, devices, jobs, passes):
+    from django.db import transaction
+
+    from lava_scheduler_app.models import Device
+    from lava_scheduler_app.scheduler import schedule_jobs
+
+    logger = logging.getLogger("benchmark")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    rows = []
+    with transaction.atomic():
+        available, workers = populate(tmpdir, devices, jobs)
+        for name in ["cold"] + ["warm"] * passes:
+            if name == "cold":
+                new_environment()
+            with Timer() as valid:
+                for device in Device.objects.all():
+                    device.is_valid()
+
+            if name == "cold":
+                new_environment()
+            with transaction.atomic():
+                with Timer() as timer:
+                    schedule_jobs(logger, available, workers)
+                transaction.set_rollback(True)
+            rows.append((name, timer, valid))
+        transaction.set_rollback(True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--devices", type=int, default=500, help="number of idle devices"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1000, help="number of jobs in the queue"
+    )
+    parser.add_argument(
+        "--passes", type=int, default=3, help="number of passes with a warm cache"
+    )
+    options = parser.parse_args()
+
+    setup_django()
+    from lava_server.files import File
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        File.KINDS["device"] = ([tmpdir], "{name}.jinja2")
+        with benchmark_database():
+            results = run(tmpdir, options.devices, options.jobs, options.passes)
+
+    rows = [
+        (
+            name,
+            "%.3f" % timer.wall,
+            "%.3f" % timer.cpu,
+            "%.3f" % valid.wall,
+        )
+        for (name, timer, valid) in results
+    ]
+    print("%d devices, %d jobs in the queue\n" % (options.devices, options.jobs))
+    print_table(["cache", "pass wall (s)", "pass cpu (s)", "is_valid() (s)"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the number of console lines per second that lava-run is able to log:
+serializing each record with the YAML emitter and sending it to the sender
+process on its own (as done previously) or with the log record serializer and
+the batched HTTPHandler.
+
+The sender process only reads the records from the pipe: the http requests
+are not measured.
+"""
+
+import argparse
+import datetime
+import multiprocessing
+
+from common import Timer, print_table, setup_path
+
+
+def console_lines(count):
+    templates = [
+        "[    %d.123456] usb 1-1: new high-speed USB device number %d using ehci",
+        '[    %d.234567] EXT4-fs (mmcblk0p%d): mounted filesystem with "ordered" mode',
+        "[  OK  ] Started Journal Service (%d/%d).",
+        "[    %d.345678] random: crng init done, entropy %d\t(ok)",
+        "%d: └─ systemd-journald.service (pid %d) — ✓",
+    ]
+    return [templates[i % len(templates)] % (i, i) for i in range(count)]
+
+
+def drain(conn, url, token, max_time):
+    while conn.recv_bytes() != b"":
+        pass
+
+
+def yaml_dump_record(data):
+    from lava_common.compat import yaml_dump
+
+    data_str = yaml_dump(
+        data, default_flow_style=True, default_style='"', width=10 ** 6
+    )
+    return data_str[:-1]
+
+
+def serialize_yaml(lines):
+    for line in lines:
+        yaml_dump_record(
+            {"dt": datetime.datetime.utcnow().isoformat(), "lvl": "target", "msg": line}
+        )
+
+
+def serialize_fast(lines):
+    from lava_common.log import dump
+
+    for line in lines:
+        dump(
+            {"dt": datetime.datetime.utcnow().isoformat(), "lvl": "target", "msg": line}
+        )
+
+
+def log_before(lines):
+    (reader, writer) = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.Process(target=drain, args=(reader, "", "", 5))
+    proc.start()
+    for line in lines:
+        data = yaml_dump_record(
+            {"dt": datetime.datetime.utcnow().isoformat(), "lvl": "target", "msg": line}
+        )
+        writer.send_bytes(data.encode("utf-8", errors="replace"))
+    writer.send_bytes(b"")
+    proc.join()
+
+
+def log_after(lines):
+    import lava_common.log
+    from lava_common.log import YAMLLogger
+
+    # Only read the records from the pipe
+    lava_common.log.sender = drain
+
+    logger = YAMLLogger("lava")
+    logger.addHTTPHandler("http://localhost/", "", 5)
+    for line in lines:
+        logger.target(line)
+    logger.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--lines", type=int, default=200000, help="number of console lines"
+    )
+    options = parser.parse_args()
+
+    setup_path()
+    lines = console_lines(options.lines)
+
+    rows = []
+    for (name, func) in [
+        ("serialize (yaml)", serialize_yaml),
+        ("serialize (fast)", serialize_fast),
+        ("log (before)", log_before),
+        ("log (after)", log_after),
+    ]:
+        with Timer() as timer:
+            func(lines)
+        rows.append((name, "%.2f" % timer.wall, "%d" % (options.lines / timer.wall)))
+
+    print("%d lines\n" % options.lines)
+    print_table(["operation", "duration (s)", "lines/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
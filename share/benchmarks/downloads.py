@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the throughput of the download action on a compressed image served
+through file://, stage by stage:
+* reading the file
+* hashing with md5, sha256 and sha512 (as done previously) or only with the
+  requested checksum
+* decompressing with an external process (as done previously) or in-process
+* the whole download action
+
+The image is made of random and zero blocks (like a real rootfs) and
+compressed with the given format.
+"""
+
+import argparse
+import hashlib
+import os
+import pathlib
+import resource
+import subprocess  # nosec - benchmark.
+import tempfile
+from urllib.parse import urlparse
+
+from common import Timer, print_table, setup_path
+
+
+COMPRESS = {"bz2": "bzip2", "gz": "gzip", "xz": "xz", "zstd": "zstd"}
+DECOMPRESS = {"bz2": "bunzip2", "gz": "gunzip", "xz": "unxz", "zstd": "unzstd"}
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def image_size(value):
+    # Size in MB, or with a "M", "G" or "T" suffix
+    units = {"M": 1, "G": 1024, "T": 1024 * 1024}
+    try:
+        if value[-1:].upper() in units:
+            return int(value[:-1]) * units[value[-1:].upper()]
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid size %r" % value)
+
+
+def create_image(directory, size, compression):
+    image = directory / "image"
+    with image.open("wb") as f_out:
+        for index in range(size):
+            f_out.write(os.urandom(1024 * 1024) if index % 4 else bytes(1024 * 1024))
+    subprocess.check_call(  # nosec - benchmark.
+        [COMPRESS[compression], "-1", "-k", str(image)]
+    )
+    return directory / ("image.%s" % compression)
+
+
+def make_action(url, directory, compression, checksums):
+    from lava_dispatcher.actions.deploy.download import FileDownloadAction
+    from lava_dispatcher.job import Job
+
+    action = FileDownloadAction("rootfs", str(directory), urlparse(url))
+    action.job = Job(1234, {}, None)
+    action.parameters = {
+        "to": "download",
+        "rootfs": {"url": url, "compression": compression, **checksums},
+        "namespace": "common",
+    }
+    action.params = action.parameters["rootfs"]
+    action.size = os.stat(urlparse(url).path).st_size
+    action.fname = str(directory / "rootfs" / "rootfs")
+    return action
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--size",
+        type=image_size,
+        default="4G",
+        help="uncompressed image size, in MB or with a M/G/T suffix (default: 4G)",
+    )
+    parser.add_argument(
+        "--tmp-dir", default=None, help="where to create the image (default: $TMPDIR)"
+    )
+    parser.add_argument("--compression", default="gz", choices=sorted(COMPRESS.keys()))
+    options = parser.parse_args()
+
+    setup_path()
+    from lava_dispatcher.utils.compression import StreamDecompressor
+
+    with tempfile.TemporaryDirectory(dir=options.tmp_dir) as tmp_dir:
+        directory = pathlib.Path(tmp_dir)
+        print("Creating a %dMB image in %s" % (options.size, tmp_dir))
+        compressed = create_image(directory, options.size, options.compression)
+        url = "file://%s" % compressed
+        sha256sum = subprocess.check_output(  # nosec - benchmark.
+            ["sha256sum", str(compressed)], text=True
+        ).split()[0]
+        action = make_action(url, directory, options.compression, {})
+        size = action.size / (1024 * 1024)
+
+        def read():
+            for _ in action.reader():
+                pass
+
+        def hash_all():
+            hashes = [hashlib.md5(), hashlib.sha256(), hashlib.sha512()]  # nosec
+            for buff in action.reader():
+                for h in hashes:
+                    h.update(buff)
+
+        def hash_requested():
+            h = hashlib.sha256()
+            for buff in action.reader():
+                h.update(buff)
+
+        def decompress_process():
+            with open(os.devnull, "wb") as f_out:
+                proc = subprocess.Popen(  # nosec - benchmark.
+                    [DECOMPRESS[options.compression]],
+                    stdin=subprocess.PIPE,
+                    stdout=f_out,
+                )
+                with proc.stdin as pipe:
+                    for buff in action.reader():
+                        pipe.write(buff)
+                proc.wait()
+
+        def decompress_in_process():
+            decompressor = StreamDecompressor(options.compression)
+            for buff in action.reader():
+                for _ in decompressor.decompress(buff):
+                    pass
+
+        def download():
+            make_action(
+                url, directory, options.compression, {"sha256sum": sha256sum}
+            ).run(None, None)
+
+        stages = [
+            ("read", read),
+            ("hash (md5+sha256+sha512)", hash_all),
+            ("hash (sha256)", hash_requested),
+            ("decompress (%s)" % DECOMPRESS[options.compression], decompress_process),
+        ]
+        if options.compression in StreamDecompressor.factories:
+            stages.append(("decompress (in-process)", decompress_in_process))
+        stages.append(("download action", download))
+
+        rows = []
+        for (name, func) in stages:
+            cpu = children_cpu()
+            with Timer() as timer:
+                func()
+            cpu = timer.cpu + children_cpu() - cpu
+            rows.append(
+                (name, "%.2f" % timer.wall, "%.1f" % (size / timer.wall), "%.2f" % cpu)
+            )
+
+    print(
+        "%dMB image, %.1fMB compressed (%s)\n"
+        % (options.size, size, options.compression)
+    )
+    print_table(["stage", "duration (s)", "MB/s", "cpu (s)"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Export the results of a job with many failures in JUnit and TAP13 (the
+jobs/<id>/junit/ and jobs/<id>/tap13/ REST API endpoints).
+Compare the previous exports (the logs are read again for every failure and
+the report is built in memory) with the streamed exports reading the logs of
+all the failures in one pass, for every storage of the logs.
+"""
+
+import argparse
+import io
+import lzma
+import pathlib
+import tempfile
+import types
+
+from common import Timer, benchmark_database, print_table, setup_django
+
+
+# Log lines for each test case
+CASE_LINES = 20
+CASES_PER_SUITE = 100
+
+
+def junit_before(job, logs_instance):
+    import junit_xml
+
+    from lava_results_app.models import TestCase
+
+    # Same as TestJobViewSet.junit previously
+    suites = []
+    for suite in job.testsuite_set.all().order_by("id"):
+        cases = []
+        for case in suite.testcase_set.all().order_by("id"):
+            md = case.action_metadata
+            duration = None
+            if md is not None:
+                duration = md.get("duration")
+                if duration is not None:
+                    duration = float(duration)
+            tc = junit_xml.TestCase(
+                case.name,
+                elapsed_sec=duration,
+                classname=case.suite.name,
+                timestamp=case.logged.isoformat(),
+            )
+            if case.result == TestCase.RESULT_FAIL:
+                logs = None
+                if case.start_log_line is not None and case.end_log_line is not None:
+                    logs = logs_instance.read(
+                        job, case.start_log_line, case.end_log_line
+                    )
+                tc.add_failure_info("failed", output=logs)
+            cases.append(tc)
+        suites.append(
+            junit_xml.TestSuite(
+                suite.name,
+                test_cases=cases,
+                timestamp=suite.get_end_datetime().isoformat(),
+            )
+        )
+    yield junit_xml.to_xml_report_string(suites, encoding="utf-8").encode("utf-8")
+
+
+def tap13_before(job, logs_instance):
+    import tap
+
+    from lava_results_app.models import TestCase
+
+    # Same as TestJobViewSet.tap13 previously
+    stream = io.StringIO()
+    count = TestCase.objects.filter(suite__job=job).count()
+    tracker = tap.tracker.Tracker(plan=count, streaming=True, stream=stream)
+    for suite in job.testsuite_set.all().order_by("id"):
+        for case in suite.testcase_set.all().order_by("id"):
+            if case.result == TestCase.RESULT_FAIL:
+                logs = logs_instance.read(job, case.start_log_line, case.end_log_line)
+                logs = "\n ".join(logs.split("\n"))
+                tracker.add_not_ok(
+                    suite.name, case.name, diagnostics=" ---\n " + logs + "..."
+                )
+            else:
+                tracker.add_ok(suite.name, case.name)
+    yield stream.getvalue().encode("utf-8")
+
+
+def junit_after(job, logs_instance):
+    from lava_rest_app.base import views
+
+    views.logs_instance = logs_instance
+    return views.junit_report(job, "")
+
+
+def tap13_after(job, logs_instance):
+    from lava_rest_app.base import views
+
+    views.logs_instance = logs_instance
+    return views.tap13_report(job)
+
+
+def write_logs(directory, storage, cases):
+    from lava_common.log import dump
+    from lava_scheduler_app.logutils import LogsBlocks, LogsFilesystem
+
+    lines = [
+        dump(
+            {
+                "dt": "2022-09-01T10:25:32.%06d" % (i % 1000000),
+                "lvl": "target",
+                "msg": "line %d: some output from the device under test" % i,
+            }
+        )
+        + "\n"
+        for i in range(cases * CASE_LINES)
+    ]
+    directory.mkdir()
+    if storage == "blocks":
+        logs = LogsBlocks()
+        job = types.SimpleNamespace(output_dir=str(directory))
+        logs.write_many(job, [l.encode("utf-8") for l in lines])
+        return logs
+    if storage == "xz":
+        with lzma.open(str(directory / "output.yaml.xz"), "wb") as f_log:
+            f_log.write("".join(lines).encode("utf-8"))
+    else:
+        (directory / "output.yaml").write_text("".join(lines), encoding="utf-8")
+    return LogsFilesystem()
+
+
+def populate(cases):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from lava_results_app.models import TestCase, TestSuite
+    from lava_scheduler_app.models import DeviceType, TestJob
+
+    job = TestJob.objects.create(
+        definition="job_name: benchmark\nvisibility: public\nactions: []\n",
+        submitter=User.objects.create(username="benchmark"),
+        requested_device_type=DeviceType.objects.create(name="qemu"),
+        is_public=True,
+        end_time=timezone.now(),
+    )
+    for start in range(0, cases, CASES_PER_SUITE):
+        suite = TestSuite.objects.create(name="suite-%d" % start, job=job)
+        TestCase.objects.bulk_create(
+            [
+                TestCase(
+                    name="case-%d" % i,
+                    suite=suite,
+                    result=TestCase.RESULT_FAIL,
+                    metadata="duration: '%d.5'\n" % (i % 10),
+                    start_log_line=i * CASE_LINES,
+                    end_log_line=(i + 1) * CASE_LINES,
+                )
+                for i in range(start, min(start + CASES_PER_SUITE, cases))
+            ]
+        )
+    return job
+
+
+def run(cases, storages, tmpdir):
+    from django.db import transaction
+
+    from lava_scheduler_app.models import TestJob
+
+    rows = []
+    with transaction.atomic():
+        job = populate(cases)
+        for storage in storages:
+            directory = pathlib.Path(tmpdir) / ("%d-%s" % (cases, storage))
+            logs_instance = write_logs(directory, storage, cases)
+            TestJob.output_dir = str(directory)
+            for (export, func) in [
+                ("junit", junit_before),
+                ("junit", junit_after),
+                ("tap13", tap13_before),
+                ("tap13", tap13_after),
+            ]:
+                version = func.__name__.split("_")[1]
+                with Timer() as first:
+                    chunks = func(job, logs_instance)
+                    size = len(next(chunks))
+                with Timer() as timer:
+                    size += sum(len(chunk) for chunk in chunks)
+                wall = first.wall + timer.wall
+                rows.append(
+                    (
+                        cases,
+                        storage,
+                        export,
+                        version,
+                        "%.3f" % wall,
+                        "%.3f" % first.wall,
+                        "%.1f" % (size / 1024 / 1024),
+                    )
+                )
+                print(
+                    "* %d failures, %s logs, %s (%s): %.3fs"
+                    % (cases, storage, export, version, wall)
+                )
+        transaction.set_rollback(True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--failures",
+        type=int,
+        nargs="+",
+        default=[1000, 5000],
+        help="number of failed test cases",
+    )
+    parser.add_argument(
+        "--storage",
+        nargs="+",
+        choices=["uncompressed", "xz", "blocks"],
+        default=["uncompressed", "xz", "blocks"],
+        help="storage of the logs",
+    )
+    options = parser.parse_args()
+
+    setup_django()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with benchmark_database():
+            for cases in options.failures:
+                rows.extend(run(cases, options.storage, tmpdir))
+
+    print()
+    print(
+        "%d log lines per failure, %d failures per suite"
+        % (CASE_LINES, CASES_PER_SUITE)
+    )
+    print_table(
+        [
+            "failures",
+            "logs",
+            "export",
+            "version",
+            "wall (s)",
+            "first chunk (s)",
+            "size (MB)",
+        ],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compare the cpu time needed to parse a batch of log lines sent by lava-run:
+the whole batch with the YAML parser (as done previously by
+internal_v1_jobs_logs) or line by line with logutils.parse_line.
+"""
+
+import argparse
+
+from common import Timer, print_table, setup_django
+from logs import MAX_RECORDS, synthetic_log
+
+
+def parse_yaml(lines, line_skip):
+    from lava_common.compat import yaml_load
+
+    data = "- " + "\n- ".join(lines)
+    count = 0
+    for (line, string) in zip(yaml_load(data), data.split("\n")):
+        if line_skip > 0:
+            line_skip -= 1
+        elif line["lvl"] == "results":
+            count += 1
+    return count
+
+
+def parse_lines(lines, line_skip):
+    from lava_scheduler_app.logutils import parse_line
+
+    data = "- " + "\n- ".join(lines)
+    count = 0
+    for string in data.split("\n"):
+        line = parse_line(string)
+        if line_skip > 0:
+            line_skip -= 1
+        elif line["lvl"] == "results":
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--batches", type=int, default=20, help="number of batches to parse"
+    )
+    options = parser.parse_args()
+
+    setup_django()
+    lines = synthetic_log(MAX_RECORDS)
+
+    rows = []
+    # (name, number of lines already stored)
+    for (name, line_skip) in [("new lines", 0), ("resent, 90% stored", 900)]:
+        results = []
+        for func in [parse_yaml, parse_lines]:
+            with Timer() as timer:
+                for _ in range(options.batches):
+                    results.append(func(lines, line_skip))
+            rows.append(
+                (
+                    name,
+                    func.__name__,
+                    "%.1f" % (timer.cpu * 10 ** 6 / (options.batches * len(lines))),
+                )
+            )
+        assert len(set(results)) == 1
+        rows.append(
+            (name, "speedup", "%.1fx" % (float(rows[-2][2]) / float(rows[-1][2])))
+        )
+
+    print_table(["batch", "parser", "cpu per line (us)"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Replay a job log against the log ingestion endpoint (internal_v1_jobs_logs)
+and report the number of lines stored per second.
+
+The log is sent in batches, like lava-run does. Without --log, a synthetic
+log with one test result every 50 lines is generated.
+"""
+
+import argparse
+import datetime
+import statistics
+import tempfile
+
+from common import Timer, benchmark_database, print_table, setup_django
+
+
+# Same limit as lava_common.log.sender
+MAX_RECORDS = 1000
+
+
+def synthetic_log(count):
+    from lava_common.log import dump
+
+    dt = datetime.datetime(2022, 9, 1)
+    lines = []
+    for i in range(count):
+        dt += datetime.timedelta(milliseconds=3)
+        if i % 50 == 49:
+            data = {
+                "dt": dt.isoformat(),
+                "lvl": "results",
+                "msg": {
+                    "case": "case-%d" % i,
+                    "definition": "definition-%d" % (i // 1000),
+                    "result": ["pass", "fail", "skip"][i % 3],
+                    "starttc": i - 10,
+                    "endtc": i,
+                },
+            }
+        else:
+            data = {
+                "dt": dt.isoformat(),
+                "lvl": ["debug", "info", "target"][i % 3],
+                "msg": "line %d: some output from the device under test" % i,
+            }
+        lines.append(dump(data))
+    return lines
+
+
+def recorded_log(filename):
+    # Each line of output.yaml is "- <record>"
+    with open(filename, encoding="utf-8") as f_in:
+        return [line[2:].rstrip("\n") for line in f_in if line.startswith("- ")]
+
+
+def run(records, batch):
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from django.test import Client
+    from django.urls import reverse
+
+    from lava_scheduler_app.models import DeviceType, TestJob
+
+    with transaction.atomic():
+        job = TestJob.objects.create(
+            definition="job_name: benchmark\nvisibility: public\nactions: []\n",
+            submitter=User.objects.create(username="benchmark"),
+            requested_device_type=DeviceType.objects.create(name="qemu"),
+            is_public=True,
+        )
+        url = reverse("lava.scheduler.internal.v1.jobs.logs", args=[job.id])
+        client = Client()
+
+        durations = []
+        index = 0
+        with Timer() as timer:
+            while index < len(records):
+                data = records[index : index + batch]
+                with Timer() as request:
+                    ret = client.post(
+                        url,
+                        data={"lines": "- " + "\n- ".join(data), "index": index},
+                        HTTP_LAVA_TOKEN=job.token,
+                    )
+                if ret.status_code != 200:
+                    raise Exception("Invalid response: %s" % ret.content)
+                index += ret.json()["line_count"]
+                durations.append(request.wall)
+        transaction.set_rollback(True)
+    return timer, durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--log", default=None, help="recorded log (output.yaml)")
+    parser.add_argument(
+        "--lines", type=int, default=50000, help="size of the synthetic log"
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        nargs="+",
+        default=[10, 100, MAX_RECORDS],
+        help="number of lines per request",
+    )
+    options = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+
+    if options.log:
+        records = recorded_log(options.log)
+    else:
+        records = synthetic_log(options.lines)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings.MEDIA_ROOT = tmpdir
+        with benchmark_database():
+            for batch in options.batch:
+                timer, durations = run(records, batch)
+                rows.append(
+                    (
+                        batch,
+                        len(durations),
+                        "%.3f" % timer.wall,
+                        "%.1f" % (statistics.median(durations) * 1000),
+                        "%d" % (len(records) / timer.wall),
+                    )
+                )
+                print("* batch of %d lines: %.3fs" % (batch, timer.wall))
+
+    print()
+    print("%d lines" % len(records))
+    print_table(
+        ["batch", "requests", "wall (s)", "median request (ms)", "lines/s"], rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the duration of a scheduling pass (schedule_jobs) as the queue depth
+and the number of idle devices grow.
+"""
+
+import argparse
+import logging
+import pathlib
+import tempfile
+
+from common import Timer, benchmark_database, print_table, setup_django
+
+
+DEVICES_PER_WORKER = 20
+USERS = 10
+TAGS = 4
+
+
+def populate(tmpdir, devices, jobs):
+    from django.contrib.auth.models import User
+
+    from lava_scheduler_app.models import Device, DeviceType, Tag, TestJob, Worker
+
+    dt = DeviceType.objects.create(name="qemu")
+    tags = [Tag.objects.create(name="tag-%02d" % i) for i in range(TAGS)]
+    users = [User.objects.create(username="user-%02d" % i) for i in range(USERS)]
+
+    workers = Worker.objects.bulk_create(
+        [
+            Worker(hostname="worker-%03d" % i, state=Worker.STATE_ONLINE)
+            for i in range(devices // DEVICES_PER_WORKER + 1)
+        ]
+    )
+    hostnames = []
+    objs = []
+    for i in range(devices):
+        hostname = "qemu-%04d" % i
+        (pathlib.Path(tmpdir) / ("%s.jinja2" % hostname)).write_text(
+            "{%% extends 'qemu.jinja2' %%}\n{%% set mac_addr = '52:54:00:12:%02x:%02x' %%}\n"
+            % (i // 256, i % 256),
+            encoding="utf-8",
+        )
+        objs.append(
+            Device(
+                hostname=hostname,
+                device_type=dt,
+                worker_host=workers[i // DEVICES_PER_WORKER],
+                health=Device.HEALTH_GOOD,
+            )
+        )
+        hostnames.append(hostname)
+    Device.objects.bulk_create(objs)
+    # Half of the devices have all the tags
+    for device in Device.objects.all()[: devices // 2]:
+        device.tags.add(*tags)
+
+    definition = "job_name: benchmark\nvisibility: public\nactions: []\n"
+    objs = [
+        TestJob(
+            definition=definition,
+            submitter=users[i % USERS],
+            requested_device_type=dt,
+            priority=[TestJob.LOW, TestJob.MEDIUM, TestJob.HIGH][i % 3],
+            is_public=True,
+        )
+        for i in range(jobs)
+    ]
+    objs = TestJob.objects.bulk_create(objs)
+    # One job out of four requires a tag
+    through = TestJob.tags.through
+    through.objects.bulk_create(
+        [
+            through(testjob_id=job.id, tag_id=tags[i % TAGS].id)
+            for (i, job) in enumerate(objs)
+            if i % 4 == 0
+        ]
+    )
+    return {"qemu": hostnames}, [w.hostname for w in workers]
+
+
+def run(tmpdir, devices, jobs):
+    from django.db import connection, transaction
+    from django.test.utils import CaptureQueriesContext
+
+    from lava_scheduler_app.scheduler import schedule_jobs
+
+    logger = logging.getLogger("benchmark")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    with transaction.atomic():
+        available, workers = populate(tmpdir, devices, jobs)
+        with CaptureQueriesContext(connection) as queries:
+            with Timer() as timer:
+                schedule_jobs(logger, available, workers)
+        transaction.set_rollback(True)
+    return timer, len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--devices",
+        type=int,
+        nargs="+",
+        default=[50, 100, 200, 400],
+        help="fleet sizes to benchmark",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        nargs="+",
+        default=[1000, 5000, 20000],
+        help="queue depths to benchmark",
+    )
+    options = parser.parse_args()
+
+    setup_django()
+    from lava_scheduler_app import environment
+    from lava_server.files import File
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        File.KINDS["device"] = ([tmpdir], "{name}.jinja2")
+        environment.devices_jinja_env.set(
+            environment.jinja2.Environment(
+                loader=File("device").loader(),
+                autoescape=False,
+                trim_blocks=True,
+                cache_size=-1,
+            )
+        )
+        with benchmark_database():
+            for devices in options.devices:
+                for jobs in options.jobs:
+                    timer, queries = run(tmpdir, devices, jobs)
+                    rows.append(
+                        (
+                            devices,
+                            jobs,
+                            "%.3f" % timer.wall,
+                            "%.3f" % timer.cpu,
+                            queries,
+                        )
+                    )
+                    print("* %d devices, %d jobs: %.3fs" % (devices, jobs, timer.wall))
+
+    print()
+    print_table(["devices", "jobs", "wall (s)", "cpu (s)", "queries"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the test job submission throughput: validate the definition against
+the job schema (as done by scheduler.jobs.validate and the web interface) then
+submit it.
+Compare the previous path (the definition is parsed for every step and the
+schemas are built for every job) with parse-once and cached schemas, one job
+at a time or with a bulk submission (scheduler.jobs.submit_many).
+"""
+
+import argparse
+import importlib
+
+from common import ROOT, Timer, benchmark_database, print_table, setup_django
+
+
+SAMPLE_JOBS = ROOT / "tests" / "lava_scheduler_app" / "sample_jobs"
+DEFINITIONS = [
+    ("singlenode", "qemu-pipeline-first-job.yaml"),
+    ("multinode", "kvm-multinode.yaml"),
+]
+
+
+def validate_before(data, extra_context_variables):
+    from voluptuous import Schema
+
+    from lava_common import schemas
+
+    # Same as lava_common.schemas.validate without the cache
+    Schema(schemas.job(extra_context_variables), extra=True)(data)
+    for action in data["actions"]:
+        action_type = next(iter(action.keys()))
+        params = action[action_type]
+        name = {
+            "boot": "boot." + params.get("method", ""),
+            "deploy": "deploy." + params.get("to", ""),
+        }.get(action_type, "test.definition")
+        module = importlib.import_module("lava_common.schemas." + name)
+        Schema(module.schema(), extra=True)(params)
+
+
+def submit_before(definitions, user):
+    from django.conf import settings
+
+    from lava_common.compat import yaml_safe_load
+    from lava_scheduler_app.dbutils import validate_job
+    from lava_scheduler_app.models import TestJob
+
+    for definition in definitions:
+        validate_before(yaml_safe_load(definition), settings.EXTRA_CONTEXT_VARIABLES)
+        validate_job(definition)
+        TestJob.from_yaml_and_user(definition, user)
+
+
+def validate_after(definition):
+    from django.conf import settings
+
+    from lava_common.schemas import validate
+    from lava_scheduler_app.dbutils import validate_job
+
+    validate(
+        validate_job(definition),
+        strict=False,
+        extra_context_variables=settings.EXTRA_CONTEXT_VARIABLES,
+    )
+
+
+def submit_after(definitions, user):
+    from lava_scheduler_app.dbutils import testjob_submission
+
+    for definition in definitions:
+        validate_after(definition)
+        testjob_submission(definition, user)
+
+
+def submit_bulk(definitions, user):
+    from lava_scheduler_app.dbutils import testjob_submission_many
+
+    for definition in definitions:
+        validate_after(definition)
+    for job in testjob_submission_many(definitions, user):
+        assert not isinstance(job, Exception)  # nosec - benchmark
+
+
+def populate():
+    from django.contrib.auth.models import User
+
+    from lava_scheduler_app.models import Device, DeviceType, Tag
+
+    dt = DeviceType.objects.create(name="qemu")
+    # Requested by the multinode job
+    tags = [Tag.objects.create(name=n) for n in ["usb-flash", "usb-eth", "testtag"]]
+    for i in range(4):
+        device = Device.objects.create(
+            hostname="qemu-%d" % i, device_type=dt, worker_host=None
+        )
+        device.tags.add(*tags)
+    # Notified by the multinode job
+    User.objects.create(username="admin")
+    return User.objects.create(username="benchmark", is_superuser=True)
+
+
+def run(jobs):
+    from django.db import transaction
+
+    rows = []
+    for (kind, filename) in DEFINITIONS:
+        definition = (SAMPLE_JOBS / filename).read_text(encoding="utf-8")
+        for (name, func) in [
+            ("before", submit_before),
+            ("after", submit_after),
+            ("bulk", submit_bulk),
+        ]:
+            with transaction.atomic():
+                user = populate()
+                # Warm up the caches and the imports
+                func([definition], user)
+                with Timer() as timer:
+                    func([definition] * jobs, user)
+                transaction.set_rollback(True)
+            rows.append(
+                (
+                    kind,
+                    jobs,
+                    name,
+                    "%.3f" % timer.wall,
+                    "%.1f" % (jobs / timer.wall),
+                )
+            )
+            print("* %d %s jobs (%s): %.3fs" % (jobs, kind, name, timer.wall))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        nargs="+",
+        default=[100, 500],
+        help="number of submissions",
+    )
+    options = parser.parse_args()
+
+    setup_django()
+
+    rows = []
+    with benchmark_database():
+        for jobs in options.jobs:
+            rows.extend(run(jobs))
+
+    print()
+    print_table(["job", "submissions", "version", "wall (s)", "jobs/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the duration of the queries listing the test jobs visible by a user
+over a growing number of test jobs: filtering on the device and device type
+permissions (accessible_by_user) or on the precomputed visibility
+(visible_by_user).
+"""
+
+import argparse
+
+from common import Timer, benchmark_database, print_table, setup_django
+
+
+DEVICE_TYPES = 10
+DEVICES = 10
+GROUPS = 20
+
+
+def populate(jobs):
+    from django.contrib.auth.models import Group, User
+
+    from lava_scheduler_app.models import (
+        Device,
+        DeviceType,
+        GroupDevicePermission,
+        GroupDeviceTypePermission,
+        TestJob,
+        TestJobVisibility,
+    )
+
+    groups = [Group.objects.create(name="group-%d" % i) for i in range(GROUPS)]
+    user = User.objects.create(username="benchmark")
+    user.groups.add(*groups[:2])
+    submitter = User.objects.create(username="submitter")
+
+    devices = []
+    for t in range(DEVICE_TYPES):
+        dt = DeviceType.objects.create(name="dt-%d" % t)
+        # Restrict half of the device types and some of the devices
+        if t % 2:
+            GroupDeviceTypePermission.objects.assign_perm(
+                DeviceType.VIEW_PERMISSION, groups[t % GROUPS], dt
+            )
+        for d in range(DEVICES):
+            device = Device.objects.create(
+                hostname="dt-%d-%d" % (t, d), device_type=dt, worker_host=None
+            )
+            if d % 3 == 0:
+                GroupDevicePermission.objects.assign_perm(
+                    Device.VIEW_PERMISSION, groups[d % GROUPS], device
+                )
+            devices.append(device)
+
+    TestJob.objects.bulk_create(
+        [
+            TestJob(
+                definition="job_name: benchmark",
+                submitter=submitter,
+                requested_device_type=devices[i % len(devices)].device_type,
+                actual_device=devices[i % len(devices)] if i % 5 else None,
+                is_public=bool(i % 7),
+                state=TestJob.STATE_FINISHED,
+            )
+            for i in range(jobs)
+        ]
+    )
+    with_groups = TestJob.objects.filter(is_public=False)
+    TestJob.viewing_groups.through.objects.bulk_create(
+        [
+            TestJob.viewing_groups.through(testjob_id=pk, group=group)
+            for (i, pk) in enumerate(with_groups.values_list("pk", flat=True))
+            for group in groups[i % 3 : i % 3 + 2]
+        ]
+    )
+    # bulk_create does not send the signals
+    for job in TestJob.objects.all():
+        TestJobVisibility.update_job(job)
+    return user
+
+
+def run(jobs):
+    from django.db import connection, transaction
+
+    from lava_scheduler_app.models import TestJob
+
+    rows = []
+    with transaction.atomic():
+        user = populate(jobs)
+        # Up to date statistics for the query planner
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        for (name, func) in [
+            (
+                "before",
+                lambda: TestJob.objects.accessible_by_user(
+                    user, TestJob.VIEW_PERMISSION
+                ),
+            ),
+            ("after", lambda: TestJob.objects.visible_by_user(user)),
+        ]:
+            with Timer() as timer:
+                count = func().count()
+                list(func().order_by("-submit_time")[:25])
+            rows.append((jobs, name, count, "%.3f" % timer.wall))
+            print("* %d jobs (%s): %.3fs" % (jobs, name, timer.wall))
+        transaction.set_rollback(True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 50000],
+        help="number of test jobs",
+    )
+    options = parser.parse_args()
+
+    setup_django()
+
+    rows = []
+    with benchmark_database():
+        for jobs in options.jobs:
+            rows.extend(run(jobs))
+
+    print()
+    print_table(["jobs", "version", "visible", "wall (s)"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compare the server load generated by idle workers when polling
+(internal_v1_workers every ping interval) and when connected to the worker
+channel of lava-publisher (a ping message every ping interval and an http
+poll every PUSH_PING_INTERVAL as a safety net).
+
+Each operation is measured against the database, then the load is computed
+for the given number of workers. Every job adds 3 http requests when polling
+(fetching the job, RUNNING and FINISHED) and none with the channel.
+"""
+
+import argparse
+import importlib
+
+from common import Timer, benchmark_database, print_table, setup_django
+
+
+DEVICES_PER_WORKER = 4
+
+
+def populate(workers):
+    from django.contrib.auth.models import User
+
+    from lava_scheduler_app.models import Device, DeviceType, TestJob, Worker
+
+    dt = DeviceType.objects.create(name="qemu")
+    user = User.objects.create(username="benchmark")
+    objs = Worker.objects.bulk_create(
+        [
+            Worker(hostname="worker-%03d" % i, state=Worker.STATE_ONLINE)
+            for i in range(workers)
+        ]
+    )
+    devices = Device.objects.bulk_create(
+        [
+            Device(
+                hostname="qemu-%04d" % i,
+                device_type=dt,
+                worker_host=objs[i // DEVICES_PER_WORKER],
+                health=Device.HEALTH_GOOD,
+                state=Device.STATE_RUNNING,
+            )
+            for i in range(workers * DEVICES_PER_WORKER)
+        ]
+    )
+    # Half of the devices are running a job
+    TestJob.objects.bulk_create(
+        [
+            TestJob(
+                definition="job_name: benchmark\nvisibility: public\nactions: []\n",
+                submitter=user,
+                requested_device_type=dt,
+                actual_device=device,
+                state=TestJob.STATE_RUNNING,
+                is_public=True,
+            )
+            for device in devices[::2]
+        ]
+    )
+    return {w.hostname: w.token for w in Worker.objects.all()}
+
+
+def measure(func, workers):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        with Timer() as timer:
+            for (name, token) in workers.items():
+                func(name, token)
+    return (timer.wall / len(workers), len(queries) / len(workers))
+
+
+def run(count):
+    from django.db import transaction
+    from django.test import Client
+    from django.urls import reverse
+
+    from lava_common.version import __version__
+
+    publisher = importlib.import_module(
+        "lava_server.management.commands.lava-publisher"
+    )
+    client = Client()
+
+    def poll(name, token):
+        ret = client.get(
+            reverse("lava.scheduler.internal.v1.workers", args=[name]),
+            {"version": __version__},
+            HTTP_LAVA_TOKEN=token,
+        )
+        assert ret.status_code == 200  # nosec
+
+    def ping(name, token):
+        publisher.worker_ping(name, __version__)
+
+    def push(name, token):
+        publisher.worker_jobs(name, ())
+
+    with transaction.atomic():
+        workers = populate(count)
+        results = {
+            "http poll": measure(poll, workers),
+            "channel ping": measure(ping, workers),
+            "channel push": measure(push, workers),
+        }
+        transaction.set_rollback(True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=300, help="number of workers")
+    parser.add_argument(
+        "--ping-interval", type=int, default=20, help="worker ping interval (s)"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=600, help="number of jobs started per hour"
+    )
+    options = parser.parse_args()
+
+    setup_django()
+    from lava_dispatcher.worker import PUSH_PING_INTERVAL
+
+    with benchmark_database():
+        results = run(options.workers)
+
+    print("%d workers\n" % options.workers)
+    print_table(
+        ["operation", "duration (ms)", "queries"],
+        [
+            (name, "%.2f" % (duration * 1000), "%.1f" % queries)
+            for (name, (duration, queries)) in results.items()
+        ],
+    )
+
+    workers = options.workers
+    jobs = options.jobs / 3600
+    (poll, poll_queries) = results["http poll"]
+    (ping, ping_queries) = results["channel ping"]
+    # Events pushing the jobs to the worker: scheduled and canceled
+    pushes = 2 * jobs
+    (push, push_queries) = results["channel push"]
+
+    polling = {
+        "requests": workers / options.ping_interval + 3 * jobs,
+        "queries": workers / options.ping_interval * poll_queries,
+        "busy": workers / options.ping_interval * poll,
+    }
+    channel = {
+        "requests": workers / PUSH_PING_INTERVAL,
+        "queries": workers / options.ping_interval * ping_queries
+        + workers / PUSH_PING_INTERVAL * poll_queries
+        + pushes * push_queries,
+        "busy": workers / options.ping_interval * ping
+        + workers / PUSH_PING_INTERVAL * poll
+        + pushes * push,
+    }
+    print()
+    print(
+        "%d workers, ping every %ds, %d jobs per hour\n"
+        % (workers, options.ping_interval, options.jobs)
+    )
+    print_table(
+        ["mode", "http requests/s", "queries/s", "server busy (%)"],
+        [
+            (
+                name,
+                "%.2f" % load["requests"],
+                "%.1f" % load["queries"],
+                "%.1f" % (load["busy"] * 100),
+            )
+            for (name, load) in [("polling", polling), ("channel", channel)]
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
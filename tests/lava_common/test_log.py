@@ -21,8 +21,47 @@ import logging
 import yaml
 
 
-from lava_common.compat import yaml_load
-from lava_common.log import HTTPHandler, sender, YAMLLogger
+from lava_common.compat import yaml_dump, yaml_load
+from lava_common.log import HTTPHandler, dump, dump_fast, sender, YAMLLogger
+
+
+def test_dump():
+    def yaml_dump_one_line(data):
+        return yaml_dump(
+            data, default_flow_style=True, default_style='"', width=10 ** 6
+        )[:-1]
+
+    # Every character is escaped like the YAML emitter does
+    chars = "".join(chr(i) for i in range(0x3000) if not 0xD800 <= i <= 0xDFFF)
+    strings = [
+        "",
+        "hello world",
+        'with "quotes" and \\ backslashes',
+        "with\ttabs\r\nand new lines\n",
+        "\x1b[0;32mcolors\x1b[0m",
+        "àéèùç and more: \u2028\u2029\ufeff\U0001F600",
+        chars,
+    ]
+    for string in strings:
+        data = {"dt": "2022-08-01T12:34:56.123456", "lvl": "target", "msg": string}
+        assert dump_fast(data) == yaml_dump_one_line(data)
+        assert dump(data) == yaml_dump_one_line(data)
+        data = {"dt": "2022", "lvl": "feedback", "msg": "hello", "ns": string}
+        assert dump_fast(data) == yaml_dump_one_line(data)
+
+    # Keys are sorted
+    data = {"msg": "hello", "lvl": "info", "dt": "2022"}
+    assert dump_fast(data) == yaml_dump_one_line(data)
+
+    # Fallback to the YAML emitter
+    assert dump_fast({}) is None
+    assert dump_fast({"dt": "2022", "lvl": "results", "msg": {"case": "a"}}) is None
+    data = {"dt": "2022", "lvl": "results", "msg": {"case": "a"}}
+    assert dump(data) == yaml_dump_one_line(data)
+    data = {"dt": "2022", "lvl": "info", "msg": "a" * 10 ** 6}
+    assert (
+        dump(data) == '{"dt": "2022", "lvl": "info", "msg": "<line way too long ...>"}'
+    )
 
 
 def test_sender(mocker):
@@ -84,6 +123,7 @@ def test_http_handler(mocker):
     Process = mocker.Mock()
     mocker.patch("multiprocessing.Process", return_value=Process)
     mocker.patch("multiprocessing.Pipe", return_value=(mocker.Mock(), mocker.Mock()))
+    mocker.patch("lava_common.log.HTTPHandler.BATCH_DELAY", 3600)
     handler = HTTPHandler("http://localhost/", "token", 1)
 
     assert len(Process.start.mock_calls) == 1
@@ -110,12 +150,75 @@ def test_http_handler(mocker):
     )
     handler.emit(record)
 
+    # The records are sent in batches
+    assert len(handler.writter.send_bytes.mock_calls) == 0
+    handler.flush()
     assert len(handler.writter.send_bytes.mock_calls) == 1
     assert handler.writter.send_bytes.mock_calls[0][1] == (b"Hello world",)
 
-    handler.close()
+    for i in range(0, HTTPHandler.BATCH_SIZE + 1):
+        record = logging.LogRecord(
+            name="lava",
+            level=logging.INFO,
+            lineno=0,
+            pathname=None,
+            msg=f"{i:04}",
+            args=None,
+            exc_info=None,
+        )
+        handler.emit(record)
     assert len(handler.writter.send_bytes.mock_calls) == 2
-    assert handler.writter.send_bytes.mock_calls[1][1] == (b"",)
+    assert handler.writter.send_bytes.mock_calls[1][1] == (
+        "\n".join(f"{i:04}" for i in range(0, HTTPHandler.BATCH_SIZE)).encode(),
+    )
+
+    handler.close()
+    assert len(handler.writter.send_bytes.mock_calls) == 4
+    assert handler.writter.send_bytes.mock_calls[2][1] == (
+        f"{HTTPHandler.BATCH_SIZE:04}".encode(),
+    )
+    assert handler.writter.send_bytes.mock_calls[3][1] == (b"",)
+
+
+def test_http_handler_delay(mocker):
+    mocker.patch("multiprocessing.Process")
+    mocker.patch("multiprocessing.Pipe", return_value=(mocker.Mock(), mocker.Mock()))
+    mocker.patch("lava_common.log.HTTPHandler.BATCH_DELAY", 0.01)
+    handler = HTTPHandler("http://localhost/", "token", 1)
+
+    record = logging.LogRecord(
+        name="lava",
+        level=logging.INFO,
+        lineno=0,
+        pathname=None,
+        msg="Hello world",
+        args=None,
+        exc_info=None,
+    )
+    handler.emit(record)
+    handler.emit(record)
+    # The pending records are sent after BATCH_DELAY
+    handler.timer.join()
+    assert handler.timer is None
+    assert handler.writter.send_bytes.mock_calls[0][1] == (b"Hello world\nHello world",)
+    handler.close()
+
+
+def test_sender_batches(mocker):
+    response = mocker.Mock(status_code=200)
+    response.json = mocker.Mock(return_value={"line_count": 3})
+    post = mocker.Mock(return_value=response)
+    enter = mocker.MagicMock()
+    enter.__enter__ = mocker.Mock(return_value=mocker.Mock(post=post))
+    mocker.patch("requests.Session", mocker.MagicMock(return_value=enter))
+
+    conn = mocker.MagicMock()
+    conn.recv_bytes = mocker.MagicMock()
+    conn.recv_bytes.side_effect = [b"a\nb\nc", b""]
+
+    sender(conn, "http://localhost", "my-token", 1)
+    assert len(post.mock_calls) == 1
+    assert post.mock_calls[0][2]["data"] == {"lines": "- a\n- b\n- c", "index": 0}
 
 
 def test_yaml_logger(mocker):
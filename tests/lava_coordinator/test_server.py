@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses>.
+
+import asyncio
+import json
+import struct
+import time
+import uuid
+
+from lava.coordinator import LavaCoordinator
+
+
+async def request(port, message):
+    (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(message).encode("utf-8")
+    writer.write(b"%08X" % len(data) + data)
+    header = await reader.read(8)
+    if not header:
+        writer.close()
+        return None
+    data = await reader.readexactly(int(header, 16))
+    writer.close()
+    return json.loads(data.decode("utf-8"))
+
+
+def run(test):
+    async def main():
+        coordinator = LavaCoordinator("localhost", 0, 4096)
+        server = await coordinator.start()
+        port = server.sockets[0].getsockname()[1]
+        try:
+            await test(coordinator, port)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(main())
+
+
+def messages(size, **kwargs):
+    group = str(uuid.uuid4())
+    return [
+        dict(
+            {
+                "group_name": group,
+                "group_size": size,
+                "client_name": "client-%d" % index,
+                "hostname": "localhost",
+                "role": "server" if index == 0 else "client",
+            },
+            **kwargs
+        )
+        for index in range(size)
+    ]
+
+
+def test_blocking_requests():
+    async def test(coordinator, port):
+        (server, client) = messages(2, wait_timeout=10)
+
+        # The first request is kept pending until the group is complete
+        first = asyncio.ensure_future(request(port, dict(server, request="group_data")))
+        await asyncio.sleep(0.1)
+        assert not first.done()
+        second = await request(port, dict(client, request="group_data"))
+        roles = {"client-0": "server", "client-1": "client"}
+        assert second == {"response": "group_data", "roles": roles}
+        assert await first == {"response": "group_data", "roles": roles}
+
+        # lava-sync
+        first = asyncio.ensure_future(
+            request(port, dict(server, request="lava_sync", messageID="sync"))
+        )
+        await asyncio.sleep(0.1)
+        assert not first.done()
+        second = await request(
+            port, dict(client, request="lava_sync", messageID="sync")
+        )
+        assert second == {"response": "ack", "message": "sync"}
+        assert await first == {"response": "ack", "message": "sync"}
+        # The sync can be used again
+        assert coordinator.all_groups[server["group_name"]]["syncs"]["sync"] == {}
+
+        # lava-wait then lava-send
+        wait = asyncio.ensure_future(
+            request(port, dict(client, request="lava_wait", messageID="ready"))
+        )
+        await asyncio.sleep(0.1)
+        assert not wait.done()
+        send = await request(
+            port,
+            dict(server, request="lava_send", messageID="ready", message={"a": "b"}),
+        )
+        assert send == {"response": "ack"}
+        assert await wait == {
+            "response": "ack",
+            "message": {"client-0": {"a": "b"}},
+        }
+        assert coordinator.waiters == {}
+
+    run(test)
+
+
+def test_wait_timeout():
+    async def test(coordinator, port):
+        (server, client) = messages(2)
+
+        # Older clients are kept pending for poll_delay seconds
+        start = time.monotonic()
+        response = await request(
+            port, dict(server, request="group_data", poll_delay=0.2)
+        )
+        assert response == {"response": "wait"}
+        assert time.monotonic() - start >= 0.2
+        assert coordinator.waiters == {}
+
+        # Answer straight away
+        response = await request(port, dict(server, request="group_data"))
+        assert response == {"response": "wait"}
+
+        # The duration is limited
+        coordinator.max_wait = 0.1
+        start = time.monotonic()
+        response = await request(
+            port, dict(server, request="group_data", wait_timeout=10)
+        )
+        assert response == {"response": "wait"}
+        assert time.monotonic() - start < 5
+
+    run(test)
+
+
+def test_many_groups():
+    async def test(coordinator, port):
+        groups = [messages(5, wait_timeout=10) for _ in range(20)]
+
+        async def node(message):
+            for msg in [
+                {"request": "group_data"},
+                {"request": "lava_sync", "messageID": "start"},
+                {"request": "lava_send", "messageID": "done"},
+                {"request": "lava_wait_all", "messageID": "done"},
+                {"request": "lava_sync", "messageID": "end"},
+            ]:
+                response = await request(port, dict(message, **msg))
+                assert response["response"] not in ["wait", "nack"]
+            return await request(port, dict(message, request="clear_group"))
+
+        responses = await asyncio.gather(
+            *[node(message) for group in groups for message in group]
+        )
+        assert responses == [{"response": "ack"}] * 100
+        for group in groups:
+            assert group[0]["group_name"] not in coordinator.all_groups
+
+    run(test)
+
+
+def test_invalid_request():
+    async def test(coordinator, port):
+        (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"invalid!")
+        assert await reader.read() == b""
+        writer.close()
+
+        (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"00000002[]")
+        assert await reader.read() == b""
+        writer.close()
+
+        # Missing request
+        (server,) = messages(1)
+        assert await request(port, server) == {"response": "nack"}
+
+    run(test)
+
+
+class Persistent:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.request_id = 0
+
+    @classmethod
+    async def connect(cls, port):
+        (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+        data = json.dumps({"request": "persistent"}).encode("utf-8")
+        writer.write(b"%08X" % len(data) + data)
+        header = await reader.readexactly(8)
+        response = json.loads(await reader.readexactly(int(header, 16)))
+        assert response == {"response": "ack", "max_frame": 16 * 1024 * 1024}
+        return cls(reader, writer)
+
+    def send(self, message):
+        self.request_id += 1
+        data = json.dumps(message).encode("utf-8")
+        self.writer.write(struct.pack("!II", len(data), self.request_id) + data)
+        return self.request_id
+
+    async def recv(self):
+        (size, request_id) = struct.unpack("!II", await self.reader.readexactly(8))
+        data = await self.reader.readexactly(size)
+        return (request_id, json.loads(data.decode("utf-8")))
+
+
+def test_persistent():
+    async def test(coordinator, port):
+        (server, client) = messages(2, wait_timeout=10)
+        conn = await Persistent.connect(port)
+
+        # The requests are handled concurrently and the responses sent as
+        # soon as they are available
+        group_data = conn.send(dict(server, request="group_data"))
+        wait = conn.send(dict(server, request="lava_wait", messageID="ready"))
+        roles = {"client-0": "server", "client-1": "client"}
+        assert await request(port, dict(client, request="group_data")) == {
+            "response": "group_data",
+            "roles": roles,
+        }
+        assert await conn.recv() == (
+            group_data,
+            {"response": "group_data", "roles": roles},
+        )
+
+        # Large messages
+        message = {"data": "\u00e9" * 0x10000}
+        send = await request(
+            port,
+            dict(client, request="lava_send", messageID="ready", message=message),
+        )
+        assert send == {"response": "ack"}
+        assert await conn.recv() == (
+            wait,
+            {"response": "ack", "message": {"client-1": message}},
+        )
+        request_id = conn.send(
+            dict(server, request="lava_send", messageID="large", message=message)
+        )
+        assert await conn.recv() == (request_id, {"response": "ack"})
+
+        # Invalid requests
+        request_id = conn.send([])
+        assert await conn.recv() == (request_id, {"response": "nack"})
+
+        # The legacy protocol is still available
+        assert await request(
+            port, dict(client, request="lava_wait", messageID="large")
+        ) == {"response": "ack", "message": {"client-0": message}}
+
+        conn.writer.close()
+
+    run(test)
@@ -1,9 +1,17 @@
+import gzip
 import logging
 import pytest
+import stat
+import tarfile
 
 from lava_common.exceptions import JobError, LAVABug
-from lava_dispatcher.actions.deploy.apply_overlay import AppendOverlays
+from lava_dispatcher.actions.deploy.apply_overlay import (
+    AppendOverlays,
+    CompressRamdisk,
+)
 from lava_dispatcher.job import Job
+from lava_dispatcher.utils.compression import CpioNewc
+from tests.lava_dispatcher.test_compression import read_initramfs
 
 
 def test_append_overlays_validate():
@@ -72,6 +80,13 @@ def test_append_overlays_validate():
         action.validate()
     assert exc.match("sparse=True is only available for ext4 images")
 
+    params["format"] = "ext4"
+    del params["sparse"]
+    with pytest.raises(JobError) as exc:
+        params["append_overlay"] = True
+        action.validate()
+    assert exc.match("append_overlay=True is only available for cpio.newc images")
+
 
 def test_append_overlays_run(mocker):
     params = {
@@ -469,3 +484,144 @@ def test_append_lava_overlay_update_guestfs(caplog, mocker, tmpdir):
         ("dispatcher", 10, "Overlays:"),
         ("dispatcher", 10, f"- rootfs.lava: '{tmpdir}/overlay.tar.gz' to '/'"),
     ]
+
+
+def make_ramdisk(path):
+    with open(str(path), "wb") as f_out:
+        archive = CpioNewc(f_out)
+        archive.add("init", stat.S_IFREG | 0o755, b"#!/bin/sh\n")
+        archive.close()
+    path.write_bytes(gzip.compress(path.read_bytes()))
+
+
+def make_tarball(path, name, content):
+    (path.parent / name).write_text(content)
+    with tarfile.open(str(path), "w") as tar:
+        tar.add(str(path.parent / name), arcname=name)
+
+
+def test_append_overlays_append_cpio(caplog, tmp_path):
+    caplog.set_level(logging.DEBUG)
+    params = {
+        "format": "cpio.newc",
+        "append_overlay": True,
+        "overlays": {
+            "lava": True,
+            "modules": {
+                "url": "http://example.com/modules.tar.xz",
+                "compression": "xz",
+                "format": "tar",
+                "path": "/lib",
+            },
+            "script": {
+                "url": "http://example.com/script.sh",
+                "format": "file",
+                "path": "/usr/bin/script.sh",
+            },
+        },
+    }
+
+    action = AppendOverlays("rootfs", params)
+    action.job = Job(1234, {}, None)
+    action.parameters = {
+        "rootfs": {"url": "http://example.com/rootfs.cpio.gz", **params},
+        "namespace": "common",
+    }
+    make_ramdisk(tmp_path / "rootfs.cpio.gz")
+    make_tarball(tmp_path / "overlay.tar", "lava-1234", "overlay")
+    make_tarball(tmp_path / "modules.tar", "modules", "modules")
+    (tmp_path / "script.sh").write_text("script")
+    action.data = {
+        "common": {
+            "compress-overlay": {"output": {"file": str(tmp_path / "overlay.tar")}},
+            "download-action": {
+                "rootfs": {
+                    "file": str(tmp_path / "rootfs.cpio.gz"),
+                    "compression": "gz",
+                    "decompressed": False,
+                },
+                "rootfs.modules": {"file": str(tmp_path / "modules.tar")},
+                "rootfs.script": {"file": str(tmp_path / "script.sh")},
+            },
+        }
+    }
+    action.mkdtemp = lambda: str(tmp_path)
+
+    action.update_cpio()
+
+    entries = read_initramfs((tmp_path / "rootfs.cpio.gz").read_bytes())
+    assert sorted(entries.keys()) == [
+        "init",
+        "lava-1234",
+        "lib",
+        "lib/modules",
+        "usr",
+        "usr/bin",
+        "usr/bin/script.sh",
+    ]
+    assert entries["lava-1234"][2] == b"overlay"
+    assert entries["lib/modules"][2] == b"modules"
+    assert entries["usr/bin/script.sh"][2] == b"script"
+    assert caplog.record_tuples == [
+        ("dispatcher", 20, f"Modifying '{tmp_path}/rootfs.cpio.gz'"),
+        ("dispatcher", 10, "Overlays:"),
+        ("dispatcher", 10, f"- rootfs.lava: '{tmp_path}/overlay.tar' to '/'"),
+        ("dispatcher", 10, f"- rootfs.modules: '{tmp_path}/modules.tar' to '/lib'"),
+        (
+            "dispatcher",
+            10,
+            f"- rootfs.script: '{tmp_path}/script.sh' to '/usr/bin/script.sh'",
+        ),
+        ("dispatcher", 10, "* compressing (gz)"),
+        ("dispatcher", 10, f"* appending '{tmp_path}/overlays.cpio.gz'"),
+    ]
+
+
+def test_compress_ramdisk_append_overlay(tmp_path):
+    action = CompressRamdisk()
+    action.job = Job(1234, {}, None)
+    action.parameters = {
+        "ramdisk": {
+            "url": "http://example.com/ramdisk.cpio.gz",
+            "compression": "gz",
+            "append_overlay": True,
+        },
+        "preseed": {"url": "http://example.com/preseed.cfg"},
+        "deployment_data": {"preseed_to_ramdisk": "preseed.cfg"},
+        "namespace": "common",
+    }
+    make_ramdisk(tmp_path / "ramdisk.cpio.gz")
+    make_tarball(tmp_path / "overlay.tar", "lava-1234", "overlay")
+    make_tarball(tmp_path / "modules.tar", "lib", "modules")
+    (tmp_path / "preseed.cfg").write_text("preseed")
+    action.data = {
+        "common": {
+            "compress-ramdisk": {
+                "append": {
+                    "modules": str(tmp_path / "modules.tar"),
+                    "overlay": str(tmp_path / "overlay.tar"),
+                }
+            },
+            "download-action": {"preseed": {"file": str(tmp_path / "preseed.cfg")}},
+            "extract-overlay-ramdisk": {
+                "ramdisk_file": {"file": str(tmp_path / "ramdisk.cpio.gz")}
+            },
+        }
+    }
+    (tmp_path / "segment").mkdir()
+    action.mkdtemp = lambda: str(tmp_path / "segment")
+
+    # The original ramdisk is kept as-is
+    original = (tmp_path / "ramdisk.cpio.gz").read_bytes()
+    assert action.append_overlay() == str(tmp_path / "ramdisk.cpio.gz")
+    data = (tmp_path / "ramdisk.cpio.gz").read_bytes()
+    assert data.startswith(original)
+
+    entries = read_initramfs(data)
+    assert sorted(entries.keys()) == ["init", "lava-1234", "lib", "preseed.cfg"]
+    assert entries["lava-1234"][2] == b"overlay"
+    assert entries["lib"][2] == b"modules"
+    assert entries["preseed.cfg"][2] == b"preseed"
+    assert action.data["common"]["compress-ramdisk"]["file"] == {
+        "preseed_local": "preseed.cfg"
+    }
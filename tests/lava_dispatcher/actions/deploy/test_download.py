@@ -19,7 +19,11 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
+import hashlib
 from pathlib import Path
+import subprocess  # nosec - unit test support.
+import threading
+import time
 import pytest
 import requests
 from urllib.parse import urlparse
@@ -36,6 +40,7 @@ from lava_dispatcher.actions.deploy.download import (
     ScpDownloadAction,
     PreDownloadedAction,
 )
+from lava_dispatcher.action import Pipeline
 from lava_dispatcher.job import Job
 from tests.lava_dispatcher.test_basic import Factory
 
@@ -785,3 +790,191 @@ def test_copy_to_lxc_without_lxc_should_do_nothing():
     action = CopyToLxcAction()
     action.job = Job(1234, {}, None)
     action.run(None, 4242)  # no crash = success
+
+
+def test_http_download_run_cache(tmpdir):
+    def reader():
+        yield b"hello"
+        yield b"world"
+
+    def broken_reader():
+        raise Exception("Should not be called")
+        yield b""
+
+    def download(job_id, reader):
+        action = HttpDownloadAction(
+            "dtb", str(tmpdir / str(job_id)), urlparse("https://example.com/dtb")
+        )
+        action.job = Job(
+            job_id,
+            {
+                "dispatcher": {
+                    "download_cache_dir": str(tmpdir / "cache"),
+                    "download_cache_size": 1024,
+                }
+            },
+            None,
+        )
+        action.url = urlparse("https://example.com/dtb")
+        action.parameters = {
+            "to": "download",
+            "images": {
+                "dtb": {
+                    "url": "https://example.com/dtb",
+                    "md5sum": "fc5e038d38a57032085441e7fe7010b0",
+                }
+            },
+            "namespace": "common",
+        }
+        action.params = action.parameters["images"]["dtb"]
+        action.validators = {"etag": '"1234"'}
+        action.reader = reader
+        action.fname = str(tmpdir / str(job_id) / "dtb/dtb")
+        action.run(None, 4212)
+        return action
+
+    # Cache miss
+    action = download(1, reader)
+    assert action.results["cache"] == "miss"
+    assert action.results["size"] == 10
+    assert action.results["md5sum"] == "fc5e038d38a57032085441e7fe7010b0"
+    assert (tmpdir / "1" / "dtb" / "dtb").read_text("utf-8") == "helloworld"
+
+    # Cache hit
+    action = download(2, broken_reader)
+    assert action.results["cache"] == "hit"
+    assert action.results["size"] == 10
+    assert action.results["md5sum"] == "fc5e038d38a57032085441e7fe7010b0"
+    assert (tmpdir / "2" / "dtb" / "dtb").read_text("utf-8") == "helloworld"
+    assert action.data["common"]["download-action"]["dtb"]["md5"] == (
+        "fc5e038d38a57032085441e7fe7010b0"
+    )
+
+    # A new version of the resource
+    action = download(3, reader)
+    action.validators = {"etag": '"5678"'}
+    action.run(None, 4212)
+    assert action.results["cache"] == "miss"
+
+    # Modified in place by a job: the entry is not changed
+    (tmpdir / "3" / "dtb" / "dtb").write_text("modified", "utf-8")
+    action = download(4, broken_reader)
+    assert action.results["cache"] == "hit"
+    assert (tmpdir / "4" / "dtb" / "dtb").read_text("utf-8") == "helloworld"
+
+
+def test_downloader_parallel_downloads(tmpdir):
+    images = ["kernel", "dtb", "rootfs"]
+    parameters = {
+        "to": "download",
+        "parallel_downloads": True,
+        "images": {key: {"url": "https://example.com/%s" % key} for key in images},
+        "namespace": "common",
+    }
+    job = Job(1234, {"dispatcher": {}}, None)
+    job.pipeline = Pipeline(job=job, parameters=parameters)
+    for key in images:
+        job.pipeline.add_action(
+            DownloaderAction(key, str(tmpdir), params=parameters["images"][key])
+        )
+
+    threads = {}
+    # Every download waits for the other ones: this only succeeds when the
+    # images are downloaded at the same time
+    barrier = threading.Barrier(len(images), timeout=30)
+
+    def reader(key, barrier=None):
+        def read():
+            threads[key] = threading.current_thread()
+            if barrier is not None:
+                barrier.wait()
+            yield key.encode("utf-8")
+
+        return read
+
+    handlers = [action.pipeline.actions[0] for action in job.pipeline.actions]
+    for handler in handlers:
+        handler.reader = reader(handler.key, barrier)
+        handler.fname = str(tmpdir / handler.key / handler.key)
+
+    for action in job.pipeline.actions:
+        action.run(None, time.time() + 60)
+    # The images are downloaded at the same time, outside of the main thread
+    assert not barrier.broken
+    assert len(set(threads.values())) == 3
+    assert threading.current_thread() not in threads.values()
+
+    # Every action did set its own data, in the pipeline order
+    for handler in handlers:
+        assert handler.prefetched is None
+        assert handler.results["size"] == len(handler.key)
+        assert (tmpdir / handler.key / handler.key).read_text("utf-8") == handler.key
+    assert list(job.pipeline.actions[0].data["common"]["download-action"]["file"]) == [
+        "kernel",
+        "dtb",
+        "rootfs",
+    ]
+
+    # Failed parallel downloads are downloaded again by the action
+    calls = []
+
+    def flaky():
+        calls.append(threading.current_thread())
+        if len(calls) == 1:
+            raise InfrastructureError("broken")
+        yield b"dtb"
+
+    for action in job.pipeline.actions:
+        action.prefetched = False
+    handlers[1].reader = flaky
+    handlers[2].reader = reader("rootfs")
+    job.pipeline.actions[1].run(None, time.time() + 60)
+    assert len(calls) == 2
+    assert (tmpdir / "dtb" / "dtb").read_text("utf-8") == "dtb"
+    assert handlers[2].prefetched is not None
+
+
+@pytest.mark.parametrize("compression", ["bz2", "gz", "xz", "zstd"])
+def test_http_download_run_decompress(tmpdir, compression):
+    data = b"hello world\n" * 100000
+    compressed = subprocess.check_output(  # nosec - unit test.
+        {"bz2": ["bzip2"], "gz": ["gzip"], "xz": ["xz"], "zstd": ["zstd"]}[compression],
+        input=data,
+    )
+
+    def reader():
+        for index in range(0, len(compressed), 1000):
+            yield compressed[index : index + 1000]
+
+    action = HttpDownloadAction(
+        "rootfs", str(tmpdir), urlparse("https://example.com/rootfs")
+    )
+    action.job = Job(1234, {}, None)
+    action.parameters = {
+        "to": "download",
+        "rootfs": {
+            "url": "https://example.com/rootfs.%s" % compression,
+            "compression": compression,
+            "sha256sum": hashlib.sha256(compressed).hexdigest(),
+        },
+        "namespace": "common",
+    }
+    action.params = action.parameters["rootfs"]
+    action.reader = reader
+    action.size = len(compressed)
+    action.fname = str(tmpdir / "rootfs/rootfs")
+    action.run(None, 4212)
+    assert (tmpdir / "rootfs/rootfs").read_binary() == data
+    # Only the requested checksums are computed
+    assert dict(action.results) == {
+        "success": {"sha256": hashlib.sha256(compressed).hexdigest()},
+        "label": "rootfs",
+        "size": len(compressed),
+        "sha256sum": hashlib.sha256(compressed).hexdigest(),
+    }
+
+    # Invalid compressed data
+    action.reader = lambda: iter([b"not compressed"])
+    action.size = -1
+    with pytest.raises(JobError):
+        action.run(None, 4212)
@@ -18,13 +18,26 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
+import bz2
 import copy
+import gzip
+import lzma
 import os
 import hashlib
-from lava_common.exceptions import InfrastructureError
+import io
+import stat
+import tarfile
+import zlib
+
+import pytest
+
+from lava_common.constants import DECOMPRESS_CHUNK_SIZE
+from lava_common.exceptions import InfrastructureError, JobError
 from tests.lava_dispatcher.test_basic import Factory, StdoutTestCase
 from lava_dispatcher.utils.compression import decompress_file
 from lava_dispatcher.utils.compression import decompress_command_map
+from lava_dispatcher.utils.compression import StreamDecompressor
+from lava_dispatcher.utils.compression import CpioNewc, cpio_append
 
 
 class TestDecompression(StdoutTestCase):
@@ -109,3 +122,145 @@ class TestDecompression(StdoutTestCase):
         with self.assertRaises(InfrastructureError):
             decompress_file("/tmp/test.xz", "zip")  # nosec - unit test only.
         self.assertEqual(copy_of_command_map, decompress_command_map)
+
+
+def test_stream_decompressor():
+    data = os.urandom(100000) + b"\0" * 10000000 + b"hello world\n" * 1000
+    for (compression, compress) in [
+        ("bz2", bz2.compress),
+        ("gz", gzip.compress),
+        ("xz", lzma.compress),
+    ]:
+        # Concatenated streams and trailing zeros
+        for compressed in [
+            compress(data),
+            compress(data[:5000]) + compress(data[5000:]),
+            compress(data) + b"\0" * 512,
+        ]:
+            decompressor = StreamDecompressor(compression)
+            chunks = []
+            for index in range(0, len(compressed), 32768):
+                chunks.extend(
+                    decompressor.decompress(compressed[index : index + 32768])
+                )
+            chunks.append(decompressor.finish())
+            assert b"".join(chunks) == data
+            assert max(len(c) for c in chunks) <= DECOMPRESS_CHUNK_SIZE
+
+        # Truncated or invalid data
+        decompressor = StreamDecompressor(compression)
+        list(decompressor.decompress(compress(data)[:-32]))
+        with pytest.raises(JobError, match="truncated input"):
+            decompressor.finish()
+        with pytest.raises(JobError, match="Unable to decompress"):
+            list(StreamDecompressor(compression).decompress(b"not compressed"))
+
+
+def read_initramfs(data):
+    """
+    Return the entries of a ramdisk made of (gzip compressed or not) cpio
+    segments, as done by the kernel (init/initramfs.c).
+    """
+    entries = {}
+    offset = 0
+    while offset < len(data):
+        if data[offset : offset + 6] == b"070701" and offset % 4 == 0:
+            while True:
+                fields = [
+                    int(data[offset + 6 + i * 8 : offset + 14 + i * 8], 16)
+                    for i in range(13)
+                ]
+                (mode, size, namesize) = (fields[1], fields[6], fields[11])
+                offset += 110
+                name = data[offset : offset + namesize - 1].decode("utf-8")
+                offset += namesize + (-(110 + namesize) % 4)
+                content = data[offset : offset + size]
+                offset += size + (-size % 4)
+                if name == "TRAILER!!!":
+                    break
+                entries[name] = (mode, fields[4], content)
+        elif data[offset] == 0:
+            offset += 1
+        else:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            segment = decompressor.decompress(data[offset:])
+            assert decompressor.eof
+            entries.update(read_initramfs(segment))
+            offset = len(data) - len(decompressor.unused_data)
+    return entries
+
+
+def test_cpio_newc(tmp_path):
+    # The original ramdisk
+    with (tmp_path / "ramdisk.cpio").open("wb") as f_out:
+        archive = CpioNewc(f_out)
+        archive.add("init", stat.S_IFREG | 0o755, b"#!/bin/sh\n")
+        archive.add("tmp", stat.S_IFDIR | 0o1777)
+        archive.close()
+    (tmp_path / "ramdisk.cpio.gz").write_bytes(
+        gzip.compress((tmp_path / "ramdisk.cpio").read_bytes())
+    )
+
+    # The overlay
+    overlay = tmp_path / "overlay"
+    (overlay / "lava-1234" / "bin").mkdir(parents=True)
+    (overlay / "lava-1234" / "bin" / "lava-test-runner").write_text("runner")
+    (overlay / "lava-1234" / "bin" / "lava-test-runner").chmod(0o755)
+    (overlay / "lava-1234" / "hello").write_bytes(b"hello" * 1001)
+    os.symlink("bin/lava-test-runner", str(overlay / "lava-1234" / "runner"))
+    os.link(str(overlay / "lava-1234" / "hello"), str(overlay / "lava-1234" / "world"))
+    with tarfile.open(str(tmp_path / "overlay.tar.gz"), "w:gz") as tar:
+        tar.add(str(overlay), arcname=".")
+    (tmp_path / "preseed.cfg").write_text("preseed")
+
+    with (tmp_path / "overlay.cpio").open("wb") as f_out:
+        archive = CpioNewc(f_out)
+        archive.add_tar(str(tmp_path / "overlay.tar.gz"), "/lava")
+        archive.add_file(str(tmp_path / "preseed.cfg"), "etc/preseed.cfg")
+        archive.close()
+        assert f_out.tell() % 4 == 0
+    (tmp_path / "overlay.cpio.gz").write_bytes(
+        gzip.compress((tmp_path / "overlay.cpio").read_bytes())
+    )
+
+    # The original file is not modified
+    os.link(str(tmp_path / "ramdisk.cpio.gz"), str(tmp_path / "original.cpio.gz"))
+    original = (tmp_path / "original.cpio.gz").read_bytes()
+    cpio_append(str(tmp_path / "ramdisk.cpio.gz"), str(tmp_path / "overlay.cpio.gz"))
+    assert (tmp_path / "original.cpio.gz").read_bytes() == original
+    assert not (tmp_path / "ramdisk.cpio.gz.tmp").exists()
+    entries = read_initramfs((tmp_path / "ramdisk.cpio.gz").read_bytes())
+    assert sorted(entries.keys()) == [
+        "etc",
+        "etc/preseed.cfg",
+        "init",
+        "lava",
+        "lava/lava-1234",
+        "lava/lava-1234/bin",
+        "lava/lava-1234/bin/lava-test-runner",
+        "lava/lava-1234/hello",
+        "lava/lava-1234/runner",
+        "lava/lava-1234/world",
+        "tmp",
+    ]
+    assert entries["init"] == (stat.S_IFREG | 0o755, 1, b"#!/bin/sh\n")
+    assert entries["tmp"] == (stat.S_IFDIR | 0o1777, 2, b"")
+    # Missing parent directories are created
+    assert entries["etc"] == (stat.S_IFDIR | 0o755, 2, b"")
+    assert entries["etc/preseed.cfg"][2] == b"preseed"
+    assert entries["lava/lava-1234/bin/lava-test-runner"] == (
+        stat.S_IFREG | 0o755,
+        1,
+        b"runner",
+    )
+    assert entries["lava/lava-1234/hello"][2] == b"hello" * 1001
+    # Hard links are stored as copies
+    assert entries["lava/lava-1234/world"][2] == b"hello" * 1001
+    assert entries["lava/lava-1234/runner"] == (
+        stat.S_IFLNK | 0o777,
+        1,
+        b"bin/lava-test-runner",
+    )
+
+    with pytest.raises(JobError, match="Unable to unpack"):
+        CpioNewc(io.BytesIO()).add_tar(str(tmp_path / "preseed.cfg"))
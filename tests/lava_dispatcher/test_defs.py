@@ -24,14 +24,17 @@ import glob
 import stat
 import shutil
 import pexpect
+import pytest
 import tempfile
+import threading
+import time
 import unittest
 import subprocess  # nosec - unit test support.
 from unittest.mock import patch
 
 from lava_common.compat import yaml_safe_dump, yaml_safe_load
 from lava_common.decorators import nottest
-from lava_common.exceptions import InfrastructureError
+from lava_common.exceptions import InfrastructureError, JobError
 from lava_dispatcher.power import FinalizeAction
 from lava_dispatcher.parser import JobParser
 from lava_dispatcher.actions.test.shell import PatternFixup
@@ -41,6 +44,7 @@ from lava_dispatcher.actions.deploy.image import DeployImagesAction
 from lava_dispatcher.actions.deploy.testdef import (
     TestDefinitionAction,
     GitRepoAction,
+    InlineRepoAction,
     TestOverlayAction,
     TestInstallAction,
     TestRunnerAction,
@@ -751,3 +755,56 @@ test3a: skip
         self.assertEqual(
             "oe", fastboot_installscript.parameters["deployment_data"]["distro"]
         )
+
+
+def test_testdef_prefetch(mocker):
+    action = TestDefinitionAction()
+    handlers = []
+    for repository in ["a", "b", "a"]:
+        handler = GitRepoAction()
+        handler.parameters = {"repository": repository}
+        handlers.append(handler)
+    action.pipeline = mocker.Mock()
+    action.pipeline.actions = handlers + [InlineRepoAction()]
+
+    # The first clones of "a" and "b" run at the same time
+    barrier = threading.Barrier(2, timeout=10)
+    calls = []
+
+    def prefetch(handler, max_end_time, abort):
+        if handler is not handlers[2]:
+            barrier.wait()
+        calls.append(handler)
+
+    mocked = mocker.patch.object(
+        GitRepoAction, "prefetch", autospec=True, side_effect=prefetch
+    )
+    action.prefetch(time.time() + 60)
+    assert len(calls) == 3
+    # The clones of the same repository are done in order
+    assert calls.index(handlers[0]) < calls.index(handlers[2])
+
+    # The clones are aborted and not waited for when the action times out
+    (started, aborted) = (threading.Event(), threading.Event())
+
+    def timeout(handler, max_end_time, abort):
+        if handler is handlers[0]:
+            started.wait(10)
+            raise JobError("git-repo-action timed out")
+        started.set()
+        if abort.wait(10):
+            time.sleep(1)
+            aborted.set()
+
+    mocked.side_effect = timeout
+    with pytest.raises(JobError):
+        action.prefetch(time.time() + 60)
+    assert not aborted.is_set()
+    assert aborted.wait(10)
+
+    # Nothing to do in parallel
+    calls.clear()
+    mocked.side_effect = prefetch
+    action.pipeline.actions = handlers[:1]
+    action.prefetch(time.time() + 60)
+    assert calls == []
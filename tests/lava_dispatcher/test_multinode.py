@@ -19,10 +19,16 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 
+import asyncio
 import os
+import socket
+import threading
+import time
 import uuid
 import json
+from unittest.mock import patch
 
+from lava.coordinator import LavaCoordinator
 from lava_common.compat import yaml_dump, yaml_unsafe_load
 from lava_common.constants import LAVA_MULTINODE_SYSTEM_TIMEOUT
 from lava_common.timeout import Timeout
@@ -837,3 +843,158 @@ class TestDelayedStart(StdoutTestCase):
         )
         self.assertFalse(self.server_protocol.delayed_start)
         self.assertFalse(self.bad_protocol.valid)
+
+
+class TestCoordinatorConnection(StdoutTestCase):
+    """
+    Test the protocol against a coordinator running in a thread
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        self.coordinator = LavaCoordinator("localhost", 0, 4096)
+        self.server = self.loop.run_until_complete(self.coordinator.start())
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        self.group = str(uuid.uuid4())
+
+    def tearDown(self):
+        super().tearDown()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        # Close the remaining connections
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            self.loop.run_until_complete(asyncio.wait(tasks))
+        self.loop.close()
+
+    def protocol(self, role, persistent):
+        parameters = {
+            "protocols": {
+                "lava-multinode": {
+                    "target_group": self.group,
+                    "role": role,
+                    "group_size": 2,
+                }
+            }
+        }
+        protocol = MultinodeProtocol(parameters, role)
+        protocol.logger = DummyLogger()
+        protocol.debug_setup()
+        protocol.settings["port"] = self.port
+        protocol.settings["poll_delay"] = 0.1
+        protocol.base_message["port"] = self.port
+        if persistent:
+            protocol._open_persistent()
+        return protocol
+
+    def run_group(self, persistent):
+        server = self.protocol("server", persistent)
+        client = self.protocol("client", persistent)
+        message = {"data": "é" * 0x10000}
+        replies = {}
+
+        def run_client():
+            client.initialise_group()
+            replies["sync"] = client.request_sync("start")
+            replies["wait"] = client.request_wait("ready")
+
+        thread = threading.Thread(target=run_client)
+        thread.start()
+        server.initialise_group()
+        self.assertEqual(
+            json.loads(server.request_sync("start")),
+            {"response": "ack", "message": "start"},
+        )
+        if persistent:
+            self.assertEqual(
+                json.loads(server.request_send("ready", message)),
+                {"response": "ack"},
+            )
+        else:
+            # Legacy messages are limited to 0xFFFE bytes
+            with self.assertRaises(JobError):
+                server.request_send("ready", message)
+            message = {"data": "ready"}
+            server.request_send("ready", message)
+        thread.join()
+        self.assertEqual(
+            json.loads(replies["sync"]), {"response": "ack", "message": "start"}
+        )
+        self.assertEqual(
+            json.loads(replies["wait"]),
+            {"response": "ack", "message": {"server": message}},
+        )
+        server.finalise_protocol()
+        client.finalise_protocol()
+        self.assertIsNone(server.connection)
+        self.assertNotIn(self.group, self.coordinator.all_groups)
+
+    def test_persistent(self):
+        # Every request uses the persistent connection
+        with patch.object(
+            MultinodeProtocol, "_connect", side_effect=AssertionError("new connection")
+        ):
+            self.run_group(persistent=True)
+
+    def test_legacy(self):
+        self.run_group(persistent=False)
+
+    def test_persistent_not_supported(self):
+        # Older coordinators answer "nack" to unknown requests
+        async def handle(reader, writer):
+            await reader.readexactly(int(await reader.readexactly(8), 16))
+            writer.write(b"%08X%s" % (19, b'{"response": "nack"}'))
+            writer.close()
+
+        server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(handle, "127.0.0.1", 0), self.loop
+        ).result()
+        self.port = server.sockets[0].getsockname()[1]
+        protocol = self.protocol("server", persistent=True)
+        self.assertIsNone(protocol.connection)
+        server.close()
+
+    def test_persistent_connection_lost(self):
+        protocol = self.protocol("server", persistent=True)
+        self.assertIsNotNone(protocol.connection)
+        protocol.connection.close()
+        protocol.connection = socket.socket()
+        protocol.parameters["protocols"]["lava-multinode"]["group_size"] = 1
+        # Use a new connection for each request
+        protocol.initialise_group()
+        self.assertIsNone(protocol.connection)
+        self.assertEqual(
+            json.loads(protocol.request_sync("start")),
+            {"response": "ack", "message": "start"},
+        )
+
+    def test_persistent_coordinator_gone(self):
+        # The coordinator accepts the persistent connection but never answers
+        async def handle(reader, writer):
+            await reader.readexactly(int(await reader.readexactly(8), 16))
+            reply = b'{"response": "ack", "max_frame": 4096}'
+            writer.write(b"%08X%s" % (len(reply), reply))
+            await reader.read()
+            writer.close()
+
+        server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(handle, "127.0.0.1", 0), self.loop
+        ).result()
+        self.port = server.sockets[0].getsockname()[1]
+        protocol = self.protocol("server", persistent=True)
+        self.assertIsNotNone(protocol.connection)
+        protocol.system_timeout.duration = 0.5
+        message = json.dumps({"request": "lava_sync", "wait_timeout": 1})
+        start = time.monotonic()
+        with self.assertRaises(socket.timeout):
+            protocol._poll_persistent(message, 1)
+        self.assertLess(time.monotonic() - start, 10)
+        protocol.finalise_protocol()
+        server.close()
@@ -0,0 +1,127 @@
+# Copyright (C) 2022 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+from pathlib import Path
+
+import pexpect
+import pytest
+
+from lava_common.timeout import Timeout
+from lava_dispatcher.shell import ShellCommand, ShellLogger
+from lava_dispatcher.utils.messages import LinuxKernelMessages
+
+
+def expect_all(child, patterns):
+    results = []
+    while True:
+        index = child.expect(patterns, timeout=10)
+        results.append((index, child.before, child.after))
+        if child.after is pexpect.EOF:
+            return results
+
+
+@pytest.mark.parametrize(
+    "logfile", ["kernel-1.txt", "kernel-2.txt", "kernel-4.txt", "kernel-panic.txt"]
+)
+def test_shell_command_matches(mocker, logfile):
+    # The bounded search returns the same matches as pexpect
+    logfile = str(Path(__file__).parent / logfile)
+    patterns = LinuxKernelMessages.get_kernel_prompts() + [pexpect.EOF]
+
+    child = pexpect.spawn("cat", [logfile], encoding="utf-8", maxread=64)
+    expected = expect_all(child, patterns)
+    assert len(expected) > 1
+
+    shell = ShellCommand(
+        "cat %s" % logfile, Timeout("fake", None, 30), logger=mocker.Mock(), window=64
+    )
+    assert expect_all(shell, patterns) == expected
+    assert shell.search_stats["searches"] > len(expected)
+
+
+def test_shell_command_overlap(mocker):
+    shell = ShellCommand(
+        "bash -c 'printf aaaaaaaaaaaaaaaaaaaa; sleep 0.2; printf \"foo bar\\n\"; sleep 0.2; printf aaaa'",
+        Timeout("fake", None, 30),
+        logger=mocker.Mock(),
+        overlap=10,
+    )
+    # "^" and "\b" do not match at the beginning of the window
+    assert shell.expect([r"^foo", r"\bbar", pexpect.EOF], timeout=10) == 1
+    assert shell.before == "aaaaaaaaaaaaaaaaaaaafoo "
+    assert shell.after == "bar"
+    # Only the new data and the overlap are searched
+    assert shell.expect(["a{15}", pexpect.EOF], timeout=10) == 1
+    assert shell.search_stats["scanned"] < 2 * len("aaaaaaaaaaaaaaaaaaaafoo bar\naaaa")
+
+
+def test_shell_command_signal_pattern(mocker):
+    # Unbounded patterns like the LAVA_SIGNAL one are only searched in the
+    # window as well
+    shell = ShellCommand(
+        "bash -c 'seq 1 100000; echo \"<LAVA_SIGNAL_STARTRUN 0_smoke 1234>\"'",
+        Timeout("fake", None, 30),
+        logger=mocker.Mock(),
+        window=4092,
+        overlap=100,
+    )
+    patterns = [r"<LAVA_SIGNAL_(\S+) ([^>]+)>", pexpect.EOF]
+    assert shell.expect(patterns, timeout=10) == 0
+    assert shell.match.groups() == ("STARTRUN", "0_smoke 1234")
+    assert shell.before.endswith("\n100000\r\n")
+    size = len(shell.before) + len(shell.after)
+    searches = shell.search_stats["searches"]
+    assert shell.search_stats["scanned"] <= size + searches * 101
+    shell.close()
+
+
+def test_shell_command_search_window(mocker):
+    shell = ShellCommand(
+        "seq 1 100000",
+        Timeout("fake", None, 30),
+        logger=mocker.Mock(),
+        window=4092,
+        overlap=100,
+    )
+    assert shell.expect(["\n100000\r\n", pexpect.EOF], timeout=10) == 0
+    size = len(shell.before) + len(shell.after)
+    # Each character is scanned at most a few times
+    searches = shell.search_stats["searches"]
+    assert shell.search_stats["scanned"] <= size + searches * 101
+    assert shell.search_stats["duration"] > 0
+
+    # The pattern lists are only compiled once
+    patterns = ["hello", pexpect.EOF]
+    assert shell.compile_pattern_list(patterns) is shell.compile_pattern_list(patterns)
+    shell.close()
+
+
+def test_shell_logger(mocker):
+    logger = mocker.Mock()
+    shell_logger = ShellLogger(logger)
+    shell_logger.write('hello "world"\r\n\x1b[0mfoo\n\nbar\n\r\nbaz\n\n\npart')
+    assert [c[0][0] for c in logger.target.call_args_list] == [
+        'hello \\"world\\"',
+        "[0mfoo",
+        "bar",
+        "",
+        "baz",
+        "",
+    ]
+    shell_logger.write("ial\n")
+    assert logger.target.call_args[0][0] == "partial"
@@ -21,6 +21,8 @@
 import os
 import pytest
 import subprocess  # nosec - unit test support.
+import threading
+import time
 import unittest
 
 from tests.utils import infrastructure_error
@@ -37,6 +39,7 @@ from lava_dispatcher.actions.test import (  # pylint: disable=unused-import
     strategies as test_strategies,
 )
 from lava_dispatcher.utils import vcs, installers
+from lava_dispatcher.utils.cache import GitCache
 from lava_dispatcher.utils.decorator import replace_exception
 from lava_dispatcher.utils.shell import which
 
@@ -172,6 +175,88 @@ def test_no_history(setup, tmpdir):
     assert not (tmpdir / "git.clone1" / ".git").exists()
 
 
+def test_clone_with_cache(setup, tmpdir, mocker):
+    cache = GitCache(str(tmpdir / "cache"), 10 * 1024 * 1024)
+    git = vcs.GitHelper("git", cache=cache)
+    run = mocker.spy(git, "_run")
+
+    def commands():
+        ret = [c[0][0][1:3] for c in run.call_args_list]
+        run.reset_mock()
+        return ret
+
+    # The mirror is created by the first clone
+    assert git.clone("git.clone1") == "a7af835862da0e0592eeeac901b90e8de2cf5b67"
+    assert commands()[0] == ["clone", "--mirror"]
+    key = cache.key(url="git")
+    assert [e[0] for e in cache.entries()] == [key]
+    # The clone points to the original repository
+    assert (
+        subprocess.check_output(  # nosec - unit test support.
+            ["git", "-C", "git.clone1", "remote", "get-url", "origin"]
+        )
+        .decode()
+        .strip()
+        == "git"
+    )
+
+    # The mirror is fetched for branches
+    assert (
+        git.clone("git.clone2", branch="testing")
+        == "f2589a1b7f0cfc30ad6303433ba4d5db1a542c2d"
+    )
+    assert commands()[0] == ["--git-dir", str(cache.mirror(key))]
+    assert (tmpdir / "git.clone2" / ".git").exists()
+
+    # But not for known commits
+    assert (
+        git.clone("git.clone3", revision="2f83e6d8189025e356a9563b8d78bdc8e2e9a3ed")
+        == "2f83e6d8189025e356a9563b8d78bdc8e2e9a3ed"
+    )
+    assert [c[0] for c in commands()] == ["-C", "clone", "-C", "-C", "-C"]
+    assert not (tmpdir / "git.clone4").exists()
+
+    # Shallow clones and errors
+    assert (
+        git.clone("git.clone4", shallow=True, history=False)
+        == "a7af835862da0e0592eeeac901b90e8de2cf5b67"
+    )
+    assert not (tmpdir / "git.clone4" / ".git").exists()
+    with pytest.raises(InfrastructureError):
+        git.clone("git.clone5", revision="badhash")
+    with pytest.raises(InfrastructureError):
+        vcs.GitHelper("does_not_exists", cache=cache).clone("git.clone6")
+    assert [e[0] for e in cache.entries()] == [key]
+
+    # Evicted when too large
+    cache.size = 1
+    assert git.clone("git.clone7") == "a7af835862da0e0592eeeac901b90e8de2cf5b67"
+    assert cache.entries() == []
+
+
+def test_clone_deadline(setup, tmpdir):
+    git = vcs.GitHelper("git")
+    git.max_end_time = time.time() + 60
+    assert git.clone("git.clone1") == "a7af835862da0e0592eeeac901b90e8de2cf5b67"
+    with pytest.raises(InfrastructureError):
+        git.clone("git.clone2", revision="badhash")
+
+    # The commands are killed when the deadline is reached
+    begin = time.monotonic()
+    git.max_end_time = time.time() + 0.5
+    with pytest.raises(InfrastructureError, match="timed out"):
+        git._run(["sleep", "10"])
+    assert time.monotonic() - begin < 5
+
+    # Or when aborted
+    git.max_end_time = None
+    git.abort = threading.Event()
+    threading.Timer(0.5, git.abort.set).start()
+    with pytest.raises(InfrastructureError, match="aborted"):
+        git._run(["sleep", "10"])
+    assert time.monotonic() - begin < 10
+
+
 ALLOWED = ["commands", "deploy", "test"]
 
 
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses>.
+
+import asyncio
+import json
+import subprocess  # nosec - unit test support.
+import time
+import types
+
+import pytest
+
+from lava_dispatcher import worker
+
+
+@pytest.fixture
+def jobs(monkeypatch, tmp_path):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr(worker, "tmp_dir", tmp_path / "tmp")
+    monkeypatch.setattr(worker, "STALE_CONFIG", {tmp_path / "tmp": "{prefix}{job_id}"})
+    return worker.JobsDB(str(tmp_path / "db.sqlite3"))
+
+
+def test_handle_concurrent_jobs(monkeypatch, jobs):
+    posts = []
+    batches = []
+    payload = {
+        "definition": "job_name: test",
+        "device": "hostname: qemu01",
+        "dispatcher": "",
+        "env": "",
+        "env-dut": "",
+    }
+
+    async def http_get(url, token, params=None):
+        raise Exception("Should not be called")
+
+    async def http_post(url, token, data):
+        if url == f"http://localhost{worker.URL_JOBS}":
+            # The batch api
+            batches.append(sorted(data.keys()))
+            if "start" in data:
+                # A slow server
+                await asyncio.sleep(0.2)
+                starts = json.loads(data["start"])
+                return worker.Response(
+                    200, json.dumps({"start": {j["id"]: payload for j in starts}})
+                )
+            for job in json.loads(data["state"]):
+                posts.append((job["id"], job["state"]))
+            return worker.Response(200, json.dumps({"state": {}}))
+        posts.append((int(url.split("/")[-2]), data["state"]))
+        return worker.Response(200, "{}")
+
+    async def start_job(url, token, job_id, *args):
+        return await asyncio.create_subprocess_exec("sleep", "0.2")
+
+    monkeypatch.setattr(worker, "http_get", http_get)
+    monkeypatch.setattr(worker, "http_post", http_post)
+    monkeypatch.setattr(worker, "start_job", start_job)
+
+    options = types.SimpleNamespace(
+        name="worker-01", token="token", url="http://localhost", job_log_interval=5
+    )
+    data = {
+        "cancel": [],
+        "running": [],
+        "start": [{"id": i, "token": "token-%d" % i} for i in range(10)],
+    }
+
+    async def run():
+        begin = time.monotonic()
+        await worker.handle(options, jobs, data)
+        # The jobs are started concurrently
+        assert time.monotonic() - begin < 1.0  # nosec
+        assert sorted(jobs.all_ids()) == list(range(10))  # nosec
+        assert len(worker.MONITORS) == 10  # nosec
+        # The jobs are reported as soon as the processes exit
+        await asyncio.wait_for(
+            asyncio.gather(*list(worker.MONITORS.values())), timeout=10
+        )
+
+    asyncio.run(run())
+    assert worker.MONITORS == {}  # nosec
+    assert jobs.all_ids() == []  # nosec
+    # One request for the payloads and one for the RUNNING states
+    assert batches == [["start"], ["state"]]  # nosec
+    assert sorted(posts) == sorted(  # nosec
+        [(i, "RUNNING") for i in range(10)] + [(i, "FINISHED") for i in range(10)]
+    )
+
+
+def test_handle_without_batch_api(monkeypatch, jobs):
+    # Older servers: fetch the payloads and post the states one by one
+    gets = []
+    posts = []
+    payload = {
+        "definition": "job_name: test",
+        "device": "hostname: qemu01",
+        "dispatcher": "",
+        "env": "",
+        "env-dut": "",
+    }
+
+    async def http_get(url, token, params=None):
+        gets.append(url)
+        return worker.Response(200, json.dumps(payload))
+
+    async def http_post(url, token, data):
+        if url == f"http://localhost{worker.URL_JOBS}":
+            return worker.Response(404, "Not found")
+        posts.append((url, data["state"]))
+        return worker.Response(200, "{}")
+
+    async def start_job(url, token, job_id, *args):
+        return None
+
+    monkeypatch.setattr(worker, "http_get", http_get)
+    monkeypatch.setattr(worker, "http_post", http_post)
+    monkeypatch.setattr(worker, "start_job", start_job)
+
+    options = types.SimpleNamespace(
+        name="worker-01", token="token", url="http://localhost", job_log_interval=5
+    )
+    data = {"start": [{"id": i, "token": "token-%d" % i} for i in range(2)]}
+    asyncio.run(worker.handle(options, jobs, data))
+    urls = [f"http://localhost{worker.URL_JOBS}{i}/" for i in range(2)]
+    assert sorted(gets) == urls  # nosec
+    assert sorted(posts) == sorted(  # nosec
+        [(url, "RUNNING") for url in urls] + [(url, "FINISHED") for url in urls]
+    )
+
+
+def test_handle_payload(monkeypatch, jobs):
+    # The payload pushed by the server is used directly
+    async def http_get(url, token, params=None):
+        raise Exception("Should not be called")
+
+    async def http_post(url, token, data):
+        return worker.Response(200, "{}")
+
+    async def start_job(url, token, job_id, *args):
+        return None
+
+    monkeypatch.setattr(worker, "http_get", http_get)
+    monkeypatch.setattr(worker, "http_post", http_post)
+    monkeypatch.setattr(worker, "start_job", start_job)
+
+    options = types.SimpleNamespace(
+        name="worker-01", token="token", url="http://localhost", job_log_interval=5
+    )
+    payload = {
+        "definition": "job_name: test",
+        "device": "hostname: qemu01",
+        "dispatcher": "",
+        "env": "",
+        "env-dut": "",
+    }
+    data = {"start": [{"id": 1, "token": "token", "payload": payload}]}
+    asyncio.run(worker.handle(options, jobs, data))
+    # lava-run was not started: the job is finished right away
+    assert jobs.all_ids() == []  # nosec
+
+
+def test_job_wait(jobs):
+    # A lava-run process started before a restart of lava-worker
+    proc = subprocess.Popen(  # nosec - unit test support.
+        ["bash", "-c", "exec -a lava-run sleep 0.5"]
+    )
+    try:
+        job = jobs.create(proc.pid, proc.pid, worker.Job.RUNNING, "", "token")
+        for _ in range(50):
+            if job.is_running():
+                break
+            time.sleep(0.1)
+        assert job.is_running()  # nosec
+
+        async def run():
+            begin = time.monotonic()
+            await asyncio.wait_for(job.wait(), timeout=10)
+            return time.monotonic() - begin
+
+        assert asyncio.run(run()) > 0.1  # nosec
+        assert not job.is_running()  # nosec
+    finally:
+        proc.wait()
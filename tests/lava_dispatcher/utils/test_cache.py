@@ -0,0 +1,93 @@
+# Copyright (C) 2022 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+import os
+import time
+
+from lava_dispatcher.utils.cache import DownloadCache, GitCache
+
+
+def test_download_cache(tmp_path):
+    cache = DownloadCache(tmp_path / "cache", 25)
+    assert DownloadCache.key(url="a", md5sum="1") == DownloadCache.key(
+        md5sum="1", url="a"
+    )
+    assert DownloadCache.key(url="a") != DownloadCache.key(url="b")
+
+    for (index, key) in enumerate(["a", "b", "c"]):
+        (tmp_path / key).write_text(key * 10, encoding="utf-8")
+        with cache.lock(key):
+            assert cache.get(key, str(tmp_path / "dst")) is None
+            cache.put(key, str(tmp_path / key), {"size": index})
+        # Make the last use of each entry distinct
+        os.utime(str(cache.path / (key + ".json")), (index, index))
+
+    with cache.lock("a"):
+        metadata = cache.get("a", str(tmp_path / "dst"))
+    assert metadata["size"] == 0
+    assert metadata["method"] in ["reflink", "copy"]
+    assert (tmp_path / "dst").read_text(encoding="utf-8") == "a" * 10
+    # The entry is not shared with the jobs
+    assert (tmp_path / "dst").stat().st_ino != (cache.path / "a").stat().st_ino
+    with (tmp_path / "dst").open("a", encoding="utf-8") as f_dst:
+        f_dst.write("modified")
+    assert (cache.path / "a").read_text(encoding="utf-8") == "a" * 10
+
+    # "b" is the least recently used entry
+    assert cache.evict() == (2, 20)
+    assert sorted(e[0] for e in cache.entries()) == ["a", "c"]
+
+    # Locked entries are kept
+    cache.size = 0
+    with cache.lock("c"):
+        assert cache.evict() == (1, 10)
+    assert cache.evict() == (0, 0)
+    assert list(cache.path.glob("*.tmp")) == []
+    # The lock files are kept
+    assert sorted(p.name for p in cache.path.iterdir()) == [
+        "a.lock",
+        "b.lock",
+        "c.lock",
+        "cache.lock",
+    ]
+
+
+def test_git_cache(tmp_path):
+    cache = GitCache(tmp_path / "cache", 100, max_age=3600)
+    for key in ["a", "b"]:
+        with cache.lock(key):
+            (cache.mirror(key) / "objects").mkdir(parents=True)
+            (cache.mirror(key) / "objects" / "pack").write_text(key * 10)
+            cache.touch(key, {"url": key})
+    assert sorted(cache.entries()) == [
+        ("a", 10, os.stat(str(cache.path / "a.json")).st_mtime),
+        ("b", 10, os.stat(str(cache.path / "b.json")).st_mtime),
+    ]
+
+    # Mirrors unused for too long are removed
+    old = time.time() - 7200
+    os.utime(str(cache.path / "b.json"), (old, old))
+    assert cache.evict() == (1, 10)
+    assert not cache.mirror("b").exists()
+    assert sorted(p.name for p in cache.path.iterdir()) == [
+        "a",
+        "a.json",
+        "a.lock",
+        "b.lock",
+        "cache.lock",
+    ]
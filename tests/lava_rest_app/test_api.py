@@ -34,6 +34,7 @@ from rest_framework.test import APIClient
 
 from lava_common.version import __version__
 from lava_common.compat import yaml_load
+from lava_scheduler_app.logutils import LogsFilesystem
 from lava_scheduler_app.models import (
     Alias,
     Device,
@@ -259,6 +260,8 @@ class TestRestApi:
             if response["Content-Type"] == "application/json":
                 return json.loads(text)
             return text
+        if hasattr(response, "streaming_content"):
+            return b"".join(response.streaming_content).decode("utf-8")
         return ""
 
     def test_root(self):
@@ -541,6 +544,37 @@ class TestRestApi:
         assert "timestamp" in tree[0][0].attrib
         assert len(tree[0][1]) == 0
 
+        # The total duration is computed from the metadata of the test cases
+        suite = result_models.TestSuite.objects.create(
+            name="smoke", job=self.public_testjob1
+        )
+        for (name, duration) in [("baz", "1.5"), ("qux", "2.25")]:
+            result_models.TestCase.objects.create(
+                name=name,
+                suite=suite,
+                result=result_models.TestCase.RESULT_SKIP,
+                metadata="duration: '%s'\nextra: data\n" % duration,
+            )
+        self.public_test_case2.metadata = "duration: '0.5'\n"
+        self.public_test_case2.save()
+        data = self.hit(
+            self.userclient,
+            reverse("api-root", args=[self.version])
+            + "jobs/%s/junit/" % self.public_testjob1.id,
+        )
+        tree = ET.fromstring(data)
+        assert tree.attrib == {
+            "failures": "1",
+            "errors": "0",
+            "tests": "4",
+            "disabled": "0",
+            "time": "4.25",
+        }
+        assert [(s.attrib["time"], s.attrib["skipped"]) for s in tree] == [
+            ("0.5", "0"),
+            ("3.75", "2"),
+        ]
+
     def test_testjob_junit_classname_prefix(self):
         data = self.hit(
             self.userclient,
@@ -550,6 +584,69 @@ class TestRestApi:
         tree = ET.fromstring(data)
         assert tree[0][0].attrib["classname"] == "unique_id_lava"
 
+    def test_testjob_junit_tap13_logs(self, monkeypatch, tmpdir):
+        lines = ["- {lvl: target, msg: line %d}\n" % i for i in range(20)]
+        (tmpdir / "output.yaml").write_text("".join(lines), encoding="utf-8")
+        monkeypatch.setattr(TestJob, "output_dir", str(tmpdir))
+        # The ranges are read by start line, not in the order of the suites
+        read_many = LogsFilesystem.read_many
+        ranges = []
+
+        def read_many_spy(self, job, job_ranges):
+            ranges.append(job_ranges)
+            return read_many(self, job, job_ranges)
+
+        monkeypatch.setattr(LogsFilesystem, "read_many", read_many_spy)
+        self.public_test_case1.start_log_line = 10
+        self.public_test_case1.end_log_line = 12
+        self.public_test_case1.save()
+        suite = result_models.TestSuite.objects.create(
+            name="smoke", job=self.public_testjob1
+        )
+        result_models.TestCase.objects.create(
+            name="baz",
+            suite=suite,
+            result=result_models.TestCase.RESULT_FAIL,
+            start_log_line=2,
+            end_log_line=3,
+        )
+
+        data = self.hit(
+            self.userclient,
+            reverse("api-root", args=[self.version])
+            + "jobs/%s/junit/" % self.public_testjob1.id,
+        )
+        tree = ET.fromstring(data)
+        assert tree.attrib["failures"] == "2"
+        assert tree.attrib["tests"] == "3"
+        assert [s.attrib["name"] for s in tree] == ["lava", "smoke"]
+        assert tree[0][0][0].text == "".join(lines[10:12])
+        assert tree[1].attrib["failures"] == "1"
+        assert tree[1][0][0].text == lines[2]
+
+        data = self.hit(
+            self.userclient,
+            reverse("api-root", args=[self.version])
+            + "jobs/%s/tap13/" % self.public_testjob1.id,
+        )
+        assert data.endswith(  # nosec - unit test support
+            """1..3
+# TAP results for lava
+not ok 1 foo
+ ---
+ - {lvl: target, msg: line 10}
+ - {lvl: target, msg: line 11}
+ ...
+ok 2 bar
+# TAP results for smoke
+not ok 3 baz
+ ---
+ - {lvl: target, msg: line 2}
+ ...
+"""
+        )
+        assert ranges == [[(2, 3), (10, 12)], [(2, 3), (10, 12)]]
+
     def test_testjob_tap13(self):
         data = self.hit(
             self.userclient,
@@ -1450,6 +1547,51 @@ ok 2 bar
         assert response.status_code == 201  # nosec - unit test support
         assert TestJob.objects.count() == 3  # nosec - unit test support
 
+    def test_submit_bulk(self):
+        response = self.userclient.post(
+            reverse("api-root", args=[self.version]) + "jobs/bulk/",
+            {
+                "definitions": [
+                    EXAMPLE_WORKING_JOB,
+                    EXAMPLE_WORKING_JOB_RESTRICTED_DEVICE_TYPE,
+                    EXAMPLE_WORKING_JOB,
+                ]
+            },
+            format="json",
+        )
+        assert response.status_code == 201  # nosec - unit test support
+        jobs = json.loads(response.content)["jobs"]
+        assert len(jobs) == 3  # nosec - unit test support
+        assert (
+            jobs[1]["error"]
+            == "Device unavailable: Device type 'restricted_device_type1' is unavailable to user 'user1'"
+        )  # nosec - unit test support
+        assert TestJob.objects.count() == 4  # nosec - unit test support
+        for job in [jobs[0], jobs[2]]:
+            assert TestJob.objects.filter(  # nosec - unit test support
+                pk__in=job["job_ids"], submitter=self.user
+            ).exists()
+
+        response = self.userclient.post(
+            reverse("api-root", args=[self.version]) + "jobs/bulk/",
+            {"definitions": [EXAMPLE_JOB]},
+            format="json",
+        )
+        assert response.status_code == 400  # nosec - unit test support
+        jobs = json.loads(response.content)["jobs"]
+        assert jobs == [
+            {
+                "error": "Problem with submitted job data: Job device_type must be specified."
+            }
+        ]  # nosec - unit test support
+
+        response = self.userclient.post(
+            reverse("api-root", args=[self.version]) + "jobs/bulk/",
+            {"definitions": EXAMPLE_WORKING_JOB},
+            format="json",
+        )
+        assert response.status_code == 400  # nosec - unit test support
+
     def test_resubmit_unauthorized(self):
         response = self.userclient.post(
             reverse("api-root", args=[self.version])
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022-present Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+
+import pytest
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from lava_results_app.models import (
+    Chart,
+    ChartQuery,
+    NamedTestAttribute,
+    Query,
+    QueryOmitResult,
+    TestCase,
+    TestData,
+    TestSuite,
+)
+from lava_scheduler_app.models import DeviceType, TestJob
+
+
+def create_jobs(user, count):
+    now = timezone.now()
+    device_type = DeviceType.objects.get_or_create(name="qemu")[0]
+    for index in range(count):
+        job = TestJob.objects.create(
+            definition="job_name: chart",
+            submitter=user,
+            requested_device_type=device_type,
+            is_public=True,
+            state=TestJob.STATE_FINISHED,
+            health=[TestJob.HEALTH_COMPLETE, TestJob.HEALTH_INCOMPLETE][index % 2],
+            end_time=now + datetime.timedelta(minutes=index),
+        )
+        data = TestData.objects.create(testjob=job)
+        for (name, value) in [("build", str(100 + index)), ("size", "1.5")]:
+            NamedTestAttribute.objects.create(
+                name=name, value=value, content_object=data
+            )
+        for suite_name in ["lava", "smoke"]:
+            suite = TestSuite.objects.create(job=job, name=suite_name)
+            for case in range(3):
+                TestCase.objects.create(
+                    name="case-%d" % case,
+                    suite=suite,
+                    result=(index + case) % 4,
+                    measurement=case * 1.5,
+                    metadata="size: %d\nname: case" % case if case else None,
+                )
+    # A suite created before the counters
+    TestSuite.objects.filter(name="smoke", job=job).update(
+        count_pass=None, count_fail=None, count_skip=None, count_unknown=None
+    )
+
+
+def legacy_data(chart_query, results):
+    # The data computed by calling the methods of each query result
+    data = []
+    for item in results:
+        if chart_query.chart_type == "attributes":
+            values = item.get_attribute_results(chart_query.attributes)
+            for (result, value) in values.items():
+                data.append(
+                    {
+                        "id": result,
+                        "pk": item.id,
+                        "attribute": str(item.get_end_datetime()),
+                        "link": item.get_absolute_url(),
+                        "date": str(item.get_end_datetime()),
+                        "pass": value["fail"] == 0,
+                        "attr_value": value["value"],
+                    }
+                )
+            continue
+
+        attribute = item.get_xaxis_attribute(chart_query.xaxis_attribute)
+        if chart_query.xaxis_attribute and not attribute:
+            continue
+        date = str(item.get_end_datetime())
+        attribute = attribute if attribute is not None else date
+        if chart_query.chart_type == "pass/fail":
+            for (result, value) in item.get_passfail_results().items():
+                data.append(
+                    {
+                        "id": result,
+                        "pk": item.id,
+                        "link": item.get_absolute_url(),
+                        "date": date,
+                        "attribute": attribute,
+                        "pass": value["fail"] == 0,
+                        "passes": value["pass"],
+                        "failures": value["fail"],
+                        "skip": value["skip"],
+                        "unknown": value["unknown"],
+                        "total": sum(value.values()),
+                    }
+                )
+        else:
+            for (result, value) in item.get_measurement_results().items():
+                data.append(
+                    {
+                        "id": result,
+                        "pk": item.id,
+                        "link": item.get_absolute_url(),
+                        "date": date,
+                        "attribute": attribute,
+                        "pass": value["fail"] == 0,
+                        "measurement": value["measurement"],
+                    }
+                )
+    return data
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("model", [TestJob, TestSuite, TestCase])
+@pytest.mark.parametrize(
+    "chart_type,xaxis_attribute,attributes",
+    [
+        ("pass/fail", None, None),
+        ("pass/fail", "build", None),
+        ("pass/fail", "missing", None),
+        ("measurement", None, None),
+        ("measurement", "build", None),
+        ("attributes", None, "build, size"),
+    ],
+)
+def test_chart_data(model, chart_type, xaxis_attribute, attributes):
+    if model == TestCase and chart_type == "pass/fail":
+        pytest.skip("pass/fail charts are not available for test cases")
+    user = User.objects.create(username="user")
+    create_jobs(user, 4)
+    content_type = ContentType.objects.get_for_model(model)
+
+    chart_query = ChartQuery(
+        id=0,
+        chart=Chart(name="Custom"),
+        chart_type=chart_type,
+        xaxis_attribute=xaxis_attribute,
+        attributes=attributes,
+    )
+
+    def get_data():
+        # The first call updates the outdated suite counters
+        chart_query.get_data(user, content_type, [])
+        with CaptureQueriesContext(connection) as queries:
+            data = chart_query.get_data(user, content_type, [])["data"]
+        return (data, len(queries))
+
+    (data, queries) = get_data()
+    # The number of queries does not depend on the number of results
+    create_jobs(user, 4)
+    (data, more_queries) = get_data()
+    assert more_queries == queries
+
+    results = Query.get_queryset(
+        content_type, [], order_by=[ChartQuery.ORDER_BY_MAP[model]]
+    ).visible_by_user(user)
+    assert data == legacy_data(chart_query, results)
+    if xaxis_attribute == "missing":
+        assert data == []
+    elif model != TestCase or chart_type == "measurement":
+        assert data != []
+
+
+@pytest.mark.django_db
+def test_chart_data_cache(mocker, settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    user = User.objects.create(username="user")
+    create_jobs(user, 2)
+    query = Query.objects.create(
+        owner=user,
+        name="jobs",
+        content_type=ContentType.objects.get_for_model(TestJob),
+        last_updated=timezone.now(),
+    )
+    chart = Chart.objects.create(name="chart", owner=user)
+    chart_query = ChartQuery.objects.create(chart=chart, query=query)
+    # Avoid the materialized view
+    get_results = mocker.patch(
+        "lava_results_app.models.Query.get_results",
+        side_effect=lambda user: TestJob.objects.all(),
+    )
+
+    data = chart_query.get_data(user)["data"]
+    assert len(data) == 4
+    assert chart_query.get_data(user)["data"] == data
+    assert len(get_results.mock_calls) == 1
+
+    # Omitting a result invalidates the cache, even from another process
+    # (bulk_create does not send any signal)
+    job = TestJob.objects.first()
+    QueryOmitResult.objects.bulk_create(
+        [QueryOmitResult(query=query, content_object=job)]
+    )
+    chart_query.get_data(user)
+    assert len(get_results.mock_calls) == 2
+    # Back to the data cached without omitted results
+    QueryOmitResult.objects.filter(query=query).delete()
+    assert chart_query.get_data(user)["data"] == data
+    assert len(get_results.mock_calls) == 2
+    QueryOmitResult.objects.create(query=query, content_object=job)
+    chart_query.get_data(user)
+    assert len(get_results.mock_calls) == 3
+
+    # Refreshing the query invalidates the cache
+    chart_query.get_data(user)
+    assert len(get_results.mock_calls) == 3
+    query.last_updated = timezone.now() + datetime.timedelta(seconds=1)
+    query.save()
+    chart_query.get_data(user)
+    assert len(get_results.mock_calls) == 4
+
+    # Live queries are not cached
+    query.is_live = True
+    query.save()
+    chart_query.get_data(user)
+    assert len(get_results.mock_calls) == 5
@@ -1,7 +1,9 @@
+import io
 import os
 import logging
 
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.core.validators import URLValidator
 from django.test import TestCase as DjangoTestCase
 
@@ -225,3 +227,49 @@ class TestTestSuite(TestCaseWithFactory):
             self.assertTrue(testcase.name.startswith("linux-INLINE-"))
             val("http://localhost/%s" % testcase.get_absolute_url())
         self.factory.cleanup()
+
+    def test_testcase_count(self):
+        job = TestJob.from_yaml_and_user(self.factory.make_job_yaml(), self.user)
+        suite = TestSuite.objects.create(job=job, name="test-suite")
+        for (index, result) in enumerate(["pass", "pass", "fail", "skip"]):
+            TestCase.objects.create(
+                name="case-%d" % index,
+                suite=suite,
+                result=TestCase.RESULT_MAP[result],
+            )
+        TestCase.objects.bulk_create(
+            [TestCase(name="case-4", suite=suite, result=TestCase.RESULT_UNKNOWN)]
+        )
+        TestSuite.add_counts({suite.id: {TestCase.RESULT_UNKNOWN: 1}})
+
+        suite = TestSuite.objects.get(pk=suite.pk)
+        self.assertEqual(suite.count_pass, 2)
+        self.assertEqual(suite.testcase_count(), 5)
+        self.assertEqual(suite.testcase_count("fail"), 1)
+        self.assertEqual(suite.testcase_count("unknown"), 1)
+        self.assertEqual(job.testcase_count(), 5)
+        self.assertEqual(job.testcase_count("pass"), 2)
+
+        # Suites created before the counters are computed on first use
+        TestSuite.objects.filter(pk=suite.pk).update(
+            count_pass=None, count_fail=None, count_skip=None, count_unknown=None
+        )
+        suite = TestSuite.objects.get(pk=suite.pk)
+        self.assertEqual(suite.testcase_count("pass"), 2)
+        self.assertEqual(TestSuite.objects.get(pk=suite.pk).count_skip, 1)
+
+        TestSuite.objects.filter(pk=suite.pk).update(
+            count_pass=None, count_fail=None, count_skip=None, count_unknown=None
+        )
+        self.assertEqual(job.testcase_count(), 5)
+
+        TestSuite.objects.filter(pk=suite.pk).update(
+            count_pass=None, count_fail=None, count_skip=None, count_unknown=None
+        )
+        call_command("refresh_testcase_counts", stdout=io.StringIO())
+        suite = TestSuite.objects.get(pk=suite.pk)
+        self.assertEqual(
+            (suite.count_pass, suite.count_fail, suite.count_skip, suite.count_unknown),
+            (2, 1, 1, 1),
+        )
+        self.factory.cleanup()
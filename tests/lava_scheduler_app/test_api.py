@@ -9,6 +9,7 @@ from io import BytesIO as StringIO
 from lava_common.compat import yaml_safe_load
 from lava_common.decorators import nottest
 from lava_scheduler_app.dbutils import validate_yaml
+from lava_scheduler_app.logutils import LogsBlocks
 from lava_scheduler_app.models import (
     Alias,
     Device,
@@ -16,6 +17,7 @@ from lava_scheduler_app.models import (
     GroupDevicePermission,
     GroupDeviceTypePermission,
     Tag,
+    TestJob,
     Worker,
 )
 from lava_scheduler_app.schema import validate_submission, SubmissionException
@@ -71,6 +73,30 @@ class TestSchedulerAPI(TestCaseWithFactory):
         else:
             self.fail("fault not raised")
 
+    def test_submit_many(self):
+        self.factory.ensure_user("test", "e@mail.invalid", "test")
+        dt = self.factory.make_device_type("qemu")
+        self.factory.make_device(device_type=dt, hostname="qemu-1")
+        definition = self.factory.make_job_data_from_file(
+            "qemu-pipeline-first-job.yaml"
+        )
+        server = self.server_proxy("test", "test")
+        ret = server.scheduler.jobs.submit_many(
+            [definition, definition.replace("device_type: qemu", "device_type: kvm")]
+        )
+        self.assertEqual(len(ret), 2)
+        self.assertEqual(
+            ret[0]["job_ids"],
+            list(TestJob.objects.values_list("id", flat=True)),
+        )
+        self.assertEqual(
+            ret[1], {"error": "Device unavailable: Device type 'kvm' is unavailable."}
+        )
+
+        with self.assertRaises(xmlrpc.client.Fault) as f:
+            server.scheduler.jobs.submit_many(definition)
+        self.assertEqual(f.exception.faultCode, 400)
+
     def test_new_devices(self):
         user = self.factory.ensure_user("test", "e@mail.invalid", "test")
         user.save()
@@ -1019,6 +1045,7 @@ def test_device_types_set_template(setup, mocker, tmpdir):
         "lava_server.files.File.KINDS",
         {"device-type": ([str(tmpdir)], "{name}.jinja2")},
     )
+    clear = mocker.patch("lava_scheduler_app.environment.device_configurations.clear")
 
     # 1. normal case
     DeviceType.objects.create(name="qemu")
@@ -1026,6 +1053,8 @@ def test_device_types_set_template(setup, mocker, tmpdir):
     assert (tmpdir / "qemu.jinja2").read_text(  # nosec
         encoding="utf-8"
     ) == "hello world"
+    # The cached device configurations are dropped
+    clear.assert_called_once_with()
 
     # 2. Invalid name
     with pytest.raises(xmlrpc.client.Fault) as exc:
@@ -1862,3 +1891,37 @@ def test_workers_update(setup):
         server("admin", "admin").scheduler.workers.update("example.com", None, "wrong")
     assert exc.value.faultCode == 400  # nosec
     assert exc.value.faultString == "Invalid health: wrong"  # nosec
+
+
+@pytest.mark.django_db
+def test_job_output(setup, mocker, tmpdir):
+    logs = LogsBlocks()
+    logs.BLOCK_SIZE = 64
+    mocker.patch("lava_scheduler_app.api.logs_instance", logs)
+    mocker.patch(
+        "lava_scheduler_app.models.TestJob.output_dir",
+        new_callable=mocker.PropertyMock,
+        return_value=str(tmpdir),
+    )
+    job = TestJob.objects.create(
+        requested_device_type=DeviceType.objects.create(name="qemu"),
+        submitter=User.objects.get(username="admin"),
+        definition="{}",
+    )
+
+    # Logs not found
+    with pytest.raises(xmlrpc.client.Fault) as exc:
+        server("admin", "admin").scheduler.job_output(job.id)
+    assert exc.value.faultCode == 404  # nosec
+
+    # Logs stored as compressed blocks
+    lines = [b"line number %d\n" % i for i in range(20)]
+    logs.write_many(job, lines)
+    assert (tmpdir / "output.yaml.blocks").exists()  # nosec
+    assert server("admin", "admin").scheduler.job_output(  # nosec
+        job.id
+    ).data == b"".join(lines)
+    assert (  # nosec
+        server("admin", "admin").scheduler.job_output(job.id, 100).data
+        == b"".join(lines)[100:]
+    )
@@ -1,5 +1,9 @@
+import os
+import pathlib
+import tempfile
 import yaml
 import jinja2
+from unittest.mock import patch
 
 from django.db.models import Q
 from lava_common.compat import yaml_safe_load
@@ -9,6 +13,7 @@ from lava_scheduler_app.models import (
     GroupDevicePermission,
     GroupDeviceTypePermission,
 )
+from lava_scheduler_app import environment
 from lava_scheduler_app.dbutils import (
     load_devicetype_template,
     invalid_template,
@@ -274,3 +279,110 @@ class DeviceTypeTest(TestCaseWithFactory):
             {"beaglebone-black", "qemu"},
             set(active_device_types().values_list("name", flat=True)),
         )
+
+
+class DeviceConfigurationCacheTest(TestCaseWithFactory):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        base = pathlib.Path(self.tmpdir.name)
+        self.device_types = base / "device-types"
+        kinds = dict(File.KINDS)
+        kinds["device"] = ([str(base / "devices")], "{name}.jinja2")
+        kinds["device-type"] = (
+            [str(self.device_types)] + File.KINDS["device-type"][0],
+            "{name}.jinja2",
+        )
+        env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(
+                kinds["device"][0] + kinds["device-type"][0]
+            ),
+            autoescape=False,
+            trim_blocks=True,
+        )
+        for patcher in [
+            patch("lava_server.files.File.KINDS", kinds),
+            patch("lava_scheduler_app.environment.devices", lambda: env),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        environment.device_configurations.clear()
+
+        dt = DeviceType.objects.create(name="qemu")
+        self.device = Device.objects.create(
+            device_type=dt, hostname="qemu-cache-01", health=Device.HEALTH_GOOD
+        )
+        self.write_device("52:54:00:12:34:59")
+
+    def write(self, path, data):
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(data, encoding="utf-8")
+        self.touch(path)
+
+    def touch(self, path):
+        # Make sure that the modification is visible even on filesystems with
+        # a coarse timestamp granularity.
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+    def write_device(self, mac_addr):
+        self.assertTrue(
+            self.device.save_configuration(
+                "{%% extends 'qemu.jinja2' %%}\n{%% set mac_addr = '%s' %%}\n"
+                % mac_addr
+            )
+        )
+        self.touch(File("device", self.device.hostname).files[0])
+
+    def test_cache_hit(self):
+        cache = environment.device_configurations
+        self.assertTrue(self.device.is_valid())
+        self.assertEqual(cache.misses, 1)
+        self.assertTrue(self.device.is_valid())
+        self.assertEqual(self.device.get_extends(), "qemu")
+        data = self.device.load_configuration()
+        self.assertIn(
+            "macaddr=52:54:00:12:34:59",
+            self.device.load_configuration(output_format="yaml"),
+        )
+        self.assertEqual(cache.misses, 1)
+        # get_extends() only parses the device dictionary
+        self.assertEqual(cache.hits, 3)
+
+        # The returned dict is a copy
+        data["actions"] = None
+        self.assertIsNotNone(self.device.load_configuration()["actions"])
+
+        # The job context is part of the key
+        self.device.load_configuration({"arch": "arm64"})
+        self.assertEqual(cache.misses, 2)
+
+    def test_invalidate_device_dictionary(self):
+        self.assertTrue(self.device.is_valid())
+        self.write_device("52:54:00:12:34:60")
+        self.assertIn(
+            "macaddr=52:54:00:12:34:60",
+            self.device.load_configuration(output_format="yaml"),
+        )
+
+        self.assertTrue(
+            self.device.save_configuration("{% extends 'unknown.jinja2' %}\n")
+        )
+        self.assertFalse(self.device.is_valid())
+        self.assertIsNone(self.device.load_configuration())
+        self.assertEqual(self.device.get_extends(), "unknown")
+
+    def test_invalidate_device_type_template(self):
+        self.assertTrue(self.device.is_valid())
+        # A template that overrides the one in the default path
+        self.write(self.device_types / "qemu.jinja2", "{% include 'custom.jinja2' %}\n")
+        self.assertFalse(self.device.is_valid())
+        # The included template is also tracked
+        self.write(self.device_types / "custom.jinja2", "hello: world\n")
+        self.assertEqual(self.device.load_configuration(), {"hello": "world"})
+        self.write(self.device_types / "custom.jinja2", "hello: everyone\n")
+        self.assertEqual(self.device.load_configuration(), {"hello": "everyone"})
+        # Back to the default template
+        (self.device_types / "qemu.jinja2").unlink()
+        self.assertTrue(self.device.is_valid())
@@ -17,14 +17,27 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import lzma
+import multiprocessing
 import pytest
+import simplejson
+import struct
+import tracemalloc
 import unittest
 
 from django.conf import settings
 
 from lava_common.compat import yaml_dump, yaml_load
-from lava_scheduler_app.logutils import LogsFilesystem, LogsMongo, LogsElasticsearch
+from lava_common.log import dump
+from lava_scheduler_app.logutils import (
+    LogsBlocks,
+    LogsFilesystem,
+    LogsMongo,
+    LogsElasticsearch,
+    parse_line,
+    parse_records,
+)
 
 
 def check_pymongo():
@@ -47,6 +60,14 @@ def logs_filesystem():
     return LogsFilesystem()
 
 
+@pytest.fixture
+def logs_blocks():
+    logs = LogsBlocks()
+    # Use small blocks to test reads across blocks
+    logs.BLOCK_SIZE = 64
+    return logs
+
+
 def test_read_logs_uncompressed(mocker, tmpdir, logs_filesystem):
     job = mocker.Mock()
     job.output_dir = tmpdir
@@ -115,6 +136,273 @@ def test_write_logs(mocker, tmpdir, logs_filesystem):
         assert f_idx.read(8) == b"\x0c\x00\x00\x00\x00\x00\x00\x00"  # nosec
 
 
+def test_write_many_logs(mocker, tmpdir, logs_filesystem):
+    job = mocker.Mock()
+    job.output_dir = tmpdir / "job-output"
+    assert logs_filesystem.line_count(job) == 0  # nosec
+    logs_filesystem.write_many(
+        job, ["hello world\n".encode("utf-8"), "how are you?\n".encode("utf-8")]
+    )
+    logs_filesystem.write_many(job, ["fine\n".encode("utf-8")])
+    assert logs_filesystem.line_count(job) == 3  # nosec
+    assert logs_filesystem.read(job) == "hello world\nhow are you?\nfine\n"  # nosec
+    assert logs_filesystem.read(job, start=1, end=2) == "how are you?\n"  # nosec
+    assert logs_filesystem.read(job, start=2) == "fine\n"  # nosec
+    with open(str(job.output_dir / "output.idx"), "rb") as f_idx:
+        assert f_idx.read() == struct.pack("=QQQ", 0, 12, 25)  # nosec
+
+
+def test_blocks_logs(mocker, tmpdir, logs_blocks):
+    job = mocker.Mock()
+    job.output_dir = tmpdir / "job-output"
+    assert logs_blocks.line_count(job) == 0  # nosec
+    assert logs_blocks.size(job) is None  # nosec
+
+    lines = ["line number %d\n" % i for i in range(53)]
+    for i in range(0, 53, 7):
+        logs_blocks.write_many(job, [l.encode("utf-8") for l in lines[i : i + 7]])
+    # Some lines are compressed, the last ones are not
+    assert (job.output_dir / "output.yaml.blocks").size() > 0  # nosec
+    assert (job.output_dir / "output.yaml.tail").size() > 0  # nosec
+    assert not (job.output_dir / "output.yaml").exists()  # nosec
+
+    assert logs_blocks.line_count(job) == 53  # nosec
+    assert logs_blocks.size(job) == len("".join(lines))  # nosec
+    assert logs_blocks.read(job) == "".join(lines)  # nosec
+    data = "".join(lines).encode("utf-8")
+    with logs_blocks.open(job) as f_logs:
+        assert f_logs.read() == data  # nosec
+        # The file is read one block at a time
+        f_logs.seek(100)
+        assert f_logs.tell() == 100  # nosec
+        assert f_logs.read(50) == data[100:150]  # nosec
+        assert f_logs.readline() == data[150 : data.index(b"\n", 150) + 1]  # nosec
+        f_logs.seek(-20, io.SEEK_END)
+        assert f_logs.read() == data[-20:]  # nosec
+        f_logs.seek(3)
+        assert [f_logs.readline() for _ in range(2)] == [  # nosec
+            lines[0][3:].encode("utf-8"),
+            lines[1].encode("utf-8"),
+        ]
+    for start in range(0, 55, 3):
+        for end in range(0, 55, 5):
+            assert logs_blocks.read(job, start, end) == "".join(  # nosec
+                lines[start:end]
+            )
+        assert logs_blocks.read(job, start) == "".join(lines[start:])  # nosec
+
+
+def test_blocks_logs_interrupted(mocker, tmpdir, logs_blocks):
+    job = mocker.Mock()
+    job.output_dir = tmpdir
+    lines = ["line number %d\n" % i for i in range(20)]
+    logs_blocks.write_many(job, [l.encode("utf-8") for l in lines])
+    tail_offset = logs_blocks._tail_offset(tmpdir)
+
+    # Blocks written without replacing the tail are ignored
+    with open(str(tmpdir / "output.yaml.tail"), "rb") as f_tail:
+        f_tail.seek(logs_blocks.TAIL_HEADER_SIZE)
+        with open(str(tmpdir / "output.yaml.blocks"), "ab") as f_blocks:
+            with open(str(tmpdir / "output.yaml.blocks.idx"), "ab") as f_bidx:
+                logs_blocks._write_blocks(f_tail, f_blocks, f_bidx, tail_offset)
+                f_bidx.write(b"partial")
+    assert logs_blocks.read(job) == "".join(lines)  # nosec
+    assert logs_blocks.read(job, 15, 18) == "".join(lines[15:18])  # nosec
+    assert logs_blocks.size(job) == len("".join(lines))  # nosec
+
+    # And dropped by the next compression
+    logs_blocks.write_many(job, [b"hello\n"])
+    assert logs_blocks.read(job) == "".join(lines) + "hello\n"  # nosec
+    assert logs_blocks.read(job, 19) == "line number 19\nhello\n"  # nosec
+
+
+def write_lines(logs, directory, name):
+    job = type("Job", (), {"output_dir": directory})
+    for i in range(0, 100, 5):
+        logs.write_many(job, [b"%s %d\n" % (name, j) for j in range(i, i + 5)])
+
+
+def test_blocks_logs_concurrent(mocker, tmpdir, logs_blocks):
+    job = mocker.Mock()
+    job.output_dir = tmpdir
+    # Many processes appending to the same logs
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(
+            target=write_lines, args=(logs_blocks, tmpdir, b"process-%d" % i)
+        )
+        for i in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0  # nosec
+
+    data = logs_blocks.read(job)
+    lines = data.splitlines(keepends=True)
+    assert sorted(lines) == sorted(  # nosec
+        "process-%d %d\n" % (i, j) for i in range(4) for j in range(100)
+    )
+    assert logs_blocks.line_count(job) == 400  # nosec
+    for index in range(0, 400, 7):
+        assert logs_blocks.read(job, index, index + 1) == lines[index]  # nosec
+
+
+def test_blocks_logs_convert(mocker, tmpdir, logs_blocks):
+    job = mocker.Mock()
+    job.output_dir = tmpdir
+    data = "".join("line number %d\n" % i for i in range(50))
+    with lzma.open(str(tmpdir / "output.yaml.xz"), "wb") as f_logs:
+        f_logs.write(data.encode("utf-8"))
+    (tmpdir / "output.yaml.size").write_text(str(len(data)), encoding="utf-8")
+
+    # Use the LogsFilesystem format until the logs are converted
+    assert logs_blocks.read(job, 1, 2) == "line number 1\n"  # nosec
+    assert logs_blocks.convert(job) is True  # nosec
+    assert not (tmpdir / "output.yaml.xz").exists()  # nosec
+    assert not (tmpdir / "output.yaml.size").exists()  # nosec
+    assert logs_blocks.convert(job) is False  # nosec
+
+    assert logs_blocks.line_count(job) == 50  # nosec
+    assert logs_blocks.size(job) == len(data)  # nosec
+    assert logs_blocks.read(job) == data  # nosec
+    assert logs_blocks.read(job, 48) == "line number 48\nline number 49\n"  # nosec
+    assert logs_blocks.read(job, 10, 12) == "line number 10\nline number 11\n"  # nosec
+
+    # New lines are appended
+    logs_blocks.write_many(job, [b"hello\n"])
+    assert logs_blocks.read(job, 49) == "line number 49\nhello\n"  # nosec
+
+
+def test_stream_logs(mocker, tmpdir, logs_filesystem, logs_blocks):
+    job = mocker.Mock()
+    job.output_dir = tmpdir
+    lines = ['- {"lvl": "info", "msg": "line %d"}\n' % i for i in range(50)]
+    logs_blocks.write_many(job, [l.encode("utf-8") for l in lines])
+    for start in range(0, 52, 7):
+        for end in [None] + list(range(0, 52, 5)):
+            data = b"".join(logs_blocks.stream(job, start, end)).decode("utf-8")
+            assert data == "".join(lines[start:end])  # nosec
+
+    (tmpdir / "output.yaml").write_text("".join(lines), encoding="utf-8")
+    for start in range(0, 52, 7):
+        for end in [None] + list(range(0, 52, 5)):
+            chunks = list(logs_filesystem.stream(job, start, end))
+            assert b"".join(chunks).decode("utf-8") == "".join(  # nosec
+                lines[start:end]
+            )
+            assert all(c.endswith(b"\n") for c in chunks)  # nosec
+
+    assert list(parse_records(logs_filesystem.stream(job, 48))) == [  # nosec
+        {"lvl": "info", "msg": "line 48"},
+        {"lvl": "info", "msg": "line 49"},
+    ]
+    # Records spanning many lines
+    assert list(  # nosec
+        parse_records([b"- lvl: info\n  msg: hello\n", b"- lvl: debug\n  msg: world\n"])
+    ) == [{"lvl": "info", "msg": "hello"}, {"lvl": "debug", "msg": "world"}]
+
+
+def test_read_many_logs(mocker, tmpdir, logs_filesystem, logs_blocks):
+    lines = ["line number %d\n" % i for i in range(50)]
+    # Unsorted and empty ranges are also valid
+    ranges = [(1, 3), (2, 2), (10, 30), (30, 31), (45, 60), (48, None), (60, 70)]
+    ranges.append((0, 5))
+    expected = ["".join(lines[start:end]) for (start, end) in ranges]
+
+    job = mocker.Mock()
+    job.output_dir = tmpdir / "blocks"
+    logs_blocks.write_many(job, [l.encode("utf-8") for l in lines])
+    # The index is opened once for all the ranges
+    get_offsets = mocker.spy(logs_blocks, "_get_offsets")
+    assert list(logs_blocks.read_many(job, ranges)) == expected  # nosec
+    assert get_offsets.call_count == 0  # nosec
+
+    job.output_dir = tmpdir / "uncompressed"
+    job.output_dir.mkdir()
+    (job.output_dir / "output.yaml").write_text("".join(lines), encoding="utf-8")
+    assert list(logs_filesystem.read_many(job, ranges)) == expected  # nosec
+    assert list(logs_blocks.read_many(job, ranges)) == expected  # nosec
+
+    job.output_dir = tmpdir / "compressed"
+    job.output_dir.mkdir()
+    with lzma.open(str(job.output_dir / "output.yaml.xz"), "wb") as f_logs:
+        f_logs.write("".join(lines).encode("utf-8"))
+    assert list(logs_filesystem.read_many(job, ranges)) == expected  # nosec
+    assert list(logs_filesystem.read_many(job, [])) == []  # nosec
+
+    # Overlapping ranges sorted by start line do not seek backward in the
+    # compressed log
+    ranges = [(0, 5), (2, 10), (3, 4), (8, 20), (25, 30), (28, None), (40, 45)]
+    expected = ["".join(lines[start:end]) for (start, end) in ranges]
+    seek = mocker.spy(lzma.LZMAFile, "seek")
+    assert list(logs_filesystem.read_many(job, ranges)) == expected  # nosec
+    offsets = [args[1] for (args, _) in seek.call_args_list]
+    assert offsets == sorted(offsets)  # nosec
+
+    # Missing logs
+    job.output_dir = tmpdir / "missing"
+    with pytest.raises(FileNotFoundError):
+        next(logs_filesystem.read_many(job, ranges))
+
+
+@pytest.mark.parametrize("backend", [LogsFilesystem, LogsBlocks])
+def test_stream_logs_memory(mocker, tmpdir, backend):
+    # The memory needed to stream and parse the logs should not depend on
+    # the size of the logs.
+    logs = backend()
+    peaks = []
+    for (index, count) in enumerate([10000, 100000]):
+        job = mocker.Mock()
+        job.output_dir = tmpdir / str(index)
+        line = '- {"dt": "2022-09-01T10:25:32.123456", "lvl": "target", "msg": "%s"}\n'
+        for i in range(0, count, 10000):
+            logs.write_many(job, [(line % ("x" * (i % 80))).encode("utf-8")] * 10000)
+
+        tracemalloc.start()
+        size = 0
+        for record in parse_records(logs.stream(job)):
+            size += 1
+        with logs.open(job) as f_logs:
+            while f_logs.read(64 * 1024):
+                pass
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        assert size == count  # nosec
+
+    # 1MB and 10MB of logs
+    assert peaks[1] < 1024 * 1024  # nosec
+    assert peaks[1] < 2 * peaks[0]  # nosec
+
+
+def test_parse_line():
+    dt = "2022-09-01T10:25:32.123456"
+    # Only the level is needed
+    line = "- " + dump({"dt": dt, "lvl": "info", "msg": 'a "quoted"\nmessage'})
+    assert parse_line(line) == {"lvl": "info"}  # nosec
+    line = "- " + dump({"dt": dt, "lvl": "feedback", "msg": "hello", "ns": "common"})
+    assert parse_line(line) == {"lvl": "feedback"}  # nosec
+    assert parse_line('- {"lvl": "debug", "msg": "hello"}') == {"lvl": "debug"}  # nosec
+    # Results and events are parsed
+    results = {"case": "linux-posix-pwd", "definition": "0_smoke-tests"}
+    line = "- " + dump({"dt": dt, "lvl": "results", "msg": results})
+    assert parse_line(line) == {"dt": dt, "lvl": "results", "msg": results}  # nosec
+    line = "- " + dump({"dt": dt, "lvl": "event", "msg": "hello"})
+    assert parse_line(line) == {"dt": dt, "lvl": "event", "msg": "hello"}  # nosec
+    line = "- " + dump({"dt": dt, "lvl": "info", "msg": "hello"})
+    assert parse_line(line, levels=["info"]) == {  # nosec
+        "dt": dt,
+        "lvl": "info",
+        "msg": "hello",
+    }
+    # Fallback to the YAML parser
+    assert parse_line("- {lvl: info, msg: hello}") == {  # nosec
+        "lvl": "info",
+        "msg": "hello",
+    }
+
+
 @unittest.skipIf(check_pymongo(), "openocd not installed")
 def test_mongo_logs(mocker):
     mocker.patch("pymongo.database.Database.command")
@@ -186,6 +474,14 @@ def test_elasticsearch_logs(mocker, logs_elasticsearch):
         data='{"dt": 1585165476209, "lvl": "info", "msg": "lava-dispatcher, installed at version: 2020.02", "job_id": 1}',
         headers={"Content-type": "application/json"},
     )  # nosec
+    post.reset_mock()
+    logs_elasticsearch.write_many(job, [line, line.replace("info", "debug")])
+    post.assert_called_once_with(
+        "%s%s/_bulk/" % (settings.ELASTICSEARCH_URI, settings.ELASTICSEARCH_INDEX),
+        data='{"index": {}}\n{"dt": 1585165476209, "lvl": "info", "msg": "lava-dispatcher, installed at version: 2020.02", "job_id": 1}\n'
+        '{"index": {}}\n{"dt": 1585165476209, "lvl": "debug", "msg": "lava-dispatcher, installed at version: 2020.02", "job_id": 1}\n',
+        headers={"Content-type": "application/x-ndjson"},
+    )  # nosec
     result = yaml_load(logs_elasticsearch.read(job))
 
     assert len(result) == 2  # nosec
@@ -213,3 +509,43 @@ def test_elasticsearch_logs(mocker, logs_elasticsearch):
             ]
         ).encode("utf-8")
     )
+
+
+def test_elasticsearch_logs_stream(mocker, logs_elasticsearch):
+    job = mocker.Mock()
+    job.id = 1
+    docs = [
+        {"dt": 1585165476209 + i, "lvl": "info", "msg": "message %d" % i}
+        for i in range(5)
+    ]
+
+    def search(url, data, headers):
+        params = simplejson.loads(data)
+        hits = docs[params["from"] : params["from"] + params["size"]]
+        return mocker.Mock(
+            text=simplejson.dumps({"hits": {"hits": [{"_source": d} for d in hits]}})
+        )
+
+    get = mocker.patch("requests.get", side_effect=search)
+    # The logs are fetched one page at a time
+    logs_elasticsearch.STREAM_PAGE_SIZE = 2
+    chunks = list(logs_elasticsearch.stream(job))
+    assert len(chunks) == 3  # nosec
+    assert [  # nosec
+        (p["from"], p["size"])
+        for p in [simplejson.loads(c[1]["data"]) for c in get.call_args_list]
+    ] == [(0, 2), (2, 2), (4, 2)]
+    records = list(parse_records(chunks))
+    assert [r["msg"] for r in records] == ["message %d" % i for i in range(5)]  # nosec
+    assert b"".join(chunks).decode("utf-8") == logs_elasticsearch.read(job)  # nosec
+
+    # Ranges of lines
+    get.reset_mock()
+    records = list(parse_records(logs_elasticsearch.stream(job, 1, 4)))
+    assert [r["msg"] for r in records] == [
+        "message 1",
+        "message 2",
+        "message 3",
+    ]  # nosec
+    assert get.call_count == 2  # nosec
+    assert list(logs_elasticsearch.stream(job, 3, 3)) == []  # nosec
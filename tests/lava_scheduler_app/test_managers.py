@@ -33,6 +33,7 @@ from lava_scheduler_app.models import (
     GroupWorkerPermission,
     DeviceType,
     TestJob,
+    TestJobVisibility,
     Device,
     Worker,
 )
@@ -1254,3 +1255,91 @@ class ManagersTest(TestCaseWithFactory):
             ),
             set(Worker.objects.all()),
         )
+
+    def test_testjob_visibility(self):
+        users = [self.admin_user, self.user1, self.user2, self.user3, AnonymousUser()]
+        user3_job = TestJob.from_yaml_and_user(self.definition, self.user3)
+
+        def check():
+            for user in users:
+                self.assertEqual(
+                    set(TestJob.objects.all().visible_by_user(user)),
+                    set(
+                        TestJob.objects.all().accessible_by_user(
+                            user, TestJob.VIEW_PERMISSION
+                        )
+                    ),
+                )
+
+        check()
+        GroupDeviceTypePermission.objects.assign_perm(
+            DeviceType.VIEW_PERMISSION, self.group1, self.qemu_device_type
+        )
+        check()
+        # Every permission implies the view permission
+        GroupDeviceTypePermission.objects.assign_perm(
+            DeviceType.SUBMIT_PERMISSION, self.group2, self.qemu_device_type
+        )
+        check()
+
+        # Scheduled jobs use the permissions of the device
+        self.qemu_job1.actual_device = self.qemu_device1
+        self.qemu_job1.save()
+        self.bbb_job1.actual_device = self.bbb_device1
+        self.bbb_job1.save()
+        check()
+        GroupDevicePermission.objects.assign_perm(
+            Device.VIEW_PERMISSION, self.group2, self.qemu_device1
+        )
+        check()
+        GroupDevicePermission.objects.assign_perm(
+            Device.CHANGE_PERMISSION, self.group1, self.bbb_device1
+        )
+        check()
+        GroupDevicePermission.objects.remove_perm(
+            Device.VIEW_PERMISSION, self.group2, self.qemu_device1
+        )
+        check()
+        GroupDeviceTypePermission.objects.remove_perm(
+            DeviceType.VIEW_PERMISSION, self.group1, self.qemu_device_type
+        )
+        check()
+        GroupDeviceTypePermission.objects.assign_perm(
+            DeviceType.VIEW_PERMISSION, self.group2, self.bbb_device_type
+        )
+        check()
+
+        # Moving a device to another device type
+        self.qemu_device2.device_type = self.bbb_device_type
+        self.qemu_device2.save()
+        self.qemu_job2.actual_device = self.qemu_device2
+        self.qemu_job2.save()
+        check()
+
+        # Private jobs
+        self.qemu_job2.is_public = False
+        self.qemu_job2.save()
+        user3_job.is_public = False
+        user3_job.save()
+        check()
+
+        # Viewing groups
+        self.user3.groups.add(self.group1)
+        self.qemu_job1.viewing_groups.add(self.group1)
+        self.bbb_job2.viewing_groups.add(self.group1, self.group2)
+        check()
+        self.bbb_job2.viewing_groups.remove(self.group2)
+        check()
+        self.group1.viewing_groups.clear()
+        check()
+        self.bbb_job2.viewing_groups.add(self.group1, self.group2)
+        self.group2.delete()
+        self.assertEqual(
+            list(TestJob.objects.get(pk=self.bbb_job2.pk).viewing_groups.all()),
+            [self.group1],
+        )
+        check()
+        # Bulk updates should update the visibility explicitly
+        TestJob.objects.filter(pk=self.qemu_job2.pk).update(is_public=True)
+        TestJobVisibility.update_job(TestJob.objects.get(pk=self.qemu_job2.pk))
+        check()
@@ -967,6 +967,44 @@ class TestYamlMultinode(TestCaseWithFactory):
             self.assertIsNotNone(job.multinode_definition)
             self.assertIn("# unit test support comment", job.multinode_definition)
 
+    def test_multinode_definition_facts(self):
+        user = self.factory.make_user()
+        device_type = self.factory.make_device_type()
+        submission = yaml_safe_load(
+            open(
+                os.path.join(
+                    os.path.dirname(__file__), "sample_jobs", "kvm-multinode.yaml"
+                ),
+                "r",
+            )
+        )
+        self.factory.make_device(device_type, "fakeqemu1")
+        tag_list = [
+            self.factory.ensure_tag("usb-flash"),
+            self.factory.ensure_tag("usb-eth"),
+            self.factory.ensure_tag("testtag"),
+        ]
+        self.factory.make_device(device_type, "fakeqemu2", tags=tag_list)
+        job_object_list = _pipeline_protocols(submission, user, None)
+        for job in job_object_list:
+            job.refresh_from_db()
+            definition = yaml_safe_load(job.definition)
+            role = definition["protocols"]["lava-multinode"]["role"]
+            self.assertEqual(
+                job.definition_facts,
+                {
+                    "dynamic_connection": False,
+                    "essential": False,
+                    "host_role": None,
+                    "role": role,
+                    "tags": sorted(t.name for t in job.tags.all()),
+                    "vland": None,
+                },
+            )
+            self.assertEqual(job.device_role, role)
+            self.assertFalse(job.dynamic_connection)
+            self.assertFalse(job.essential_role)
+
     @patch("lava_dispatcher.actions.deploy.download.requests_retry")
     def test_invalid_multinode(self, requests_mock):
         user = self.factory.make_user()
@@ -27,7 +27,7 @@ from django.contrib.auth.models import User
 from django.test import TestCase
 from django.utils import timezone
 
-from lava_scheduler_app.models import Device, DeviceType, TestJob, Worker
+from lava_scheduler_app.models import Device, DeviceType, Tag, TestJob, Worker
 from lava_scheduler_app.scheduler import schedule, schedule_health_checks
 
 
@@ -881,3 +881,67 @@ class TestJobQueueTimeout(TestCase):
         else:
             assert canceling == 1
             assert canceled == 0
+
+
+class TestTags(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger()
+        self.worker01 = Worker.objects.create(
+            hostname="worker-01", state=Worker.STATE_ONLINE
+        )
+        self.user = User.objects.create(username="user-01")
+        self.device_type01 = DeviceType.objects.create(
+            name="qemu", disable_health_check=True
+        )
+        self.tag01 = Tag.objects.create(name="tag-01")
+        self.tag02 = Tag.objects.create(name="tag-02")
+        self.device01 = Device.objects.create(
+            hostname="qemu01",
+            device_type=self.device_type01,
+            worker_host=self.worker01,
+            health=Device.HEALTH_GOOD,
+        )
+        self.device02 = Device.objects.create(
+            hostname="qemu02",
+            device_type=self.device_type01,
+            worker_host=self.worker01,
+            health=Device.HEALTH_GOOD,
+        )
+        self.device02.tags.add(self.tag01, self.tag02)
+
+    def _create_job(self, tags, priority=TestJob.MEDIUM):
+        job = TestJob.objects.create(
+            requested_device_type=self.device_type01,
+            submitter=self.user,
+            definition=_minimal_valid_job(None),
+            priority=priority,
+        )
+        job.tags.add(*tags)
+        return job
+
+    def test_tags_subset(self):
+        job01 = self._create_job([self.tag01, self.tag02])
+        job02 = self._create_job([], priority=TestJob.LOW)
+        job03 = self._create_job([self.tag02])
+
+        schedule(self.logger, [], ["worker-01"])
+        for job in [job01, job02, job03]:
+            job.refresh_from_db()
+        # job01 is the only one requiring tags that qemu02 provides and job02
+        # is the only remaining job that qemu01 can run.
+        self.assertEqual(job01.state, TestJob.STATE_SCHEDULED)
+        self.assertEqual(job01.actual_device, self.device02)
+        self.assertEqual(job02.state, TestJob.STATE_SCHEDULED)
+        self.assertEqual(job02.actual_device, self.device01)
+        self.assertEqual(job03.state, TestJob.STATE_SUBMITTED)
+        self.assertEqual(job03.actual_device, None)
+
+    def test_unknown_tags(self):
+        job01 = self._create_job([Tag.objects.create(name="tag-03")])
+
+        schedule(self.logger, [], ["worker-01"])
+        job01.refresh_from_db()
+        self.assertEqual(job01.state, TestJob.STATE_SUBMITTED)
+        for device in [self.device01, self.device02]:
+            device.refresh_from_db()
+            self.assertEqual(device.state, Device.STATE_IDLE)
@@ -1,12 +1,14 @@
 import logging
 import os
 import json
+from unittest.mock import patch
 
 from django.contrib.auth.models import Group, Permission, User
 from django.test import TestCase
 
+from lava_common import schemas
 from lava_common.compat import yaml_safe_dump, yaml_safe_load
-from lava_scheduler_app.dbutils import testjob_submission
+from lava_scheduler_app.dbutils import testjob_submission, testjob_submission_many
 from lava_scheduler_app.models import (
     Alias,
     Device,
@@ -15,8 +17,10 @@ from lava_scheduler_app.models import (
     NotificationCallback,
     Tag,
     TestJob,
+    TestJobVisibility,
 )
 from lava_scheduler_app.notifications import create_notification
+from lava_scheduler_app.schema import SubmissionException
 from linaro_django_xmlrpc.models import AuthToken
 
 
@@ -215,6 +219,121 @@ class TestTestJob(TestCaseWithFactory):
             data["state_string"], TestJob.STATE_CHOICES[TestJob.STATE_SUBMITTED][1]
         )
 
+    def test_parse_once(self):
+        self.factory.cleanup()
+        user = self.factory.make_user()
+        dt = self.factory.make_device_type(name="qemu")
+        self.factory.make_device(device_type=dt, hostname="qemu-1")
+        definition = self.factory.make_job_data_from_file(
+            "qemu-pipeline-first-job.yaml"
+        )
+        # The definition is only parsed by validate_job
+        with patch(
+            "lava_scheduler_app.models.yaml_safe_load", side_effect=AssertionError
+        ):
+            job = testjob_submission(definition, user, None)
+        self.assertEqual(job.original_definition, definition)
+        self.assertEqual(yaml_safe_load(job.definition), yaml_safe_load(definition))
+
+    def test_schemas_cache(self):
+        data = yaml_safe_load(
+            self.factory.make_job_data_from_file("qemu-pipeline-first-job.yaml")
+        )
+        schemas.validate(data, extra_context_variables=["foo"])
+        job_info = schemas.job_schema.cache_info()
+        action_info = schemas.action_schema.cache_info()
+        schemas.validate(data, extra_context_variables=["foo"])
+        self.assertEqual(schemas.job_schema.cache_info().hits, job_info.hits + 1)
+        self.assertEqual(schemas.job_schema.cache_info().misses, job_info.misses)
+        self.assertEqual(
+            schemas.action_schema.cache_info().hits,
+            action_info.hits + len(data["actions"]),
+        )
+        self.assertEqual(schemas.action_schema.cache_info().misses, action_info.misses)
+
+        # The context variables and strictness are part of the key
+        data["context"] = {"bar": 1}
+        self.assertRaises(
+            schemas.Invalid,
+            schemas.validate,
+            data,
+            extra_context_variables=["foo"],
+        )
+        schemas.validate(data, extra_context_variables=["bar"])
+        del data["context"]
+        schemas.validate(dict(data, unknown=1), strict=False)
+        self.assertRaises(schemas.Invalid, schemas.validate, dict(data, unknown=1))
+
+    def test_submission_many(self):
+        self.factory.cleanup()
+        user = self.factory.make_user()
+        group = self.factory.make_group("group1")
+        dt = self.factory.make_device_type(name="qemu")
+        tags = [self.factory.ensure_tag(t) for t in ["usb-flash", "usb-eth", "testtag"]]
+        for hostname in ["qemu-1", "qemu-2"]:
+            device = self.factory.make_device(device_type=dt, hostname=hostname)
+            device.tags.add(*tags)
+        singlenode = yaml_safe_load(
+            self.factory.make_job_data_from_file("qemu-pipeline-first-job.yaml")
+        )
+        # Duplicated tags are ignored, like in the single submission
+        with_tags = dict(
+            singlenode, tags=["testtag", "testtag"], visibility={"group": ["group1"]}
+        )
+        personal = dict(singlenode, visibility="personal")
+        unknown = dict(singlenode, device_type="unknown")
+        multinode = self.factory.make_job_data_from_file("kvm-multinode.yaml")
+        self.factory.ensure_user("admin", "admin@mail.invalid", "admin")
+
+        with self.settings(EVENT_NOTIFICATION=True), patch(
+            "lava_scheduler_app.signals.send_events"
+        ) as send_events:
+            jobs = testjob_submission_many(
+                [
+                    yaml_safe_dump(singlenode),
+                    yaml_safe_dump(with_tags),
+                    "{",
+                    multinode,
+                    yaml_safe_dump(unknown),
+                    yaml_safe_dump(personal),
+                ],
+                user,
+            )
+        self.assertEqual(len(jobs), 6)
+        self.assertIsInstance(jobs[2], SubmissionException)
+        self.assertIsInstance(jobs[4], DevicesUnavailableException)
+        self.assertEqual(len(jobs[3]), 2)
+        self.assertEqual(TestJob.objects.count(), 5)
+
+        (public, tagged, personal) = (jobs[0], jobs[1], jobs[5])
+        for job in [public, tagged, personal]:
+            job.refresh_from_db()
+            self.assertEqual(job.requested_device_type, dt)
+            self.assertEqual(job.submitter, user)
+            self.assertEqual(job.state, TestJob.STATE_SUBMITTED)
+        self.assertEqual(yaml_safe_load(tagged.definition), with_tags)
+        self.assertEqual(list(tagged.tags.all()), [tags[2]])
+        self.assertEqual(list(public.tags.all()), [])
+        self.assertEqual(list(tagged.viewing_groups.all()), [group])
+        self.assertEqual(
+            list(personal.viewing_groups.values_list("name", flat=True)),
+            [user.username],
+        )
+        # The visibility is the one computed by the signals
+        for job in [public, tagged, personal]:
+            visibility = job.visibility
+            TestJobVisibility.update_job(job)
+            self.assertIsNotNone(visibility)
+            self.assertEqual(job.visibility, visibility)
+
+        # One event for every singlenode job, the multinode ones are sent by
+        # the signals
+        self.assertEqual(len(send_events.mock_calls), 1)
+        events = send_events.mock_calls[0][1][1]
+        self.assertEqual(
+            [data["job"] for (_, data) in events], [public.id, tagged.id, personal.id]
+        )
+
     def test_device_type_alias(self):
         self.factory.cleanup()
         user = self.factory.make_user()
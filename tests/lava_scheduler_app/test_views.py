@@ -495,11 +495,8 @@ def test_job_log_file_plain_no_log_file(client, monkeypatch, setup):
 @pytest.mark.django_db
 def test_job_log_file_plain(client, monkeypatch, setup):
     monkeypatch.setattr(
-        "lava_scheduler_app.logutils.logs_instance.open",
-        lambda dir_name: """
-line one
-line two
-""",
+        "lava_scheduler_app.logutils.logs_instance.stream",
+        lambda dir_name: iter([b"line one\n", b"line two\n"]),
     )
     job_1 = TestJob.objects.get(description="test job 01")
     ret = client.post(reverse("lava.scheduler.job.log_file.plain", args=[job_1.pk]))
@@ -507,6 +504,7 @@ line two
     assert (
         ret["Content-Disposition"] == "attachment; filename=job_%d.log" % job_1.id
     )  # nosec
+    assert b"".join(ret.streaming_content) == b"line one\nline two\n"  # nosec
 
 
 @pytest.mark.django_db
@@ -17,6 +17,12 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
 
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import asyncio
+import importlib
+import json
 from pathlib import Path
 import pytest
 from django.urls import reverse
@@ -26,7 +32,11 @@ from django.contrib.auth.models import User
 from lava_common.compat import yaml_load
 from lava_common.version import __version__
 from lava_results_app.models import TestCase
+from lava_scheduler_app import dbutils
 from lava_scheduler_app.models import Device, DeviceType, TestJob, Worker
+from lava_server.files import File
+
+publisher = importlib.import_module("lava_server.management.commands.lava-publisher")
 
 
 def create_objects(w):
@@ -263,6 +273,100 @@ def test_internal_v1_jobs_post(client, mocker, settings):
     assert j2.failure_comment == "an error"
 
 
+@pytest.mark.django_db
+def test_internal_v1_jobs_many(client, mocker, settings):
+    # Create objects
+    objs = create_objects(Worker.objects.create(hostname="worker-01"))
+    (j1, j2, j3, j4, j5, j6) = objs["jobs"]
+    url = reverse("lava.scheduler.internal.v1.jobs")
+
+    # Test errors
+    ret = client.get(url)
+    assert ret.status_code == 403
+
+    ret = client.post(url, data={"start": "not json"})
+    assert ret.status_code == 400
+    assert ret.json()["error"] == "Invalid 'start' or 'state'"
+
+    # Start payloads: the worker configuration is read once
+    read = mocker.spy(File, "read")
+    starts = [
+        {"id": j1.id, "token": j1.token},
+        {"id": j5.id, "token": j5.token},
+        {"id": j6.id, "token": j6.token},
+        {"id": j2.id, "token": ""},
+        {"id": 12345, "token": ""},
+    ]
+    ret = client.post(url, data={"start": json.dumps(starts)})
+    assert ret.status_code == 200
+    data = ret.json()["start"]
+    assert read.call_count == 3
+    assert list(data[str(j1.id)].keys()) == [
+        "definition",
+        "device",
+        "dispatcher",
+        "env",
+        "env-dut",
+    ]
+    assert (
+        data[str(j1.id)]
+        == client.get(
+            reverse("lava.scheduler.internal.v1.jobs", args=[j1.id]),
+            HTTP_LAVA_TOKEN=j1.token,
+        ).json()
+    )
+    assert "hostname: qemu05" in data[str(j6.id)]["device"]
+    assert data[str(j2.id)] == {"error": "Invalid 'token'"}
+    assert data["12345"] == {"error": "Unknown job '12345'"}
+    assert (Path(j5.output_dir) / "job.yaml").exists()
+
+    # Errors only affect the given job
+    load_configuration = Device.load_configuration
+
+    def broken_configuration(self, *args, **kwargs):
+        if self.hostname == "qemu01":
+            return None
+        return load_configuration(self, *args, **kwargs)
+
+    mocker.patch.object(Device, "load_configuration", broken_configuration)
+    ret = client.post(url, data={"start": json.dumps(starts[:3])})
+    assert ret.status_code == 200
+    data = ret.json()["start"]
+    assert data[str(j1.id)]["error"].startswith("Unable to build the payload: ")
+    assert "definition" in data[str(j5.id)]
+    assert "definition" in data[str(j6.id)]
+    mocker.patch.object(Device, "load_configuration", load_configuration)
+
+    # The payloads already sent are not built again
+    start_payload = mocker.spy(dbutils, "job_start_payload")
+    data = dbutils.worker_jobs(j1.actual_device.worker_host, payload=True, sent={j1.id})
+    assert start_payload.call_count == 2
+    assert sorted(s["id"] for s in data["start"] if "payload" in s) == [j5.id, j6.id]
+    assert {"id": j1.id, "token": j1.token} in data["start"]
+
+    # States
+    states = [
+        {"id": j1.id, "token": j1.token, "state": "Running"},
+        {"id": j5.id, "token": j5.token, "state": "Running"},
+        {"id": j6.id, "token": j6.token, "state": "Canceling"},
+        {"id": j2.id, "token": "", "state": "Running"},
+    ]
+    ret = client.post(url, data={"state": json.dumps(states)})
+    assert ret.status_code == 200
+    assert ret.json()["state"] == {
+        str(j1.id): {},
+        str(j5.id): {},
+        str(j6.id): {"error": "Not handled state 'Canceling'"},
+        str(j2.id): {"error": "Invalid 'token'"},
+    }
+    j1.refresh_from_db()
+    assert j1.state == TestJob.STATE_RUNNING
+    j5.refresh_from_db()
+    assert j5.state == TestJob.STATE_RUNNING
+    j6.refresh_from_db()
+    assert j6.state == TestJob.STATE_SCHEDULED
+
+
 @pytest.mark.django_db
 def test_internal_v1_jobs_logs(client, mocker, settings):
     # Create objects
@@ -417,6 +521,9 @@ def test_internal_v1_jobs_logs(client, mocker, settings):
     assert tc.end_log_line == 20
     assert tc.suite.job == j1
     assert tc.suite.name == "0_smoke-tests"
+    # The counters are updated by the bulk insert
+    assert tc.suite.count_pass == 1
+    assert tc.suite.testcase_count() == 1
 
 
 @pytest.mark.django_db
@@ -591,3 +698,158 @@ def test_internal_v1_workers_post(client, mocker, settings):
         "name": "worker-02",
         "token": Worker.objects.get(hostname="worker-02").token,
     }
+
+
+def create_publisher_app(mocker):
+    app = web.Application()
+    app["logger"] = mocker.Mock()
+    app["websockets"] = set()
+    app["workers"] = {}
+    app.add_routes([web.get("/ws/workers/{name}/", publisher.worker_handler)])
+    return app
+
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_channel_without_events(mocker, settings):
+    settings.EVENT_NOTIFICATION = False
+    worker = Worker.objects.create(
+        hostname="worker-01", health=Worker.HEALTH_ACTIVE, state=Worker.STATE_OFFLINE
+    )
+    app = create_publisher_app(mocker)
+
+    async def run():
+        async with TestClient(TestServer(app)) as client:
+            # The worker should fallback to the http api
+            with pytest.raises(aiohttp.WSServerHandshakeError) as exc:
+                await client.ws_connect(
+                    "/ws/workers/worker-01/",
+                    params={"version": __version__},
+                    headers={"LAVA-Token": worker.token},
+                )
+            assert exc.value.status == 400
+            assert app["workers"] == {}
+
+    asyncio.run(run())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_channel(mocker, settings):
+    settings.EVENT_NOTIFICATION = True
+    worker = Worker.objects.create(
+        hostname="worker-01", health=Worker.HEALTH_ACTIVE, state=Worker.STATE_OFFLINE
+    )
+    objs = create_objects(worker)
+    (j1, j2, j3, j4, j5, j6) = objs["jobs"]
+    app = create_publisher_app(mocker)
+
+    async def run():
+        async with TestClient(TestServer(app)) as client:
+            url = "/ws/workers/worker-01/"
+            # Test errors
+            for (name, token, version) in [
+                ("worker-03", worker.token, __version__),
+                ("worker-01", "", __version__),
+                ("worker-01", worker.token, "v0.1"),
+            ]:
+                with pytest.raises(aiohttp.WSServerHandshakeError) as exc:
+                    await client.ws_connect(
+                        f"/ws/workers/{name}/",
+                        params={"version": version},
+                        headers={"LAVA-Token": token},
+                    )
+                assert exc.value.status == 400
+
+            ws = await client.ws_connect(
+                url,
+                params={"version": __version__},
+                headers={"LAVA-Token": worker.token},
+            )
+            # The jobs are sent when connecting
+            data = await ws.receive_json(timeout=10)
+            assert data["type"] == "jobs"
+            assert data["cancel"] == [{"id": j3.id, "token": j3.token}]
+            assert data["running"] == [{"id": j2.id, "token": j2.token}]
+            assert sorted(s["id"] for s in data["start"]) == [j1.id, j5.id, j6.id]
+            start = [s for s in data["start"] if s["id"] == j1.id][0]
+            assert start["token"] == j1.token
+            assert yaml_load(start["payload"]["definition"]) == {
+                "compatibility": 0,
+                "device_type": "qemu",
+            }
+            assert "available_architectures:" in start["payload"]["device"]
+
+            # Requests
+            await ws.send_json({"type": "ping", "id": 1})
+            assert await ws.receive_json(timeout=10) == {
+                "type": "reply",
+                "id": 1,
+                "status": 200,
+                "data": {},
+            }
+
+            await ws.send_json(
+                {"type": "state", "id": 2, "job": j1.id, "token": "", "data": {}}
+            )
+            assert await ws.receive_json(timeout=10) == {
+                "type": "reply",
+                "id": 2,
+                "status": 400,
+                "data": {"error": "Invalid 'token'"},
+            }
+
+            await ws.send_json(
+                {
+                    "type": "state",
+                    "id": 3,
+                    "job": j1.id,
+                    "token": j1.token,
+                    "data": {"state": "Running"},
+                }
+            )
+            assert (await ws.receive_json(timeout=10))["status"] == 200
+
+            # Events for this worker wake up the connection
+            publisher.notify_worker(
+                app,
+                [
+                    "org.lavasoftware.testjob",
+                    "",
+                    "",
+                    "",
+                    json.dumps({"state": "Canceling", "worker": "worker-02"}),
+                ],
+            )
+            publisher.notify_worker(
+                app,
+                [
+                    "org.lavasoftware.testjob",
+                    "",
+                    "",
+                    "",
+                    json.dumps({"state": "Canceling", "worker": "worker-01"}),
+                ],
+            )
+            data = await ws.receive_json(timeout=10)
+            assert data["type"] == "jobs"
+            # The payloads were sent with the first message
+            assert sorted(s["id"] for s in data["start"]) == [j5.id, j6.id]
+            assert all("payload" not in s for s in data["start"])
+            assert sorted(data["running"], key=lambda d: d["id"]) == [
+                {"id": j1.id, "token": j1.token},
+                {"id": j2.id, "token": j2.token},
+            ]
+            await ws.close()
+
+            # Wait for the handler to finish
+            for _ in range(100):
+                if not app["workers"]:
+                    break
+                await asyncio.sleep(0.1)
+            assert app["workers"] == {}
+
+    asyncio.run(run())
+
+    j1.refresh_from_db()
+    assert j1.state == TestJob.STATE_RUNNING
+    worker.refresh_from_db()
+    assert worker.state == Worker.STATE_ONLINE
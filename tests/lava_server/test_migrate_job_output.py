@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from lava_scheduler_app import logutils
+from lava_scheduler_app.logutils import LogsBlocks, LogsFilesystem
+from lava_scheduler_app.models import DeviceType, TestJob, User
+
+
+@pytest.mark.django_db
+def test_migrate_job_output_blocks(mocker):
+    job = TestJob.objects.create(
+        definition="job_name: test",
+        submitter=User.objects.create(username="user"),
+        requested_device_type=DeviceType.objects.create(name="qemu"),
+        state=TestJob.STATE_FINISHED,
+    )
+    convert = mocker.patch.object(LogsBlocks, "convert", return_value=True)
+    rename = mocker.patch("os.rename")
+
+    # The converted logs are only readable by LogsBlocks
+    mocker.patch.object(logutils, "logs_instance", LogsFilesystem())
+    with pytest.raises(CommandError):
+        call_command("migrate-job-output", "--blocks")
+    assert convert.call_count == 0
+
+    # Only the logs are converted
+    mocker.patch.object(logutils, "logs_instance", LogsBlocks())
+    mocker.patch("os.path.exists", return_value=True)
+    call_command("migrate-job-output", "--blocks")
+    assert [c[0][0] for c in convert.call_args_list] == [job]
+    assert rename.call_count == 0